@@ -4,549 +4,103 @@
 import datetime
 import logging
 import argparse
-from math import exp, log, pow, sqrt
+import sys
+import types
 import pandas as pd
 
 # Import from other CFFDRS code files
+import parallel
+import timing
 import util
+import fwi_core
+# model equations are in fwi_core.py (no pandas), imported here so they are still
+# available as NG_FWI.<name>. Model constants are only in fwi_core.py and read from
+# there at call time, NG_FWI.<constant> gets and sets fwi_core.<constant>
+from fwi_core import (
+    ffmc_to_mcffmc, mcffmc_to_ffmc, dmc_to_mcdmc, mcdmc_to_dmc, dc_to_mcdc, mcdc_to_dc,
+    hourly_fine_fuel_moisture, duff_moisture_code, drought_code,
+    initial_spread_index, buildup_index, fire_weather_index, daily_severity_rating,
+    hourly_grass_fuel_moisture, Pign, curing_factor, mcgfmc_to_gfmc,
+    matted_grass_spread_ROS, standing_grass_spread_ROS,
+    grass_spread_index, grass_fire_weather_index,
+    drying_units, rain_since_intercept_reset, ffmc_effective_rain, grass_standing_date,
+    Parameters
+)
 
 logger = logging.getLogger("cffdrs")
 logger.setLevel(logging.WARNING)
 
-### Variable Definitions ###
-# Only change these if you know what you are doing, or
-# reach out to the CFS Fire Danger Group for more info
+MODEL_CONSTANTS = [name.upper() for name in fwi_core.PARAMETERS]
 
-# Startup moisture code values
-FFMC_DEFAULT = 85.0
-DMC_DEFAULT = 6.0
-DC_DEFAULT = 15.0
 
-# Precipitation intercept
-FFMC_INTERCEPT = 0.5
-DMC_INTERCEPT = 1.5
-DC_INTERCEPT = 2.8
+# forwards the model constants to fwi_core, so setting e.g. NG_FWI.FFMC_INTERCEPT
+# changes the constant every calculation uses
+class _Module(types.ModuleType):
+    def __getattr__(self, name):
+        if name in MODEL_CONSTANTS:
+            return getattr(fwi_core, name)
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
-# Drying variables
-DMC_REGRESSION = 2.22e-4
-DC_REGRESSION = 1.5e-2
-DMC_OFFSET_TEMP = 0.0
-DC_OFFSET_TEMP = 0.0
+    def __setattr__(self, name, value):
+        if name in MODEL_CONSTANTS:
+            setattr(fwi_core, name, value)
+        else:
+            super().__setattr__(name, value)
 
-# Grassland fuel load (grass_fuel_load, kg/m^2)
-DEFAULT_GRASS_FUEL_LOAD = 0.35
 
-# Transition from matted to standing grass in a calendar year (default July 1st)
-GRASS_TRANSITION = True  # default True, False for GFMC to always be standing
-MON_STANDING = 7
-DAY_STANDING = 1
+sys.modules[__name__].__class__ = _Module
+
+### Variable Definitions ###
+# Only change these if you know what you are doing, or
+# reach out to the CFS Fire Danger Group for more info
+# (model constants are in fwi_core.py)
 
 # For input data that can't be split by year (i.e. data runs between Dec 31 - Jan 1)
 # If True, every station's data needs to be sequential (one continuous run)
 CONTINUOUS_MULTIYEAR = False  # default False, True to not split by year
 
-### Functions ###
-
-##
-# Convert to fine fuel moisture content (%)
-# @param ffmc       Fine Fuel Moisture Code (FFMC)
-# @return           fine fuel moisture content (%)
-def ffmc_to_mcffmc(ffmc):
-    C_FFMC = 14875 / 101
-    return C_FFMC * (101 - ffmc) / (59.5 + ffmc)
-
-##
-# Convert to FFMC
-# @param mcffmc     fine fuel moisture content (%)
-# @return           FFMC
-def mcffmc_to_ffmc(mcffmc):
-    C_FFMC = 14875 / 101
-    return 59.5 * (250 - mcffmc) / (C_FFMC + mcffmc)
-
-##
-# Convert to duff moisture content (%)
-# @param dmc        Duff Moisture Code (DMC)
-# @return           duff moisture content (%)
-def dmc_to_mcdmc(dmc):
-   return (280 / exp(dmc / 43.43)) + 20
-
-##
-# Convert to DMC
-# @param mcdmc      duff moisture content (%)
-# @return           DMC
-def mcdmc_to_dmc(mcdmc):
-   return 43.43 * log(280 / (mcdmc - 20))
-
-##
-# Convert to DC moisture content (%)
-# @param dc         Drought Code (DC)
-# @return           DC moisture content (%)
-def dc_to_mcdc(dc):
-   return 400 * exp(-dc / 400)
-
-##
-# Convert to DC
-# @param mcdc       DC moisture content (%)
-# @return           DC
-def mcdc_to_dc(mcdc):
-   return 400 * log(400 / mcdc)
-
-##
-# Calculate hourly fine fuel moisture content. Needs to be converted to get FFMC
-#
-# @param lastmc          Previous fine fuel moisture content (%)
-# @param temp            Temperature (Celcius)
-# @param rh              Relative Humidity (percent, 0-100)
-# @param ws              Wind Speed (km/h)
-# @param rain            Rainfall AFTER intercept (mm)
-# @param time_increment  Duration of timestep (hr, default 1.0)
-# @return                Hourly fine fuel moisture content (%)
-def hourly_fine_fuel_moisture(lastmc, temp, rh, ws, rain, time_increment = 1.0):
-    rf = 42.5
-    drf = 0.0579
-    # use moisture directly instead of converting to/from ffmc
-    # expects any rain intercept to already be applied
-    mo = lastmc
-    if rain != 0.0:
-        # duplicated in both formulas, so calculate once
-        # lastmc == mo, but use lastmc since mo changes after first equation
-        mo += rf * rain * exp(-100.0 / (251 - lastmc)) * (1.0 - exp(-6.93 / rain))
-        if lastmc > 150:
-            mo += 0.0015 * pow(lastmc - 150, 2) * sqrt(rain)
-        if mo > 250.0: 
-            mo = 250.0
-    # duplicated in both formulas, so calculate once
-    e1 = 0.18 * (21.1 - temp) * (1.0 - (exp(-0.115 * rh)))
-    ed = 0.942 * pow(rh, 0.679) + (11.0 * exp((rh - 100) / 10.0)) + e1
-    ew = 0.618 * pow(rh, 0.753) + (10.0 * exp((rh - 100) / 10.0)) + e1
-    m = ew if (mo < ed) else ed
-    if mo != ed:
-        # these are the same formulas with a different value for a1
-        a1 = (rh / 100.0) if (mo > ed) else ((100.0 - rh) / 100.0)
-        k0_or_k1 = 0.424 * (1 - pow(a1, 1.7)) + (0.0694 * sqrt(ws) * (1 - pow(a1, 8)))
-        kd_or_kw = 2.0 * drf * k0_or_k1 * exp(0.0365 * temp)
-        m += (mo - m) * pow(10, (-kd_or_kw * time_increment))
-    return m
-
-##
-# Calculate duff moisture content
-#
-# @param last_mcdmc             Previous duff moisture content (%)
-# @param hr                     Time of day (hr)
-# @param temp                   Temperature (Celcius)
-# @param rh                     Relative Humidity (%)
-# @param prec                   Hourly precipitation (mm)
-# @param sunrise                Sunrise (hr)
-# @param sunset                 Sunset (hr)
-# @param prec_cumulative_prev   Cumulative precipitation since start of rain (mm)
-# @param time_increment         Duration of timestep (hr, default 1.0)
-# @return                       Hourly duff moisture content (%)
-def duff_moisture_code(
-    last_mcdmc,
-    hr,
-    temp,
-    rh,
-    prec,
-    sunrise,
-    sunset,
-    prec_cumulative_prev,
-    time_increment = 1.0  # duration of timestep, in hours
-):
-    # wetting
-    if prec_cumulative_prev + prec > DMC_INTERCEPT:  # prec_cumulative above threshold
-        if prec_cumulative_prev <= DMC_INTERCEPT:  # just passed threshold
-            rw = (prec_cumulative_prev + prec) * 0.92 - 1.27
-        else:  # previously passed threshold
-            rw = prec * 0.92
-        
-        last_dmc = mcdmc_to_dmc(last_mcdmc)
-        if last_dmc <= 33:
-            b = 100.0 / (0.3 * last_dmc + 0.5)
-        elif last_dmc <= 65:
-            b = -1.3 * log(last_dmc) + 14.0
-        else:
-            b = 6.2 * log(last_dmc) - 17.2
-        
-        mr = last_mcdmc + (1e3 * rw) / (b * rw + 48.77)
-    else:  # prec_cumulative below threshold
-        mr = last_mcdmc
-    
-    if mr > 300.0:
-        mr = 300.0
-    
-    # drying
-    # since sunset can be > 24, check hr + 24 (ignoring change between days)
-    if (sunrise <= hr <= sunset or
-        (hr < 6 and sunrise <= hr + 24 <= sunset)):  # daytime
-        if temp < 0:
-            temp = 0.0
-        rk = DMC_REGRESSION * (temp + DMC_OFFSET_TEMP) * (100.0 - rh)
-        invtau = rk / 43.43
-        mcdmc = (mr - 20.0) * exp(-time_increment * invtau) + 20.0
-    else:  # nighttime
-        mcdmc = mr
-    
-    if mcdmc > 300.0:
-        mcdmc = 300.0
-    
-    return(mcdmc)
-
-##
-# Calculate drought code moisture content
-#
-# @param last_mcdc              Previous drought code moisture content (%)
-# @param hr                     Time of day (hr)
-# @param temp                   Temperature (Celcius)
-# @param prec                   Hourly precipitation (mm)
-# @param sunrise                Sunrise (hr)
-# @param sunset                 Sunset (hr)
-# @param prec_cumulative_prev   Cumulative precipitation since start of rain (mm)
-# @param time_increment         Duration of timestep (hr, default 1.0)
-# @return                       Hourly drought code moisture content (%)
-def drought_code(
-    last_mcdc,
-    hr,
-    temp,
-    prec,
-    sunrise,
-    sunset,
-    prec_cumulative_prev,
-    time_increment = 1.0
-):
-    # wetting
-    if prec_cumulative_prev + prec > DC_INTERCEPT:  # prec_cumulative above threshold
-        if prec_cumulative_prev <= DC_INTERCEPT:  # just passed threshold
-            rw = (prec_cumulative_prev + prec) * 0.83 - 1.27
-        else:  # previously passed threshold
-            rw = prec * 0.83
-        mr = last_mcdc + 3.937 * rw / 2.0
-    else:
-        mr = last_mcdc
-    
-    if mr > 400.0:
-        mr = 400.0
-    
-    # drying
-    # since sunset can be > 24, check hr + 24 (ignoring change between days)
-    if (sunrise <= hr <= sunset or
-        (hr < 6 and sunrise <= hr + 24 <= sunset)):  # daytime
-        if temp > 0:
-            pe = DC_REGRESSION * (temp + DC_OFFSET_TEMP) + 3.0 / 16.0
-        else:
-            pe = 0
-        invtau = pe / 400.0
-        mcdc = mr * exp(-time_increment * invtau)
-    else:  # nighttime
-        mcdc = mr
-
-    if mcdc > 400.0:
-        mcdc = 400.0
-    
-    return(mcdc)
-
-##
-# Calculate Initial Spread Index (ISI)
-#
-# @param wind            Wind Speed (km/h)
-# @param ffmc            Fine Fuel Moisure Code
-# @return                Initial Spread Index
-def initial_spread_index(ws, ffmc):
-    fm = ffmc_to_mcffmc(ffmc)
-    fw = (12 * (1 - exp(-0.0818 * (ws - 28)))) if (40 <= ws) else exp(0.05039 * ws)
-    ff = 91.9 * exp(-0.1386 * fm) * (1.0 + fm**5.31 / 4.93e07)
-    isi = 0.208 * fw * ff
-    return isi
-
-##
-# Calculate Build-up Index (BUI)
-#
-# @param dmc             Duff Moisture Code
-# @param dc              Drought Code
-# @return                Build-up Index
-def buildup_index(dmc, dc):
-    bui = 0.0 if (0 == dmc and 0 == dc) else (0.8 * dc * dmc / (dmc + 0.4 * dc))
-    if bui < dmc:
-        p = (dmc - bui) / dmc
-        cc = 0.92 + pow(0.0114 * dmc, 1.7)
-        bui = dmc - cc * p
-        if bui <= 0:
-            bui = 0.0
-    return bui
-
-##
-# Calculate Fire Weather Index (FWI)
-#
-# @param isi             Initial Spread Index
-# @param bui             Build-up Index
-# @return                Fire Weather Index
-def fire_weather_index(isi, bui):
-    if bui > 80:
-        bb = 0.1 * isi * 1000 / (25 + 108.64 / exp(0.023 * bui))
-    else:
-        bb = 0.1 * isi * (0.626 * pow(bui, 0.809) + 2)
-    fwi = bb if bb <= 1 else exp(2.72 * pow(0.434 * log(bb), 0.647))
-    return fwi
-
+# Outputs that can be selected with hFWI(outputs = ...) and the outputs each one needs
+OUTPUT_DEPENDENCIES = {
+    "mcffmc": [],
+    "ffmc": ["mcffmc"],
+    "dmc": [],
+    "dc": [],
+    "isi": ["ffmc"],
+    "bui": ["dmc", "dc"],
+    "fwi": ["isi", "bui"],
+    "dsr": ["fwi"],
+    "mcgfmc_matted": ["mcgfmc_standing"],  # matted and standing are both kept for the
+    "mcgfmc_standing": ["mcgfmc_matted"],  # matted to standing transition
+    "gfmc": ["mcgfmc_matted"],
+    "gsi": ["mcgfmc_matted"],
+    "gfwi": ["gsi"]
+}
+OUTPUTS_FWI = ["ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr"]
+OUTPUTS_GRASS = ["gfmc", "gsi", "gfwi"]
 
-def daily_severity_rating(fwi):
-    return 0.0272 * pow(fwi, 1.77)
-
-##
-# Calculate hourly grassland fuel moisture content. Needs to be converted to get GFMC.
-#
-# @param lastmc          Previous grassland fuel moisture content (percent)
-# @param temp            Temperature (Celcius)
-# @param rh              Relative Humidity (percent, 0-100)
-# @param ws              Wind Speed (km/h)
-# @param rain            Rainfall (mm)
-# @param solrad          Solar radiation (kW/m^2)
-# @param load            Grassland Fuel Load (kg/m^2)
-# @param time_increment  Duration of timestep (hr, default 1.0)
-# @return                Grassland fuel moisture content (percent)
-def hourly_grass_fuel_moisture(
-    lastmc,
-    temp,
-    rh,
-    ws,
-    rain,
-    solrad,
-    load,
-    time_increment = 1.0
-):
-
-    rf = 0.27
-    drf = 0.389633
-    # use moisture directly instead of converting to/from ffmc
-    # expects any rain intercept to already be applied
-    mo = lastmc
-    if rain != 0.0:
-        mo += rain / load * 100.0
-        if mo > 250:
-            mo = 250.0
-    # fuel temp from CEVW
-    tf = temp + 17.9 * solrad * exp(-0.034 * ws)
-    # fuel humidity
-    if tf > temp:
-        rhf = (rh * 6.107 * pow(10.0, 7.5 * temp / (temp + 237.0)) /
-            (6.107 * pow(10.0, 7.5 * tf / (tf + 237.0))))
-    else:
-        rhf = rh
-    # 18.85749879,18.85749879,7.77659602,21.24361786,19.22479551,19.22479551
-    # duplicated in both formulas, so calculate once
-    e1 = rf * (26.7 - tf) * (1.0 - (1.0 / exp(0.115 * rhf)))
-    # GRASS EMC
-    ed = 1.62 * pow(rhf, 0.532) + (13.7 * exp((rhf - 100) / 13.0)) + e1
-    ew = 1.42 * pow(rhf, 0.512) + (12.0 * exp((rhf - 100) / 18.0)) + e1
-    
-    moed = mo - ed
-    moew = mo - ew
-    
-    e = None
-    a1 = None
-    m = None
-    moe = None
-    
-    if (moed == 0) or (moew >= 0 and moed < 0):
-        m = mo
-        if (moed == 0):
-            e = ed
-        if moew >= 0:
-            e = ew
-    else:
-        if moed > 0:
-            a1 = rhf / 100.0
-            e = ed
-            moe = moed
-        else:
-            a1 = (100.0 - rhf) / 100.0
-            e = ew
-            moe = moew
-        if (a1 < 0):
-            # avoids complex number in a1^1.7 xkd calculation
-            a1 = 0
-        xkd = (0.424 * (1 - a1 ** 1.7) + (0.0694 * sqrt(ws) * (1 - a1 ** 8)))
-        xkd = xkd * drf * exp(0.0365 * tf)
-        m = e + moe * exp(-1.0 * log(10.0) * xkd * time_increment)
-    return m
-
-def Pign(mc, wind2m, Cint, Cmc, Cws):
-    #  Thisd is the general standard form for the probability of sustained flaming models for each FF cover type
-    #     here :
-    #       mc is cured moisture (%) in the litter fuels being ignited
-    #       wind2m (km/h)  is the estimated 2 metre standard height for wind at hte site of the fire ignition
-    #       Cint, Cmc and Cws   are coefficients for the standard Pign model form for a given FF cover type
-
-    #       return >> is the Probability of Sustained flaming from a single small flaming ember/brand
-    Prob = 1.0 / (1.0 + exp(-1.0 * (Cint + Cmc * mc + Cws * wind2m)))
-    return Prob
-
-def curing_factor(cur):
-    # cur is the percentage cure of the grass fuel complex.  100= fully cured
-    #   ....The OPPOSITE (100-x) of greenness...
-
-    #    This is the Cruz et al (2015) model with the original precision of the coefficent estimates
-    #    and as in CSIRO code:https://research.csiro.au/spark/resources/model-library/csiro-grassland-models/
-    cf = (1.036 / (1 + 103.989 * exp(-0.0996 * (cur - 20)))) if (cur >= 20.0) else 0.0
-    return cf
-
-def mcgfmc_to_gfmc(mc, cur, wind):
-    #   THIS is the way to get the CODE value from cured grassland moisture
-    #     IT takes fully cured grass moisture  (from the grass moisture model (100% cured)  (from the FMS...updated version of Wotton 2009)
-    #        and a estimate of the fuel complex curing (as percent cured)
-    #        and estimated wind speed (necessary for a calc
-    #     and calculated the probability of sustainable flaming ignition  (a funciton of MC  and wind)
-    #     THEN it accounts for curing effect on probability of fire spread sustainability, using the curing factor from Cruz et al (2015) for grass
-    #     THEN from this calcuates an 'effective moisture content' which is the moisture content that would be required to achieve
-    #        the curing adjusted probabiltiy of sustained flaming if one were calcuating it directly through the standard Pign equation.
-    #     and THEN converts this effective moisture content to a CODE value via the FF-scale the FFMC uses for consistency
-
-    #     relies on models of:
-    #        Prob of sustained flaming for grass model (PsusF(grass)
-    #        and  the curing_factor  function
-    #        AND and estiamte of open 10 m to 2 m wind reduction (0.75)...hardcoded in here now.....
-
-    # MC is moisture content (%)
-    # cur=percent curing of the grassland  (%)
-    # wind=  10 m open wind (km/h)
-
-    #     currently (NOv 2023) the coefficients for the PsusF(grass) models are hardcoded into the GFMC function
-
-    wind2m_open_factor = 0.75
-
-    Intercept = 1.49
-    Cmoisture = -0.11
-    Cwind = 0.075
-    # GRASS: these coefficients (above) could change down the road .....explicitly coded in above*/
-    # /* convert from 10 m wind in open to 2 m wind in open COULD be updated */
-    wind2m = wind2m_open_factor * wind
-
-    probign = Pign(mc, wind2m, Intercept, Cmoisture, Cwind)
-
-    # /* adjust ignition diretctly with the curing function on ROS */
-    newPign = curing_factor(cur) * probign
-
-    # /* now to back calc effective moisture - algebraically reverse the Pign equation*/
-    # /* 250 is a saturation value just a check*/
-    egmc = (
-        ((log(newPign / (1.0 - newPign)) - Intercept - Cwind * wind2m) / Cmoisture)
-        if (newPign > 0.0)
-        else 250
-    )
-
-    if egmc > 250.0:
-        egmc = 250.0
-    return mcffmc_to_ffmc(egmc)
-
-def matted_grass_spread_ROS(ws, mc, cur):
-    #  /*  CUT grass  Rate  of spread from cheney 1998  (and new CSIRO grassland code
-    #   We use this for MATTED grass in our post-winter context
-    #   --ws=10 m open wind km/h
-    #   --mc = moisture content in  cured grass  (%)
-    #   --cur = percentage of grassland cured  (%)
-    #   output should be ROS in m/min   */
-    fw = 16.67 * (
-        (0.054 + 0.209 * ws) if (ws < 5) else (1.1 + 0.715 * (ws - 5.0) ** 0.844)
-    )
-    fm = (
-        exp(-0.108 * mc)
-        if mc < 12
-        else (
-            0.6838 - 0.0342 * mc
-            if (mc < 20.0 and ws < 10.0)
-            else 0.547 - 0.0228 * mc
-            if (mc < 23.9 and ws >= 10.0)
-            else 0.0
-        )
-    )
-    if (fm < 0):
-      fm = 0.0
-    cf = curing_factor(cur)
-    return fw * fm * cf
-
-def standing_grass_spread_ROS(ws, mc, cur):
-    #  /*  standing grass  Rate  of spread from cheney 1998  (and new CSIRO grassland code)
-    #   We use this for standing grass in our post-winter context
-    #   ITS only the WIND function that chnges here between cut and standing
-    #   --ws=10 m open wind km/h
-    #   --mc = moisture content in grass  (%)
-    #   --cur = percentage of grassland cured  (%)
-    #   output should be ROS in m/min   */
-    fw = 16.67 * (
-        (0.054 + 0.269 * ws) if (ws < 5) else (1.4 + 0.838 * (ws - 5.0) ** 0.844)
-    )
-    fm = (
-        exp(-0.108 * mc)
-        if mc < 12
-        else (
-            0.6838 - 0.0342 * mc
-            if (mc < 20.0 and ws < 10.0)
-            else 0.547 - 0.0228 * mc
-            if (mc < 23.9 and ws >= 10.0)
-            else 0.0
-        )
-    )
-    if (fm < 0):
-      fm = 0.0
-    cf = curing_factor(cur)
-    return fw * fm * cf
-
-##
-# Calculate Grassland Spread Index (GSI)
-#
-# @param ws              Wind Speed (km/h)
-# @param mc              Grass moisture content (percent)
-# @param cur             Degree of curing (percent, 0-100)
-# @param standing        Grass standing (True/False)
-# @return                Grassland Spread Index
-def grass_spread_index(ws, mc, cur, standing):
-    #  So we don't have to transition midseason between standing and matted grass spread rate models
-    #  We will simply scale   GSI   by the average of the   matted and standing spread rates
-    
-    #now allowing switch between standing and matted grass
-    ros = None
-    if (standing):
-      #standing
-      ros = standing_grass_spread_ROS(ws, mc, cur)
-    
-    else:
-      #matted
-      ros = matted_grass_spread_ROS(ws, mc, cur)
-    
-    
-    return 1.11 * ros
+### Functions ###
 
 ##
-# Calculate Grassland Fire Weather Index
+# Find every output needed to calculate the selected outputs
 #
-# @param gsi               Grassland Spread Index
-# @param load              Grassland Fuel Load (kg/m^2)
-# @return                  Grassland Fire Weather Index
-def grass_fire_weather_index(gsi, load):
-    # this just converts back to ROS in m/min
-    ros = gsi / 1.11
-    Fint = 300.0 * load * ros
-    if Fint > 100:
-        return(log(Fint / 60.0) / 0.14)
-    else:
-        return(Fint / 25.0)
-
-# Calculate number of drying "units" this hour contributes
-def drying_units():  # temp, rh, ws, rain, solrad
-    # for now, just add 1 drying "unit" per hour
-    return 1.0
-
-def rain_since_intercept_reset(rain, canopy):
-    # for now, want 5 "units" of drying (which is 1 per hour to start)
-    TARGET_DRYING_SINCE_INTERCEPT = 5.0
-    if rain > 0 or canopy["rain_total_prev"] == 0:  # if raining, reset drying
-        canopy["drying_since_intercept"] = 0.0
-    else:
-        canopy["drying_since_intercept"] += drying_units()
-        if canopy["drying_since_intercept"] >= TARGET_DRYING_SINCE_INTERCEPT:
-            # reset rain if intercept reset criteria met
-            canopy["rain_total_prev"] = 0.0
-            canopy["drying_since_intercept"] = 0.0
-    return canopy
+# @param    outputs     output names (keys of OUTPUT_DEPENDENCIES), None for all
+# @return               set of output names to calculate
+def resolve_outputs(outputs = None):
+    if outputs is None:
+        return set(OUTPUT_DEPENDENCIES)
+    if isinstance(outputs, str):
+        outputs = [outputs]
+    need = set()
+    todo = [o.lower() for o in outputs]
+    while len(todo) > 0:
+        o = todo.pop()
+        if not o in OUTPUT_DEPENDENCIES:
+            raise ValueError("Unknown output " + o + ", choose from " +
+                ", ".join(OUTPUT_DEPENDENCIES))
+        if not o in need:
+            need.add(o)
+            todo.extend(OUTPUT_DEPENDENCIES[o])
+    return need
 
 ##
 # Calculate hourly FWI indices from hourly weather stream for a single station
@@ -560,7 +114,10 @@ def rain_since_intercept_reset(rain, canopy):
 # @param    mcgfmc_standing_old previous value for standing mcgfmc
 # @param    prec_cumulative     cumulative precipitation this rainfall
 # @param    canopy_drying       consecutive hours of no rain
+# @param    outputs             outputs to calculate (default None for all, see hFWI())
+# @param    params              Parameters (default None for the globals)
 # @return                       hourly values FWI and weather stream
+@timing.timed()
 def _stnHFWI(
     w,
     ffmc_old,
@@ -570,8 +127,11 @@ def _stnHFWI(
     mcgfmc_matted_old,
     mcgfmc_standing_old,
     prec_cumulative,
-    canopy_drying
+    canopy_drying,
+    outputs = None,
+    params = None
 ):
+    need = resolve_outputs(outputs)
     if not CONTINUOUS_MULTIYEAR and len(w["yr"].unique()) != 1:
         logger.warning("WARNING: _stnHFWI() function received more than one year")
     if not util.is_sequential_hours(w):
@@ -584,7 +144,7 @@ def _stnHFWI(
         raise RuntimeError("Expected a single longitude (long) each station year")
     if len(w["timezone"].unique()) != 1:
         raise RuntimeError("Expected a single UTC offset (timezone) each station year")
-    if len(w["grass_fuel_load"].unique()) != 1:
+    if "mcgfmc_matted" in need and len(w["grass_fuel_load"].unique()) != 1:
         raise RuntimeError("Expected a single grass_fuel_load value each station year")
     r = w.copy()
     if mcffmc_old == None or mcffmc_old == "None":
@@ -606,108 +166,129 @@ def _stnHFWI(
         "drying_since_intercept": canopy_drying}
     # transition btwn matted and standing grassland fuel
     # does not account for fire seasons continuous across multiple years
-    DATE_GRASS_STANDING = datetime.date(r.at[0, "yr"], MON_STANDING, DAY_STANDING)
-    if DATE_GRASS_STANDING < r.at[0, "date"]:  # use next year if date already passed
-        DATE_GRASS_STANDING = datetime.date(r.at[0, "yr"] + 1,
-            MON_STANDING, DAY_STANDING)
-    results = []
-    for i in range(len(r)):
-        cur = r.iloc[i].to_dict()
-        canopy = rain_since_intercept_reset(cur["prec"], canopy)
-        # determine rain for ffmc and whether or not intercept should happen now
-        if canopy["rain_total_prev"] + cur["prec"] <= FFMC_INTERCEPT:  # not enough rain
-            rain_ffmc = 0.0
-        elif canopy["rain_total_prev"] > FFMC_INTERCEPT:  # already saturated canopy
-            rain_ffmc = cur["prec"]
-        else:
-            rain_ffmc = canopy["rain_total_prev"] + cur["prec"] - FFMC_INTERCEPT
-        mcffmc = hourly_fine_fuel_moisture(
-            mcffmc,
-            cur["temp"],
-            cur["rh"],
-            cur["ws"],
-            rain_ffmc
-        )
-        cur["mcffmc"] = mcffmc
-        # convert to code for output, but keep using moisture % for precision
-        cur["ffmc"] = mcffmc_to_ffmc(mcffmc)
-        # not ideal, but at least encapsulates the code for each index
-        mcdmc = duff_moisture_code(
-            mcdmc,
-            cur["hr"],
-            cur["temp"],
-            cur["rh"],
-            cur["prec"],
-            cur["sunrise"],
-            cur["sunset"],
-            canopy["rain_total_prev"]
-        )
-        cur["dmc"] = mcdmc_to_dmc(mcdmc)
-        mcdc = drought_code(
-            mcdc,
-            cur["hr"],
-            cur["temp"],
-            cur["prec"],
-            cur["sunrise"],
-            cur["sunset"],
-            canopy["rain_total_prev"]
-        )
-        cur["dc"] = mcdc_to_dc(mcdc)
-        cur["isi"] = initial_spread_index(cur["ws"], cur["ffmc"])
-        cur["bui"] = buildup_index(cur["dmc"], cur["dc"])
-        cur["fwi"] = fire_weather_index(cur["isi"], cur["bui"])
-        cur["dsr"] = daily_severity_rating(cur["fwi"])
-        # done using canopy, can update for next step
-        canopy["rain_total_prev"] += cur["prec"]
-        # grass updates
-        mcgfmc_matted = hourly_grass_fuel_moisture(
-            mcgfmc_matted,
-            cur["temp"],
-            cur["rh"],
-            cur["ws"],
-            cur["prec"],
-            cur["solrad"],
-            cur["grass_fuel_load"]
-        )
-        #for standing grass we make a come very simplifying assumptions based on obs from the field (echo bay study):
-        #standing not really affected by rain -- to introduce some effect we introduce just a simplification of the FFMC Rain absorption function
-        #which averages 6% or so for rains  (<5mm...between 7% and 5%,    lower for larger rains)(NO intercept)
-        #AND the solar radiation exposure is less, and the cooling from the wind is stronger.  SO we assume there is effectively no extra
-        #heating of the grass from solar
-        #working at the margin like this should make a nice bracket for moisture between the matted and standing that users can use
-        #...reality will be in between the matt and stand
-        mcgfmc_standing = hourly_grass_fuel_moisture(
-            mcgfmc_standing,
-            cur["temp"],
-            cur["rh"],
-            cur["ws"],
-            cur["prec"] * 0.06,
-            0.0,
-            cur["grass_fuel_load"]
-        )        
+    DATE_GRASS_STANDING = grass_standing_date(r.at[0, "date"], params)
+    grass_transition = fwi_core.GRASS_TRANSITION if params is None else params.grass_transition
+    with timing.stage("_stnHFWI.loop", rows = len(r)):
+        results = []
+        for i in range(len(r)):
+            cur = r.iloc[i].to_dict()
+            canopy = rain_since_intercept_reset(cur["prec"], canopy)
+            if "mcffmc" in need:
+                # determine rain for ffmc and whether or not intercept should happen now
+                rain_ffmc = ffmc_effective_rain(canopy["rain_total_prev"], cur["prec"],
+                    params)
+                mcffmc = hourly_fine_fuel_moisture(
+                    mcffmc,
+                    cur["temp"],
+                    cur["rh"],
+                    cur["ws"],
+                    rain_ffmc
+                )
+                cur["mcffmc"] = mcffmc
+                # convert to code for output, but keep using moisture % for precision
+                cur["ffmc"] = mcffmc_to_ffmc(mcffmc)
+            if "dmc" in need:
+                # not ideal, but at least encapsulates the code for each index
+                mcdmc = duff_moisture_code(
+                    mcdmc,
+                    cur["hr"],
+                    cur["temp"],
+                    cur["rh"],
+                    cur["prec"],
+                    cur["sunrise"],
+                    cur["sunset"],
+                    canopy["rain_total_prev"],
+                    params = params
+                )
+                cur["dmc"] = mcdmc_to_dmc(mcdmc)
+            if "dc" in need:
+                mcdc = drought_code(
+                    mcdc,
+                    cur["hr"],
+                    cur["temp"],
+                    cur["prec"],
+                    cur["sunrise"],
+                    cur["sunset"],
+                    canopy["rain_total_prev"],
+                    params = params
+                )
+                cur["dc"] = mcdc_to_dc(mcdc)
+            if "isi" in need:
+                cur["isi"] = initial_spread_index(cur["ws"], cur["ffmc"])
+            if "bui" in need:
+                cur["bui"] = buildup_index(cur["dmc"], cur["dc"])
+            if "fwi" in need:
+                cur["fwi"] = fire_weather_index(cur["isi"], cur["bui"])
+            if "dsr" in need:
+                cur["dsr"] = daily_severity_rating(cur["fwi"])
+            # done using canopy, can update for next step
+            canopy["rain_total_prev"] += cur["prec"]
+            # grass updates
+            if "mcgfmc_matted" in need:
+                mcgfmc_matted = hourly_grass_fuel_moisture(
+                    mcgfmc_matted,
+                    cur["temp"],
+                    cur["rh"],
+                    cur["ws"],
+                    cur["prec"],
+                    cur["solrad"],
+                    cur["grass_fuel_load"]
+                )
+                #for standing grass we make a come very simplifying assumptions based on obs from the field (echo bay study):
+                #standing not really affected by rain -- to introduce some effect we introduce just a simplification of the FFMC Rain absorption function
+                #which averages 6% or so for rains  (<5mm...between 7% and 5%,    lower for larger rains)(NO intercept)
+                #AND the solar radiation exposure is less, and the cooling from the wind is stronger.  SO we assume there is effectively no extra
+                #heating of the grass from solar
+                #working at the margin like this should make a nice bracket for moisture between the matted and standing that users can use
+                #...reality will be in between the matt and stand
+                mcgfmc_standing = hourly_grass_fuel_moisture(
+                    mcgfmc_standing,
+                    cur["temp"],
+                    cur["rh"],
+                    cur["ws"],
+                    cur["prec"] * 0.06,
+                    0.0,
+                    cur["grass_fuel_load"]
+                )        
         
-        # check if matted to standing transition happened already
-        if GRASS_TRANSITION and cur["date"] < DATE_GRASS_STANDING:
-            standing = False
-            mcgfmc = mcgfmc_matted
-        else:
-            standing = True
-            mcgfmc = mcgfmc_standing
+                # check if matted to standing transition happened already
+                if grass_transition and cur["date"] < DATE_GRASS_STANDING:
+                    standing = False
+                    mcgfmc = mcgfmc_matted
+                else:
+                    standing = True
+                    mcgfmc = mcgfmc_standing
         
-        cur["mcgfmc_matted"] = mcgfmc_matted
-        cur["mcgfmc_standing"] = mcgfmc_standing
-        cur["gfmc"] = mcgfmc_to_gfmc(mcgfmc, cur["percent_cured"], cur["ws"])
-        cur["gsi"] = grass_spread_index(cur["ws"], mcgfmc, cur["percent_cured"], standing)
-        cur["gfwi"] = grass_fire_weather_index(cur["gsi"], cur["grass_fuel_load"])
-        # save wetting variables for timestep-by-timestep runs
-        cur["prec_cumulative"] = canopy["rain_total_prev"]
-        cur["canopy_drying"] = canopy["drying_since_intercept"]
-        # append results for this row
-        results.append(cur)
+                cur["mcgfmc_matted"] = mcgfmc_matted
+                cur["mcgfmc_standing"] = mcgfmc_standing
+                if "gfmc" in need:
+                    cur["gfmc"] = mcgfmc_to_gfmc(mcgfmc, cur["percent_cured"], cur["ws"])
+                if "gsi" in need:
+                    cur["gsi"] = grass_spread_index(cur["ws"], mcgfmc, cur["percent_cured"], standing)
+                if "gfwi" in need:
+                    cur["gfwi"] = grass_fire_weather_index(cur["gsi"], cur["grass_fuel_load"])
+            # save wetting variables for timestep-by-timestep runs
+            cur["prec_cumulative"] = canopy["rain_total_prev"]
+            cur["canopy_drying"] = canopy["drying_since_intercept"]
+            # append results for this row
+            results.append(cur)
     
-    r = pd.DataFrame(results)
+    with timing.stage("_stnHFWI.assembly", rows = len(results)):
+        r = pd.DataFrame(results)
     return r
 
+##
+# hFWI() of one group in a worker process, splitting it the same way as the caller
+#
+# @param    w                   hourly values weather stream of a station (year)
+# @param    continuous          CONTINUOUS_MULTIYEAR of the caller
+# @param    kwargs              other arguments of hFWI()
+# @return                       hFWI(w, **kwargs)
+def _hfwi_group(w, continuous, **kwargs):
+    global CONTINUOUS_MULTIYEAR
+    CONTINUOUS_MULTIYEAR = continuous
+    return hFWI(w, **kwargs)
+
 ##
 # Calculate hourly FWI indices from hourly weather stream.
 #
@@ -723,102 +304,157 @@ def _stnHFWI(
 # @param    canopy_drying       consecutive hours of no rain (default 0)
 # @param    silent              suppresses informative print statements (default False)
 # @param    round_out           decimals to truncate output to, None for none (default 4)
+# @param    compact             float32 values, categorical id and an integer time index
+#                               instead of datetime objects (see util.compact) (default False)
+# @param    outputs             outputs to calculate, e.g. OUTPUTS_FWI or ["ffmc", "isi"],
+#                               along with the outputs they need (see OUTPUT_DEPENDENCIES),
+#                               None for all (default None)
+#                               sunrise/sunset are skipped if DMC, DC and grass aren't needed,
+#                               and solrad and percent_cured if grass isn't needed
+# @param    params              model constants (fwi_core.Parameters) to use instead of
+#                               the globals, default None (the startup values are
+#                               still the arguments above, see sweep.py to also vary them)
+# @param    workers             processes to run the station years in (see parallel.py),
+#                               0 for one per CPU, default None to run them here one at
+#                               a time
+# @param    executor            concurrent.futures executor to run the station years in
+#                               instead of a new process pool (default None)
 # @return                       hourly values FWI and weather stream
+@timing.timed()
 def hFWI(
     df_wx,
     timezone = None,
-    ffmc_old = FFMC_DEFAULT,
+    ffmc_old = fwi_core.FFMC_DEFAULT,
     mcffmc_old = None,
-    dmc_old = DMC_DEFAULT,
-    dc_old = DC_DEFAULT,
-    mcgfmc_matted_old = ffmc_to_mcffmc(FFMC_DEFAULT),
-    mcgfmc_standing_old = ffmc_to_mcffmc(FFMC_DEFAULT),
+    dmc_old = fwi_core.DMC_DEFAULT,
+    dc_old = fwi_core.DC_DEFAULT,
+    mcgfmc_matted_old = ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT),
+    mcgfmc_standing_old = ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT),
     prec_cumulative = 0.0,
     canopy_drying = 0,
     silent = False,
-    round_out = 4
+    round_out = 4,
+    compact = False,
+    outputs = None,
+    params = None,
+    workers = None,
+    executor = None
 ):
     if not silent:
         print("\n########\nFWI2025 (" + util.version() + ")\n")
+
+    if workers is not None or executor is not None:
+        # every station year (or station) is independent, so each runs through hFWI()
+        # in a worker and the results are put back together in input order
+        wx = df_wx.rename(columns = str.lower)
+        split = ["id"] if CONTINUOUS_MULTIYEAR else ["id", "yr"]
+        split = [col for col in split if col in wx.columns]
+        if not silent:
+            print("Running " + str(len(wx.groupby(split, sort = False)) if split else 1) +
+                " station " + ("" if CONTINUOUS_MULTIYEAR else "year ") + "groups in " +
+                ("the executor" if executor is not None else str(workers) + " processes"))
+        results = parallel.map_groups(_hfwi_group, df_wx, [wx[col] for col in split],
+            workers, executor, args = (CONTINUOUS_MULTIYEAR,), kwargs = dict(
+                timezone = timezone, ffmc_old = ffmc_old, mcffmc_old = mcffmc_old,
+                dmc_old = dmc_old, dc_old = dc_old,
+                mcgfmc_matted_old = mcgfmc_matted_old,
+                mcgfmc_standing_old = mcgfmc_standing_old,
+                prec_cumulative = prec_cumulative, canopy_drying = canopy_drying,
+                silent = True, round_out = round_out, outputs = outputs,
+                params = params))
+        with timing.stage("hFWI.assembly", rows = len(df_wx)):
+            results = pd.concat(results, ignore_index = True)
+        if compact:
+            with timing.stage("hFWI.compact", rows = len(results)):
+                results = util.compact(results)
+        if not silent:
+            print("########\n")
+        return results
     
-    wx = df_wx.copy()
-    # make all column names lower case
-    wx.columns = map(str.lower, wx.columns)
-    og_names = wx.columns
-    # check for required columns
-    req_cols = ["lat", "long", "yr", "mon", "day", "hr", "temp", "rh", "ws", "prec"]
-    for col in req_cols:
-        if not col in wx.columns:
-            raise RuntimeError("Missing required input column: " + col)
-    # check timezone
-    if timezone == None:
-        if not "timezone" in wx.columns:
-            raise RuntimeError("Either provide a timezone column or " +
-                "specify argument in hFWI()")
-    else:
-        wx["timezone"] = float(timezone)
-    # check for optional columns that have a default
-    had_stn = "id" in og_names
-    had_minute = "minute" in og_names
-    if not had_stn:
-        wx["id"] = "STN"
-    if not had_minute:
-        wx["minute"] = 0
-    # check for optional columns that can be calculated
-    had_timestamp = "timestamp" in og_names
-    had_date = "date" in og_names
-    if not had_timestamp:
-        wx["timestamp"] = wx.apply(
-            lambda row: datetime.datetime(
-                row["yr"], row["mon"], row["day"], row["hr"], row["minute"]
-                ), axis=1
-            )
-    if not had_date:
-        wx["date"] = wx["timestamp"].apply(lambda ts: ts.date())
-    if not "grass_fuel_load" in og_names:
-        wx["grass_fuel_load"] = DEFAULT_GRASS_FUEL_LOAD
-    if not "percent_cured" in og_names:
-        wx["percent_cured"] = wx.apply(lambda row:
-            util.seasonal_curing(row["yr"], row["mon"], row["day"]), axis = 1)
-    if not "solrad" in wx.columns:
-        needs_solrad = True
-    else:
-        needs_solrad = False
+    with timing.stage("hFWI.prep", rows = len(df_wx)):
+        need = resolve_outputs(outputs)
+        needs_grass = "mcgfmc_matted" in need
+        needs_sunlight = needs_grass or "dmc" in need or "dc" in need
+        wx = df_wx.copy()
+        # make all column names lower case
+        wx.columns = map(str.lower, wx.columns)
+        og_names = wx.columns
+        # check for required columns
+        req_cols = ["lat", "long", "yr", "mon", "day", "hr", "temp", "rh", "ws", "prec"]
+        for col in req_cols:
+            if not col in wx.columns:
+                raise RuntimeError("Missing required input column: " + col)
+        # check timezone
+        if timezone == None:
+            if not "timezone" in wx.columns:
+                raise RuntimeError("Either provide a timezone column or " +
+                    "specify argument in hFWI()")
+        else:
+            wx["timezone"] = float(timezone)
+        # check for optional columns that have a default
+        had_stn = "id" in og_names
+        had_minute = "minute" in og_names
+        if not had_stn:
+            wx["id"] = "STN"
+        if not had_minute:
+            wx["minute"] = 0
+        # check for optional columns that can be calculated
+        had_timestamp = "timestamp" in og_names
+        had_date = "date" in og_names
+        if not had_timestamp:
+            wx["timestamp"] = wx.apply(
+                lambda row: datetime.datetime(
+                    row["yr"], row["mon"], row["day"], row["hr"], row["minute"]
+                    ), axis=1
+                )
+        if not had_date:
+            wx["date"] = wx["timestamp"].apply(lambda ts: ts.date())
+        if needs_grass and not "grass_fuel_load" in og_names:
+            wx["grass_fuel_load"] = (fwi_core.DEFAULT_GRASS_FUEL_LOAD if params is None
+                else params.default_grass_fuel_load)
+        if needs_grass and not "percent_cured" in og_names:
+            wx["percent_cured"] = wx.apply(lambda row:
+                util.seasonal_curing(row["yr"], row["mon"], row["day"]), axis = 1)
+        if needs_grass and not "solrad" in wx.columns:
+            needs_solrad = True
+        else:
+            needs_solrad = False
     # check for values outside valid ranges
-    if any(isinstance(tz, str) for tz in wx["timezone"]):
-        raise ValueError("UTC offset (timezone) should be a number, not a string")
-    if not (all(wx["rh"] >= 0) and all(wx["rh"] <= 100)):
-        raise ValueError("All relative humidity (rh) must be between 0-100%")
-    if not all(wx["ws"] >= 0):
-        raise ValueError("All wind speed (ws) must be >= 0")
-    if not all(wx["prec"] >= 0):
-        raise ValueError("All precipitation (prec) must be >= 0")
-    if not (all(wx["mon"] >= 1) and all(wx["mon"] <= 12)):
-        raise ValueError("All months (mon) must be between 1-12")
-    if (not needs_solrad) and (not all(wx["solrad"] >= 0)):
-        raise ValueError("All solar radiation (solrad) must be >= 0")
-    if ("percent_cured" in og_names) and (not (
-        all(wx["percent_cured"] >= 0) and all(wx["percent_cured"] <= 100))):
-        raise ValueError("All percent_cured must be between 0-100%")
-    if ("grass_fuel_load" in og_names) and (not (all(wx["grass_fuel_load"] > 0))):
-        raise ValueError("All grass_fuel_load must be > 0")
-    if not (all(wx["day"] >= 1) and all(wx["day"] <= 31)):
-        raise ValueError("All day must be 1-31")
-    if mcffmc_old == None or mcffmc_old == "None":
-        if ffmc_old == None or ffmc_old == "None":
-            raise ValueError("Either ffmc_old OR mcffmc_old should be None, not both")
-        elif not (0 <= ffmc_old <= 101):
-            raise ValueError("ffmc_old must be between 0-101")
-    else:
-        if ffmc_old == None or ffmc_old == "None":
-            if not (0 <= mcffmc_old <= 250):
-                raise ValueError("mcffmc_old must be between 0-250%")
+    with timing.stage("hFWI.validation", rows = len(wx)):
+        if any(isinstance(tz, str) for tz in wx["timezone"]):
+            raise ValueError("UTC offset (timezone) should be a number, not a string")
+        if not (all(wx["rh"] >= 0) and all(wx["rh"] <= 100)):
+            raise ValueError("All relative humidity (rh) must be between 0-100%")
+        if not all(wx["ws"] >= 0):
+            raise ValueError("All wind speed (ws) must be >= 0")
+        if not all(wx["prec"] >= 0):
+            raise ValueError("All precipitation (prec) must be >= 0")
+        if not (all(wx["mon"] >= 1) and all(wx["mon"] <= 12)):
+            raise ValueError("All months (mon) must be between 1-12")
+        if ("solrad" in og_names) and (not all(wx["solrad"] >= 0)):
+            raise ValueError("All solar radiation (solrad) must be >= 0")
+        if ("percent_cured" in og_names) and (not (
+            all(wx["percent_cured"] >= 0) and all(wx["percent_cured"] <= 100))):
+            raise ValueError("All percent_cured must be between 0-100%")
+        if ("grass_fuel_load" in og_names) and (not (all(wx["grass_fuel_load"] > 0))):
+            raise ValueError("All grass_fuel_load must be > 0")
+        if not (all(wx["day"] >= 1) and all(wx["day"] <= 31)):
+            raise ValueError("All day must be 1-31")
+        if mcffmc_old == None or mcffmc_old == "None":
+            if ffmc_old == None or ffmc_old == "None":
+                raise ValueError("Either ffmc_old OR mcffmc_old should be None, not both")
+            elif not (0 <= ffmc_old <= 101):
+                raise ValueError("ffmc_old must be between 0-101")
         else:
-            raise ValueError("One of ffmc_old OR mcffmc_old should be None, not neither")
-    if not (dmc_old >= 0):
-        raise ValueError("dmc_old must be >= 0")
-    if not (dc_old >= 0):
-        raise ValueError("dc_old must be >= 0")
+            if ffmc_old == None or ffmc_old == "None":
+                if not (0 <= mcffmc_old <= 250):
+                    raise ValueError("mcffmc_old must be between 0-250%")
+            else:
+                raise ValueError("One of ffmc_old OR mcffmc_old should be None, not neither")
+        if not (dmc_old >= 0):
+            raise ValueError("dmc_old must be >= 0")
+        if not (dc_old >= 0):
+            raise ValueError("dc_old must be >= 0")
     
     # print message with startup values used
     if not silent:
@@ -834,7 +470,7 @@ def hFWI(
             "mm and canopy drying =", canopy_drying, "\n")
     
     # loop over every station year if not continuous multiyear data
-    results = None
+    results = []
     split = ["id", "yr"]
     if CONTINUOUS_MULTIYEAR:
         split = ["id"]  # if continuous multiyear data, only split by ID
@@ -846,36 +482,46 @@ def hFWI(
             print("Running station " + str(idx[0]))
         logger.debug(f"Running for {idx}")
         w = by_year.reset_index(drop = True)
-        w = util.get_sunlight(w, get_solrad = needs_solrad)
+        if needs_sunlight:
+            w = util.get_sunlight(w, get_solrad = needs_solrad)
         r = _stnHFWI(w, ffmc_old, mcffmc_old, dmc_old, dc_old,
             mcgfmc_matted_old, mcgfmc_standing_old,
-            prec_cumulative, canopy_drying)
-        results = pd.concat([results, r])
-    results.reset_index(drop = True, inplace = True)
+            prec_cumulative, canopy_drying, need, params)
+        results.append(r)
+    with timing.stage("hFWI.assembly", rows = len(wx)):
+        results = pd.concat(results)
+        results.reset_index(drop = True, inplace = True)
     
-    # remove optional variables that we added
-    if not had_stn:
-        results = results.drop(columns = "id")
-    if not had_minute:
-        results = results.drop(columns = "minute")
-    if not had_timestamp:
-        results = results.drop(columns = "timestamp")
-    if not had_date:
-        results = results.drop(columns = "date")
+        # remove optional variables that we added
+        if not had_stn:
+            results = results.drop(columns = "id")
+        if not had_minute:
+            results = results.drop(columns = "minute")
+        if not had_timestamp:
+            results = results.drop(columns = "timestamp")
+        if not had_date:
+            results = results.drop(columns = "date")
 
     # round decimal places of output columns
-    if not (round_out == None or round_out == "None"):
-        outcols = ["sunrise", "sunset", "sunlight_hours",
-            "mcffmc", "ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr",
-            "mcgfmc_matted", "mcgfmc_standing", "gfmc", "gsi", "gfwi",
-            "prec_cumulative", "canopy_drying"]
-        if "solrad" not in og_names:
-            outcols.insert(0, "solrad")
-        if "percent_cured" not in og_names:
-            outcols.insert(0, "percent_cured")
-        if "grass_fuel_load" not in og_names:
-            outcols.insert(0, "grass_fuel_load")
-        results[outcols] = results[outcols].map(round, ndigits = int(round_out))
+    with timing.stage("hFWI.rounding", rows = len(results)):
+        if not (round_out == None or round_out == "None"):
+            outcols = ["sunrise", "sunset", "sunlight_hours",
+                "mcffmc", "ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr",
+                "mcgfmc_matted", "mcgfmc_standing", "gfmc", "gsi", "gfwi",
+                "prec_cumulative", "canopy_drying"]
+            if "solrad" not in og_names:
+                outcols.insert(0, "solrad")
+            if "percent_cured" not in og_names:
+                outcols.insert(0, "percent_cured")
+            if "grass_fuel_load" not in og_names:
+                outcols.insert(0, "grass_fuel_load")
+            # only the selected outputs (and what they need) are calculated
+            outcols = [col for col in outcols if col in results.columns]
+            results[outcols] = results[outcols].map(round, ndigits = int(round_out))
+
+    if compact:
+        with timing.stage("hFWI.compact", rows = len(results)):
+            results = util.compact(results)
 
     if not silent:
         print("########\n")
@@ -890,19 +536,19 @@ if __name__ == "__main__":
     parser.add_argument("output", help = "Output csv file name and location")
     parser.add_argument("timezone", nargs = "?", default = None,
         help = "UTC offset (default None for column provided in input)")
-    parser.add_argument("ffmc_old", nargs = "?", default = FFMC_DEFAULT,
+    parser.add_argument("ffmc_old", nargs = "?", default = fwi_core.FFMC_DEFAULT,
         help = "Starting value for FFMC (startup 85, None for mcffmc_old)")
     parser.add_argument("mcffmc_old", nargs = "?", default = None,
         help = "Starting value for mcffmc (default None for ffmc_old input)")
-    parser.add_argument("dmc_old", nargs = "?", default = DMC_DEFAULT, type = float,
+    parser.add_argument("dmc_old", nargs = "?", default = fwi_core.DMC_DEFAULT, type = float,
         help = "Starting DMC (default 6)")
-    parser.add_argument("dc_old", nargs = "?", default = DC_DEFAULT, type = float,
+    parser.add_argument("dc_old", nargs = "?", default = fwi_core.DC_DEFAULT, type = float,
         help = "Starting DC (default 15)")
     parser.add_argument("mcgfmc_matted_old", nargs = "?",
-        default = ffmc_to_mcffmc(FFMC_DEFAULT), type = float,
+        default = ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT), type = float,
         help = "Starting mcgfmc for matted fuels (default mcffmc when FFMC = 85)")
     parser.add_argument("mcgfmc_standing_old", nargs = "?",
-        default = ffmc_to_mcffmc(FFMC_DEFAULT), type = float,
+        default = ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT), type = float,
         help = "Starting mcgfmc for standing fuels (default mcffmc when FFMC = 85)")
     parser.add_argument("prec_cumulative", nargs = "?", default = 0.0, type = float,
         help = "Cumulative precipitation of rain event (default 0)")
@@ -911,10 +557,15 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--silent", action = "store_true")
     parser.add_argument("-r", "--round_out", default = 4, nargs = "?",
         help = "Decimal places to truncate outputs to, None for no rounding (default 4)")
+    parser.add_argument("-o", "--outputs", nargs = "*", default = None,
+        help = "Outputs to calculate (default all): " + ", ".join(OUTPUT_DEPENDENCIES))
+    parser.add_argument("-w", "--workers", default = None, type = int,
+        help = "Processes to run station years in (default one at a time)")
 
     args = parser.parse_args()
     df_in = pd.read_csv(args.input)
     df_out = hFWI(df_in, args.timezone, args.ffmc_old, args.mcffmc_old,
         args.dmc_old, args.dc_old, args.mcgfmc_matted_old, args.mcgfmc_standing_old,
-        args.prec_cumulative, args.canopy_drying, args.silent, args.round_out)
+        args.prec_cumulative, args.canopy_drying, args.silent, args.round_out,
+        outputs = args.outputs, workers = args.workers)
     df_out.to_csv(args.output, index = False)
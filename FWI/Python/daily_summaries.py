@@ -2,12 +2,19 @@ import logging
 import argparse
 import pandas as pd
 import NG_FWI
+import fwi_core
+import parallel
+import timing
 import util
 import datetime
 
 logger = logging.getLogger("cffdrs")
 logger.setLevel(logging.WARNING)
 
+SUMMARY_COLUMNS = ["id", "yr", "mon", "day", "sunrise", "sunset", "peak_hr", "duration",
+  "ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr", "gfmc", "gsi", "gfwi",
+  "ws_smooth", "isi_smooth", "gsi_smooth"]
+
 
 def smooth_5pt(source):
   #binomial smoother  ... specifically for the 24 hour day
@@ -76,25 +83,126 @@ def pseudo_date(yr, mon, day, hr, reset_hr = 5):
   
   return "{}-{}".format(adjusted_yr, adjusted_jd)
 
+##
+# Daily summaries of one station (see generate_daily_summaries())
+# @param    by_stn          hourly FWI of the station
+# @param    reset_hr        new boundary to define day to summarize
+# @param    silent          suppresses informative print statements
+# @return                   dictionary of SUMMARY_COLUMNS -> list of daily values
+def _station_summaries(by_stn, reset_hr, silent = False):
+  stn = by_stn["id"].iloc[0]
+  Spread_Threshold_ISI = 5.0
+  results = {k: [] for k in SUMMARY_COLUMNS}
+  if not silent:
+    print("Summarizing " + str(stn) + " to daily")
+  by_stn["pseudo_DATE"] = by_stn.apply(lambda row:
+    pseudo_date(row["yr"], row["mon"], row["day"], row["hr"], reset_hr), axis = 1)
+  # first year for transition btwn matted and standing (esp if southern hemisphere)
+  DATE_GRASS_STANDING = datetime.date(by_stn.reset_index().at[0, "yr"],
+    fwi_core.MON_STANDING, fwi_core.DAY_STANDING)
+
+  for _, by_date in by_stn.groupby("pseudo_DATE", sort = False):
+    by_date = by_date.reset_index(drop = True)
+
+    # if this pseudo-date doesn't have more than 12 hours, skip
+    if by_date.shape[0] <= 12:
+      continue
+    
+    # find daily peak burn times
+    by_date["ws_smooth"] = smooth_5pt(by_date["ws"])
+    by_date["isi_smooth"] = by_date.apply(lambda row:
+      NG_FWI.initial_spread_index(row["ws_smooth"], row["ffmc"]), axis = 1)
+    
+    max_ffmc = by_date["ffmc"].max()
+    if max_ffmc < 85.0:
+      peak_time = 12  # 12 hours into pseudo-date
+    else:
+      peak_time = by_date["isi_smooth"].idxmax()
+    
+    # append date
+    results["id"].append(stn)
+    results["yr"].append(by_date.at[0, "yr"])
+    results["mon"].append(by_date.at[0, "mon"])
+    results["day"].append(by_date.at[0, "day"])
+    
+    # format sunrise and sunset as hh:mm from decimal hours
+    sr = by_date.at[peak_time, "sunrise"]
+    ss = by_date.at[peak_time, "sunset"]
+    results["sunrise"].append("{:02d}:{:02d}".format(int(sr),
+      int(60 * (sr - int(sr)))))
+    results["sunset"].append("{:02d}:{:02d}".format(int(ss),
+      int(60 * (ss - int(ss)))))
+    
+    # append hour of peak burn and active burning duration
+    results["peak_hr"].append(by_date.at[peak_time, "hr"])
+    # calculate duration of active burning window
+    if any(by_date["isi_smooth"] >= Spread_Threshold_ISI):
+      # find first and last hours of active burning
+      active_burning = by_date[by_date["isi_smooth"] >= Spread_Threshold_ISI]
+      t_ab0 = datetime.datetime(active_burning.iloc[0].yr,
+        active_burning.iloc[0].mon,
+        active_burning.iloc[0].day,
+        active_burning.iloc[0].hr)
+      t_ab1 = datetime.datetime(active_burning.iloc[-1].yr,
+        active_burning.iloc[-1].mon,
+        active_burning.iloc[-1].day,
+        active_burning.iloc[-1].hr)
+      results["duration"].append((t_ab1 - t_ab0).seconds // 3600 + 1)
+    else:
+      results["duration"].append(0)
+
+    # append outputs at peak burn
+    results["ffmc"].append(by_date.at[peak_time, "ffmc"])
+    results["dmc"].append(by_date.at[peak_time, "dmc"])
+    results["dc"].append(by_date.at[peak_time, "dc"])
+    results["isi"].append(by_date.at[peak_time, "isi"])
+    results["bui"].append(by_date.at[peak_time, "bui"])
+    results["fwi"].append(by_date.at[peak_time, "fwi"])
+    results["dsr"].append(by_date.at[peak_time, "dsr"])
+    results["gfmc"].append(by_date.at[peak_time, "gfmc"])
+    results["gsi"].append(by_date.at[peak_time, "gsi"])
+    results["gfwi"].append(by_date.at[peak_time, "gfwi"])
+    
+    results["ws_smooth"].append(by_date.at[peak_time, "ws_smooth"])
+    results["isi_smooth"].append(by_date.at[peak_time, "isi_smooth"])
+
+    d = datetime.date(by_date.at[0, "yr"], by_date.at[0, "mon"], by_date.at[0, "day"])
+    if fwi_core.GRASS_TRANSITION and d < DATE_GRASS_STANDING:
+      standing = False
+      mcgfmc = by_date.at[peak_time, "mcgfmc_matted"]
+    else:
+      standing = True
+      mcgfmc = by_date.at[peak_time, "mcgfmc_standing"]
+    results["gsi_smooth"].append(NG_FWI.grass_spread_index(
+      by_date.at[peak_time, "ws_smooth"], mcgfmc,
+      by_date.at[peak_time, "percent_cured"], standing))
+
+  return results
+
 ##
 # Calculate Daily Summaries from hourly FWI indices
 # @param    hourly_FWI      hourly FWI dataframe (output of hFWI())
 # @param    reset_hr        new boundary to define day to summarize (default 5)
 # @param    silent          suppresses informative print statements (default False)
 # @param    round_out       decimals to truncate output to, None for none (default 4)
+# @param    workers         processes to summarize the stations in (see parallel.py),
+#                           0 for one per CPU, default None to summarize them here
+# @param    executor        concurrent.futures executor to summarize the stations in
+#                           instead of a new process pool (default None)
 # @return                   daily summary of peak FWI conditions
+@timing.timed()
 def generate_daily_summaries(
   hourly_FWI,
   reset_hr = 5,
   silent = False,
-  round_out = 4
+  round_out = 4,
+  workers = None,
+  executor = None
 ):
   if not silent:
     print("\n########\nFWI2025: Daily Summaries (" + util.version() + ")\n")
 
   hourly_data = hourly_FWI.copy()
-  Spread_Threshold_ISI = 5.0
-
   # check for "id" column
   if "id" in hourly_data.columns:
     had_stn = True
@@ -107,107 +215,32 @@ def generate_daily_summaries(
     else:
       logger.error('Missing "id" column with multiple years and locations in data')
   
-  # initialize dictionary of lists
-  outcols = ["id", "yr", "mon", "day", "sunrise", "sunset", "peak_hr", "duration",
-    "ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr", "gfmc", "gsi", "gfwi",
-    "ws_smooth", "isi_smooth", "gsi_smooth"]
-  results = {k: [] for k in outcols}
-  
-  for stn, by_stn in hourly_data.groupby("id", sort = False):
+  if workers is not None or executor is not None:
     if not silent:
-      print("Summarizing " + str(stn) + " to daily")
-    by_stn["pseudo_DATE"] = by_stn.apply(lambda row:
-      pseudo_date(row["yr"], row["mon"], row["day"], row["hr"], reset_hr), axis = 1)
-    # first year for transition btwn matted and standing (esp if southern hemisphere)
-    DATE_GRASS_STANDING = datetime.date(by_stn.reset_index().at[0, "yr"],
-      NG_FWI.MON_STANDING, NG_FWI.DAY_STANDING)
-
-    for _, by_date in by_stn.groupby("pseudo_DATE", sort = False):
-      by_date = by_date.reset_index(drop = True)
-
-      # if this pseudo-date doesn't have more than 12 hours, skip
-      if by_date.shape[0] <= 12:
-        continue
-      
-      # find daily peak burn times
-      by_date["ws_smooth"] = smooth_5pt(by_date["ws"])
-      by_date["isi_smooth"] = by_date.apply(lambda row:
-        NG_FWI.initial_spread_index(row["ws_smooth"], row["ffmc"]), axis = 1)
-      
-      max_ffmc = by_date["ffmc"].max()
-      if max_ffmc < 85.0:
-        peak_time = 12  # 12 hours into pseudo-date
-      else:
-        peak_time = by_date["isi_smooth"].idxmax()
-      
-      # append date
-      results["id"].append(stn)
-      results["yr"].append(by_date.at[0, "yr"])
-      results["mon"].append(by_date.at[0, "mon"])
-      results["day"].append(by_date.at[0, "day"])
-      
-      # format sunrise and sunset as hh:mm from decimal hours
-      sr = by_date.at[peak_time, "sunrise"]
-      ss = by_date.at[peak_time, "sunset"]
-      results["sunrise"].append("{:02d}:{:02d}".format(int(sr),
-        int(60 * (sr - int(sr)))))
-      results["sunset"].append("{:02d}:{:02d}".format(int(ss),
-        int(60 * (ss - int(ss)))))
-      
-      # append hour of peak burn and active burning duration
-      results["peak_hr"].append(by_date.at[peak_time, "hr"])
-      # calculate duration of active burning window
-      if any(by_date["isi_smooth"] >= Spread_Threshold_ISI):
-        # find first and last hours of active burning
-        active_burning = by_date[by_date["isi_smooth"] >= Spread_Threshold_ISI]
-        t_ab0 = datetime.datetime(active_burning.iloc[0].yr,
-          active_burning.iloc[0].mon,
-          active_burning.iloc[0].day,
-          active_burning.iloc[0].hr)
-        t_ab1 = datetime.datetime(active_burning.iloc[-1].yr,
-          active_burning.iloc[-1].mon,
-          active_burning.iloc[-1].day,
-          active_burning.iloc[-1].hr)
-        results["duration"].append((t_ab1 - t_ab0).seconds // 3600 + 1)
-      else:
-        results["duration"].append(0)
-
-      # append outputs at peak burn
-      results["ffmc"].append(by_date.at[peak_time, "ffmc"])
-      results["dmc"].append(by_date.at[peak_time, "dmc"])
-      results["dc"].append(by_date.at[peak_time, "dc"])
-      results["isi"].append(by_date.at[peak_time, "isi"])
-      results["bui"].append(by_date.at[peak_time, "bui"])
-      results["fwi"].append(by_date.at[peak_time, "fwi"])
-      results["dsr"].append(by_date.at[peak_time, "dsr"])
-      results["gfmc"].append(by_date.at[peak_time, "gfmc"])
-      results["gsi"].append(by_date.at[peak_time, "gsi"])
-      results["gfwi"].append(by_date.at[peak_time, "gfwi"])
-      
-      results["ws_smooth"].append(by_date.at[peak_time, "ws_smooth"])
-      results["isi_smooth"].append(by_date.at[peak_time, "isi_smooth"])
-
-      d = datetime.date(by_date.at[0, "yr"], by_date.at[0, "mon"], by_date.at[0, "day"])
-      if NG_FWI.GRASS_TRANSITION and d < DATE_GRASS_STANDING:
-        standing = False
-        mcgfmc = by_date.at[peak_time, "mcgfmc_matted"]
-      else:
-        standing = True
-        mcgfmc = by_date.at[peak_time, "mcgfmc_standing"]
-      results["gsi_smooth"].append(NG_FWI.grass_spread_index(
-        by_date.at[peak_time, "ws_smooth"], mcgfmc,
-        by_date.at[peak_time, "percent_cured"], standing))
+      print("Summarizing " + str(len(hourly_data["id"].unique())) + " stations in " +
+        ("the executor" if executor is not None else str(workers) + " processes"))
+    by_station = parallel.map_groups(_station_summaries, hourly_data, ["id"],
+      workers, executor, args = (reset_hr,), kwargs = {"silent": True})
+  else:
+    by_station = [_station_summaries(by_stn, reset_hr, silent)
+      for _, by_stn in hourly_data.groupby("id", sort = False)]
+  results = {k: [] for k in SUMMARY_COLUMNS}
+  for r in by_station:
+    for k in SUMMARY_COLUMNS:
+      results[k].extend(r[k])
 
   if not had_stn:
     results.pop("id")
   
-  results = pd.DataFrame(results)
+  with timing.stage("generate_daily_summaries.assembly", rows = len(results["yr"])):
+    results = pd.DataFrame(results)
 
   # round decimal places of output columns
-  if not (round_out == None or round_out == "None"):
-    outcols = ["ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr",
-      "gfmc", "gsi", "gfwi", "ws_smooth", "isi_smooth", "gsi_smooth"]
-    results[outcols] = results[outcols].map(round, ndigits = int(round_out))
+  with timing.stage("generate_daily_summaries.rounding", rows = len(results)):
+    if not (round_out == None or round_out == "None"):
+      outcols = ["ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr",
+        "gfmc", "gsi", "gfwi", "ws_smooth", "isi_smooth", "gsi_smooth"]
+      results[outcols] = results[outcols].map(round, ndigits = int(round_out))
 
   if not silent:
       print("########\n")
@@ -226,8 +259,11 @@ if __name__ == "__main__":
   parser.add_argument("-s", "--silent", action = "store_true")
   parser.add_argument("-r", "--round_out", default = 4, nargs = "?",
     help = "Decimal places to truncate outputs to, None for no rounding (default 4)")
+  parser.add_argument("-w", "--workers", default = None, type = int,
+    help = "Processes to summarize stations in (default one at a time)")
   
   args = parser.parse_args()
   df_in = pd.read_csv(args.input)
-  df_out = generate_daily_summaries(df_in, args.reset_hr, args.silent, args.round_out)
+  df_out = generate_daily_summaries(df_in, args.reset_hr, args.silent, args.round_out,
+    args.workers)
   df_out.to_csv(args.output, index = False)
@@ -0,0 +1,239 @@
+# Ensemble forecasts of hourly FWI
+#
+# Forecasts of N ensemble members of daily min/max weather go through
+# minmax_to_hourly() and the hourly FWI recurrence with the members as an extra
+# axis: make_hourly.minmax_to_hourly_members() makes the hourly weather of every
+# member at once, every member of a station starts from the station's observed
+# state, and all members (of all stations covering the same days) are stepped
+# together one hour at a time with fwi_batch.step_batch(). The cost of a step
+# barely depends on the number of members, so 50 members take about as long as
+# one. The output summarizes the members by percentiles of each hour.
+#
+#   import ensemble
+#   summary = ensemble.ensemble_fwi(df_minmax, states = {"PRF": state})
+#
+# Unlike hFWI(), runs aren't restarted at the start of each year (the same as
+# fwi_core.step()), forecasts being short.
+
+### Import packages ###
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Import from other CFFDRS code files
+import fwi_batch
+import fwi_core
+import make_hourly
+import timing
+import util
+
+DEFAULT_PERCENTILES = [10, 25, 50, 75, 90]
+# outputs summarized by default
+SUMMARY_OUTPUTS = ["ffmc", "dmc", "dc", "isi", "bui", "fwi", "dsr",
+    "gfmc", "gsi", "gfwi"]
+WEATHER = ["temp", "rh", "ws", "prec"]
+
+##
+# Step every member of groups from minmax_to_hourly_members() through the hourly
+# FWI recurrence, adding the outputs (lanes, hours) to each group
+#
+# @param groups             list of dictionaries from minmax_to_hourly_members()
+# @param states             dictionary of station id -> fwi_core.StationState to
+#                           start its members from (e.g. state_store.to_station_state()
+#                           of its latest observed state), default None
+# @param ffmc_old           startup FFMC of stations not in states
+# @param dmc_old            startup DMC of stations not in states
+# @param dc_old             startup DC of stations not in states
+# @return                   groups
+def run_members(
+    groups,
+    states = None,
+    ffmc_old = fwi_core.FFMC_DEFAULT,
+    dmc_old = fwi_core.DMC_DEFAULT,
+    dc_old = fwi_core.DC_DEFAULT
+):
+    states = {} if states is None else states
+    default = fwi_core.initial_state(ffmc_old, dmc_old, dc_old)
+    for g in groups:
+        ids = [None] * len(g["member"]) if g["id"] is None else g["id"]
+        lanes = fwi_batch.StateArray.from_states(
+            [states.get(i, default) for i in ids])
+        n_lanes, n_hours = g["temp"].shape
+        with timing.stage("ensemble.steps", rows = n_lanes * n_hours):
+            hourly = {}
+            for h in range(n_hours):
+                lanes, out = fwi_batch.step_batch(lanes, {
+                    "date": g["date"][h], "hr": g["hr"][h],
+                    "lat": g["lat"], "long": g["long"], "timezone": g["timezone"],
+                    "sunrise": g["sunrise"][:, h], "sunset": g["sunset"][:, h],
+                    "temp": g["temp"][:, h], "rh": g["rh"][:, h],
+                    "ws": g["ws"][:, h], "prec": g["prec"][:, h]})
+                for k, v in out.items():
+                    hourly.setdefault(k, []).append(v)
+        for k, v in hourly.items():
+            g[k] = np.stack(v, axis = 1)
+        g["states"] = lanes
+    return groups
+
+##
+# Percentiles of the members of each station and hour
+#
+# @param groups             list of dictionaries from run_members()
+# @param percentiles        percentiles to calculate (default DEFAULT_PERCENTILES)
+# @param outputs            outputs (and weather) to summarize (default SUMMARY_OUTPUTS)
+# @param round_out          decimals to truncate output to, None for none (default 4)
+# @return                   dataframe with one row per station and hour, columns:
+#                           [id], lat, long, timezone, yr, mon, day, hr, members,
+#                           <output>_p<percentile> for each output and percentile
+def summarize(
+    groups,
+    percentiles = DEFAULT_PERCENTILES,
+    outputs = SUMMARY_OUTPUTS,
+    round_out = 4
+):
+    frames = []
+    for g in groups:
+        ids = np.repeat("", len(g["member"])) if g["id"] is None else g["id"]
+        dates = pd.DatetimeIndex(g["date"])
+        for stn in pd.unique(ids):
+            lanes = np.nonzero(ids == stn)[0]
+            first = lanes[0]
+            df = pd.DataFrame({
+                "id": stn,
+                "lat": g["lat"][first],
+                "long": g["long"][first],
+                "timezone": g["timezone"][first],
+                "yr": dates.year,
+                "mon": dates.month,
+                "day": dates.day,
+                "hr": g["hr"],
+                "members": len(lanes)})
+            for var in outputs:
+                if not var in g:
+                    raise RuntimeError("Unknown output to summarize: " + var)
+                # percentiles along the member axis, for every hour at once
+                values = np.percentile(g[var][lanes], percentiles, axis = 0)
+                for q, v in zip(percentiles, values):
+                    df[f"{var}_p{q:g}"] = v
+            if g["id"] is None:
+                del df["id"]
+            frames.append(df)
+    result = pd.concat(frames, ignore_index = True)
+    if not (round_out == None or round_out == "None"):
+        cols = [c for c in result.columns if "_p" in c]
+        result[cols] = result[cols].round(int(round_out))
+    return result
+
+##
+# Hourly FWI of ensemble forecasts of daily min/max weather
+#
+# @param w                  daily min/max weather of every member, columns:
+#                           [id], member, lat, long, [timezone], yr, mon, day,
+#                           temp_min, temp_max, rh_min, rh_max, ws_min, ws_max, prec
+# @param timezone           UTC offset (default None for column provided in w)
+# @param prec_hr            hour when daily precipitation occurs (default "sunrise")
+# @param member             name of the member column (default "member")
+# @param states             dictionary of station id -> fwi_core.StationState shared
+#                           by its members (default None)
+# @param ffmc_old           startup FFMC of stations not in states
+# @param dmc_old            startup DMC of stations not in states
+# @param dc_old             startup DC of stations not in states
+# @param percentiles        percentiles of the members to output
+# @param outputs            outputs (and weather) to summarize
+# @param summary            True for percentiles per station and hour, False for
+#                           every member's hourly weather and outputs
+# @param silent             suppresses informative print statements (default False)
+# @param round_out          decimals to truncate output to, None for none (default 4)
+# @return                   summary from summarize(), or hourly weather of
+#                           minmax_to_hourly(member = member) with the FWI outputs
+@timing.timed()
+def ensemble_fwi(
+    w,
+    timezone = None,
+    prec_hr = "sunrise",
+    member = "member",
+    states = None,
+    ffmc_old = fwi_core.FFMC_DEFAULT,
+    dmc_old = fwi_core.DMC_DEFAULT,
+    dc_old = fwi_core.DC_DEFAULT,
+    percentiles = DEFAULT_PERCENTILES,
+    outputs = SUMMARY_OUTPUTS,
+    summary = True,
+    silent = False,
+    round_out = 4
+):
+    if not silent:
+        print("\n########\nFWI2025: Ensemble FWI (" + util.version() + ")\n")
+    groups = make_hourly.minmax_to_hourly_members(w, timezone, prec_hr, member,
+        round_out)
+    groups = run_members(groups, states, ffmc_old, dmc_old, dc_old)
+    if summary:
+        result = summarize(groups, percentiles, outputs, round_out)
+    else:
+        result = make_hourly.members_to_frame(groups, member)
+        for var in outputs:
+            if not var in WEATHER:
+                result[var] = np.concatenate([g[var].reshape(-1) for g in groups])
+        if not (round_out == None or round_out == "None"):
+            cols = [c for c in outputs if not c in WEATHER]
+            result[cols] = result[cols].round(int(round_out))
+    if not silent:
+        print("########\n")
+    return result
+
+
+if __name__ == "__main__":
+    # run ensemble_fwi by command line. run with option -h or --help to see usage
+    parser = argparse.ArgumentParser(prog = "ensemble")
+    parser.add_argument("input", help = "Input csv data file, columns: " +
+        "[id], member, lat, long, [timezone], yr, mon, day, " +
+        "temp_min, temp_max, rh_min, rh_max, ws_min, ws_max, prec")
+    parser.add_argument("output", help = "Output csv file name and location")
+    parser.add_argument("--member", default = "member",
+        help = "Column of ensemble members (default member)")
+    parser.add_argument("--ffmc", type = float, default = fwi_core.FFMC_DEFAULT,
+        help = "Startup FFMC of every station")
+    parser.add_argument("--dmc", type = float, default = fwi_core.DMC_DEFAULT,
+        help = "Startup DMC of every station")
+    parser.add_argument("--dc", type = float, default = fwi_core.DC_DEFAULT,
+        help = "Startup DC of every station")
+    parser.add_argument("--state-db", default = None,
+        help = "State database (see state_store.py) to start each station from " +
+        "its latest state before its first day")
+    parser.add_argument("-p", "--percentiles", default = None,
+        help = "Comma separated percentiles (default 10,25,50,75,90)")
+    parser.add_argument("-o", "--outputs", default = None,
+        help = "Comma separated outputs to summarize (default " +
+        ",".join(SUMMARY_OUTPUTS) + ")")
+    parser.add_argument("--members", action = "store_true",
+        help = "Output every member instead of percentiles")
+    parser.add_argument("-s", "--silent", action = "store_true")
+    args = parser.parse_args()
+    df_in = pd.read_csv(args.input)
+    states = None
+    if args.state_db is not None:
+        import state_store
+        df_id = df_in.rename(columns = str.lower)
+        first = df_id.sort_values(["yr", "mon", "day"]).groupby("id").first()
+        states = {}
+        with state_store.StateStore(args.state_db) as store:
+            for stn, row in first.iterrows():
+                record = store.latest([stn], before = state_store.hour_index(
+                    row["yr"], row["mon"], row["day"], 0) - 1).get(str(stn))
+                if record is not None:
+                    states[stn] = state_store.to_station_state(record)
+    df_out = ensemble_fwi(
+        df_in,
+        member = args.member,
+        states = states,
+        ffmc_old = args.ffmc,
+        dmc_old = args.dmc,
+        dc_old = args.dc,
+        percentiles = DEFAULT_PERCENTILES if args.percentiles is None else
+            [float(q) for q in args.percentiles.split(",")],
+        outputs = SUMMARY_OUTPUTS if args.outputs is None else args.outputs.split(","),
+        summary = not args.members,
+        silent = args.silent
+    )
+    df_out.to_csv(args.output, index = False)
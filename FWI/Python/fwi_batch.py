@@ -0,0 +1,529 @@
+# Batched hourly FWI: one hour for many stations at once with NumPy
+#
+# The same equations as fwi_core.py, written on arrays (one element per station, or
+# per ensemble member, scenario, ...) so a whole array of states can be stepped one
+# hour in a few vectorized operations instead of a Python loop over stations.
+#
+#   import fwi_batch
+#   states = fwi_batch.initial_states(n)
+#   states, out = fwi_batch.step_batch(states, {"lat": lat, "long": long,
+#       "timezone": tz, "yr": 2007, "mon": 6, "day": 1, "hr": 13,
+#       "temp": temp, "rh": rh, "ws": ws, "prec": prec})
+#
+# Results match fwi_core.step() (and hFWI()) to floating point rounding. Each call has
+# a fixed cost of a few hundred array operations, so for a handful of stations
+# fwi_core.step() in a loop is faster.
+
+### Import packages ###
+import numpy as np
+
+# Import from other CFFDRS code files
+import fwi_core
+from fwi_core import STATE_VARIABLES, StationState
+
+### Equations on arrays (see fwi_core.py for the scalar versions) ###
+
+def ffmc_to_mcffmc(ffmc):
+    C_FFMC = 14875 / 101
+    return C_FFMC * (101 - ffmc) / (59.5 + ffmc)
+
+
+def mcffmc_to_ffmc(mcffmc):
+    C_FFMC = 14875 / 101
+    return 59.5 * (250 - mcffmc) / (C_FFMC + mcffmc)
+
+
+def dmc_to_mcdmc(dmc):
+    return (280 / np.exp(dmc / 43.43)) + 20
+
+
+def mcdmc_to_dmc(mcdmc):
+    return 43.43 * np.log(280 / (mcdmc - 20))
+
+
+def dc_to_mcdc(dc):
+    return 400 * np.exp(-dc / 400)
+
+
+def mcdc_to_dc(mcdc):
+    return 400 * np.log(400 / mcdc)
+
+
+def _daytime(hr, sunrise, sunset):
+    # since sunset can be > 24, check hr + 24 (ignoring change between days)
+    return (((sunrise <= hr) & (hr <= sunset)) |
+        ((hr < 6) & (sunrise <= hr + 24) & (hr + 24 <= sunset)))
+
+
+def hourly_fine_fuel_moisture(lastmc, temp, rh, ws, rain, time_increment = 1.0):
+    rf = 42.5
+    drf = 0.0579
+    wet = rain != 0.0
+    r = np.where(wet, rain, 1.0)
+    mo = lastmc + rf * r * np.exp(-100.0 / (251 - lastmc)) * (1.0 - np.exp(-6.93 / r))
+    mo = mo + np.where(lastmc > 150, 0.0015 * (lastmc - 150) ** 2 * np.sqrt(r), 0.0)
+    mo = np.where(wet, np.minimum(mo, 250.0), lastmc)
+    e1 = 0.18 * (21.1 - temp) * (1.0 - (np.exp(-0.115 * rh)))
+    ed = 0.942 * rh ** 0.679 + (11.0 * np.exp((rh - 100) / 10.0)) + e1
+    ew = 0.618 * rh ** 0.753 + (10.0 * np.exp((rh - 100) / 10.0)) + e1
+    m = np.where(mo < ed, ew, ed)
+    a1 = np.where(mo > ed, rh / 100.0, (100.0 - rh) / 100.0)
+    k0_or_k1 = 0.424 * (1 - a1 ** 1.7) + (0.0694 * np.sqrt(ws) * (1 - a1 ** 8))
+    kd_or_kw = 2.0 * drf * k0_or_k1 * np.exp(0.0365 * temp)
+    return np.where(mo != ed, m + (mo - m) * 10.0 ** (-kd_or_kw * time_increment), m)
+
+
+# model parameters, fwi_core.Parameters of the globals if not given (values can be
+# arrays of one value per station, or per parameter set in a sweep)
+def _params(params):
+    return fwi_core.Parameters() if params is None else params
+
+
+def duff_moisture_code(last_mcdmc, hr, temp, rh, prec, sunrise, sunset,
+    prec_cumulative_prev, time_increment = 1.0, params = None):
+    p = _params(params)
+    total = prec_cumulative_prev + prec
+    rw = np.where(prec_cumulative_prev <= p.dmc_intercept,
+        total * 0.92 - 1.27, prec * 0.92)
+    last_dmc = mcdmc_to_dmc(last_mcdmc)
+    b = np.where(last_dmc <= 33, 100.0 / (0.3 * last_dmc + 0.5),
+        np.where(last_dmc <= 65, -1.3 * np.log(last_dmc) + 14.0,
+        6.2 * np.log(last_dmc) - 17.2))
+    mr = np.where(total > p.dmc_intercept,
+        last_mcdmc + (1e3 * rw) / (b * rw + 48.77), last_mcdmc)
+    mr = np.minimum(mr, 300.0)
+    rk = p.dmc_regression * (np.maximum(temp, 0.0) + p.dmc_offset_temp) * (100.0 - rh)
+    invtau = rk / 43.43
+    mcdmc = np.where(_daytime(hr, sunrise, sunset),
+        (mr - 20.0) * np.exp(-time_increment * invtau) + 20.0, mr)
+    return np.minimum(mcdmc, 300.0)
+
+
+def drought_code(last_mcdc, hr, temp, prec, sunrise, sunset, prec_cumulative_prev,
+    time_increment = 1.0, params = None):
+    p = _params(params)
+    total = prec_cumulative_prev + prec
+    rw = np.where(prec_cumulative_prev <= p.dc_intercept,
+        total * 0.83 - 1.27, prec * 0.83)
+    mr = np.where(total > p.dc_intercept, last_mcdc + 3.937 * rw / 2.0, last_mcdc)
+    mr = np.minimum(mr, 400.0)
+    pe = np.where(temp > 0,
+        p.dc_regression * (temp + p.dc_offset_temp) + 3.0 / 16.0, 0.0)
+    invtau = pe / 400.0
+    mcdc = np.where(_daytime(hr, sunrise, sunset), mr * np.exp(-time_increment * invtau), mr)
+    return np.minimum(mcdc, 400.0)
+
+
+def initial_spread_index(ws, ffmc):
+    fm = ffmc_to_mcffmc(ffmc)
+    fw = np.where(40 <= ws, 12 * (1 - np.exp(-0.0818 * (ws - 28))), np.exp(0.05039 * ws))
+    ff = 91.9 * np.exp(-0.1386 * fm) * (1.0 + fm ** 5.31 / 4.93e07)
+    return 0.208 * fw * ff
+
+
+def buildup_index(dmc, dc):
+    zero = (dmc == 0) & (dc == 0)
+    bui = np.where(zero, 0.0, 0.8 * dc * dmc / np.where(zero, 1.0, dmc + 0.4 * dc))
+    p = (dmc - bui) / np.where(dmc == 0, 1.0, dmc)
+    cc = 0.92 + (0.0114 * dmc) ** 1.7
+    return np.where(bui < dmc, np.maximum(dmc - cc * p, 0.0), bui)
+
+
+def fire_weather_index(isi, bui):
+    bb = np.where(bui > 80, 0.1 * isi * 1000 / (25 + 108.64 / np.exp(0.023 * bui)),
+        0.1 * isi * (0.626 * bui ** 0.809 + 2))
+    return np.where(bb <= 1, bb,
+        np.exp(2.72 * (0.434 * np.log(np.maximum(bb, 1.0))) ** 0.647))
+
+
+def daily_severity_rating(fwi):
+    return 0.0272 * fwi ** 1.77
+
+
+def hourly_grass_fuel_moisture(lastmc, temp, rh, ws, rain, solrad, load,
+    time_increment = 1.0):
+    rf = 0.27
+    drf = 0.389633
+    mo = np.where(rain != 0.0, np.minimum(lastmc + rain / load * 100.0, 250.0), lastmc)
+    # fuel temp from CEVW
+    tf = temp + 17.9 * solrad * np.exp(-0.034 * ws)
+    # fuel humidity
+    rhf = np.where(tf > temp,
+        rh * 6.107 * 10.0 ** (7.5 * temp / (temp + 237.0)) /
+        (6.107 * 10.0 ** (7.5 * tf / (tf + 237.0))), rh)
+    e1 = rf * (26.7 - tf) * (1.0 - (1.0 / np.exp(0.115 * rhf)))
+    # GRASS EMC
+    ed = 1.62 * rhf ** 0.532 + (13.7 * np.exp((rhf - 100) / 13.0)) + e1
+    ew = 1.42 * rhf ** 0.512 + (12.0 * np.exp((rhf - 100) / 18.0)) + e1
+    moed = mo - ed
+    moew = mo - ew
+    keep = (moed == 0) | ((moew >= 0) & (moed < 0))
+    drying = moed > 0
+    a1 = np.where(drying, rhf / 100.0, (100.0 - rhf) / 100.0)
+    # avoids complex number in a1^1.7 xkd calculation
+    a1 = np.maximum(a1, 0.0)
+    e = np.where(drying, ed, ew)
+    moe = np.where(drying, moed, moew)
+    xkd = (0.424 * (1 - a1 ** 1.7) + (0.0694 * np.sqrt(ws) * (1 - a1 ** 8)))
+    xkd = xkd * drf * np.exp(0.0365 * tf)
+    return np.where(keep, mo, e + moe * np.exp(-1.0 * np.log(10.0) * xkd * time_increment))
+
+
+def curing_factor(cur):
+    return np.where(cur >= 20.0, 1.036 / (1 + 103.989 * np.exp(-0.0996 * (cur - 20))), 0.0)
+
+
+def mcgfmc_to_gfmc(mc, cur, wind):
+    wind2m_open_factor = 0.75
+    Intercept = 1.49
+    Cmoisture = -0.11
+    Cwind = 0.075
+    wind2m = wind2m_open_factor * wind
+    probign = 1.0 / (1.0 + np.exp(-1.0 * (Intercept + Cmoisture * mc + Cwind * wind2m)))
+    # adjust ignition directly with the curing function on ROS
+    newPign = curing_factor(cur) * probign
+    # back calculate effective moisture, 250 is a saturation value
+    ign = newPign > 0.0
+    p = np.where(ign, newPign, 0.5)
+    egmc = np.where(ign,
+        (np.log(p / (1.0 - p)) - Intercept - Cwind * wind2m) / Cmoisture, 250)
+    return mcffmc_to_ffmc(np.minimum(egmc, 250.0))
+
+
+def _grass_moisture_factor(ws, mc):
+    fm = np.where(mc < 12, np.exp(-0.108 * mc),
+        np.where((mc < 20.0) & (ws < 10.0), 0.6838 - 0.0342 * mc,
+        np.where((mc < 23.9) & (ws >= 10.0), 0.547 - 0.0228 * mc, 0.0)))
+    return np.maximum(fm, 0.0)
+
+
+def grass_spread_index(ws, mc, cur, standing):
+    wind = np.maximum(ws - 5.0, 0.0) ** 0.844
+    fw = 16.67 * np.where(standing,
+        np.where(ws < 5, 0.054 + 0.269 * ws, 1.4 + 0.838 * wind),
+        np.where(ws < 5, 0.054 + 0.209 * ws, 1.1 + 0.715 * wind))
+    ros = fw * _grass_moisture_factor(ws, mc) * curing_factor(cur)
+    return 1.11 * ros
+
+
+def grass_fire_weather_index(gsi, load):
+    # this just converts back to ROS in m/min
+    ros = gsi / 1.11
+    Fint = 300.0 * load * ros
+    return np.where(Fint > 100, np.log(np.maximum(Fint, 100.0) / 60.0) / 0.14, Fint / 25.0)
+
+
+def rain_since_intercept_reset(rain, rain_total_prev, drying_since_intercept):
+    # for now, want 5 "units" of drying (which is 1 per hour to start)
+    TARGET_DRYING_SINCE_INTERCEPT = 5.0
+    reset = (rain > 0) | (rain_total_prev == 0)  # if raining, reset drying
+    drying = np.where(reset, 0.0, drying_since_intercept + fwi_core.drying_units())
+    # reset rain if intercept reset criteria met
+    done = ~reset & (drying >= TARGET_DRYING_SINCE_INTERCEPT)
+    return np.where(done, 0.0, rain_total_prev), np.where(done, 0.0, drying)
+
+
+def ffmc_effective_rain(rain_total_prev, prec, params = None):
+    intercept = _params(params).ffmc_intercept
+    return np.where(rain_total_prev + prec <= intercept, 0.0,
+        np.where(rain_total_prev > intercept, prec, rain_total_prev + prec - intercept))
+
+### Dates and sunlight on arrays ###
+
+##
+# Dates as numpy datetime64[D]
+#
+# @param yr             Year
+# @param mon            Month of year
+# @param day            Day of month
+# @return               datetime64[D] array
+def to_dates(yr, mon, day):
+    yr, mon, day = np.broadcast_arrays(np.asarray(yr, dtype = np.int64),
+        np.asarray(mon, dtype = np.int64), np.asarray(day, dtype = np.int64))
+    months = (yr - 1970) * 12 + (mon - 1)
+    return months.astype("datetime64[M]").astype("datetime64[D]") + (day - 1)
+
+
+def _year(dates):
+    return dates.astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def grass_standing_date(dates, params = None):
+    p = _params(params)
+    standing = to_dates(_year(dates), p.mon_standing, p.day_standing)
+    # use next year if date already passed
+    return np.where(standing < dates, to_dates(_year(dates) + 1,
+        p.mon_standing, p.day_standing), standing)
+
+
+def seasonal_curing(dates, start_mon = 3, start_day = 12):
+    table = np.asarray(fwi_core.SEASONAL_PERCENT_CURED)
+    years = _year(dates)
+    shift = dates - to_dates(years, start_mon, start_day)
+    shift = np.where(shift < np.timedelta64(0, "D"),
+        dates - to_dates(years - 1, start_mon, start_day), shift)
+    days_in = shift.astype(np.int64) + 1
+    green = days_in < (len(table) - 1) * 10
+    i = np.where(green, days_in // 10, 0)
+    per_cur0 = table[i]
+    per_cur1 = table[np.minimum(i + 1, len(table) - 1)]
+    period_frac = (days_in % 10) / 10.0
+    return np.where(green, per_cur0 + (per_cur1 - per_cur0) * period_frac, table[-1])
+
+
+def _solar_day(dates):
+    years = _year(dates)
+    jd = (dates - dates.astype("datetime64[Y]").astype("datetime64[D]")).astype(np.int64) + 1
+    leap = ((years % 4 == 0) & (years % 100 != 0)) | (years % 400 == 0)
+    dec_hour = 12.0
+    fracyear = 2.0 * np.pi * (jd - 1.0 + (dec_hour - 12.0) / 24.0)
+    fracyear = np.where(leap, fracyear / 366.0, fracyear / 365.0)
+    eqtime = 229.18 * (0.000075 +
+        0.001868 * np.cos(fracyear) - 0.032077 * np.sin(fracyear) -
+        0.014615 * np.cos(2.0 * fracyear) - 0.040849 * np.sin(2.0 * fracyear))
+    decl = (0.006918 -
+        0.399912 * np.cos(fracyear) + 0.070257 * np.sin(fracyear) -
+        0.006758 * np.cos(fracyear * 2.0) + 0.000907 * np.sin(2.0 * fracyear) -
+        0.002697 * np.cos(3.0 * fracyear) + 0.00148 * np.sin(3.0 * fracyear))
+    return decl, eqtime
+
+
+def sunrise_sunset(lat, long, timezone, dates):
+    decl, eqtime = _solar_day(dates)
+    zenith = 90.833 * np.pi / 180.0
+    x_tmp = (np.cos(zenith) / (np.cos(lat * np.pi / 180.0) * np.cos(decl)) -
+        np.tan(lat * np.pi / 180.0) * np.tan(decl))
+    halfday = 180.0 / np.pi * np.arccos(np.clip(x_tmp, -1, 1))
+    sunrise = (720.0 - 4.0 * (long + halfday) - eqtime) / 60 + timezone
+    sunset = (720.0 - 4.0 * (long - halfday) - eqtime) / 60 + timezone
+    return sunrise, sunset
+
+
+def solar_radiation(lat, long, timezone, dates, hr, temp, rh):
+    decl, eqtime = _solar_day(dates)
+    timeoffset = eqtime + 4 * long - 60 * timezone
+    hourangle = (hr * 60.0 + timeoffset) / 4 - 180
+    zenith = np.arccos(np.sin(lat * np.pi / 180) * np.sin(decl) +
+        np.cos(lat * np.pi / 180) * np.cos(decl) * np.cos(hourangle * np.pi / 180))
+    zenith = np.minimum(np.pi / 2, zenith)
+    vpd = 6.11 * (1.0 - rh / 100.0) * np.exp(17.29 * temp / (temp + 237.3))
+    solrad = np.cos(zenith) * 0.92 * (1.0 - np.exp(-0.22 * vpd))
+    # always set low values to 0
+    return np.where(solrad < 1e-4, 0.0, solrad)
+
+### Batched state-step API ###
+
+##
+# States of N stations as arrays, one element per station (see fwi_core.StationState)
+# date_grass_standing is datetime64[D], NaT until the first step sets it
+class StateArray:
+    __slots__ = STATE_VARIABLES + ["date_grass_standing"]
+
+    def __init__(
+        self,
+        mcffmc,
+        mcdmc,
+        mcdc,
+        mcgfmc_matted,
+        mcgfmc_standing,
+        prec_cumulative = 0.0,
+        canopy_drying = 0.0,
+        date_grass_standing = None
+    ):
+        n = len(np.atleast_1d(mcffmc))
+        for k, v in zip(STATE_VARIABLES, (mcffmc, mcdmc, mcdc, mcgfmc_matted,
+            mcgfmc_standing, prec_cumulative, canopy_drying)):
+            setattr(self, k, np.array(np.broadcast_to(np.asarray(v, dtype = float), n)))
+        if date_grass_standing is None:
+            date_grass_standing = np.datetime64("NaT")
+        self.date_grass_standing = np.array(np.broadcast_to(
+            np.asarray(date_grass_standing, dtype = "datetime64[D]"), n))
+
+    def __len__(self):
+        return len(self.mcffmc)
+
+    def __repr__(self):
+        return "StateArray({} stations)".format(len(self))
+
+    def copy(self):
+        return StateArray(*(getattr(self, k).copy() for k in self.__slots__))
+
+    ##
+    # States of some of the stations
+    #
+    # @param    index       integer indices or boolean mask
+    # @return               StateArray
+    def take(self, index):
+        return StateArray(*(getattr(self, k)[index] for k in self.__slots__))
+
+    ##
+    # Replace the states of some of the stations (in place)
+    #
+    # @param    index       integer indices or boolean mask
+    # @param    states      StateArray for those stations
+    def put(self, index, states):
+        for k in self.__slots__:
+            getattr(self, k)[index] = getattr(states, k)
+
+    def to_states(self):
+        return [StationState(*(v.item() for v in values[:-1]),
+            None if np.isnat(values[-1]) else values[-1].item())
+            for values in zip(*(getattr(self, k) for k in self.__slots__))]
+
+    @classmethod
+    def from_states(cls, states):
+        values = [[getattr(s, k) for s in states] for k in STATE_VARIABLES]
+        dates = [np.datetime64("NaT") if s.date_grass_standing is None
+            else np.datetime64(s.date_grass_standing, "D") for s in states]
+        return cls(*values, date_grass_standing = np.array(dates, dtype = "datetime64[D]"))
+
+    @classmethod
+    def concat(cls, arrays):
+        return cls(*(np.concatenate([getattr(a, k) for a in arrays])
+            for k in cls.__slots__))
+
+##
+# Make the states of N stations to start a run from, same defaults as hFWI()
+#
+# @param n                  number of stations
+# @param ffmc               startup FFMC (number or array)
+# @param dmc                startup DMC (number or array)
+# @param dc                 startup DC (number or array)
+# @param mcgfmc_matted      startup matted mcgfmc (default FFMC = 85)
+# @param mcgfmc_standing    startup standing mcgfmc (default FFMC = 85)
+# @param prec_cumulative    cumulative precipitation this rainfall
+# @param canopy_drying      consecutive hours of no rain
+# @return                   StateArray
+# (see startup_states() for the startup defaults of fwi_core.Parameters)
+def initial_states(
+    n,
+    ffmc = fwi_core.FFMC_DEFAULT,
+    dmc = fwi_core.DMC_DEFAULT,
+    dc = fwi_core.DC_DEFAULT,
+    mcgfmc_matted = None,
+    mcgfmc_standing = None,
+    prec_cumulative = 0.0,
+    canopy_drying = 0.0
+):
+    default_mcgfmc = fwi_core.ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT)
+    return StateArray(
+        np.broadcast_to(ffmc_to_mcffmc(np.asarray(ffmc, dtype = float)), n),
+        dmc_to_mcdmc(np.asarray(dmc, dtype = float)),
+        dc_to_mcdc(np.asarray(dc, dtype = float)),
+        default_mcgfmc if mcgfmc_matted is None else mcgfmc_matted,
+        default_mcgfmc if mcgfmc_standing is None else mcgfmc_standing,
+        prec_cumulative,
+        canopy_drying
+    )
+
+##
+# States to start a run from with the startup defaults of parameters, one per
+# parameter set when they are arrays (see fwi_core.Parameters.startup_state())
+#
+# @param n                  number of stations (or parameter sets)
+# @param params             fwi_core.Parameters (default None for the globals)
+# @return                   StateArray
+def startup_states(n, params = None):
+    p = _params(params)
+    mcgfmc = np.broadcast_to(ffmc_to_mcffmc(np.asarray(p.ffmc_default, dtype = float)), n)
+    return initial_states(n, p.ffmc_default, p.dmc_default, p.dc_default,
+        mcgfmc.copy(), mcgfmc.copy())
+
+##
+# Advance N stations one hour, the same calculation as fwi_core.step() on each
+# obs values are arrays (one element per station) or numbers shared by every station,
+# with the same names and defaults as fwi_core.step(). The grass outputs are
+# calculated when obs has solrad or lat, long and timezone.
+#
+# @param states     StateArray, not modified
+# @param obs        weather this hour (dictionary): date (datetime64[D]) or yr, mon, day,
+#                   hr, temp, rh, ws, prec and lat, long, timezone or the values they give
+# @param params     fwi_core.Parameters, values can be arrays with one value per
+#                   station (default None for the globals)
+# @return           (new StateArray, dictionary of output arrays)
+def step_batch(states, obs, params = None):
+    n = len(states)
+    params = _params(params)
+    def value(name):
+        return np.broadcast_to(np.asarray(obs[name], dtype = float), n)
+    temp = value("temp")
+    rh = value("rh")
+    ws = value("ws")
+    prec = value("prec")
+    hr = value("hr")
+    if "date" in obs:
+        dates = np.broadcast_to(np.asarray(obs["date"], dtype = "datetime64[D]"), n)
+    else:
+        dates = np.broadcast_to(to_dates(obs["yr"], obs["mon"], obs["day"]), n)
+    new = states.copy()
+    unset = np.isnat(new.date_grass_standing)
+    if unset.any():
+        mon = np.broadcast_to(params.mon_standing, n)[unset]
+        day = np.broadcast_to(params.day_standing, n)[unset]
+        new.date_grass_standing[unset] = grass_standing_date(dates[unset],
+            fwi_core.Parameters(mon_standing = mon, day_standing = day))
+    out = {}
+    with np.errstate(all = "ignore"):
+        if "sunrise" in obs and "sunset" in obs:
+            sunrise, sunset = value("sunrise"), value("sunset")
+        else:
+            sunrise, sunset = sunrise_sunset(value("lat"), value("long"),
+                value("timezone"), dates)
+            out["sunrise"] = sunrise
+            out["sunset"] = sunset
+            out["sunlight_hours"] = sunset - sunrise
+        rain_total_prev, drying = rain_since_intercept_reset(prec,
+            states.prec_cumulative, states.canopy_drying)
+        new.mcffmc = hourly_fine_fuel_moisture(states.mcffmc, temp, rh, ws,
+            ffmc_effective_rain(rain_total_prev, prec, params))
+        new.mcdmc = duff_moisture_code(states.mcdmc, hr, temp, rh, prec,
+            sunrise, sunset, rain_total_prev, params = params)
+        new.mcdc = drought_code(states.mcdc, hr, temp, prec, sunrise, sunset,
+            rain_total_prev, params = params)
+        out["mcffmc"] = new.mcffmc
+        out["ffmc"] = mcffmc_to_ffmc(new.mcffmc)
+        out["dmc"] = mcdmc_to_dmc(new.mcdmc)
+        out["dc"] = mcdc_to_dc(new.mcdc)
+        out["isi"] = initial_spread_index(ws, out["ffmc"])
+        out["bui"] = buildup_index(out["dmc"], out["dc"])
+        out["fwi"] = fire_weather_index(out["isi"], out["bui"])
+        out["dsr"] = daily_severity_rating(out["fwi"])
+        new.prec_cumulative = rain_total_prev + prec
+        new.canopy_drying = drying
+        if "solrad" in obs or "lat" in obs:
+            if "solrad" in obs:
+                solrad = value("solrad")
+            else:
+                solrad = solar_radiation(value("lat"), value("long"), value("timezone"),
+                    dates, hr, temp, rh)
+                out["solrad"] = solrad
+            if "percent_cured" in obs:
+                cur = value("percent_cured")
+            else:
+                cur = seasonal_curing(dates)
+                out["percent_cured"] = cur
+            if "grass_fuel_load" in obs:
+                load = value("grass_fuel_load")
+            else:
+                load = np.broadcast_to(np.asarray(params.default_grass_fuel_load,
+                    dtype = float), n).copy()
+                out["grass_fuel_load"] = load
+            if "standing" in obs:
+                standing = np.broadcast_to(np.asarray(obs["standing"], dtype = bool), n)
+            else:
+                standing = ~(np.asarray(params.grass_transition, dtype = bool) &
+                    (dates < new.date_grass_standing))
+            new.mcgfmc_matted = hourly_grass_fuel_moisture(states.mcgfmc_matted,
+                temp, rh, ws, prec, solrad, load)
+            # standing grass: 6% of the rain and no solar heating
+            new.mcgfmc_standing = hourly_grass_fuel_moisture(states.mcgfmc_standing,
+                temp, rh, ws, prec * 0.06, 0.0, load)
+            mcgfmc = np.where(standing, new.mcgfmc_standing, new.mcgfmc_matted)
+            out["mcgfmc_matted"] = new.mcgfmc_matted
+            out["mcgfmc_standing"] = new.mcgfmc_standing
+            out["gfmc"] = mcgfmc_to_gfmc(mcgfmc, cur, ws)
+            out["gsi"] = grass_spread_index(ws, mcgfmc, cur, standing)
+            out["gfwi"] = grass_fire_weather_index(out["gsi"], load)
+    out["prec_cumulative"] = new.prec_cumulative
+    out["canopy_drying"] = new.canopy_drying
+    return new, out
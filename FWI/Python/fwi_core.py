@@ -0,0 +1,948 @@
+# Pure numeric core of the hourly FWI calculation
+#
+# The equations of the FWI System and grassland fuel moisture for one timestep, plus
+# sunrise/sunset/solar radiation for one location and a minimal state-step API, with
+# nothing but the standard library (no pandas, no NumPy). For embedding the FWI
+# calculation in other programs and services, where importing pandas is slow or
+# unavailable. NG_FWI.py (hFWI) uses these functions and keeps the same names.
+#
+#   import fwi_core
+#   state = fwi_core.initial_state()
+#   state, out = fwi_core.step(state, {"lat": 46.0, "long": -77.4, "timezone": -5,
+#       "yr": 2007, "mon": 6, "day": 1, "hr": 13, "temp": 20.0, "rh": 40.0, "ws": 15.0,
+#       "prec": 0.0})
+#
+# fwi_batch.py steps many stations at once with NumPy.
+# fwi_core.hFWI is NG_FWI.hFWI, imported (along with pandas) the first time it is used.
+
+### Import packages ###
+import datetime
+import importlib
+from calendar import isleap
+from math import acos, cos, exp, log, pi, pow, sin, sqrt, tan
+
+### Variable Definitions ###
+# Only change these if you know what you are doing, or
+# reach out to the CFS Fire Danger Group for more info
+
+# Startup moisture code values
+FFMC_DEFAULT = 85.0
+DMC_DEFAULT = 6.0
+DC_DEFAULT = 15.0
+
+# Precipitation intercept
+FFMC_INTERCEPT = 0.5
+DMC_INTERCEPT = 1.5
+DC_INTERCEPT = 2.8
+
+# Drying variables
+DMC_REGRESSION = 2.22e-4
+DC_REGRESSION = 1.5e-2
+DMC_OFFSET_TEMP = 0.0
+DC_OFFSET_TEMP = 0.0
+
+# Grassland fuel load (grass_fuel_load, kg/m^2)
+DEFAULT_GRASS_FUEL_LOAD = 0.35
+
+# Transition from matted to standing grass in a calendar year (default July 1st)
+GRASS_TRANSITION = True  # default True, False for GFMC to always be standing
+MON_STANDING = 7
+DAY_STANDING = 1
+
+# Default percent_cured every 10 days from the grassland fuel green up start
+# (Boreal Plains, see seasonal_curing())
+SEASONAL_PERCENT_CURED = [
+    96.0,  # "winter" cured value
+    95.0,
+    93.0,
+    92.0,
+    90.5,
+    88.4,
+    84.4,
+    78.1,
+    68.7,
+    50.3,
+    32.9,
+    23.0,
+    22.0,
+    21.0,
+    20.0,
+    25.7,
+    35.0,
+    43.0,
+    49.8,
+    60.0,
+    68.0,
+    72.0,
+    75.0,
+    78.9,
+    86.0,
+    96.0  # "winter" cured value for rest of year
+]
+
+# model constants a Parameters object holds (the globals above, in lower case)
+PARAMETERS = ["ffmc_default", "dmc_default", "dc_default",
+    "ffmc_intercept", "dmc_intercept", "dc_intercept",
+    "dmc_regression", "dc_regression", "dmc_offset_temp", "dc_offset_temp",
+    "default_grass_fuel_load", "grass_transition", "mon_standing", "day_standing"]
+
+##
+# Model constants as an explicit object, passed as params to the equations, step(),
+# fwi_batch.step_batch() and hFWI() instead of changing the globals above (the
+# default, params = None, is still the globals). Values not given are the globals
+# at the time the object is made. In fwi_batch, values can be arrays with one value
+# per lane, to run many parameter sets at once (see sweep.py).
+class Parameters:
+    __slots__ = PARAMETERS
+
+    def __init__(self, **values):
+        for k in self.__slots__:
+            setattr(self, k, values.pop(k) if k in values else globals()[k.upper()])
+        if len(values) > 0:
+            raise ValueError("Unknown parameters: " + ", ".join(values) +
+                ", choose from " + ", ".join(self.__slots__))
+
+    def __repr__(self):
+        return "Parameters(" + ", ".join(
+            "{}={!r}".format(k, getattr(self, k)) for k in self.__slots__) + ")"
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    # copy with some values changed
+    def replace(self, **values):
+        return Parameters(**{**self.to_dict(), **values})
+
+    # state to start a run from with the startup defaults of these parameters
+    def startup_state(self):
+        return initial_state(self.ffmc_default, self.dmc_default, self.dc_default,
+            ffmc_to_mcffmc(self.ffmc_default), ffmc_to_mcffmc(self.ffmc_default))
+
+### Functions ###
+
+##
+# Convert to fine fuel moisture content (%)
+# @param ffmc       Fine Fuel Moisture Code (FFMC)
+# @return           fine fuel moisture content (%)
+def ffmc_to_mcffmc(ffmc):
+    C_FFMC = 14875 / 101
+    return C_FFMC * (101 - ffmc) / (59.5 + ffmc)
+
+##
+# Convert to FFMC
+# @param mcffmc     fine fuel moisture content (%)
+# @return           FFMC
+def mcffmc_to_ffmc(mcffmc):
+    C_FFMC = 14875 / 101
+    return 59.5 * (250 - mcffmc) / (C_FFMC + mcffmc)
+
+##
+# Convert to duff moisture content (%)
+# @param dmc        Duff Moisture Code (DMC)
+# @return           duff moisture content (%)
+def dmc_to_mcdmc(dmc):
+   return (280 / exp(dmc / 43.43)) + 20
+
+##
+# Convert to DMC
+# @param mcdmc      duff moisture content (%)
+# @return           DMC
+def mcdmc_to_dmc(mcdmc):
+   return 43.43 * log(280 / (mcdmc - 20))
+
+##
+# Convert to DC moisture content (%)
+# @param dc         Drought Code (DC)
+# @return           DC moisture content (%)
+def dc_to_mcdc(dc):
+   return 400 * exp(-dc / 400)
+
+##
+# Convert to DC
+# @param mcdc       DC moisture content (%)
+# @return           DC
+def mcdc_to_dc(mcdc):
+   return 400 * log(400 / mcdc)
+
+##
+# Calculate hourly fine fuel moisture content. Needs to be converted to get FFMC
+#
+# @param lastmc          Previous fine fuel moisture content (%)
+# @param temp            Temperature (Celcius)
+# @param rh              Relative Humidity (percent, 0-100)
+# @param ws              Wind Speed (km/h)
+# @param rain            Rainfall AFTER intercept (mm)
+# @param time_increment  Duration of timestep (hr, default 1.0)
+# @return                Hourly fine fuel moisture content (%)
+def hourly_fine_fuel_moisture(lastmc, temp, rh, ws, rain, time_increment = 1.0):
+    rf = 42.5
+    drf = 0.0579
+    # use moisture directly instead of converting to/from ffmc
+    # expects any rain intercept to already be applied
+    mo = lastmc
+    if rain != 0.0:
+        # duplicated in both formulas, so calculate once
+        # lastmc == mo, but use lastmc since mo changes after first equation
+        mo += rf * rain * exp(-100.0 / (251 - lastmc)) * (1.0 - exp(-6.93 / rain))
+        if lastmc > 150:
+            mo += 0.0015 * pow(lastmc - 150, 2) * sqrt(rain)
+        if mo > 250.0: 
+            mo = 250.0
+    # duplicated in both formulas, so calculate once
+    e1 = 0.18 * (21.1 - temp) * (1.0 - (exp(-0.115 * rh)))
+    ed = 0.942 * pow(rh, 0.679) + (11.0 * exp((rh - 100) / 10.0)) + e1
+    ew = 0.618 * pow(rh, 0.753) + (10.0 * exp((rh - 100) / 10.0)) + e1
+    m = ew if (mo < ed) else ed
+    if mo != ed:
+        # these are the same formulas with a different value for a1
+        a1 = (rh / 100.0) if (mo > ed) else ((100.0 - rh) / 100.0)
+        k0_or_k1 = 0.424 * (1 - pow(a1, 1.7)) + (0.0694 * sqrt(ws) * (1 - pow(a1, 8)))
+        kd_or_kw = 2.0 * drf * k0_or_k1 * exp(0.0365 * temp)
+        m += (mo - m) * pow(10, (-kd_or_kw * time_increment))
+    return m
+
+##
+# Calculate duff moisture content
+#
+# @param last_mcdmc             Previous duff moisture content (%)
+# @param hr                     Time of day (hr)
+# @param temp                   Temperature (Celcius)
+# @param rh                     Relative Humidity (%)
+# @param prec                   Hourly precipitation (mm)
+# @param sunrise                Sunrise (hr)
+# @param sunset                 Sunset (hr)
+# @param prec_cumulative_prev   Cumulative precipitation since start of rain (mm)
+# @param time_increment         Duration of timestep (hr, default 1.0)
+# @param params                 Parameters (default None for the globals)
+# @return                       Hourly duff moisture content (%)
+def duff_moisture_code(
+    last_mcdmc,
+    hr,
+    temp,
+    rh,
+    prec,
+    sunrise,
+    sunset,
+    prec_cumulative_prev,
+    time_increment = 1.0,  # duration of timestep, in hours
+    params = None
+):
+    if params is None:
+        intercept, regression, offset_temp = DMC_INTERCEPT, DMC_REGRESSION, DMC_OFFSET_TEMP
+    else:
+        intercept = params.dmc_intercept
+        regression = params.dmc_regression
+        offset_temp = params.dmc_offset_temp
+    # wetting
+    if prec_cumulative_prev + prec > intercept:  # prec_cumulative above threshold
+        if prec_cumulative_prev <= intercept:  # just passed threshold
+            rw = (prec_cumulative_prev + prec) * 0.92 - 1.27
+        else:  # previously passed threshold
+            rw = prec * 0.92
+        
+        last_dmc = mcdmc_to_dmc(last_mcdmc)
+        if last_dmc <= 33:
+            b = 100.0 / (0.3 * last_dmc + 0.5)
+        elif last_dmc <= 65:
+            b = -1.3 * log(last_dmc) + 14.0
+        else:
+            b = 6.2 * log(last_dmc) - 17.2
+        
+        mr = last_mcdmc + (1e3 * rw) / (b * rw + 48.77)
+    else:  # prec_cumulative below threshold
+        mr = last_mcdmc
+    
+    if mr > 300.0:
+        mr = 300.0
+    
+    # drying
+    # since sunset can be > 24, check hr + 24 (ignoring change between days)
+    if (sunrise <= hr <= sunset or
+        (hr < 6 and sunrise <= hr + 24 <= sunset)):  # daytime
+        if temp < 0:
+            temp = 0.0
+        rk = regression * (temp + offset_temp) * (100.0 - rh)
+        invtau = rk / 43.43
+        mcdmc = (mr - 20.0) * exp(-time_increment * invtau) + 20.0
+    else:  # nighttime
+        mcdmc = mr
+    
+    if mcdmc > 300.0:
+        mcdmc = 300.0
+    
+    return(mcdmc)
+
+##
+# Calculate drought code moisture content
+#
+# @param last_mcdc              Previous drought code moisture content (%)
+# @param hr                     Time of day (hr)
+# @param temp                   Temperature (Celcius)
+# @param prec                   Hourly precipitation (mm)
+# @param sunrise                Sunrise (hr)
+# @param sunset                 Sunset (hr)
+# @param prec_cumulative_prev   Cumulative precipitation since start of rain (mm)
+# @param time_increment         Duration of timestep (hr, default 1.0)
+# @param params                 Parameters (default None for the globals)
+# @return                       Hourly drought code moisture content (%)
+def drought_code(
+    last_mcdc,
+    hr,
+    temp,
+    prec,
+    sunrise,
+    sunset,
+    prec_cumulative_prev,
+    time_increment = 1.0,
+    params = None
+):
+    if params is None:
+        intercept, regression, offset_temp = DC_INTERCEPT, DC_REGRESSION, DC_OFFSET_TEMP
+    else:
+        intercept = params.dc_intercept
+        regression = params.dc_regression
+        offset_temp = params.dc_offset_temp
+    # wetting
+    if prec_cumulative_prev + prec > intercept:  # prec_cumulative above threshold
+        if prec_cumulative_prev <= intercept:  # just passed threshold
+            rw = (prec_cumulative_prev + prec) * 0.83 - 1.27
+        else:  # previously passed threshold
+            rw = prec * 0.83
+        mr = last_mcdc + 3.937 * rw / 2.0
+    else:
+        mr = last_mcdc
+    
+    if mr > 400.0:
+        mr = 400.0
+    
+    # drying
+    # since sunset can be > 24, check hr + 24 (ignoring change between days)
+    if (sunrise <= hr <= sunset or
+        (hr < 6 and sunrise <= hr + 24 <= sunset)):  # daytime
+        if temp > 0:
+            pe = regression * (temp + offset_temp) + 3.0 / 16.0
+        else:
+            pe = 0
+        invtau = pe / 400.0
+        mcdc = mr * exp(-time_increment * invtau)
+    else:  # nighttime
+        mcdc = mr
+
+    if mcdc > 400.0:
+        mcdc = 400.0
+    
+    return(mcdc)
+
+##
+# Calculate Initial Spread Index (ISI)
+#
+# @param wind            Wind Speed (km/h)
+# @param ffmc            Fine Fuel Moisure Code
+# @return                Initial Spread Index
+def initial_spread_index(ws, ffmc):
+    fm = ffmc_to_mcffmc(ffmc)
+    fw = (12 * (1 - exp(-0.0818 * (ws - 28)))) if (40 <= ws) else exp(0.05039 * ws)
+    ff = 91.9 * exp(-0.1386 * fm) * (1.0 + fm**5.31 / 4.93e07)
+    isi = 0.208 * fw * ff
+    return isi
+
+##
+# Calculate Build-up Index (BUI)
+#
+# @param dmc             Duff Moisture Code
+# @param dc              Drought Code
+# @return                Build-up Index
+def buildup_index(dmc, dc):
+    bui = 0.0 if (0 == dmc and 0 == dc) else (0.8 * dc * dmc / (dmc + 0.4 * dc))
+    if bui < dmc:
+        p = (dmc - bui) / dmc
+        cc = 0.92 + pow(0.0114 * dmc, 1.7)
+        bui = dmc - cc * p
+        if bui <= 0:
+            bui = 0.0
+    return bui
+
+##
+# Calculate Fire Weather Index (FWI)
+#
+# @param isi             Initial Spread Index
+# @param bui             Build-up Index
+# @return                Fire Weather Index
+def fire_weather_index(isi, bui):
+    if bui > 80:
+        bb = 0.1 * isi * 1000 / (25 + 108.64 / exp(0.023 * bui))
+    else:
+        bb = 0.1 * isi * (0.626 * pow(bui, 0.809) + 2)
+    fwi = bb if bb <= 1 else exp(2.72 * pow(0.434 * log(bb), 0.647))
+    return fwi
+
+
+def daily_severity_rating(fwi):
+    return 0.0272 * pow(fwi, 1.77)
+
+##
+# Calculate hourly grassland fuel moisture content. Needs to be converted to get GFMC.
+#
+# @param lastmc          Previous grassland fuel moisture content (percent)
+# @param temp            Temperature (Celcius)
+# @param rh              Relative Humidity (percent, 0-100)
+# @param ws              Wind Speed (km/h)
+# @param rain            Rainfall (mm)
+# @param solrad          Solar radiation (kW/m^2)
+# @param load            Grassland Fuel Load (kg/m^2)
+# @param time_increment  Duration of timestep (hr, default 1.0)
+# @return                Grassland fuel moisture content (percent)
+def hourly_grass_fuel_moisture(
+    lastmc,
+    temp,
+    rh,
+    ws,
+    rain,
+    solrad,
+    load,
+    time_increment = 1.0
+):
+
+    rf = 0.27
+    drf = 0.389633
+    # use moisture directly instead of converting to/from ffmc
+    # expects any rain intercept to already be applied
+    mo = lastmc
+    if rain != 0.0:
+        mo += rain / load * 100.0
+        if mo > 250:
+            mo = 250.0
+    # fuel temp from CEVW
+    tf = temp + 17.9 * solrad * exp(-0.034 * ws)
+    # fuel humidity
+    if tf > temp:
+        rhf = (rh * 6.107 * pow(10.0, 7.5 * temp / (temp + 237.0)) /
+            (6.107 * pow(10.0, 7.5 * tf / (tf + 237.0))))
+    else:
+        rhf = rh
+    # 18.85749879,18.85749879,7.77659602,21.24361786,19.22479551,19.22479551
+    # duplicated in both formulas, so calculate once
+    e1 = rf * (26.7 - tf) * (1.0 - (1.0 / exp(0.115 * rhf)))
+    # GRASS EMC
+    ed = 1.62 * pow(rhf, 0.532) + (13.7 * exp((rhf - 100) / 13.0)) + e1
+    ew = 1.42 * pow(rhf, 0.512) + (12.0 * exp((rhf - 100) / 18.0)) + e1
+    
+    moed = mo - ed
+    moew = mo - ew
+    
+    e = None
+    a1 = None
+    m = None
+    moe = None
+    
+    if (moed == 0) or (moew >= 0 and moed < 0):
+        m = mo
+        if (moed == 0):
+            e = ed
+        if moew >= 0:
+            e = ew
+    else:
+        if moed > 0:
+            a1 = rhf / 100.0
+            e = ed
+            moe = moed
+        else:
+            a1 = (100.0 - rhf) / 100.0
+            e = ew
+            moe = moew
+        if (a1 < 0):
+            # avoids complex number in a1^1.7 xkd calculation
+            a1 = 0
+        xkd = (0.424 * (1 - a1 ** 1.7) + (0.0694 * sqrt(ws) * (1 - a1 ** 8)))
+        xkd = xkd * drf * exp(0.0365 * tf)
+        m = e + moe * exp(-1.0 * log(10.0) * xkd * time_increment)
+    return m
+
+def Pign(mc, wind2m, Cint, Cmc, Cws):
+    #  Thisd is the general standard form for the probability of sustained flaming models for each FF cover type
+    #     here :
+    #       mc is cured moisture (%) in the litter fuels being ignited
+    #       wind2m (km/h)  is the estimated 2 metre standard height for wind at hte site of the fire ignition
+    #       Cint, Cmc and Cws   are coefficients for the standard Pign model form for a given FF cover type
+
+    #       return >> is the Probability of Sustained flaming from a single small flaming ember/brand
+    Prob = 1.0 / (1.0 + exp(-1.0 * (Cint + Cmc * mc + Cws * wind2m)))
+    return Prob
+
+def curing_factor(cur):
+    # cur is the percentage cure of the grass fuel complex.  100= fully cured
+    #   ....The OPPOSITE (100-x) of greenness...
+
+    #    This is the Cruz et al (2015) model with the original precision of the coefficent estimates
+    #    and as in CSIRO code:https://research.csiro.au/spark/resources/model-library/csiro-grassland-models/
+    cf = (1.036 / (1 + 103.989 * exp(-0.0996 * (cur - 20)))) if (cur >= 20.0) else 0.0
+    return cf
+
+def mcgfmc_to_gfmc(mc, cur, wind):
+    #   THIS is the way to get the CODE value from cured grassland moisture
+    #     IT takes fully cured grass moisture  (from the grass moisture model (100% cured)  (from the FMS...updated version of Wotton 2009)
+    #        and a estimate of the fuel complex curing (as percent cured)
+    #        and estimated wind speed (necessary for a calc
+    #     and calculated the probability of sustainable flaming ignition  (a funciton of MC  and wind)
+    #     THEN it accounts for curing effect on probability of fire spread sustainability, using the curing factor from Cruz et al (2015) for grass
+    #     THEN from this calcuates an 'effective moisture content' which is the moisture content that would be required to achieve
+    #        the curing adjusted probabiltiy of sustained flaming if one were calcuating it directly through the standard Pign equation.
+    #     and THEN converts this effective moisture content to a CODE value via the FF-scale the FFMC uses for consistency
+
+    #     relies on models of:
+    #        Prob of sustained flaming for grass model (PsusF(grass)
+    #        and  the curing_factor  function
+    #        AND and estiamte of open 10 m to 2 m wind reduction (0.75)...hardcoded in here now.....
+
+    # MC is moisture content (%)
+    # cur=percent curing of the grassland  (%)
+    # wind=  10 m open wind (km/h)
+
+    #     currently (NOv 2023) the coefficients for the PsusF(grass) models are hardcoded into the GFMC function
+
+    wind2m_open_factor = 0.75
+
+    Intercept = 1.49
+    Cmoisture = -0.11
+    Cwind = 0.075
+    # GRASS: these coefficients (above) could change down the road .....explicitly coded in above*/
+    # /* convert from 10 m wind in open to 2 m wind in open COULD be updated */
+    wind2m = wind2m_open_factor * wind
+
+    probign = Pign(mc, wind2m, Intercept, Cmoisture, Cwind)
+
+    # /* adjust ignition diretctly with the curing function on ROS */
+    newPign = curing_factor(cur) * probign
+
+    # /* now to back calc effective moisture - algebraically reverse the Pign equation*/
+    # /* 250 is a saturation value just a check*/
+    egmc = (
+        ((log(newPign / (1.0 - newPign)) - Intercept - Cwind * wind2m) / Cmoisture)
+        if (newPign > 0.0)
+        else 250
+    )
+
+    if egmc > 250.0:
+        egmc = 250.0
+    return mcffmc_to_ffmc(egmc)
+
+def matted_grass_spread_ROS(ws, mc, cur):
+    #  /*  CUT grass  Rate  of spread from cheney 1998  (and new CSIRO grassland code
+    #   We use this for MATTED grass in our post-winter context
+    #   --ws=10 m open wind km/h
+    #   --mc = moisture content in  cured grass  (%)
+    #   --cur = percentage of grassland cured  (%)
+    #   output should be ROS in m/min   */
+    fw = 16.67 * (
+        (0.054 + 0.209 * ws) if (ws < 5) else (1.1 + 0.715 * (ws - 5.0) ** 0.844)
+    )
+    fm = (
+        exp(-0.108 * mc)
+        if mc < 12
+        else (
+            0.6838 - 0.0342 * mc
+            if (mc < 20.0 and ws < 10.0)
+            else 0.547 - 0.0228 * mc
+            if (mc < 23.9 and ws >= 10.0)
+            else 0.0
+        )
+    )
+    if (fm < 0):
+      fm = 0.0
+    cf = curing_factor(cur)
+    return fw * fm * cf
+
+def standing_grass_spread_ROS(ws, mc, cur):
+    #  /*  standing grass  Rate  of spread from cheney 1998  (and new CSIRO grassland code)
+    #   We use this for standing grass in our post-winter context
+    #   ITS only the WIND function that chnges here between cut and standing
+    #   --ws=10 m open wind km/h
+    #   --mc = moisture content in grass  (%)
+    #   --cur = percentage of grassland cured  (%)
+    #   output should be ROS in m/min   */
+    fw = 16.67 * (
+        (0.054 + 0.269 * ws) if (ws < 5) else (1.4 + 0.838 * (ws - 5.0) ** 0.844)
+    )
+    fm = (
+        exp(-0.108 * mc)
+        if mc < 12
+        else (
+            0.6838 - 0.0342 * mc
+            if (mc < 20.0 and ws < 10.0)
+            else 0.547 - 0.0228 * mc
+            if (mc < 23.9 and ws >= 10.0)
+            else 0.0
+        )
+    )
+    if (fm < 0):
+      fm = 0.0
+    cf = curing_factor(cur)
+    return fw * fm * cf
+
+##
+# Calculate Grassland Spread Index (GSI)
+#
+# @param ws              Wind Speed (km/h)
+# @param mc              Grass moisture content (percent)
+# @param cur             Degree of curing (percent, 0-100)
+# @param standing        Grass standing (True/False)
+# @return                Grassland Spread Index
+def grass_spread_index(ws, mc, cur, standing):
+    #  So we don't have to transition midseason between standing and matted grass spread rate models
+    #  We will simply scale   GSI   by the average of the   matted and standing spread rates
+    
+    #now allowing switch between standing and matted grass
+    ros = None
+    if (standing):
+      #standing
+      ros = standing_grass_spread_ROS(ws, mc, cur)
+    
+    else:
+      #matted
+      ros = matted_grass_spread_ROS(ws, mc, cur)
+    
+    
+    return 1.11 * ros
+
+##
+# Calculate Grassland Fire Weather Index
+#
+# @param gsi               Grassland Spread Index
+# @param load              Grassland Fuel Load (kg/m^2)
+# @return                  Grassland Fire Weather Index
+def grass_fire_weather_index(gsi, load):
+    # this just converts back to ROS in m/min
+    ros = gsi / 1.11
+    Fint = 300.0 * load * ros
+    if Fint > 100:
+        return(log(Fint / 60.0) / 0.14)
+    else:
+        return(Fint / 25.0)
+
+# Calculate number of drying "units" this hour contributes
+def drying_units():  # temp, rh, ws, rain, solrad
+    # for now, just add 1 drying "unit" per hour
+    return 1.0
+
+def rain_since_intercept_reset(rain, canopy):
+    # for now, want 5 "units" of drying (which is 1 per hour to start)
+    TARGET_DRYING_SINCE_INTERCEPT = 5.0
+    if rain > 0 or canopy["rain_total_prev"] == 0:  # if raining, reset drying
+        canopy["drying_since_intercept"] = 0.0
+    else:
+        canopy["drying_since_intercept"] += drying_units()
+        if canopy["drying_since_intercept"] >= TARGET_DRYING_SINCE_INTERCEPT:
+            # reset rain if intercept reset criteria met
+            canopy["rain_total_prev"] = 0.0
+            canopy["drying_since_intercept"] = 0.0
+    return canopy
+
+##
+# Rain reaching the fine fuels this hour, after the FFMC canopy intercept
+#
+# @param    rain_total_prev     cumulative precipitation before this hour (mm)
+# @param    prec                hourly precipitation (mm)
+# @param    params              Parameters (default None for the globals)
+# @return                       rain for hourly_fine_fuel_moisture() (mm)
+def ffmc_effective_rain(rain_total_prev, prec, params = None):
+    intercept = FFMC_INTERCEPT if params is None else params.ffmc_intercept
+    if rain_total_prev + prec <= intercept:  # not enough rain
+        return 0.0
+    elif rain_total_prev > intercept:  # already saturated canopy
+        return prec
+    return rain_total_prev + prec - intercept
+
+##
+# Set default percent_cured values based off annual variation in Boreal Plains region
+#
+# @param yr             Year
+# @param mon            Month of year
+# @param day            Day of month
+# @param start_mon      Month of grassland fuel green up start (Boreal Plains Mar 12)
+# @param start_day      Day of grassland fuel green up start (Boreal Plains Mar 12)
+# @return               percent_cured [%], percent of grassland fuel that is cured
+
+def seasonal_curing(yr, mon, day, start_mon = 3, start_day = 12):
+    # find previous green up start date (year - 1 or year)
+    shift = datetime.date(yr, mon, day) - datetime.date(yr, start_mon, start_day)
+    if shift.days < 0:
+        shift = datetime.date(yr, mon, day) - datetime.date(yr - 1, start_mon, start_day)
+    days_in = shift.days + 1  # green up start date is first value different (not 0th)
+    # check if date is in green phase or winter (cured) phase
+    if days_in < (len(SEASONAL_PERCENT_CURED) - 1) * 10:
+        # linear interpolation between every 10-day value
+        per_cur0 = SEASONAL_PERCENT_CURED[days_in // 10]
+        per_cur1 = SEASONAL_PERCENT_CURED[days_in // 10 + 1]
+        period_frac = (days_in % 10) / 10.0
+        return per_cur0 + (per_cur1 - per_cur0) * period_frac
+    else:
+        return SEASONAL_PERCENT_CURED[-1]
+
+##
+# Solar declination and equation of time for a date (same as util.get_sunlight())
+#
+# @param date           date (datetime.date)
+# @return               (declination (radians), equation of time (minutes))
+def _solar_day(date):
+    jd = date.timetuple().tm_yday
+    dec_hour = 12.0
+    fracyear = 2.0 * pi * (jd - 1.0 + (dec_hour - 12.0) / 24.0)
+    fracyear = fracyear / 366.0 if isleap(date.year) else fracyear / 365.0
+    eqtime = 229.18 * (0.000075 +
+        0.001868 * cos(fracyear) - 0.032077 * sin(fracyear) -
+        0.014615 * cos(2.0 * fracyear) - 0.040849 * sin(2.0 * fracyear))
+    decl = (0.006918 -
+        0.399912 * cos(fracyear) + 0.070257 * sin(fracyear) -
+        0.006758 * cos(fracyear * 2.0) + 0.000907 * sin(2.0 * fracyear) -
+        0.002697 * cos(3.0 * fracyear) + 0.00148 * sin(3.0 * fracyear))
+    return decl, eqtime
+
+##
+# Calculate sunrise and sunset for one location and day
+#
+# @param lat            Latitude (degrees)
+# @param long           Longitude (degrees)
+# @param timezone       UTC offset (hr)
+# @param date           date (datetime.date)
+# @return               (sunrise (hr), sunset (hr)), sunset can be > 24
+def sunrise_sunset(lat, long, timezone, date):
+    decl, eqtime = _solar_day(date)
+    zenith = 90.833 * pi / 180.0
+    x_tmp = (cos(zenith) / (cos(lat * pi / 180.0) * cos(decl)) -
+        tan(lat * pi / 180.0) * tan(decl))
+    # keep in range
+    x_tmp = max(-1, min(1, x_tmp))
+    halfday = 180.0 / pi * acos(x_tmp)
+    sunrise = (720.0 - 4.0 * (long + halfday) - eqtime) / 60 + timezone
+    sunset = (720.0 - 4.0 * (long - halfday) - eqtime) / 60 + timezone
+    return sunrise, sunset
+
+##
+# Calculate solar radiation for one location and hour
+#
+# @param lat            Latitude (degrees)
+# @param long           Longitude (degrees)
+# @param timezone       UTC offset (hr)
+# @param date           date (datetime.date)
+# @param hr             Hour of day
+# @param temp           Temperature (Celcius)
+# @param rh             Relative Humidity (percent, 0-100)
+# @return               Solar radiation (kW/m^2)
+def solar_radiation(lat, long, timezone, date, hr, temp, rh):
+    decl, eqtime = _solar_day(date)
+    timeoffset = eqtime + 4 * long - 60 * timezone
+    tst = hr * 60.0 + timeoffset
+    hourangle = tst / 4 - 180
+    zenith = acos(sin(lat * pi / 180) * sin(decl) +
+        cos(lat * pi / 180) * cos(decl) * cos(hourangle * pi / 180))
+    zenith = min(pi / 2, zenith)
+    vpd = 6.11 * (1.0 - rh / 100.0) * exp(17.29 * temp / (temp + 237.3))
+    solrad = cos(zenith) * 0.92 * (1.0 - exp(-0.22 * vpd))
+    if solrad < 1e-4:  # always set low values to 0
+        solrad = 0.0
+    return solrad
+
+### State-step API ###
+
+# variables carried from one hour to the next (the *_old arguments of hFWI())
+STATE_VARIABLES = ["mcffmc", "mcdmc", "mcdc", "mcgfmc_matted", "mcgfmc_standing",
+    "prec_cumulative", "canopy_drying"]
+
+##
+# State of one station between hours: moisture contents, the canopy rain and drying
+# counters and the date of the matted to standing grass transition (None until the
+# first step sets it, like the first row of a station year in hFWI())
+class StationState:
+    __slots__ = STATE_VARIABLES + ["date_grass_standing"]
+
+    def __init__(
+        self,
+        mcffmc,
+        mcdmc,
+        mcdc,
+        mcgfmc_matted,
+        mcgfmc_standing,
+        prec_cumulative = 0.0,
+        canopy_drying = 0.0,
+        date_grass_standing = None
+    ):
+        self.mcffmc = mcffmc
+        self.mcdmc = mcdmc
+        self.mcdc = mcdc
+        self.mcgfmc_matted = mcgfmc_matted
+        self.mcgfmc_standing = mcgfmc_standing
+        self.prec_cumulative = prec_cumulative
+        self.canopy_drying = canopy_drying
+        self.date_grass_standing = date_grass_standing
+
+    def __repr__(self):
+        return "StationState(" + ", ".join(
+            "{}={!r}".format(k, getattr(self, k)) for k in self.__slots__) + ")"
+
+    def __eq__(self, other):
+        return (isinstance(other, StationState) and
+            all(getattr(self, k) == getattr(other, k) for k in self.__slots__))
+
+    def copy(self):
+        return StationState(*(getattr(self, k) for k in self.__slots__))
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{k: d[k] for k in cls.__slots__ if k in d})
+
+##
+# Make the state to start a run from, same defaults as hFWI()
+#
+# @param ffmc                   startup FFMC
+# @param dmc                    startup DMC
+# @param dc                     startup DC
+# @param mcgfmc_matted          startup matted mcgfmc (default FFMC = 85)
+# @param mcgfmc_standing        startup standing mcgfmc (default FFMC = 85)
+# @param prec_cumulative        cumulative precipitation this rainfall
+# @param canopy_drying          consecutive hours of no rain
+# @param date_grass_standing    matted to standing transition (default None to set it
+#                               from the first step)
+# @return                       StationState
+def initial_state(
+    ffmc = FFMC_DEFAULT,
+    dmc = DMC_DEFAULT,
+    dc = DC_DEFAULT,
+    mcgfmc_matted = None,
+    mcgfmc_standing = None,
+    prec_cumulative = 0.0,
+    canopy_drying = 0.0,
+    date_grass_standing = None
+):
+    return StationState(
+        ffmc_to_mcffmc(ffmc),
+        dmc_to_mcdmc(dmc),
+        dc_to_mcdc(dc),
+        ffmc_to_mcffmc(FFMC_DEFAULT) if mcgfmc_matted is None else mcgfmc_matted,
+        ffmc_to_mcffmc(FFMC_DEFAULT) if mcgfmc_standing is None else mcgfmc_standing,
+        prec_cumulative,
+        canopy_drying,
+        date_grass_standing
+    )
+
+##
+# Matted to standing transition for a run starting on a date (July 1st of that year,
+# or of the next year if it has already passed)
+#
+# @param date           first date of the run (datetime.date)
+# @param params         Parameters (default None for the globals)
+# @return               transition date (datetime.date)
+def grass_standing_date(date, params = None):
+    if params is None:
+        mon, day = MON_STANDING, DAY_STANDING
+    else:
+        mon, day = params.mon_standing, params.day_standing
+    standing = datetime.date(date.year, mon, day)
+    if standing < date:  # use next year if date already passed
+        standing = datetime.date(date.year + 1, mon, day)
+    return standing
+
+
+def _obs_date(obs):
+    if "date" in obs:
+        return obs["date"]
+    return datetime.date(int(obs["yr"]), int(obs["mon"]), int(obs["day"]))
+
+##
+# Advance a station one hour, the same calculation as one row of hFWI()
+# Values hFWI() would add to the weather are calculated when obs doesn't have them:
+# sunrise, sunset and solrad from lat, long and timezone, percent_cured from
+# seasonal_curing(), grass_fuel_load (DEFAULT_GRASS_FUEL_LOAD) and standing from the
+# state's grass transition date. The grass outputs are skipped without solrad or a
+# location to calculate it from.
+#
+# @param state      StationState, not modified
+# @param obs        weather this hour (dictionary): date (or yr, mon, day), hr, temp,
+#                   rh, ws, prec and lat, long, timezone or the values they give
+# @param params     Parameters (default None for the globals)
+# @return           (new StationState, dictionary of outputs)
+def step(state, obs, params = None):
+    temp = obs["temp"]
+    rh = obs["rh"]
+    ws = obs["ws"]
+    prec = obs["prec"]
+    hr = obs["hr"]
+    date = _obs_date(obs)
+    new = state.copy()
+    if new.date_grass_standing is None:
+        new.date_grass_standing = grass_standing_date(date, params)
+    out = {}
+    if "sunrise" in obs and "sunset" in obs:
+        sunrise, sunset = obs["sunrise"], obs["sunset"]
+    else:
+        sunrise, sunset = sunrise_sunset(obs["lat"], obs["long"], obs["timezone"], date)
+        out["sunrise"] = sunrise
+        out["sunset"] = sunset
+        out["sunlight_hours"] = sunset - sunrise
+    canopy = rain_since_intercept_reset(prec,
+        {"rain_total_prev": state.prec_cumulative,
+        "drying_since_intercept": state.canopy_drying})
+    new.mcffmc = hourly_fine_fuel_moisture(state.mcffmc, temp, rh, ws,
+        ffmc_effective_rain(canopy["rain_total_prev"], prec, params))
+    new.mcdmc = duff_moisture_code(state.mcdmc, hr, temp, rh, prec,
+        sunrise, sunset, canopy["rain_total_prev"], params = params)
+    new.mcdc = drought_code(state.mcdc, hr, temp, prec,
+        sunrise, sunset, canopy["rain_total_prev"], params = params)
+    out["mcffmc"] = new.mcffmc
+    out["ffmc"] = mcffmc_to_ffmc(new.mcffmc)
+    out["dmc"] = mcdmc_to_dmc(new.mcdmc)
+    out["dc"] = mcdc_to_dc(new.mcdc)
+    out["isi"] = initial_spread_index(ws, out["ffmc"])
+    out["bui"] = buildup_index(out["dmc"], out["dc"])
+    out["fwi"] = fire_weather_index(out["isi"], out["bui"])
+    out["dsr"] = daily_severity_rating(out["fwi"])
+    new.prec_cumulative = canopy["rain_total_prev"] + prec
+    new.canopy_drying = canopy["drying_since_intercept"]
+    if "solrad" in obs or "lat" in obs:
+        if "solrad" in obs:
+            solrad = obs["solrad"]
+        else:
+            solrad = solar_radiation(obs["lat"], obs["long"], obs["timezone"], date,
+                hr, temp, rh)
+            out["solrad"] = solrad
+        if "percent_cured" in obs:
+            cur = obs["percent_cured"]
+        else:
+            cur = seasonal_curing(date.year, date.month, date.day)
+            out["percent_cured"] = cur
+        if "grass_fuel_load" in obs:
+            load = obs["grass_fuel_load"]
+        else:
+            load = (DEFAULT_GRASS_FUEL_LOAD if params is None
+                else params.default_grass_fuel_load)
+            out["grass_fuel_load"] = load
+        if "standing" in obs:
+            standing = obs["standing"]
+        else:
+            transition = GRASS_TRANSITION if params is None else params.grass_transition
+            standing = not (transition and date < new.date_grass_standing)
+        new.mcgfmc_matted = hourly_grass_fuel_moisture(state.mcgfmc_matted,
+            temp, rh, ws, prec, solrad, load)
+        # standing grass: 6% of the rain and no solar heating (see NG_FWI._stnHFWI())
+        new.mcgfmc_standing = hourly_grass_fuel_moisture(state.mcgfmc_standing,
+            temp, rh, ws, prec * 0.06, 0.0, load)
+        mcgfmc = new.mcgfmc_standing if standing else new.mcgfmc_matted
+        out["mcgfmc_matted"] = new.mcgfmc_matted
+        out["mcgfmc_standing"] = new.mcgfmc_standing
+        out["gfmc"] = mcgfmc_to_gfmc(mcgfmc, cur, ws)
+        out["gsi"] = grass_spread_index(ws, mcgfmc, cur, standing)
+        out["gfwi"] = grass_fire_weather_index(out["gsi"], load)
+    out["prec_cumulative"] = new.prec_cumulative
+    out["canopy_drying"] = new.canopy_drying
+    return new, out
+
+# pandas-facing functions, only imported (with pandas) the first time they are used
+_LAZY = {"hFWI": "NG_FWI", "generate_daily_summaries": "daily_summaries"}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name]), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,515 @@
+# Long-running local FWI service
+#
+# Keeps the state of every station in memory (see fwi_batch.StateArray) and steps
+# stations one hour at a time as observations arrive, instead of re-running hFWI()
+# over each station's history for every update. Observations from requests that
+# arrive close together are stepped as one vectorized batch (fwi_batch.step_batch()).
+# States are saved to a JSON snapshot periodically and on shutdown, and loaded again
+# on start. A snapshot file ending in .db is a state database (see state_store.py)
+# instead, where each station's state is saved at the last hour it was stepped, so
+# hFWI() runs of the GISS scripts and the service can continue from each other.
+# Only the standard library and NumPy are used, and the service listens on
+# localhost or a Unix socket, so it can be run and tested without outside services.
+#
+#   python fwi_service.py --port 8080 --snapshot fwi_state.json
+#   python fwi_service.py --port 8080 --snapshot fwi_state.db
+#   python fwi_service.py --socket /tmp/fwi.sock
+#
+# HTTP API (JSON bodies):
+#   POST /step          {"observations": [{"id", "yr", "mon", "day", "hr", "temp", "rh",
+#                       "ws", "prec", "lat", "long", "timezone", ...}, ...]}
+#                       -> {"results": [{"id", "yr", "mon", "day", "hr", "ffmc", ...}]}
+#                       lat, long and timezone are remembered from a station's earlier
+#                       observations, the other optional values are as in fwi_core.step()
+#                       each station's observations must be for hours after the last hour
+#                       it was stepped to, so a repeated request is rejected (400)
+#   GET  /state/<id>    state of a station (fwi_core.StationState fields)
+#   PUT  /state/<id>    set a station's state: StationState fields, or the startup
+#                       codes ffmc, dmc, dc (and other fwi_core.initial_state() arguments),
+#                       which can then be stepped from any hour
+#   GET  /stations      station ids
+#   POST /snapshot      save a snapshot now
+#   GET  /health        number of stations and batches run
+
+### Import packages ###
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from urllib.parse import unquote
+
+import numpy as np
+
+# Import from other CFFDRS code files
+import fwi_batch
+import fwi_core
+import state_store
+
+logger = logging.getLogger("cffdrs")
+
+# decimals of the returned outputs (same as hFWI())
+ROUND_OUT = 4
+REQUIRED = ["id", "yr", "mon", "day", "hr", "temp", "rh", "ws", "prec"]
+LOCATION = ["lat", "long", "timezone"]
+
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+##
+# Check one observation, same valid ranges as hFWI()
+#
+# @param    obs         observation dictionary
+# @param    located     station ids with a location already (observations without
+#                       lat, long and timezone, or sunrise and sunset, need one)
+# @return               None, raises ValueError if not valid
+def check_observation(obs, located = ()):
+    for col in REQUIRED:
+        if not col in obs:
+            raise ValueError("Missing required observation value: " + col)
+    if (not all(k in obs for k in LOCATION) and not ("sunrise" in obs and "sunset" in obs)
+            and obs["id"] not in located):
+        raise ValueError("Station " + str(obs["id"]) +
+            " has no location, lat, long and timezone are required")
+    if not (0 <= obs["rh"] <= 100):
+        raise ValueError("Relative humidity (rh) must be between 0-100%")
+    if not (obs["ws"] >= 0):
+        raise ValueError("Wind speed (ws) must be >= 0")
+    if not (obs["prec"] >= 0):
+        raise ValueError("Precipitation (prec) must be >= 0")
+    if not (1 <= obs["mon"] <= 12):
+        raise ValueError("Month (mon) must be between 1-12")
+    if not (1 <= obs["day"] <= 31):
+        raise ValueError("Day (day) must be 1-31")
+    if "solrad" in obs and not (obs["solrad"] >= 0):
+        raise ValueError("Solar radiation (solrad) must be >= 0")
+    if "percent_cured" in obs and not (0 <= obs["percent_cured"] <= 100):
+        raise ValueError("percent_cured must be between 0-100%")
+    if "grass_fuel_load" in obs and not (obs["grass_fuel_load"] > 0):
+        raise ValueError("grass_fuel_load must be > 0")
+
+
+def state_to_json(state):
+    d = state.to_dict()
+    if d["date_grass_standing"] is not None:
+        d["date_grass_standing"] = d["date_grass_standing"].isoformat()
+    return d
+
+
+def state_from_json(d):
+    if "mcffmc" not in d:
+        # startup codes, as for hFWI()
+        args = {k: d[k] for k in ["ffmc", "dmc", "dc", "mcgfmc_matted",
+            "mcgfmc_standing", "prec_cumulative", "canopy_drying"] if k in d}
+        state = fwi_core.initial_state(**args)
+    else:
+        state = fwi_core.StationState.from_dict(d)
+    if d.get("date_grass_standing") is not None:
+        state.date_grass_standing = datetime.date.fromisoformat(d["date_grass_standing"])
+    return state
+
+##
+# Station states and the stepping of observations, independent of the server
+class FWIService:
+    def __init__(self, snapshot_file = None, snapshot_interval = 300.0,
+        batch_window = 0.005, max_batch = 10000):
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.states = fwi_batch.initial_states(0)
+        # station id -> row of self.states
+        self.index = {}
+        # station id -> {"lat", "long", "timezone"} from its last observation with them
+        self.locations = {}
+        # station id -> hour (state_store.hour_index()) of its last observation
+        self.times = {}
+        self.batches = 0
+        self.dirty = False
+        self._pending = []
+        self._pending_count = 0
+        self._wake = None
+        self._timer = None
+        if snapshot_file is not None and os.path.isfile(snapshot_file):
+            self.load_snapshot(snapshot_file)
+
+    def station_ids(self):
+        return list(self.index)
+
+    def _rows(self, ids):
+        new_ids = [i for i in dict.fromkeys(ids) if i not in self.index]
+        if len(new_ids) > 0:
+            for k, i in enumerate(new_ids):
+                self.index[i] = len(self.states) + k
+            self.states = fwi_batch.StateArray.concat(
+                [self.states, fwi_batch.initial_states(len(new_ids))])
+        return np.array([self.index[i] for i in ids], dtype = np.int64)
+
+    def get_state(self, station):
+        if station not in self.index:
+            return None
+        return self.states.take([self.index[station]]).to_states()[0]
+
+    def set_state(self, station, state):
+        row = self._rows([station])
+        self.states.put(row, fwi_batch.StateArray.from_states([state]))
+        self.dirty = True
+
+    ##
+    # Check a list of observations, with the locations of their earlier observations
+    # Each station's observations must be for hours after the last hour it was
+    # stepped to and after each other, so a repeated request (e.g. a retry) or an
+    # observation for an hour already stepped doesn't step a station a second time.
+    #
+    # @param    observations    list of observation dictionaries
+    # @return                   None, raises ValueError if any is not valid
+    def check_observations(self, observations):
+        located = set(self.locations)
+        last = {}
+        for obs in observations:
+            check_observation(obs, located)
+            if all(k in obs for k in LOCATION):
+                located.add(obs["id"])
+            station = obs["id"]
+            t = state_store.hour_index(obs["yr"], obs["mon"], obs["day"], obs["hr"])
+            previous = last.get(station, self.times.get(station))
+            if previous is not None and t <= previous:
+                raise ValueError("Station " + str(station) + " is already stepped to " +
+                    "{:04d}-{:02d}-{:02d} {:02d}:00".format(*(int(obs[k])
+                    for k in ["yr", "mon", "day", "hr"])) + " or later, observations must be for later hours")
+            last[station] = t
+
+    ##
+    # Step observations one hour each, in order for each station
+    # A station observed more than once is stepped once per round, so its
+    # observations are applied in the order given. The observations are stepped on
+    # a copy of their stations' states, which is only saved if all of them succeed,
+    # so a failure leaves every station (and the list of stations) as it was.
+    #
+    # @param    observations    list of observation dictionaries (see check_observations())
+    # @return                   list of output dictionaries, in the same order
+    def step_observations(self, observations):
+        self.check_observations(observations)
+        results = [None] * len(observations)
+        remaining = []
+        locations = {}
+        for i, obs in enumerate(observations):
+            obs = dict(obs)
+            station = obs["id"]
+            if all(k in obs for k in LOCATION):
+                locations[station] = {k: obs[k] for k in LOCATION}
+            elif station in locations:
+                obs.update(locations[station])
+            elif station in self.locations:
+                obs.update(self.locations[station])
+            remaining.append((i, obs))
+        ids = list(dict.fromkeys(obs["id"] for _, obs in remaining))
+        known = [i for i in ids if i in self.index]
+        work = fwi_batch.StateArray.concat([
+            self.states.take(np.array([self.index[i] for i in known], dtype = np.int64)),
+            fwi_batch.initial_states(len(ids) - len(known))])
+        work_index = {i: k for k, i in enumerate(known + [i for i in ids if i not in self.index])}
+        times = {}
+        while len(remaining) > 0:
+            seen = set()
+            this_round = {}
+            later = []
+            for i, obs in remaining:
+                if obs["id"] in seen:
+                    later.append((i, obs))
+                else:
+                    seen.add(obs["id"])
+                    # observations with the same values given are stepped together
+                    this_round.setdefault(frozenset(obs), []).append((i, obs))
+            for keys, items in this_round.items():
+                self._step_group(work, work_index, sorted(keys - {"id"}), items, results, times)
+            remaining = later
+        # every observation succeeded, the new states are saved
+        rows = self._rows(list(work_index))
+        self.states.put(rows, work)
+        self.locations.update(locations)
+        self.times.update(times)
+        self.batches += 1
+        self.dirty = True
+        return results
+
+    def _step_group(self, work, work_index, keys, items, results, times):
+        rows = np.array([work_index[obs["id"]] for _, obs in items], dtype = np.int64)
+        obs = {k: np.array([o[k] for _, o in items]) for k in keys}
+        new, out = fwi_batch.step_batch(work.take(rows), obs)
+        work.put(rows, new)
+        for j, (i, o) in enumerate(items):
+            r = {k: o[k] for k in ["id", "yr", "mon", "day", "hr"]}
+            times[o["id"]] = state_store.hour_index(o["yr"], o["mon"], o["day"], o["hr"])
+            for k, v in out.items():
+                r[k] = round(float(v[j]), ROUND_OUT)
+            results[i] = r
+
+    ##
+    # Queue observations to be stepped with the next batch
+    #
+    # @param    observations    list of observation dictionaries
+    # @return                   list of output dictionaries, in the same order
+    async def submit(self, observations):
+        self.check_observations(observations)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((observations, future))
+        self._pending_count += len(observations)
+        if self._pending_count >= self.max_batch:
+            self._wake.set()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_window, self._wake.set)
+        return await future
+
+    async def _batcher(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, []
+            self._pending_count = 0
+            if len(pending) == 0:
+                continue
+            observations = [obs for request, _ in pending for obs in request]
+            try:
+                results = self.step_observations(observations)
+            except Exception:
+                # nothing was saved, each request is stepped on its own so only
+                # the requests that fail get the error
+                logger.exception("Batch of %d observations failed, stepping its %d requests one by one",
+                    len(observations), len(pending))
+                for request, future in pending:
+                    try:
+                        result = self.step_observations(request)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    if not future.done():
+                        future.set_result(result)
+                continue
+            start = 0
+            for request, future in pending:
+                if not future.done():
+                    future.set_result(results[start:start + len(request)])
+                start += len(request)
+
+    async def _snapshotter(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self.dirty:
+                self.save_snapshot()
+
+    ##
+    # Save every station's state and location
+    # Written to a temporary file first and then renamed, so a snapshot is never partial.
+    # A .db file is a state database, updated in one transaction (without locations).
+    #
+    # @param    filename    file to save to (default the service's snapshot_file)
+    def save_snapshot(self, filename = None):
+        filename = self.snapshot_file if filename is None else filename
+        if filename is None:
+            return
+        states = self.states.to_states()
+        if filename.endswith(".db"):
+            with state_store.StateStore(filename) as store:
+                store.upsert(state_store.state_from_station_state(station,
+                    self.times.get(station, state_store.STARTUP_TIME), states[row],
+                    source = "fwi_service") for station, row in self.index.items())
+            self.dirty = False
+            logger.info("Saved %d station states to %s", len(self.index), filename)
+            return
+        stations = {}
+        for station, row in self.index.items():
+            d = state_to_json(states[row])
+            d.update(self.locations.get(station, {}))
+            if station in self.times:
+                d["time"] = self.times[station]
+            stations[station] = d
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"time": time.time(), "stations": stations}, f)
+        os.replace(tmp, filename)
+        self.dirty = False
+        logger.info("Saved %d station states to %s", len(stations), filename)
+
+    def load_snapshot(self, filename):
+        if filename.endswith(".db"):
+            # latest state of every station, in one query
+            with state_store.StateStore(filename) as store:
+                for station, record in store.latest().items():
+                    self.set_state(station, state_store.to_station_state(record))
+                    if record["time"] != state_store.STARTUP_TIME:
+                        self.times[station] = record["time"]
+            self.dirty = False
+            return
+        with open(filename) as f:
+            stations = json.load(f)["stations"]
+        for station, d in stations.items():
+            self.set_state(station, state_from_json(d))
+            if all(k in d for k in LOCATION):
+                self.locations[station] = {k: d[k] for k in LOCATION}
+            if "time" in d:
+                self.times[station] = d["time"]
+        self.dirty = False
+
+    ### HTTP ###
+
+    async def handle(self, method, path, body):
+        parts = [unquote(p) for p in path.split("?")[0].strip("/").split("/")]
+        if parts == ["step"] and method == "POST":
+            observations = body["observations"] if isinstance(body, dict) else body
+            return 200, {"results": await self.submit(observations)}
+        if parts[0] == "state" and len(parts) == 2:
+            if method == "GET":
+                state = self.get_state(parts[1])
+                if state is None:
+                    return 404, {"error": "Unknown station " + parts[1]}
+                return 200, state_to_json(state)
+            if method == "PUT":
+                self.set_state(parts[1], state_from_json(body))
+                # a new state can be stepped from any hour
+                self.times.pop(parts[1], None)
+                return 200, state_to_json(self.get_state(parts[1]))
+        if parts == ["stations"] and method == "GET":
+            return 200, {"stations": self.station_ids()}
+        if parts == ["snapshot"] and method == "POST":
+            self.save_snapshot()
+            return 200, {"snapshot": self.snapshot_file}
+        if parts == ["health"] and method == "GET":
+            return 200, {"status": "ok", "stations": len(self.index),
+                "batches": self.batches}
+        if parts[0] in ("step", "state", "stations", "snapshot", "health"):
+            return 405, {"error": method + " not allowed on " + path}
+        return 404, {"error": "Unknown path " + path}
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                raw = await reader.readexactly(length) if length > 0 else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                    status, result = await self.handle(method.upper(), path, body)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, result = 400, {"error": str(e)}
+                except Exception as e:
+                    logger.exception("Request failed")
+                    status, result = 500, {"error": repr(e)}
+                data = json.dumps(result).encode()
+                close = headers.get("connection", "").lower() == "close"
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+                    "Content-Length: {}\r\n{}\r\n".format(status, HTTP_STATUS[status],
+                    len(data), "Connection: close\r\n" if close else "").encode() + data)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    ##
+    # Run the server until cancelled
+    #
+    # @param    host        address to listen on (default localhost)
+    # @param    port        port to listen on (0 for any free port)
+    # @param    unix        Unix socket path to listen on instead of host and port
+    # @param    started     optional asyncio.Future set to the listening server
+    async def serve(self, host = "127.0.0.1", port = 8080, unix = None, started = None):
+        self._wake = asyncio.Event()
+        if unix is not None:
+            server = await asyncio.start_unix_server(self._connection, path = unix)
+        else:
+            server = await asyncio.start_server(self._connection, host, port)
+        tasks = [asyncio.create_task(self._batcher())]
+        if self.snapshot_file is not None and self.snapshot_interval:
+            tasks.append(asyncio.create_task(self._snapshotter()))
+        if started is not None:
+            started.set_result(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.dirty:
+                self.save_snapshot()
+
+##
+# Send one request to the service
+#
+# @param    method      HTTP method
+# @param    path        path, e.g. "/step"
+# @param    body        JSON body (default None)
+# @param    host        service address
+# @param    port        service port
+# @param    unix        Unix socket path instead of host and port
+# @return               (status, JSON response)
+async def request(method, path, body = None, host = "127.0.0.1", port = 8080, unix = None):
+    if unix is not None:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    data = b"" if body is None else json.dumps(body).encode()
+    writer.write("{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n"
+        "Content-Length: {}\r\nConnection: close\r\n\r\n".format(method, path, host,
+        len(data)).encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    result = json.loads(await reader.readexactly(length))
+    writer.close()
+    return status, result
+
+
+if __name__ == "__main__":
+    # run the service by command line. run with option -h or --help to see usage
+    parser = argparse.ArgumentParser(prog = "fwi_service")
+    parser.add_argument("--host", default = "127.0.0.1",
+        help = "Address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type = int, default = 8080,
+        help = "Port to listen on (default 8080)")
+    parser.add_argument("--socket", default = None,
+        help = "Unix socket to listen on instead of host and port")
+    parser.add_argument("--snapshot", default = None,
+        help = "Snapshot file (.json, or .db for a state database) to load on start and "
+        "save states to (default none)")
+    parser.add_argument("--snapshot-interval", type = float, default = 300.0,
+        help = "Seconds between snapshots (default 300)")
+    parser.add_argument("--batch-window", type = float, default = 0.005,
+        help = "Seconds to wait for more requests before stepping a batch (default 0.005)")
+    parser.add_argument("--max-batch", type = int, default = 10000,
+        help = "Observations that start a batch without waiting (default 10000)")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.INFO)
+    service = FWIService(args.snapshot, args.snapshot_interval, args.batch_window,
+        args.max_batch)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
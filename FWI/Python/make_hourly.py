@@ -3,8 +3,12 @@ import argparse
 from math import exp, pi, sin, ceil
 from warnings import warn
 
+import numpy as np
 import pandas as pd
 
+import fwi_batch
+import parallel
+import timing
 import util
 
 C_TEMP = {"c_alpha": 0.0, "c_beta": 2.75, "c_gamma": -1.9}
@@ -228,6 +232,224 @@ def do_prediction(
     return cmp
 
 
+##
+# Beck & Trevitt diurnal curve on arrays, the same curve as make_prediction() for
+# many stations or ensemble members (lanes) at once, one hour per value.
+#
+# @param     var_min        daily minimums, shape (lanes, days)
+# @param     var_max        daily maximums, shape (lanes, days)
+# @param     sunrise        sunrise of the day before, each day and the day after,
+#                           shape (lanes, days + 2)
+# @param     sunset         sunset, same shape as sunrise
+# @param     c_alpha        hours after sunrise of the minimum
+# @param     c_beta         hours after solar noon of the maximum
+# @param     c_gamma        decay rate after sunset
+# @param     min_value      lowest value (default -inf)
+# @param     max_value      highest value (default inf)
+# @return                   hourly values, shape (lanes, days, 24)
+def diurnal_curve(
+    var_min,
+    var_max,
+    sunrise,
+    sunset,
+    c_alpha,
+    c_beta,
+    c_gamma,
+    min_value = float("-inf"),
+    max_value = float("inf")
+):
+    # the day before and after have the same values as the first and last day
+    var_min = np.pad(var_min, ((0, 0), (1, 1)), mode = "edge")
+    var_max = np.pad(var_max, ((0, 0), (1, 1)), mode = "edge")
+    time_min = sunrise + c_alpha
+    # approximate solar noon as midpoint between sunrise and sunset
+    time_max = (sunset - sunrise) / 2 + sunrise + c_beta
+    var_min_tom = np.concatenate([var_min[:, 1:], var_min[:, -1:]], axis = 1)
+    time_min_tom = np.concatenate([time_min[:, 1:], time_min[:, -1:]], axis = 1)
+    var_change = var_min + (var_max - var_min) * np.sin(
+        (pi / 2) * ((sunset - time_min) / (time_max - time_min)))
+    # days of the output, hours along the last axis
+    def day(a):
+        return a[:, 1:-1, None]
+    t = np.arange(24.0)
+    before_min = t <= day(time_min)
+    rising = ~before_min & (t < day(sunset))
+    rise = day(var_min) + (day(var_max) - day(var_min)) * np.sin(
+        (pi / 2) * ((t - day(time_min)) / (day(time_max) - day(time_min))))
+    # before the minimum the curve falls from the previous day's sunset value
+    hour_curve = np.where(before_min, t + 24, t)
+    time_g_min = np.where(before_min, day(time_min), day(time_min_tom))
+    var_g_min = np.where(before_min, day(var_min), day(var_min_tom))
+    change = np.where(before_min, var_change[:, :-2, None], day(var_change))
+    fall = var_g_min + (change - var_g_min) * np.exp(
+        c_gamma * (hour_curve - day(sunset)) / (24 - day(sunset) + time_g_min))
+    return np.clip(np.where(rising, rise, fall), min_value, max_value)
+
+
+def _check_minmax(w, timezone, prec_hr):
+    r = w.copy()
+    # check for required columns
+    r.columns = map(str.upper, r.columns)
+    req_cols = ["LAT", "LONG", "YR", "MON", "DAY", "TEMP_MIN", "TEMP_MAX",
+                "RH_MIN", "RH_MAX", "WS_MIN", "WS_MAX", "PREC"]
+    for col in req_cols:
+        if not col in r.columns:
+            raise RuntimeError("Missing required input column: " + col)
+    # check for ID column
+    had_id = "ID" in r.columns
+    if not had_id:
+        r["ID"] = "STN"
+    # check timezone
+    if timezone == None:
+        if not "TIMEZONE" in r.columns:
+            raise RuntimeError("Either provide a timezone column or " +
+                "specify argument in minmax_to_hourly")
+    else:
+        r["TIMEZONE"] = float(timezone)
+    # check prec_hr
+    if not (prec_hr == "sunrise" or
+        (isinstance(prec_hr, int) and 0 <= prec_hr <= 23)):
+        raise TypeError("prec_hr input needs to be 'sunrise' or an integer [0,23]")
+    return r, had_id
+
+##
+# Convert daily min/max values of ensemble members to hourly values, as arrays.
+# Every member of a station has to cover the same sequential days. Sunrise and
+# sunset are calculated once per station and day, and the diurnal curves of all
+# members (and of stations covering the same days) are calculated together.
+#
+# @param    w               daily min/max values weather stream, columns:
+#                           [id], member, lat, long, [timezone], yr, mon, day,
+#                           temp_min, temp_max, rh_min, rh_max, ws_min, ws_max, prec
+# @param    timezone        UTC offset (default None for column provided in w)
+# @param    prec_hr         hour when daily precipitation occurs (default "sunrise")
+# @param    member          name of the member column (default "member")
+# @param    round_out       decimals to truncate temp, rh and ws to, None for none (default 4)
+# @return                   list of dictionaries, one per group of stations with
+#                           the same days, each with lanes (station and member pairs)
+#                           along the first axis and hours along the second:
+#                           id, member, lat, long, timezone (one per lane),
+#                           date, hr (one per hour), sunrise, sunset, temp, rh, ws,
+#                           prec (lanes, hours)
+@timing.timed()
+def minmax_to_hourly_members(
+    w,
+    timezone = None,
+    prec_hr = "sunrise",
+    member = "member",
+    round_out = 4
+):
+    r, had_id = _check_minmax(w, timezone, prec_hr)
+    member = member.upper()
+    if not member in r.columns:
+        raise RuntimeError("Missing member column: " + member)
+    # days since 1970 (pandas would keep dates as datetime64[s])
+    r["DATE"] = fwi_batch.to_dates(r["YR"].values, r["MON"].values,
+        r["DAY"].values).astype(np.int64)
+    if r.duplicated(["ID", member, "DATE"]).any():
+        raise RuntimeError("Expected one row per station, member and day")
+    variables = ["TEMP_MIN", "TEMP_MAX", "RH_MIN", "RH_MAX", "WS_MIN", "WS_MAX", "PREC"]
+    # stations covering the same days are calculated together
+    groups = {}
+    for stn, by_stn in r.groupby("ID", sort = False):
+        for col in ["LAT", "LONG", "TIMEZONE"]:
+            if 1 != len(by_stn[col].unique()):
+                raise RuntimeError(f"Expected a single {col} value for {stn}")
+        dates = np.sort(by_stn["DATE"].unique())
+        members = by_stn[member].unique()
+        if (len(by_stn) != len(dates) * len(members) or not (np.diff(dates) == 1).all()):
+            raise RuntimeError(f"Expected every member of {stn} to have the same " +
+                "sequential daily weather")
+        values = {}
+        for col in variables:
+            values[col] = by_stn.pivot(index = member, columns = "DATE",
+                values = col).reindex(index = members, columns = dates).values
+        groups.setdefault((dates[0], len(dates)), []).append(
+            (stn, members, by_stn.iloc[0], values))
+    result = []
+    for (first, n_days), stations in groups.items():
+        dates = (first + np.arange(n_days)).astype("datetime64[D]")
+        ids = np.concatenate([np.repeat(stn, len(m)) for stn, m, _, _ in stations])
+        lanes = {"id": ids,
+            "member": np.concatenate([m for _, m, _, _ in stations])}
+        for col in ["LAT", "LONG", "TIMEZONE"]:
+            lanes[col.lower()] = np.concatenate(
+                [np.repeat(float(row[col]), len(m)) for _, m, row, _ in stations])
+        daily = {col: np.concatenate([v[col] for _, _, _, v in stations]).astype(float)
+            for col in variables}
+        # sunrise and sunset per station, including the day before and after
+        days = dates[0] - 1 + np.arange(n_days + 2)
+        rows = np.concatenate([np.repeat(k, len(m)) for k, (_, m, _, _) in enumerate(stations)])
+        sunrise, sunset = fwi_batch.sunrise_sunset(
+            np.array([float(row["LAT"]) for _, _, row, _ in stations])[:, None],
+            np.array([float(row["LONG"]) for _, _, row, _ in stations])[:, None],
+            np.array([float(row["TIMEZONE"]) for _, _, row, _ in stations])[:, None],
+            days[None, :])
+        sunrise, sunset = sunrise[rows], sunset[rows]
+        n_lanes = len(ids)
+        temp = diurnal_curve(daily["TEMP_MIN"], daily["TEMP_MAX"], sunrise, sunset,
+            **C_TEMP)
+        ws = diurnal_curve(daily["WS_MIN"], daily["WS_MAX"], sunrise, sunset,
+            **C_WIND, min_value = 0)
+        rh_opp = diurnal_curve(1 - daily["RH_MAX"] / 100, 1 - daily["RH_MIN"] / 100,
+            sunrise, sunset, **C_RH, min_value = 0, max_value = 1)
+        rh = 100 * (1 - rh_opp)
+        prec = np.zeros((n_lanes, n_days, 24))
+        if prec_hr == "sunrise":  # place daily precipitation at sunrise
+            rain_hr = np.ceil(sunrise[:, 1:-1]).astype(int)
+            if (rain_hr < 0).any():
+                warn("Daily sunrise precipitation before hour 0 placed at hour 0")
+            if (rain_hr > 23).any():
+                warn("Daily sunrise precipitation after hour 23 placed at hour 23")
+            rain_hr = np.clip(rain_hr, 0, 23)
+        else:  # place daily precipitation at user specified hour
+            rain_hr = np.full((n_lanes, n_days), prec_hr)
+        np.put_along_axis(prec, rain_hr[:, :, None], daily["PREC"][:, :, None], axis = 2)
+        hourly = {"temp": temp, "rh": rh, "ws": ws}
+        if not (round_out == None or round_out == "None"):
+            hourly = {k: np.round(v, int(round_out)) for k, v in hourly.items()}
+        hourly["prec"] = prec
+        lanes["date"] = np.repeat(dates, 24)
+        lanes["hr"] = np.tile(np.arange(24), n_days)
+        lanes["sunrise"] = np.repeat(sunrise[:, 1:-1], 24, axis = 1)
+        lanes["sunset"] = np.repeat(sunset[:, 1:-1], 24, axis = 1)
+        for k, v in hourly.items():
+            lanes[k] = v.reshape(n_lanes, n_days * 24)
+        if not had_id:
+            lanes["id"] = None
+        result.append(lanes)
+    return result
+
+##
+# Hourly values stream of arrays from minmax_to_hourly_members()
+#
+# @param    groups          list of dictionaries from minmax_to_hourly_members()
+# @param    member          name of the member column (default "member")
+# @return                   hourly values stream, columns:
+#                           [id], member, lat, long, timezone, yr, mon, day, hr,
+#                           temp, rh, ws, prec
+def members_to_frame(groups, member = "member"):
+    frames = []
+    for g in groups:
+        n_lanes, n_hours = g["temp"].shape
+        df = pd.DataFrame({
+            "id": np.repeat(g["id"], n_hours) if g["id"] is not None else None,
+            member: np.repeat(g["member"], n_hours),
+            "lat": np.repeat(g["lat"], n_hours),
+            "long": np.repeat(g["long"], n_hours),
+            "timezone": np.repeat(g["timezone"], n_hours)})
+        dates = pd.DatetimeIndex(np.tile(g["date"], n_lanes))
+        df["yr"] = dates.year
+        df["mon"] = dates.month
+        df["day"] = dates.day
+        df["hr"] = np.tile(g["hr"], n_lanes)
+        for col in ["temp", "rh", "ws", "prec"]:
+            df[col] = g[col].reshape(-1)
+        if g["id"] is None:
+            del df["id"]
+        frames.append(df)
+    return pd.concat(frames, ignore_index = True)
+
 ##
 # Convert daily min/max values stream to hourly values stream.
 # Uses Beck & Trevitt method with default A/B/G values.
@@ -236,6 +458,7 @@ def do_prediction(
 # @param     skip_invalid   if station year data non-sequential, skip and warn
 # @param     verbose        whether to output progress messages
 # @return                   hourly values weather stream
+@timing.timed()
 def minmax_to_hourly_single(w, prec_hr, skip_invalid = False, verbose = False):
     r = w.copy()
     r.columns = map(str.upper, r.columns)
@@ -317,9 +540,17 @@ def minmax_to_hourly_single(w, prec_hr, skip_invalid = False, verbose = False):
 # @param    verbose         whether to output progress messages
 # @param    silent          suppresses informative print statements (default False)
 # @param    round_out       decimals to truncate output to, None for none (default 4)
+# @param    member          name of a column of ensemble members (default None for
+#                           none), every member is converted at once with
+#                           minmax_to_hourly_members() and has this column in the output
+# @param    workers         processes to convert the station years in (see parallel.py),
+#                           0 for one per CPU, default None to convert them here
+# @param    executor        concurrent.futures executor to convert the station years in
+#                           instead of a new process pool (default None)
 # @return                   hourly values weather stream, columns:
-#                           [id], lat, long, timezone, yr, mon, day, hr,
+#                           [id], [member], lat, long, timezone, yr, mon, day, hr,
 #                           temp, rh, wind, prec
+@timing.timed()
 def minmax_to_hourly(
     w,
     timezone = None,
@@ -327,35 +558,34 @@ def minmax_to_hourly(
     skip_invalid = False,
     verbose = False,
     silent = False,
-    round_out = 4
+    round_out = 4,
+    member = None,
+    workers = None,
+    executor = None
 ):
     if not silent:
         print("\n########\nFWI2025: Make Hourly Inputs (" + util.version() + ")\n")
 
-    r = w.copy()
-    # check for required columns
-    r.columns = map(str.upper, r.columns)
-    req_cols = ["LAT", "LONG", "YR", "MON", "DAY", "TEMP_MIN", "TEMP_MAX",
-                "RH_MIN", "RH_MAX", "WS_MIN", "WS_MAX", "PREC"]
-    for col in req_cols:
-        if not col in r.columns:
-            raise RuntimeError("Missing required input column: " + col)
-    # check for ID column
-    had_id = "ID" in r.columns
-    if not had_id:
-        r["ID"] = "STN"
-    # check timezone
-    if timezone == None:
-        if not "TIMEZONE" in r.columns:
-            raise RuntimeError("Either provide a timezone column or " +
-                "specify argument in minmax_to_hourly")
-    else:
-        r["TIMEZONE"] = float(timezone)
-    # check prec_hr
-    if not (prec_hr == "sunrise" or
-        (isinstance(prec_hr, int) and 0 <= prec_hr <= 23)):
-        raise TypeError("prec_hr input needs to be 'sunrise' or an integer [0,23]")
+    if member is not None:
+        result = members_to_frame(
+            minmax_to_hourly_members(w, timezone, prec_hr, member, round_out), member)
+        if not silent:
+            print("########\n")
+        return result
+
+    r, had_id = _check_minmax(w, timezone, prec_hr)
     
+    if workers is not None or executor is not None:
+        # same order as the loop below: stations in order of appearance, then years
+        r = r.iloc[np.argsort(pd.factorize(r["ID"])[0], kind = "stable")]
+        if not silent:
+            print("Predicting hourly weather of " +
+                str(len(r.groupby(["ID", "YR"], sort = False))) + " station years in " +
+                ("the executor" if executor is not None else str(workers) + " processes"))
+        result = pd.concat(parallel.map_groups(minmax_to_hourly_single, r,
+            ["ID", "YR"], workers, executor, args = (prec_hr, skip_invalid, verbose)))
+        return _finish_hourly(result, had_id, silent, round_out)
+
     # loop over every station year
     result = pd.DataFrame()
     for stn in r["ID"].unique():
@@ -366,15 +596,19 @@ def minmax_to_hourly(
                 print(f"Predicting hourly weather at {stn} for {yr}")
             df = minmax_to_hourly_single(by_year, prec_hr, skip_invalid, verbose)
             result = pd.concat([result, df])
+    return _finish_hourly(result, had_id, silent, round_out)
+
 
+def _finish_hourly(result, had_id, silent, round_out):
     # delete ID column if it wasn't provided
     if not had_id:
         del result["id"]
 
     # round decimal places of output columns
-    if not (round_out == None or round_out == "None"):
-        outcols = ["temp", "rh", "ws"]
-        result[outcols] = result[outcols].map(round, ndigits = int(round_out))
+    with timing.stage("minmax_to_hourly.rounding", rows = len(result)):
+        if not (round_out == None or round_out == "None"):
+            outcols = ["temp", "rh", "ws"]
+            result[outcols] = result[outcols].map(round, ndigits = int(round_out))
     
     if not silent:
         print("########\n")
@@ -403,6 +637,10 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--silent", action = "store_true")
     parser.add_argument("-r", "--round_out", default = 4, nargs = "?",
         help = "Decimals to truncate outputs to, None for no rounding (default 4)")
+    parser.add_argument("-m", "--member", default = None,
+        help = "Column of ensemble members, converted together (default none)")
+    parser.add_argument("-w", "--workers", default = None, type = int,
+        help = "Processes to convert station years in (default one at a time)")
 
     args = parser.parse_args()
     df_in = pd.read_csv(args.input)
@@ -413,6 +651,8 @@ if __name__ == "__main__":
         args.skip_invalid,
         args.verbose,
         args.silent,
-        args.round_out
+        args.round_out,
+        args.member,
+        args.workers
     )
     df_out.to_csv(args.output, index = False)
@@ -0,0 +1,150 @@
+# Running independent groups of a dataframe in other processes
+#
+# hFWI() restarts every station year (every station with CONTINUOUS_MULTIYEAR) from
+# the startup values, minmax_to_hourly() converts every station year on its own and
+# generate_daily_summaries() summarizes every station on its own, so their groups can
+# run in any order in other processes. map_groups() sends every group to a
+# concurrent.futures executor without pickling dataframes: the numeric columns (and
+# index) of the whole frame are copied once into a multiprocessing.shared_memory
+# block, and each task is the name of the block, its layout and the rows of the
+# group, which the worker copies out with NumPy. Only the values of the other columns
+# (e.g. id) in the group are pickled with the task. Results come back in the order of
+# the groups (their first row in the frame), whatever order they finish in.
+#
+#   df = NG_FWI.hFWI(df_wx, workers = 4)
+#   with concurrent.futures.ProcessPoolExecutor(8) as pool:
+#       df = NG_FWI.hFWI(df_wx, executor = pool)
+#
+# The function run on each group has to be importable by the workers (a module level
+# function), as for multiprocessing.
+
+### Import packages ###
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# dtype kinds copied through shared memory (bool, integer, float, datetime, timedelta)
+SHARED_KINDS = "biufmM"
+ALIGNMENT = 64
+
+##
+# Copy the numeric columns and index of a dataframe into shared memory
+#
+# @param df                 dataframe
+# @return                   (SharedMemory, layout), layout a list of
+#                           (column, dtype string, offset), None as the column for
+#                           the index
+def _to_shared(df):
+    arrays = []
+    offset = 0
+    index = df.index.to_numpy()
+    if index.dtype.kind in SHARED_KINDS:
+        arrays.append((None, index))
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind in SHARED_KINDS and not isinstance(df[col].dtype,
+                pd.api.extensions.ExtensionDtype):
+            arrays.append((col, values))
+    layout = []
+    for col, values in arrays:
+        layout.append((col, values.dtype.str, offset))
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    shm = shared_memory.SharedMemory(create = True, size = max(offset, 1))
+    for (col, values), (_, dtype, start) in zip(arrays, layout):
+        np.ndarray(len(values), dtype = dtype, buffer = shm.buf,
+            offset = start)[:] = values
+    return shm, layout
+
+##
+# Rebuild one group in a worker and run func on it
+#
+# @param func               function(group, *args, **kwargs)
+# @param name               shared memory block name
+# @param layout             layout from _to_shared()
+# @param n_rows             rows of the whole frame
+# @param columns            column order of the frame
+# @param rows               slice or positions of the group's rows
+# @param others             dictionary of column -> (values, dtype) of the other
+#                           columns for the group's rows
+# @param args               other positional arguments of func
+# @param kwargs             keyword arguments of func
+# @return                   func(group, *args, **kwargs)
+def _run_group(func, name, layout, n_rows, columns, rows, others, args, kwargs):
+    shm = shared_memory.SharedMemory(name = name)
+    try:
+        shared = {}
+        for col, dtype, offset in layout:
+            view = np.ndarray(n_rows, dtype = dtype, buffer = shm.buf, offset = offset)
+            shared[col] = view[rows].copy()
+            del view
+    finally:
+        shm.close()
+    index = shared.pop(None, None)
+    data = {}
+    for col in columns:
+        if col in shared:
+            data[col] = shared[col]
+        else:
+            values, dtype = others[col]
+            data[col] = pd.array(values, dtype = dtype)
+    group = pd.DataFrame(data, columns = columns, index = index)
+    return func(group, *args, **kwargs)
+
+##
+# Positions of the rows of each group, in the order of their first row
+#
+# @param df                 dataframe
+# @param by                 keys as for DataFrame.groupby() (empty for one group)
+# @return                   list of slices (contiguous groups) or position arrays
+def group_rows(df, by):
+    if len(by) == 0:
+        return [slice(0, len(df))] if len(df) > 0 else []
+    positions = list(df.groupby(by, sort = False).indices.values())
+    positions.sort(key = lambda p: p[0])
+    rows = []
+    for p in positions:
+        if p[-1] - p[0] + 1 == len(p):
+            rows.append(slice(int(p[0]), int(p[-1]) + 1))
+        else:
+            rows.append(p)
+    return rows
+
+##
+# Run func on every group of a dataframe in an executor
+#
+# @param func               function(group, *args, **kwargs) of a module
+# @param df                 dataframe
+# @param by                 keys as for DataFrame.groupby() (empty for one group)
+# @param workers            number of processes of a new process pool (default None
+#                           for os.cpu_count(), 1 runs the groups here one at a time)
+# @param executor           concurrent.futures executor to use instead (default None)
+# @param args               other positional arguments of func
+# @param kwargs             keyword arguments of func
+# @return                   list of results in the order of the groups
+def map_groups(func, df, by, workers = None, executor = None, args = (), kwargs = None):
+    kwargs = {} if kwargs is None else kwargs
+    rows = group_rows(df, by)
+    if executor is None and (workers == 1 or len(rows) <= 1):
+        return [func(df.iloc[r], *args, **kwargs) for r in rows]
+    shm, layout = _to_shared(df)
+    try:
+        shared = set(col for col, _, _ in layout)
+        others = [col for col in df.columns if not col in shared]
+        columns = list(df.columns)
+        own = executor is None
+        if own:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers = min(workers, len(rows)) if workers else None)
+        try:
+            futures = [executor.submit(_run_group, func, shm.name, layout, len(df),
+                columns, r, {col: (df[col].to_numpy()[r], df[col].dtype)
+                for col in others}, args, kwargs) for r in rows]
+            return [f.result() for f in futures]
+        finally:
+            if own:
+                executor.shutdown(cancel_futures = True)
+    finally:
+        shm.close()
+        shm.unlink()
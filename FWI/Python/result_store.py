@@ -0,0 +1,312 @@
+# Consolidated store of FWI outputs, partitioned by station and year
+#
+# Reading one summer of one station from a .csv output parses every year and every
+# column of the file. The store keeps the outputs of many stations (e.g. every
+# era5FWI_<id>.csv of a region) in one folder, one file per station and year,
+#
+#   <root>/<station id>/<year>.npz
+#
+# with the rows of each partition sorted by time and split into row groups of
+# ROW_GROUP_HOURS. Each column of each row group is its own (compressed) array in the
+# file, in the compact representation of util.compact(), so a query only decompresses
+# the columns it asks for in the row groups it needs. The station index
+# (<root>/index.npz) has the first and last hour of every row group of every station,
+# so a query on some stations and a date range only opens the partitions and row
+# groups that overlap it.
+#
+#   store = ResultStore("FWIStore")
+#   store.ingest("era5FWI_36.00N_9.00W.csv")
+#   df = store.read(["36.00N_9.00W"], start = "2020-06-01", end = "2020-08-31 23:00",
+#       columns = ["yr", "mon", "day", "hr", "fwi"])
+#
+# Times are hours since 1970-01-01 00:00 of the data's own (standard) time, as
+# util.time_index(). The index is rewritten by every write, so the store has one
+# writer at a time (any number of readers).
+
+### Import packages ###
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+# Import from other CFFDRS code files
+import util
+
+# hours in a row group, about a month
+ROW_GROUP_HOURS = 24 * 31
+INDEX_FILE = "index.npz"
+INDEX_COLUMNS = ["id", "year", "group", "start", "end", "rows"]
+
+##
+# Hours since 1970-01-01 00:00 of a time
+#
+# @param t              hour index (int), anything pd.Timestamp() takes, or None
+# @return               hour index, None for None
+def to_hours(t):
+    if t is None:
+        return None
+    if isinstance(t, (int, np.integer)):
+        return int(t)
+    return int((pd.Timestamp(t) - pd.Timestamp(1970, 1, 1)) // pd.Timedelta(hours = 1))
+
+##
+# Year of hour indices
+#
+# @param hours          hour indices
+# @return               array of years
+def hour_years(hours):
+    return (np.asarray(hours, dtype = np.int64).astype("datetime64[h]")
+        .astype("datetime64[Y]").astype(np.int64) + 1970)
+
+
+def _write_npz(filename, arrays):
+    # written under another name first, readers only ever see complete files
+    temp = filename + ".tmp"
+    with open(temp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temp, filename)
+
+##
+# Partitioned store of FWI outputs
+class ResultStore:
+    ##
+    # @param    root            folder of the store (created if it doesn't exist)
+    # @param    row_group_hours hours in a row group of new partitions
+    def __init__(self, root, row_group_hours = ROW_GROUP_HOURS):
+        self.root = root
+        self.row_group_hours = row_group_hours
+        os.makedirs(root, exist_ok = True)
+        self.index = pd.DataFrame({c: np.array([], dtype = np.int64) for c in INDEX_COLUMNS})
+        self.index["id"] = self.index["id"].astype(str)
+        # input file -> (modification time, size, its station ids) when it was ingested
+        self.sources = {}
+        filename = os.path.join(root, INDEX_FILE)
+        if os.path.isfile(filename):
+            with np.load(filename) as data:
+                self.index = pd.DataFrame({c: data[c] for c in INDEX_COLUMNS})
+                self.sources = {str(path): (int(mtime), int(size), str(ids)) for path, mtime, size, ids
+                    in zip(data["source_path"], data["source_mtime_ns"], data["source_size"],
+                    data["source_ids"])}
+
+    def _partition(self, station, year):
+        return os.path.join(self.root, urllib.parse.quote(str(station), safe = ""),
+            "{}.npz".format(int(year)))
+
+    def _save_index(self):
+        self.index = self.index.sort_values(["id", "start"], kind = "stable").reset_index(drop = True)
+        paths = list(self.sources)
+        arrays = {c: self.index[c].to_numpy() for c in INDEX_COLUMNS}
+        arrays["id"] = arrays["id"].astype(str)
+        arrays["source_path"] = np.array(paths, dtype = str)
+        arrays["source_mtime_ns"] = np.array([self.sources[p][0] for p in paths], dtype = np.int64)
+        arrays["source_size"] = np.array([self.sources[p][1] for p in paths], dtype = np.int64)
+        arrays["source_ids"] = np.array([self.sources[p][2] for p in paths], dtype = str)
+        _write_npz(os.path.join(self.root, INDEX_FILE), arrays)
+
+    def _write_partitions(self, df):
+        df = util.compact(df)
+        if not "time" in df.columns or not "id" in df.columns:
+            raise RuntimeError("Outputs need id and yr, mon, day, hr (or time) columns to be stored")
+        df = df.assign(id = df["id"].astype(str).astype("category"))
+        df = df.iloc[np.argsort(df["time"].to_numpy(), kind = "stable")]
+        years = hour_years(df["time"].to_numpy())
+        entries = []
+        for (station, year), rows in df.groupby([df["id"].astype(str).to_numpy(), years],
+                sort = False).indices.items():
+            part = df.iloc[rows]
+            t = part["time"].to_numpy()
+            first_hour = util.time_index(year, 1, 1, 0)
+            groups = (t - first_hour) // self.row_group_hours
+            arrays = {"__columns__": np.array(list(part.columns), dtype = str)}
+            for g in np.unique(groups):
+                in_group = groups == g
+                for col in part.columns:
+                    values = part[col][in_group]
+                    if isinstance(values.dtype, pd.CategoricalDtype):
+                        values = values.cat.remove_unused_categories()
+                        arrays["{}/{}.codes".format(g, col)] = values.cat.codes.to_numpy()
+                        arrays["{}/{}.categories".format(g, col)] = np.array(
+                            values.cat.categories, dtype = str)
+                    else:
+                        arrays["{}/{}".format(g, col)] = values.to_numpy()
+                entries.append((station, int(year), int(g), int(t[in_group][0]),
+                    int(t[in_group][-1]), int(in_group.sum())))
+            filename = self._partition(station, year)
+            os.makedirs(os.path.dirname(filename), exist_ok = True)
+            _write_npz(filename, arrays)
+        new = pd.DataFrame(entries, columns = INDEX_COLUMNS)
+        replaced = self.index.set_index(["id", "year"]).index.isin(
+            new.set_index(["id", "year"]).index)
+        self.index = pd.concat([self.index[~replaced], new], ignore_index = True)
+        return len(df)
+
+    ##
+    # Save outputs, replacing the partitions of the station years in them
+    #
+    # @param    df          outputs (e.g. of hFWI()) with id and yr, mon, day, hr (or
+    #                       time) columns, of any number of stations
+    # @return               number of rows saved
+    def write(self, df):
+        n = self._write_partitions(df)
+        self._save_index()
+        return n
+
+    ##
+    # Remove every partition of some stations
+    #
+    # @param    ids         station ids
+    def remove(self, ids):
+        ids = [str(i) for i in ids]
+        for station in ids:
+            shutil.rmtree(os.path.join(self.root, urllib.parse.quote(station, safe = "")),
+                ignore_errors = True)
+        self.index = self.index[~self.index["id"].isin(ids)]
+        # their files are ingested again even if unchanged
+        self.sources = {path: v for path, v in self.sources.items()
+            if not any(i in ids for i in v[2].split("\n"))}
+        self._save_index()
+
+    ##
+    # Save an output file (.csv or compact .npz) as the whole of the stations in it,
+    # unless it is unchanged since it was last ingested
+    #
+    # @param    filename    output file
+    # @param    force       ingest even if the file is unchanged
+    # @return               number of rows saved (0 if unchanged)
+    def ingest(self, filename, force = False):
+        st = os.stat(filename)
+        if not force and self.sources.get(filename, ())[:2] == (st.st_mtime_ns, st.st_size):
+            return 0
+        df = util.read_output(filename)
+        ids = df["id"].astype(str).unique()
+        for station in ids:
+            shutil.rmtree(os.path.join(self.root, urllib.parse.quote(station, safe = "")),
+                ignore_errors = True)
+        self.index = self.index[~self.index["id"].isin(ids)]
+        n = self._write_partitions(df)
+        self.sources[filename] = (st.st_mtime_ns, st.st_size, "\n".join(ids))
+        self._save_index()
+        return n
+
+    def stations(self):
+        return list(pd.unique(self.index["id"]))
+
+    ##
+    # First and last hour of each station
+    #
+    # @param    ids         station ids (default None for every station)
+    # @return               dataframe of id, start, end, rows
+    def spans(self, ids = None):
+        index = self.index if ids is None else self.index[self.index["id"].isin([str(i) for i in ids])]
+        return index.groupby("id", sort = False).agg(start = ("start", "min"),
+            end = ("end", "max"), rows = ("rows", "sum")).reset_index()
+
+    ##
+    # Columns saved for a station (its first partition)
+    #
+    # @param    station     station id (default None for the first station)
+    # @return               list of column names
+    def columns(self, station = None):
+        index = self.index if station is None else self.index[self.index["id"] == str(station)]
+        if len(index) == 0:
+            return []
+        with np.load(self._partition(index["id"].iloc[0], index["year"].iloc[0])) as data:
+            return list(data["__columns__"])
+
+    ##
+    # Rows of some stations in a time range, reading only the partitions and row groups
+    # that overlap it and only the columns asked for
+    #
+    # @param    ids         station ids (default None for every station), rows come
+    #                       in this order then in time order
+    # @param    start       first hour (hour index or anything pd.Timestamp() takes,
+    #                       default None)
+    # @param    end         last hour (default None)
+    # @param    columns     columns to read (default None for all)
+    # @return               dataframe in the compact representation
+    def read(self, ids = None, start = None, end = None, columns = None):
+        start = to_hours(start)
+        end = to_hours(end)
+        selected = self.index
+        if ids is not None:
+            ids = [str(i) for i in ids]
+            selected = selected[selected["id"].isin(ids)]
+            order = pd.Categorical(selected["id"], categories = list(dict.fromkeys(ids)))
+            selected = selected.iloc[np.argsort(order.codes, kind = "stable")]
+        if start is not None:
+            selected = selected[selected["end"] >= start]
+        if end is not None:
+            selected = selected[selected["start"] <= end]
+        parts = {}
+        categorical = set()
+        all_columns = columns
+        for (station, year), groups in selected.groupby(["id", "year"], sort = False):
+            filename = self._partition(station, year)
+            with np.load(filename) as data:
+                saved = list(data["__columns__"])
+                wanted = saved if columns is None else columns
+                if all_columns is None:
+                    all_columns = wanted
+                for col in wanted:
+                    if not col in saved:
+                        raise RuntimeError(f'Column "{col}" not found in {filename}')
+                for g in groups["group"]:
+                    t = data["{}/time".format(g)]
+                    lo = 0 if start is None else np.searchsorted(t, start, "left")
+                    hi = len(t) if end is None else np.searchsorted(t, end, "right")
+                    for col in wanted:
+                        if "{}/{}.codes".format(g, col) in data.files:
+                            categorical.add(col)
+                            values = data["{}/{}.categories".format(g, col)][
+                                data["{}/{}.codes".format(g, col)][lo:hi]]
+                        elif col == "time":
+                            values = t[lo:hi]
+                        else:
+                            values = data["{}/{}".format(g, col)][lo:hi]
+                        parts.setdefault(col, []).append(values)
+        if all_columns is None:
+            return pd.DataFrame()
+        out = {}
+        for col in all_columns:
+            if not col in parts:
+                out[col] = np.array([])
+            elif col in categorical:
+                out[col] = pd.Categorical(np.concatenate(parts[col]))
+            else:
+                out[col] = np.concatenate(parts[col])
+        return pd.DataFrame(out)
+
+
+if __name__ == "__main__":
+    # ingest outputs into a store or query it by command line. run with option -h or
+    # --help to see usage
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(prog = "result_store")
+    parser.add_argument("store", help = "Store folder")
+    parser.add_argument("--ingest", nargs = "+", default = None,
+        help = "Output files (.csv or .npz) to save in the store")
+    parser.add_argument("--stations", action = "store_true",
+        help = "Print the first and last hour of every station as csv")
+    parser.add_argument("--query", nargs = "+", default = None,
+        help = "Station ids to print as csv")
+    parser.add_argument("--from", dest = "start", default = None,
+        help = "First date of the query (e.g. 2020-06-01)")
+    parser.add_argument("--to", dest = "end", default = None,
+        help = "Last date and time of the query (e.g. '2020-08-31 23:00')")
+    parser.add_argument("--columns", nargs = "+", default = None,
+        help = "Columns of the query (default all)")
+    args = parser.parse_args()
+    store = ResultStore(args.store)
+    if args.ingest is not None:
+        for filename in args.ingest:
+            n = store.ingest(filename)
+            print("{}: {}".format(filename, "{} rows".format(n) if n > 0 else "unchanged"),
+                file = sys.stderr)
+    if args.stations:
+        store.spans().to_csv(sys.stdout, index = False)
+    if args.query is not None:
+        store.read(args.query, args.start, args.end, args.columns).to_csv(sys.stdout,
+            index = False)
@@ -0,0 +1,295 @@
+# SQLite store of FWI states by station and hour
+#
+# Saves the full state hFWI() (or fwi_core.step()) needs to continue a run, the
+# moisture codes, grass moisture contents, canopy rain and drying counters and the
+# grass transition date, for each station id and hour. Warm starts for any number
+# of stations are one query (latest()), and the states at the end of many runs are
+# saved with one transaction (upsert()). The database is in WAL mode, so processes of
+# a multiprocessing pool can read it while another process writes.
+#
+#   with StateStore("fwi_state.db") as store:
+#       start = store.latest(["PRF"], before = hour_index(2007, 5, 10, 0))
+#       df = NG_FWI.hFWI(df_wx, **hfwi_args(start.get("PRF")))
+#       store.upsert([state_from_output(df.iloc[-1])])
+#
+# Times are hours since 1970-01-01 00:00 of the data's own (standard) time, the same
+# as util.time_index(). Startup codes that don't belong to an hour (e.g. from a list
+# of points) are saved at STARTUP_TIME, before any hour.
+
+### Import packages ###
+import datetime
+import sqlite3
+import time
+
+# Import from other CFFDRS code files
+import fwi_core
+
+# time of startup codes, before every real hour
+STARTUP_TIME = -(2 ** 62)
+STATE_COLUMNS = ["ffmc", "mcffmc", "dmc", "dc", "mcgfmc_matted", "mcgfmc_standing",
+    "prec_cumulative", "canopy_drying", "date_grass_standing"]
+COLUMNS = ["id", "time"] + STATE_COLUMNS + ["source", "updated"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fwi_state (
+    id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    ffmc REAL,
+    mcffmc REAL,
+    dmc REAL,
+    dc REAL,
+    mcgfmc_matted REAL,
+    mcgfmc_standing REAL,
+    prec_cumulative REAL,
+    canopy_drying REAL,
+    date_grass_standing TEXT,
+    source TEXT,
+    updated REAL,
+    PRIMARY KEY (id, time)
+) WITHOUT ROWID
+"""
+
+##
+# Hours since 1970-01-01 00:00 (see util.time_index(), without NumPy)
+#
+# @param yr             Year
+# @param mon            Month of year
+# @param day            Day of month
+# @param hr             Hour of day
+# @return               integer time index
+def hour_index(yr, mon, day, hr):
+    return ((datetime.date(int(yr), int(mon), int(day)) - datetime.date(1970, 1, 1)).days
+        * 24 + int(hr))
+
+
+def hour_to_datetime(t):
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(hours = t)
+
+##
+# State record of the last row of an hFWI() output (or any row)
+#
+# @param row            row with id, yr, mon, day, hr and the state columns
+#                       (a pandas Series or dictionary)
+# @param source         where the state came from (e.g. output file)
+# @return               state record dictionary
+def state_from_output(row, source = None):
+    record = {"id": str(row["id"]),
+        "time": hour_index(row["yr"], row["mon"], row["day"], row["hr"]),
+        "source": source}
+    for col in STATE_COLUMNS:
+        # outputs that weren't calculated are left out (None)
+        if col in row and col != "date_grass_standing" and row[col] == row[col]:
+            record[col] = float(row[col])
+    return record
+
+##
+# State record of startup codes (ffmc, dmc, dc as for hFWI())
+#
+# @param station        station id
+# @param ffmc           startup FFMC
+# @param dmc            startup DMC
+# @param dc             startup DC
+# @param t              hour the codes are for (default STARTUP_TIME)
+# @param source         where the codes came from (e.g. "points", "config")
+# @return               state record dictionary
+def state_from_codes(station, ffmc, dmc, dc, t = STARTUP_TIME, source = None):
+    return {"id": str(station), "time": t, "ffmc": float(ffmc), "dmc": float(dmc),
+        "dc": float(dc), "source": source}
+
+
+def state_from_station_state(station, t, state, source = None):
+    return {"id": str(station), "time": t, "mcffmc": state.mcffmc,
+        "ffmc": fwi_core.mcffmc_to_ffmc(state.mcffmc),
+        "dmc": fwi_core.mcdmc_to_dmc(state.mcdmc), "dc": fwi_core.mcdc_to_dc(state.mcdc),
+        "mcgfmc_matted": state.mcgfmc_matted, "mcgfmc_standing": state.mcgfmc_standing,
+        "prec_cumulative": state.prec_cumulative, "canopy_drying": state.canopy_drying,
+        "date_grass_standing": None if state.date_grass_standing is None
+            else state.date_grass_standing.isoformat(),
+        "source": source}
+
+##
+# Keyword arguments of hFWI() to start from a state record
+#
+# @param record         state record (None for the hFWI() defaults)
+# @return               dictionary of ffmc_old, mcffmc_old, dmc_old, dc_old,
+#                       mcgfmc_matted_old, mcgfmc_standing_old, prec_cumulative,
+#                       canopy_drying (only those the record has)
+def hfwi_args(record):
+    if record is None:
+        return {}
+    args = {}
+    if record.get("mcffmc") is not None:
+        args["ffmc_old"] = None
+        args["mcffmc_old"] = record["mcffmc"]
+    elif record.get("ffmc") is not None:
+        args["ffmc_old"] = record["ffmc"]
+    for col, arg in [("dmc", "dmc_old"), ("dc", "dc_old"),
+        ("mcgfmc_matted", "mcgfmc_matted_old"), ("mcgfmc_standing", "mcgfmc_standing_old"),
+        ("prec_cumulative", "prec_cumulative"), ("canopy_drying", "canopy_drying")]:
+        if record.get(col) is not None:
+            args[arg] = record[col]
+    return args
+
+##
+# fwi_core.StationState of a state record, with the hFWI() defaults for what it lacks
+#
+# @param record         state record
+# @return               fwi_core.StationState
+def to_station_state(record):
+    args = hfwi_args(record)
+    state = fwi_core.initial_state(
+        fwi_core.FFMC_DEFAULT if args.get("ffmc_old") is None else args["ffmc_old"],
+        args.get("dmc_old", fwi_core.DMC_DEFAULT),
+        args.get("dc_old", fwi_core.DC_DEFAULT),
+        args.get("mcgfmc_matted_old"),
+        args.get("mcgfmc_standing_old"),
+        args.get("prec_cumulative", 0.0),
+        args.get("canopy_drying", 0.0))
+    if args.get("mcffmc_old") is not None:
+        state.mcffmc = args["mcffmc_old"]
+    if record.get("date_grass_standing") is not None:
+        state.date_grass_standing = datetime.date.fromisoformat(
+            record["date_grass_standing"])
+    return state
+
+##
+# Station states in a SQLite database
+class StateStore:
+    ##
+    # @param    filename    database file (created if it doesn't exist)
+    # @param    timeout     seconds to wait for another process's write to finish
+    def __init__(self, filename, timeout = 60.0):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename, timeout = timeout)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ##
+    # Insert or replace many state records in one transaction
+    #
+    # @param    records     state records (dictionaries with id, time and any of
+    #                       STATE_COLUMNS and source)
+    # @return               number of records written
+    def upsert(self, records):
+        now = time.time()
+        rows = [tuple(r.get(c) for c in COLUMNS[:-1]) + (now,)
+            for r in records if r is not None]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO fwi_state ({}) VALUES ({}) ON CONFLICT (id, time) DO UPDATE "
+                "SET {}".format(", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)),
+                ", ".join("{0} = excluded.{0}".format(c) for c in COLUMNS[2:])), rows)
+        return len(rows)
+
+    ##
+    # Replace the startup codes (at STARTUP_TIME) of some sources, e.g. the codes a run
+    # takes from its config, so codes removed from it don't stay in the database
+    #
+    # @param    records     startup state records of those sources (see state_from_codes())
+    # @param    sources     sources whose startup codes are replaced
+    # @param    ids         stations whose startup codes are replaced (default None for
+    #                       every station)
+    # @return               number of records written
+    def replace_startup(self, records, sources, ids = None):
+        records = [r for r in records if r is not None]
+        sources = list(sources)
+        condition = "time = ? AND source IN ({})".format(", ".join("?" * len(sources)))
+        with self.conn:
+            if ids is not None:
+                self._with_ids(ids)
+                condition += " AND id IN (SELECT id FROM wanted)"
+            self.conn.execute("DELETE FROM fwi_state WHERE " + condition,
+                [STARTUP_TIME] + sources)
+        return self.upsert(records)
+
+    def _with_ids(self, ids):
+        # large id lists go through a temporary table instead of query parameters
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (id TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM wanted")
+        self.conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)",
+            ((str(i),) for i in ids))
+
+    ##
+    # Latest state of each station, at or before a time
+    #
+    # @param    ids         station ids (default None for every station)
+    # @param    before      latest time to consider (default None for any)
+    # @return               dictionary of station id -> state record
+    def latest(self, ids = None, before = None):
+        where = []
+        params = []
+        if ids is not None:
+            self._with_ids(ids)
+            where.append("id IN (SELECT id FROM wanted)")
+        if before is not None:
+            where.append("time <= ?")
+            params.append(int(before))
+        condition = "" if len(where) == 0 else "WHERE " + " AND ".join(where)
+        query = ("SELECT s.* FROM fwi_state s JOIN (SELECT id, MAX(time) AS time "
+            "FROM fwi_state {} GROUP BY id) m ON s.id = m.id AND s.time = m.time").format(
+            condition)
+        return {row["id"]: dict(row) for row in self.conn.execute(query, params)}
+
+    ##
+    # Every saved state of some stations in a time range
+    #
+    # @param    ids         station ids (default None for every station)
+    # @param    start       first time (default None)
+    # @param    end         last time (default None)
+    # @return               list of state records ordered by id and time
+    def read(self, ids = None, start = None, end = None):
+        where = []
+        params = []
+        if ids is not None:
+            self._with_ids(ids)
+            where.append("id IN (SELECT id FROM wanted)")
+        if start is not None:
+            where.append("time >= ?")
+            params.append(int(start))
+        if end is not None:
+            where.append("time <= ?")
+            params.append(int(end))
+        condition = "" if len(where) == 0 else "WHERE " + " AND ".join(where)
+        return [dict(row) for row in self.conn.execute(
+            "SELECT * FROM fwi_state {} ORDER BY id, time".format(condition), params)]
+
+    def station_ids(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT id FROM fwi_state")]
+
+
+if __name__ == "__main__":
+    # show or import states by command line. run with option -h or --help to see usage
+    import argparse
+    import csv
+    import sys
+    parser = argparse.ArgumentParser(prog = "state_store")
+    parser.add_argument("database", help = "State database file")
+    parser.add_argument("--import-codes", default = None,
+        help = "csv of id,ffmc,dmc,dc startup codes to save at STARTUP_TIME")
+    parser.add_argument("--latest", action = "store_true",
+        help = "Print the latest state of every station as csv")
+    args = parser.parse_args()
+    with StateStore(args.database) as store:
+        if args.import_codes is not None:
+            with open(args.import_codes) as f:
+                rows = [r for r in csv.reader(f) if len(r) >= 4 and not r[0].startswith("#")]
+            n = store.upsert(state_from_codes(r[0], r[1], r[2], r[3], source = "import")
+                for r in rows if r[0] != "id")
+            print("Saved startup codes of {} stations".format(n))
+        if args.latest:
+            writer = csv.DictWriter(sys.stdout, COLUMNS)
+            writer.writeheader()
+            for record in store.latest().values():
+                writer.writerow(record)
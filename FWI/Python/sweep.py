@@ -0,0 +1,373 @@
+# Parameter sweeps: many sets of model constants over one weather stream
+#
+# Sensitivity and calibration studies run the hourly FWI with hundreds of
+# combinations of the model constants (fwi_core.Parameters). Instead of changing the
+# globals and rerunning hFWI() for each one, the parameter sets are the lanes of one
+# fwi_batch run: every parameter is an array with one value per set, the weather,
+# sunlight and curing of each hour are calculated once, and each hour is one
+# step_batch() call for every set.
+#
+#   sets = sweep.parameter_grid(dmc_regression = [2.0e-4, 2.22e-4, 2.4e-4],
+#       dc_intercept = [2.4, 2.8, 3.2])
+#   df = sweep.sweep(df_wx, sets)
+#
+# Like hFWI(), every station year starts from the startup codes (here those of each
+# parameter set, ffmc_default, dmc_default and dc_default), or every station with
+# NG_FWI.CONTINUOUS_MULTIYEAR.
+#
+# Grass fuel load and curing scenarios (grass_scenarios()) only change the grass
+# outputs, so the moisture codes and FWI outputs are calculated once by hFWI() and
+# only the matted and standing grass moisture and the grass indices are stepped with
+# the scenarios as lanes.
+#
+#   df = sweep.grass_scenarios(df_wx, [{"grass_fuel_load": 0.2},
+#       {"grass_fuel_load": 0.5, "percent_cured": 80}])
+
+### Import packages ###
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# Import from other CFFDRS code files
+import fwi_batch
+import fwi_core
+import NG_FWI
+import timing
+import util
+
+SWEEP_OUTPUTS = NG_FWI.OUTPUTS_FWI + NG_FWI.OUTPUTS_GRASS
+# what grass scenarios can change
+SCENARIO_COLUMNS = ["grass_fuel_load", "percent_cured"]
+GRASS_OUTPUTS = ["mcgfmc_matted", "mcgfmc_standing"] + NG_FWI.OUTPUTS_GRASS
+
+##
+# Every combination of some parameter values
+#
+# @param values             parameter name = list of values (see fwi_core.PARAMETERS)
+# @return                   dataframe with one row per parameter set
+def parameter_grid(**values):
+    for k in values:
+        if not k in fwi_core.PARAMETERS:
+            raise ValueError("Unknown parameter " + k + ", choose from " +
+                ", ".join(fwi_core.PARAMETERS))
+    combos = list(itertools.product(*values.values()))
+    return pd.DataFrame(combos, columns = list(values))
+
+##
+# Parameters with one value per set for the parameters in sets, and the globals for
+# the others
+#
+# @param sets               dataframe (or list of dictionaries) of parameter sets
+# @return                   fwi_core.Parameters
+def to_parameters(sets):
+    sets = pd.DataFrame(sets)
+    return fwi_core.Parameters(**{k: sets[k].values for k in sets.columns})
+
+##
+# Run every parameter set over the hours of one station (year)
+#
+# @param hours              dictionary of arrays, one value per hour: date
+#                           (datetime64[D]), hr, temp, rh, ws, prec, sunrise, sunset,
+#                           solrad, percent_cured and optionally grass_fuel_load
+# @param params             fwi_core.Parameters with arrays of n_sets values
+# @param n_sets             number of parameter sets
+# @param outputs            outputs to keep (default SWEEP_OUTPUTS)
+# @return                   dictionary of output -> array (sets, hours)
+def run_sweep(hours, params, n_sets, outputs = SWEEP_OUTPUTS):
+    states = fwi_batch.startup_states(n_sets, params)
+    n_hours = len(hours["hr"])
+    result = {k: np.empty((n_sets, n_hours)) for k in outputs}
+    with timing.stage("sweep.steps", rows = n_sets * n_hours):
+        for h in range(n_hours):
+            states, out = fwi_batch.step_batch(states,
+                {k: v[h] for k, v in hours.items()}, params)
+            for k in outputs:
+                result[k][:, h] = out[k]
+    return result
+
+##
+# Hourly FWI of a weather stream for many sets of model parameters
+#
+# @param df_wx              hourly values weather stream (as for hFWI())
+# @param sets               dataframe (or list of dictionaries) of parameter sets,
+#                           e.g. from parameter_grid()
+# @param timezone           UTC offset (default None for column provided in df_wx)
+# @param outputs            outputs to keep (default SWEEP_OUTPUTS)
+# @param silent             suppresses informative print statements (default False)
+# @param round_out          decimals to truncate output to, None for none (default 4)
+# @return                   dataframe with one row per parameter set and hour, columns:
+#                           set (row of sets), [id], yr, mon, day, hr and outputs
+@timing.timed()
+def sweep(
+    df_wx,
+    sets,
+    timezone = None,
+    outputs = SWEEP_OUTPUTS,
+    silent = False,
+    round_out = 4
+):
+    if not silent:
+        print("\n########\nFWI2025: Parameter sweep (" + util.version() + ")\n")
+    sets = pd.DataFrame(sets).reset_index(drop = True)
+    params = to_parameters(sets)
+    n_sets = len(sets)
+    wx = df_wx.copy()
+    wx.columns = map(str.lower, wx.columns)
+    req_cols = ["lat", "long", "yr", "mon", "day", "hr", "temp", "rh", "ws", "prec"]
+    for col in req_cols:
+        if not col in wx.columns:
+            raise RuntimeError("Missing required input column: " + col)
+    if timezone == None:
+        if not "timezone" in wx.columns:
+            raise RuntimeError("Either provide a timezone column or " +
+                "specify argument in sweep()")
+    else:
+        wx["timezone"] = float(timezone)
+    had_stn = "id" in wx.columns
+    if not had_stn:
+        wx["id"] = "STN"
+    split = ["id"] if NG_FWI.CONTINUOUS_MULTIYEAR else ["id", "yr"]
+    frames = []
+    for idx, w in wx.groupby(split, sort = False):
+        if not silent:
+            print("Running " + " ".join(str(i) for i in idx) + " for " +
+                str(n_sets) + " parameter sets")
+        for col in ["lat", "long", "timezone"]:
+            if len(w[col].unique()) != 1:
+                raise RuntimeError(f"Expected a single {col} value each station year")
+        dates = fwi_batch.to_dates(w["yr"].values, w["mon"].values, w["day"].values)
+        t = dates.astype(np.int64) * 24 + w["hr"].values
+        if not (np.diff(t) == 1).all():
+            raise RuntimeError("Expected hourly weather input to be sequential")
+        lat, long, tz = (float(w[col].iloc[0]) for col in ["lat", "long", "timezone"])
+        hours = {"date": dates}
+        for col in ["hr", "temp", "rh", "ws", "prec"]:
+            hours[col] = w[col].values.astype(float)
+        # the same for every parameter set, so calculated once per hour
+        hours["sunrise"], hours["sunset"] = fwi_batch.sunrise_sunset(lat, long, tz, dates)
+        hours["solrad"] = (w["solrad"].values.astype(float) if "solrad" in w.columns
+            else fwi_batch.solar_radiation(lat, long, tz, dates, hours["hr"],
+                hours["temp"], hours["rh"]))
+        hours["percent_cured"] = (w["percent_cured"].values.astype(float)
+            if "percent_cured" in w.columns else fwi_batch.seasonal_curing(dates))
+        if "grass_fuel_load" in w.columns:
+            hours["grass_fuel_load"] = w["grass_fuel_load"].values.astype(float)
+        result = run_sweep(hours, params, n_sets, outputs)
+        n_hours = len(w)
+        df = pd.DataFrame({
+            "set": np.repeat(np.arange(n_sets), n_hours),
+            "id": np.tile(w["id"].values, n_sets),
+            "yr": np.tile(w["yr"].values, n_sets),
+            "mon": np.tile(w["mon"].values, n_sets),
+            "day": np.tile(w["day"].values, n_sets),
+            "hr": np.tile(w["hr"].values, n_sets)})
+        for k in outputs:
+            df[k] = result[k].reshape(-1)
+        frames.append(df)
+    result = pd.concat(frames, ignore_index = True)
+    result = result.sort_values(["set"], kind = "stable", ignore_index = True)
+    if not had_stn:
+        del result["id"]
+    if not (round_out == None or round_out == "None"):
+        result[outputs] = result[outputs].round(int(round_out))
+    if not silent:
+        print("########\n")
+    return result
+
+##
+# Grass outputs of one station (year) for every scenario
+#
+# @param hours              dictionary of arrays, one value per hour: date
+#                           (datetime64[D]), temp, rh, ws, prec, solrad, percent_cured,
+#                           grass_fuel_load
+# @param loads              grass fuel load of each scenario (NaN for hours["grass_fuel_load"])
+# @param cured              percent cured of each scenario (NaN for hours["percent_cured"])
+# @param mcgfmc_matted_old  startup matted grass moisture content
+# @param mcgfmc_standing_old startup standing grass moisture content
+# @param params             fwi_core.Parameters (default None for the globals)
+# @return                   dictionary of GRASS_OUTPUTS -> array (scenarios, hours)
+def run_grass_scenarios(hours, loads, cured, mcgfmc_matted_old, mcgfmc_standing_old,
+        params = None):
+    p = fwi_batch._params(params)
+    n_sets = len(loads)
+    n_hours = len(hours["date"])
+    load = np.where(np.isnan(loads)[:, None], hours["grass_fuel_load"][None, :],
+        loads[:, None])
+    cur = np.where(np.isnan(cured)[:, None], hours["percent_cured"][None, :],
+        cured[:, None])
+    matted = np.empty((n_sets, n_hours))
+    standing = np.empty((n_sets, n_hours))
+    mc_matted = np.full(n_sets, float(mcgfmc_matted_old))
+    mc_standing = np.full(n_sets, float(mcgfmc_standing_old))
+    with timing.stage("sweep.grass_steps", rows = n_sets * n_hours):
+        for h in range(n_hours):
+            mc_matted = fwi_batch.hourly_grass_fuel_moisture(mc_matted, hours["temp"][h],
+                hours["rh"][h], hours["ws"][h], hours["prec"][h], hours["solrad"][h],
+                load[:, h])
+            # standing grass: 6% of the rain and no solar heating
+            mc_standing = fwi_batch.hourly_grass_fuel_moisture(mc_standing,
+                hours["temp"][h], hours["rh"][h], hours["ws"][h], hours["prec"][h] * 0.06,
+                0.0, load[:, h])
+            matted[:, h] = mc_matted
+            standing[:, h] = mc_standing
+    # the rest doesn't carry over between hours, so every hour at once
+    date_standing = fwi_batch.grass_standing_date(hours["date"][:1], params)[0]
+    is_standing = ~(bool(p.grass_transition) & (hours["date"] < date_standing))
+    mcgfmc = np.where(is_standing[None, :], standing, matted)
+    ws = np.broadcast_to(hours["ws"], mcgfmc.shape)
+    with np.errstate(all = "ignore"):
+        gfmc = fwi_batch.mcgfmc_to_gfmc(mcgfmc, cur, ws)
+        gsi = fwi_batch.grass_spread_index(ws, mcgfmc, cur,
+            np.broadcast_to(is_standing, mcgfmc.shape))
+        gfwi = fwi_batch.grass_fire_weather_index(gsi, load)
+    return {"mcgfmc_matted": matted, "mcgfmc_standing": standing,
+        "gfmc": gfmc, "gsi": gsi, "gfwi": gfwi}
+
+##
+# Hourly FWI of a weather stream for many grass fuel load and curing scenarios,
+# calculating the moisture codes and FWI outputs once
+#
+# @param df_wx              hourly values weather stream (as for hFWI())
+# @param scenarios          dataframe (or list of dictionaries) with grass_fuel_load
+#                           and/or percent_cured columns, one row per scenario (missing
+#                           or NaN values are those of df_wx or the defaults)
+# @param timezone           UTC offset (default None for column provided in df_wx)
+# @param wide               False for one row per scenario and hour, True for one row
+#                           per hour with <output>_s<scenario> columns (default False)
+# @param silent             suppresses informative print statements (default False)
+# @param round_out          decimals to truncate output to, None for none (default 4)
+# @param hfwi_args          other hFWI() options (e.g. startup values, params)
+# @return                   long: hFWI() outputs (without grass outputs) with scenario,
+#                           grass_fuel_load, percent_cured and GRASS_OUTPUTS columns;
+#                           wide: hFWI() outputs with GRASS_OUTPUTS of every scenario
+@timing.timed()
+def grass_scenarios(
+    df_wx,
+    scenarios,
+    timezone = None,
+    wide = False,
+    silent = False,
+    round_out = 4,
+    **hfwi_args
+):
+    scenarios = pd.DataFrame(scenarios).reset_index(drop = True)
+    for col in scenarios.columns:
+        if not col in SCENARIO_COLUMNS:
+            raise ValueError("Unknown scenario column " + col + ", choose from " +
+                ", ".join(SCENARIO_COLUMNS))
+    n_sets = len(scenarios)
+    loads = (scenarios["grass_fuel_load"].values.astype(float)
+        if "grass_fuel_load" in scenarios.columns else np.full(n_sets, np.nan))
+    cured = (scenarios["percent_cured"].values.astype(float)
+        if "percent_cured" in scenarios.columns else np.full(n_sets, np.nan))
+    params = hfwi_args.get("params")
+    mcgfmc_matted_old = hfwi_args.pop("mcgfmc_matted_old",
+        fwi_core.ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT))
+    mcgfmc_standing_old = hfwi_args.pop("mcgfmc_standing_old",
+        fwi_core.ffmc_to_mcffmc(fwi_core.FFMC_DEFAULT))
+    # the moisture codes are the same for every scenario
+    df = NG_FWI.hFWI(df_wx, timezone, silent = silent, round_out = None,
+        outputs = NG_FWI.OUTPUTS_FWI, **hfwi_args)
+    wx = df_wx.rename(columns = str.lower)
+    had_stn = "id" in df.columns
+    if not had_stn:
+        df["id"] = "STN"
+    default_load = fwi_core.DEFAULT_GRASS_FUEL_LOAD if params is None else \
+        params.default_grass_fuel_load
+    split = ["id"] if NG_FWI.CONTINUOUS_MULTIYEAR else ["id", "yr"]
+    grass = {k: [] for k in GRASS_OUTPUTS + SCENARIO_COLUMNS}
+    rows = []
+    for _, w in df.groupby(split, sort = False):
+        rows.append(w.index.values)
+        lat, long, tz = (float(w[col].iloc[0]) for col in ["lat", "long", "timezone"])
+        dates = fwi_batch.to_dates(w["yr"].values, w["mon"].values, w["day"].values)
+        hours = {"date": dates}
+        for col in ["hr", "temp", "rh", "ws", "prec"]:
+            hours[col] = w[col].values.astype(float)
+        # as in hFWI(), from df_wx if it has them
+        hours["solrad"] = (w["solrad"].values.astype(float) if "solrad" in wx.columns
+            else fwi_batch.solar_radiation(lat, long, tz, dates, hours["hr"],
+                hours["temp"], hours["rh"]))
+        hours["percent_cured"] = (w["percent_cured"].values.astype(float)
+            if "percent_cured" in wx.columns else fwi_batch.seasonal_curing(dates))
+        hours["grass_fuel_load"] = (w["grass_fuel_load"].values.astype(float)
+            if "grass_fuel_load" in wx.columns else np.full(len(w), default_load))
+        result = run_grass_scenarios(hours, loads, cured, mcgfmc_matted_old,
+            mcgfmc_standing_old, params)
+        for k in GRASS_OUTPUTS:
+            grass[k].append(result[k])
+        grass["grass_fuel_load"].append(np.where(np.isnan(loads)[:, None],
+            hours["grass_fuel_load"][None, :], loads[:, None]))
+        grass["percent_cured"].append(np.where(np.isnan(cured)[:, None],
+            hours["percent_cured"][None, :], cured[:, None]))
+    # back in the order of df
+    order = np.argsort(np.concatenate(rows), kind = "stable")
+    grass = {k: np.concatenate(v, axis = 1)[:, order] for k, v in grass.items()}
+    if not had_stn:
+        del df["id"]
+    df = df.drop(columns = [c for c in SCENARIO_COLUMNS + ["solrad"] if c in df.columns])
+    if not (round_out == None or round_out == "None"):
+        decimals = int(round_out)
+        df[NG_FWI.OUTPUTS_FWI] = df[NG_FWI.OUTPUTS_FWI].round(decimals)
+        grass = {k: np.round(v, decimals) if k in GRASS_OUTPUTS else v
+            for k, v in grass.items()}
+    if wide:
+        df = df.reset_index(drop = True)
+        columns = {}
+        for i in range(n_sets):
+            for k in SCENARIO_COLUMNS + GRASS_OUTPUTS:
+                columns[f"{k}_s{i}"] = grass[k][i]
+        return pd.concat([df, pd.DataFrame(columns)], axis = 1)
+    result = pd.concat([df] * n_sets, ignore_index = True)
+    result.insert(0, "scenario", np.repeat(np.arange(n_sets), len(df)))
+    for k in SCENARIO_COLUMNS + GRASS_OUTPUTS:
+        result[k] = grass[k].reshape(-1)
+    return result
+
+
+if __name__ == "__main__":
+    # run a sweep by command line. run with option -h or --help to see usage
+    parser = argparse.ArgumentParser(prog = "sweep")
+    parser.add_argument("input", help = "Input csv hourly weather file (as for NG_FWI)")
+    parser.add_argument("output", help = "Output csv file name and location")
+    parser.add_argument("-p", "--param", action = "append", default = [],
+        help = "name=value,value,... of a parameter to vary, every combination " +
+        "is run (repeat for more parameters, names: " +
+        ", ".join(fwi_core.PARAMETERS) + ")")
+    parser.add_argument("--sets", default = None,
+        help = "csv of parameter sets (one column per parameter) instead of --param")
+    parser.add_argument("-o", "--outputs", default = None,
+        help = "Comma separated outputs to keep (default " + ",".join(SWEEP_OUTPUTS) + ")")
+    parser.add_argument("--grass-scenarios", default = None,
+        help = "csv of grass_fuel_load and/or percent_cured scenarios to run " +
+        "instead of parameter sets")
+    parser.add_argument("--wide", action = "store_true",
+        help = "One row per hour with the grass outputs of every scenario")
+    parser.add_argument("-s", "--silent", action = "store_true")
+    args = parser.parse_args()
+    if args.grass_scenarios is not None:
+        df_out = grass_scenarios(
+            pd.read_csv(args.input),
+            pd.read_csv(args.grass_scenarios),
+            wide = args.wide,
+            silent = args.silent
+        )
+        df_out.to_csv(args.output, index = False)
+        parser.exit()
+    if args.sets is not None:
+        sets = pd.read_csv(args.sets)
+    else:
+        values = {}
+        for p in args.param:
+            name, _, vals = p.partition("=")
+            values[name] = [float(v) for v in vals.split(",")]
+        sets = parameter_grid(**values)
+    df_out = sweep(
+        pd.read_csv(args.input),
+        sets,
+        outputs = SWEEP_OUTPUTS if args.outputs is None else args.outputs.split(","),
+        silent = args.silent
+    )
+    df_out.to_csv(args.output, index = False)
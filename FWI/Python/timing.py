@@ -0,0 +1,214 @@
+# Per-stage timing of the FWI functions
+#
+# hFWI(), _stnHFWI(), util.get_sunlight(), generate_daily_summaries(),
+# minmax_to_hourly() (and the GISS drivers) mark their stages with stage(). Nothing
+# is recorded until a callback is added, then every finished stage is passed to the
+# callbacks as a dictionary:
+#   stage         stage name (e.g. "hFWI.validation", "_stnHFWI.loop")
+#   parent        name of the enclosing stage (None at the top)
+#   rows          rows processed, when known
+#   wall          wall time (seconds)
+#   peak_mem      peak memory allocated by Python above the start of the stage (bytes,
+#                 only while tracemalloc is tracing, see capture())
+#   max_rss       peak resident memory of the process so far (bytes, where available)
+#   pid, time     process id and time the stage finished
+# plus any extra fields given to stage() (e.g. id and yr of a station year).
+#
+# Example:
+#   import timing
+#   timing.add_callback(timing.json_log("stages.jsonl"))
+#   with timing.capture("hFWI.prof"):  # optional cProfile and tracemalloc
+#       NG_FWI.hFWI(df)
+
+### Import packages ###
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_callbacks = []
+# stages currently running, innermost last
+_open = []
+
+
+def add_callback(callback):
+    _callbacks.append(callback)
+    return callback
+
+
+def remove_callback(callback):
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+def enabled():
+    return len(_callbacks) > 0
+
+
+def max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+##
+# Time a stage of a calculation, for use as a with statement
+# The record is yielded so rows and other fields can be set while the stage runs.
+#
+# @param    name        stage name
+# @param    rows        rows processed (default None)
+# @param    fields      extra fields to record
+# @return               context manager yielding the record (None when disabled)
+@contextlib.contextmanager
+def stage(name, rows = None, **fields):
+    if not _callbacks:
+        yield None
+        return
+    record = {"stage": name, "parent": _open[-1]["stage"] if _open else None,
+        "rows": rows}
+    record.update(fields)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # keep the peak so far for the enclosing stages before starting a new one
+        for outer in _open:
+            outer["_peak"] = max(outer.get("_peak", 0), peak)
+        tracemalloc.reset_peak()
+        record["_start_mem"] = current
+    _open.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall"] = time.perf_counter() - start
+        _open.pop()
+        if tracing and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], record.pop("_peak", 0))
+            record["peak_mem"] = peak - record.pop("_start_mem")
+            if _open:
+                _open[-1]["_peak"] = max(_open[-1].get("_peak", 0), peak)
+        else:
+            record.pop("_start_mem", None)
+            record.pop("_peak", None)
+            record["peak_mem"] = None
+        record["max_rss"] = max_rss()
+        record["pid"] = os.getpid()
+        record["time"] = time.time()
+        for callback in list(_callbacks):
+            callback(record)
+
+##
+# Decorator timing every call of a function as a stage
+#
+# @param    name        stage name (default the function name)
+# @return               decorator, rows are the length of the first argument if it has
+#                       one (a data frame or list, not a file name)
+def timed(name = None):
+    def decorate(fn):
+        stage_name = fn.__name__ if name is None else name
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            if not _callbacks:
+                return fn(*args, **kwargs)
+            rows = None
+            if len(args) > 0 and hasattr(args[0], "__len__") and not isinstance(args[0], str):
+                rows = len(args[0])
+            with stage(stage_name, rows):
+                return fn(*args, **kwargs)
+        return timed_fn
+    return decorate
+
+##
+# Callback writing each stage as a line of JSON
+# The file is opened in append mode and written one line at a time, so processes of a
+# multiprocessing pool can share it.
+class json_log:
+    def __init__(self, logfile):
+        self.logfile = logfile
+        self.f = open(logfile, "a")
+
+    def __call__(self, record):
+        self.f.write(json.dumps(record, default = str) + "\n")
+        self.f.flush()
+
+    def close(self):
+        remove_callback(self)
+        self.f.close()
+
+##
+# Callback printing each stage on one line
+def print_stage(record):
+    print("{}{} rows={} wall={:.6f}s{}".format(
+        "  " * len(_open), record["stage"], record["rows"], record["wall"],
+        "" if record["peak_mem"] is None else
+        " peak_mem={:.1f}MB".format(record["peak_mem"] / 1e6)))
+
+##
+# Profile everything run in a with statement with cProfile and tracemalloc
+# Stages record their peak memory while tracemalloc is tracing.
+#
+# @param    profile_file    file to save cProfile statistics to (None for no cProfile)
+# @param    trace_memory    whether to trace memory allocations (default True)
+# @return                   context manager yielding the cProfile.Profile (or None)
+@contextlib.contextmanager
+def capture(profile_file = None, trace_memory = True):
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = None
+    if profile_file is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield profiler
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+        if started_tracing:
+            tracemalloc.stop()
+
+##
+# Total the records of a JSON stage log by stage
+#
+# @param    logfile     file written by json_log
+# @return               list of (stage, calls, rows, total wall, max peak_mem) by total wall
+def summarize(logfile):
+    totals = {}
+    with open(logfile) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            t = totals.setdefault(record["stage"], [0, 0, 0.0, None])
+            t[0] += 1
+            t[1] += record["rows"] or 0
+            t[2] += record["wall"]
+            if record.get("peak_mem") is not None:
+                t[3] = max(t[3] or 0, record["peak_mem"])
+    return sorted(((k,) + tuple(v) for k, v in totals.items()),
+        key = lambda t: t[3], reverse = True)
+
+
+if __name__ == "__main__":
+    # summarize a stage log by command line. run with option -h or --help to see usage
+    import argparse
+    parser = argparse.ArgumentParser(prog = "timing")
+    parser.add_argument("logfile", help = "JSON lines stage log (written by json_log)")
+    args = parser.parse_args()
+    print("{:<40s} {:>8s} {:>12s} {:>12s} {:>12s} {:>10s}".format(
+        "stage", "calls", "rows", "wall (s)", "rows/s", "peak (MB)"))
+    for name, calls, rows, wall, peak in summarize(args.logfile):
+        print("{:<40s} {:>8d} {:>12d} {:>12.3f} {:>12.0f} {:>10s}".format(
+            name, calls, rows, wall, rows / wall if wall > 0 else 0,
+            "" if peak is None else "{:.1f}".format(peak / 1e6)))
@@ -5,6 +5,9 @@ from calendar import isleap
 import numpy as np
 import pandas as pd
 
+import timing
+from fwi_core import seasonal_curing  # kept here for existing callers
+
 
 def version():
     # update this and CHANGELOG.md before merging to main
@@ -80,6 +83,7 @@ def find_rh(q, temp):
 # @param df                Dataframe to add columns to
 # @param get_solrad        Whether to calculate solar radiation
 # @return                  Sunrise, sunset, sunlight hours, and solar radiation (kW/m^2)
+@timing.timed()
 def get_sunlight(df, get_solrad = False):
     df.columns = map(str.lower, df.columns)
     # columns to split along unique days
@@ -137,22 +141,23 @@ def get_sunlight(df, get_solrad = False):
 
     # calculate solar radiation
     if get_solrad:
-        df_all["tst"] = df_all.apply(
-            lambda x: (x["timestamp"].hour) * 60.0 + x["timeoffset"], axis = 1)
-        df_all["hourangle"] = df_all.apply(lambda x: x["tst"] / 4 - 180, axis = 1)
-        df_all["zenith"] = df_all.apply(
-            lambda x: acos(sin(x["lat"] * pi / 180) * sin(x["decl"]) +
-            cos(x["lat"] * pi / 180) * cos(x["decl"]) *
-            cos(x["hourangle"] * pi / 180)), axis = 1)
-        df_all["zenith"] = df_all["zenith"].apply(lambda zenith: min(pi / 2, zenith))
-        # need later so keep column
-        df_all["cos_zenith"] = df_all["zenith"].apply(cos)
-        df_all["vpd"] = df_all.apply(lambda x:
-            6.11 * (1.0 - x["rh"] / 100.0) * exp(17.29 * x["temp"] / (x["temp"] + 237.3)),
-            axis = 1)
-        df_all["solrad"] = df_all.apply(lambda x:
-            x["cos_zenith"] * 0.92 * (1.0 - exp(-0.22 * x["vpd"])), axis = 1)
-        df_all.loc[df_all["solrad"] < 1e-4, "solrad"] = 0.0  # always set low values to 0
+        with timing.stage("get_sunlight.solrad", rows = len(df_all)):
+            df_all["tst"] = df_all.apply(
+                lambda x: (x["timestamp"].hour) * 60.0 + x["timeoffset"], axis = 1)
+            df_all["hourangle"] = df_all.apply(lambda x: x["tst"] / 4 - 180, axis = 1)
+            df_all["zenith"] = df_all.apply(
+                lambda x: acos(sin(x["lat"] * pi / 180) * sin(x["decl"]) +
+                cos(x["lat"] * pi / 180) * cos(x["decl"]) *
+                cos(x["hourangle"] * pi / 180)), axis = 1)
+            df_all["zenith"] = df_all["zenith"].apply(lambda zenith: min(pi / 2, zenith))
+            # need later so keep column
+            df_all["cos_zenith"] = df_all["zenith"].apply(cos)
+            df_all["vpd"] = df_all.apply(lambda x:
+                6.11 * (1.0 - x["rh"] / 100.0) * exp(17.29 * x["temp"] / (x["temp"] + 237.3)),
+                axis = 1)
+            df_all["solrad"] = df_all.apply(lambda x:
+                x["cos_zenith"] * 0.92 * (1.0 - exp(-0.22 * x["vpd"])), axis = 1)
+            df_all.loc[df_all["solrad"] < 1e-4, "solrad"] = 0.0  # always set low values to 0
         
         cols_sun = ["solrad", "sunrise", "sunset"]
     else:
@@ -166,56 +171,104 @@ def get_sunlight(df, get_solrad = False):
     return df_result
 
 ##
-# Set default percent_cured values based off annual variation in Boreal Plains region
+# Hours since 1970-01-01 00:00 of the data's own (standard) time
 #
 # @param yr             Year
 # @param mon            Month of year
 # @param day            Day of month
-# @param start_mon      Month of grassland fuel green up start (Boreal Plains Mar 12)
-# @param start_day      Day of grassland fuel green up start (Boreal Plains Mar 12)
-# @return               percent_cured [%], percent of grassland fuel that is cured
-
-def seasonal_curing(yr, mon, day, start_mon = 3, start_day = 12):
-    # store default values of percent_cured every 10 days of the year
-    PERCENT_CURED = [
-        96.0,  # "winter" cured value
-        95.0,
-        93.0,
-        92.0,
-        90.5,
-        88.4,
-        84.4,
-        78.1,
-        68.7,
-        50.3,
-        32.9,
-        23.0,
-        22.0,
-        21.0,
-        20.0,
-        25.7,
-        35.0,
-        43.0,
-        49.8,
-        60.0,
-        68.0,
-        72.0,
-        75.0,
-        78.9,
-        86.0,
-        96.0  # "winter" cured value for rest of year
-    ]
-    # find previous green up start date (year - 1 or year)
-    shift = datetime.date(yr, mon, day) - datetime.date(yr, start_mon, start_day)
-    if shift.days < 0:
-        shift = datetime.date(yr, mon, day) - datetime.date(yr - 1, start_mon, start_day)
-    days_in = shift.days + 1  # green up start date is first value different (not 0th)
-    # check if date is in green phase or winter (cured) phase
-    if days_in < (len(PERCENT_CURED) - 1) * 10:
-        # linear interpolation between every 10-day value
-        per_cur0 = PERCENT_CURED[days_in // 10]
-        per_cur1 = PERCENT_CURED[days_in // 10 + 1]
-        period_frac = (days_in % 10) / 10.0
-        return per_cur0 + (per_cur1 - per_cur0) * period_frac
-    else:
-        return PERCENT_CURED[-1]
+# @param hr             Hour of day
+# @return               integer time index (int32)
+def time_index(yr, mon, day, hr):
+    months = ((np.asarray(yr, dtype = np.int64) - 1970) * 12 +
+        np.asarray(mon, dtype = np.int64) - 1).astype("datetime64[M]")
+    days = (months.astype("datetime64[D]") - np.datetime64("1970-01-01", "D")).astype(np.int64)
+    days += np.asarray(day, dtype = np.int64) - 1
+    return (days * 24 + np.asarray(hr, dtype = np.int64)).astype(np.int32)
+
+##
+# Convert an output table (e.g. of hFWI() or generate_daily_summaries()) to a compact
+# representation: float32 values, small integer dates, categorical strings, an integer
+# time index and no Python datetime objects
+#
+# @param df             Dataframe to convert
+# @return               Dataframe with:
+#                       time (hours since 1970-01-01, int32) if df has yr, mon, day, hr
+#                       yr (int16), mon, day, hr, minute (int8)
+#                       strings (e.g. id) as categories
+#                       sunrise and sunset as float64, all other numbers as float32
+#                       timestamp and date columns dropped
+def compact(df):
+    out = {}
+    if all(c in df.columns for c in ["yr", "mon", "day", "hr"]):
+        out["time"] = time_index(df["yr"], df["mon"], df["day"], df["hr"])
+    for col in df.columns:
+        values = df[col]
+        if col in ["timestamp", "date"]:
+            continue
+        elif col == "time":
+            out[col] = values.to_numpy().astype(np.int32)
+        elif col == "yr":
+            out[col] = values.to_numpy().astype(np.int16)
+        elif col in ["mon", "day", "hr", "minute"]:
+            out[col] = values.to_numpy().astype(np.int8)
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            out[col] = values
+        elif col in ["sunrise", "sunset"]:
+            # kept as float64 so daily summaries format the same hh:mm (e.g. 5.95 as float32
+            # is 5.9499998, or 05:56 instead of 05:57)
+            out[col] = values.to_numpy().astype(np.float64)
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            out[col] = values.to_numpy().astype(np.float32)
+        else:
+            out[col] = values.astype(str).astype("category")
+    return pd.DataFrame(out, index = df.index)
+
+##
+# Save a table in the compact storage format (a .npz file of one array per column,
+# categories are saved as codes and their labels)
+#
+# @param df             Dataframe to save (converted with compact() first)
+# @param filename       File to save to (.npz)
+def save_compact(df, filename):
+    df = compact(df)
+    arrays = {"__columns__": np.array(list(df.columns), dtype = str)}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[col + ".codes"] = values.cat.codes.to_numpy()
+            arrays[col + ".categories"] = np.array(values.cat.categories, dtype = str)
+        else:
+            arrays[col] = values.to_numpy()
+    with open(filename, "wb") as f:
+        np.savez_compressed(f, **arrays)
+
+##
+# Load a table saved with save_compact()
+#
+# @param filename       File to load (.npz)
+# @param columns        Columns to load (default None for all)
+# @return               Dataframe in the compact representation
+def load_compact(filename, columns = None):
+    out = {}
+    with np.load(filename) as data:
+        all_columns = list(data["__columns__"])
+        for col in (all_columns if columns is None else columns):
+            if col not in all_columns:
+                raise RuntimeError(f'Column "{col}" not found in {filename}')
+            if col + ".codes" in data.files:
+                out[col] = pd.Categorical.from_codes(data[col + ".codes"],
+                    data[col + ".categories"])
+            else:
+                out[col] = data[col]
+    return pd.DataFrame(out)
+
+##
+# Read an output table saved as .csv or in the compact storage format (.npz)
+#
+# @param filename       File to read
+# @param columns        Columns to read (default None for all)
+# @return               Dataframe
+def read_output(filename, columns = None):
+    if str(filename).endswith(".npz"):
+        return load_compact(filename, columns)
+    return pd.read_csv(filename, usecols = columns)
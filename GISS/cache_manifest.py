@@ -0,0 +1,168 @@
+# cache of the outputs of era5_convert.py, giss_hourly_FWI_parallel.py and era5_to_fwi.py, so reruns skip points whose inputs and settings didn't change
+# (see the cache section of giss_config.py)
+#
+# each point gets a key, a hash of the contents of its input file(s), the settings that change its outputs (start/end years, starting codes,
+# outputs, format, model constants, the code version util.version() and, with a state database, the state the point starts from)
+# the manifest, a SQLite database written only by the main process of each script, maps every output file to the key it was made with
+# a point whose outputs all exist with the same key is skipped. outputs about to be remade with a different key are moved to
+# <store>/<old key>/ instead of being deleted, so going back to earlier settings restores them from the store instead of recalculating them
+# the store is kept under max_bytes by removing the least recently used keys
+# input hashes are saved with the file size and modification time, so unchanged inputs aren't read again
+
+import hashlib, json, os, shutil, sqlite3, time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (path TEXT PRIMARY KEY, key TEXT NOT NULL, size INTEGER, extra TEXT, updated REAL);
+CREATE TABLE IF NOT EXISTS inputs (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT);
+CREATE TABLE IF NOT EXISTS store (key TEXT PRIMARY KEY, files TEXT, size INTEGER, extra TEXT, used REAL);
+"""
+
+# model constants and options of the FWI code the outputs depend on (see Parameters in FWI/Python/fwi_core.py)
+def model_constants():
+    import fwi_core, NG_FWI
+    constants = fwi_core.Parameters().to_dict()
+    constants["continuous_multiyear"] = NG_FWI.CONTINUOUS_MULTIYEAR
+    return constants
+
+class CacheManifest:
+    def __init__(self, filename, store=None, max_bytes=0, timeout=60.0):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(filename, timeout=timeout)
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # sha256 of a file's contents, only read again when its size or modification time changed
+    def file_hash(self, path):
+        st = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime_ns, hash FROM inputs WHERE path = ?", (path,)).fetchone()
+        if (row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns):
+            return row[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO inputs VALUES (?, ?, ?, ?)", (path, st.st_size, st.st_mtime_ns, h.hexdigest()))
+        return h.hexdigest()
+
+    # key of a point from the contents of its inputs and its settings (a JSON serializable dictionary)
+    def key(self, inputs, config):
+        content = {"inputs": [self.file_hash(path) for path in inputs], "config": config}
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _recorded(self, outputs):
+        rows = {}
+        for path in outputs:
+            row = self.conn.execute("SELECT key, size, extra FROM outputs WHERE path = ?", (path,)).fetchone()
+            if (row is None or (not os.path.isfile(path)) or os.path.getsize(path) != row[1]):
+                return None
+            rows[path] = row
+        keys = set(row[0] for row in rows.values())
+        if (len(keys) != 1):
+            return None
+        return keys.pop(), json.loads(rows[outputs[0]][2])
+
+    # whether the outputs of a point are up to date with key, restoring them from the store if they were made with it before
+    # returns (True, extra saved by record()) or (False, None) if the point has to be run (after moving its outputs to the store)
+    def check(self, outputs, key):
+        recorded = self._recorded(outputs)
+        if (recorded is not None and recorded[0] == key):
+            return True, recorded[1]
+        self.stash(outputs)
+        if (self.store is None):
+            return False, None
+        row = self.conn.execute("SELECT files, extra FROM store WHERE key = ?", (key,)).fetchone()
+        folder = os.path.join(self.store, key)
+        if (row is None or not all(os.path.isfile(os.path.join(folder, name)) for name in json.loads(row[0]))):
+            return False, None
+        for path, name in zip(outputs, json.loads(row[0])):
+            os.replace(os.path.join(folder, name), path)
+            # newer than anything made from the previous outputs (e.g. by fwi_climatology.py)
+            os.utime(path)
+        shutil.rmtree(folder, ignore_errors=True)
+        with self.conn:
+            self.conn.execute("DELETE FROM store WHERE key = ?", (key,))
+        self.record(outputs, key, json.loads(row[1]))
+        return True, json.loads(row[1])
+
+    # moves outputs made with another key to <store>/<key>/, or deletes them without a store (or if they were never recorded),
+    # so a run that fails can't leave an old output that would be taken as made with the new key
+    def stash(self, outputs):
+        recorded = self._recorded(outputs)
+        with self.conn:
+            self.conn.executemany("DELETE FROM outputs WHERE path = ?", [(path,) for path in outputs])
+        if (recorded is None or self.store is None or self.max_bytes <= 0):
+            for path in outputs:
+                if (os.path.isfile(path)):
+                    os.remove(path)
+            return
+        old_key, extra = recorded
+        folder = os.path.join(self.store, old_key)
+        os.makedirs(folder, exist_ok=True)
+        names = ["{}_{}".format(i, os.path.basename(path)) for i, path in enumerate(outputs)]
+        size = 0
+        for path, name in zip(outputs, names):
+            size += os.path.getsize(path)
+            os.replace(path, os.path.join(folder, name))
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?, ?)", (old_key, json.dumps(names), size, json.dumps(extra), time.time()))
+
+    # saves that outputs were made with key, with extra (JSON serializable, e.g. the point's last state) returned by check()
+    def record(self, outputs, key, extra=None):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)",
+                                  [(path, key, os.path.getsize(path), json.dumps(extra), now) for path in outputs])
+
+    # removes the least recently used keys of the store until it is under max_bytes
+    def evict(self):
+        if (self.store is None):
+            return 0
+        rows = self.conn.execute("SELECT key, size FROM store ORDER BY used DESC").fetchall()
+        total = 0
+        evicted = []
+        for key, size in rows:
+            total += size
+            if (total > self.max_bytes):
+                evicted.append(key)
+        for key in evicted:
+            shutil.rmtree(os.path.join(self.store, key), ignore_errors=True)
+        with self.conn:
+            self.conn.executemany("DELETE FROM store WHERE key = ?", [(key,) for key in evicted])
+        return len(evicted)
+
+# runs fn on the points that aren't up to date in the cache, with run_points(fn, list of arguments) (e.g. Pool.starmap)
+# jobs are (arguments of fn, input files, settings, output files), points are recorded when fn returned something other than None
+# (None is a failed point) and all their outputs exist afterwards
+# returns the result of each job in order, the saved result (extra) of skipped points
+def run_cached(cache, run_points, fn, jobs):
+    if (cache is None):
+        return run_points(fn, [job[0] for job in jobs])
+    results = [None] * len(jobs)
+    keys = [None] * len(jobs)
+    todo = []
+    for i, (args, inputs, config, outputs) in enumerate(jobs):
+        keys[i] = cache.key(inputs, config)
+        current, extra = cache.check(outputs, keys[i])
+        if (current):
+            results[i] = extra
+        else:
+            todo.append(i)
+    print("Cache: {} of {} points up to date, running {}".format(len(jobs) - len(todo), len(jobs), len(todo)))
+    for i, result in zip(todo, run_points(fn, [jobs[i][0] for i in todo])):
+        results[i] = result
+        outputs = jobs[i][3]
+        if (result is not None and all(os.path.isfile(path) for path in outputs)):
+            cache.record(outputs, keys[i], result)
+    cache.evict()
+    return results
@@ -4,6 +4,7 @@
 
 import cdsapi, subprocess 
 from giss_config import *
+from point_registry import region_points
 
 subprocess.call(["mkdir",
                 "-p",
@@ -12,27 +13,16 @@ subprocess.call(["mkdir",
 
 client = cdsapi.Client()
 
-with open("{}/{}/{}".format(projectDir, regionName, pointLocations)) as f:
-    counter = 0
-    for line in f:
-        counter += 1
-        if (line[0] == '#'):
-            continue
-        latlon = line.strip().split('#')[0].split(',')
-        if (len(latlon) != 3):
-            print("Line {}: does not have three entries, skipping...")
-            continue
-        station_id = latlon[0]
-        lat = float(latlon[1])
-        lon = float(latlon[2])
-        request = {
-            "variable": variableRequest,
-            "location": {"longitude": lon, "latitude": lat},
-            "date": ["{}/{}".format(start_date, end_date)],
-            "data_format": "csv"
-        }
+points = region_points()
+for k in range(len(points)):
+    request = {
+        "variable": variableRequest,
+        "location": {"longitude": float(points.records['lon'][k]), "latitude": float(points.records['lat'][k])},
+        "date": ["{}/{}".format(start_date, end_date)],
+        "data_format": "csv"
+    }
 
-        target = "{}/{}/{}/{}_{}.zip".format(projectDir, regionName, downloadedFolder, downloadedPrefix, station_id)
+    target = points.path("downloaded", k)
 
-        client.retrieve(dataset, request, target)
+    client.retrieve(dataset, request, target)
 
@@ -1,16 +1,18 @@
 import pandas as pd
 import numpy as np
 import argparse, os, subprocess
-from giss_utils import get_timezone
-import calendar, time
+from giss_utils import check_sharding, get_timezone, init_timing, profiled
+import timing
+import calendar, time, zipfile
 from datetime import datetime
 from multiprocessing import Pool
 from giss_config import *
+from work_queue import WorkQueue
+from cache_manifest import CacheManifest, run_cached
+from point_registry import region_points
+import util
 
-subprocess.call(["mkdir",
-                "-p",
-                "{}/{}/{}".format(projectDir, regionName, convertedFolder)
-                 ])
+CONVERTED_COLUMNS = ['id', 'lat', 'long', 'timezone', 'yr', 'mon', 'day', 'hr', 'temp', 'rh', 'ws', 'prec']
 
 # Teten's equation without the constant in the front
 def tetens(temp):
@@ -19,39 +21,72 @@ def tetens(temp):
     else:
         return np.exp(21.875 * temp / (temp + 265.5))
 
-vtetens = np.vectorize(tetens)
-
-def do_conversion(inputfile, outputfile=None):
-    start_time = time.perf_counter()
-    # create a temp working directory to store unzipped files
-    if outputfile is None:
-        outdir_temp = "./{}".format(".".join(inputfile.split('/')[-1].split('.')[:-1]))
-    else:
-        outdir_temp = "{}/{}".format("/".join(outputfile.split('/')[0:-1]), ".".join(inputfile.split('/')[-1].split('.')[0:-1]))
-
-    subprocess.call(["mkdir", "-p", outdir_temp])
-    subprocess.call(["unzip", "-o", inputfile, "-d", outdir_temp])
-    unzipped = os.listdir(outdir_temp)
+# tetens on arrays, the same value for each element
+def vtetens(temp):
+    temp = np.asarray(temp, dtype=float)
+    return np.where(temp > 0, np.exp(17.27 * temp / (temp + 237.3)), np.exp(21.875 * temp / (temp + 265.5)))
+
+# FWI weather from ERA5 variables (arrays or series of the same shape), returns temp (C), rh (%), ws (km/h), prec (mm)
+# t2m = 2m temperature (K), d2m = 2m dewpoint temperature (K), tp = total precipitation (m), u10, v10 = 10m wind components (m/s)
+def era5_weather(t2m, d2m, tp, u10, v10):
+    temp = t2m - 273.15
+    prec = np.maximum(tp * 1000, 0)
+    ws = np.maximum(np.hypot(u10, v10) * 3.6, 0)
+    rh = np.minimum(vtetens(d2m - 273.15) / vtetens(t2m - 273.15) * 100, 100)
+    return temp, rh, ws, prec
+
+# id generated from the location
+def era5_station_id(lat, lon):
+    llat = 'N'
+    llon = 'E'
 
+    if (lat < 0):
+        llat = 'S'
+    if (lon < 0):
+        llon = 'W'
+    return "{:.2f}{}_{:.2f}{}".format(np.abs(lat), llat, np.abs(lon), llon)
+
+# id, yr, mon, day, hr of the first hour era5_data gives for a downloaded ERA5 .zip file, reading only its first line
+def era5_first_row(inputfile):
+    with zipfile.ZipFile(inputfile) as zf:
+        name = [name for name in zf.namelist() if (not name.endswith('/'))][0]
+        first = pd.read_csv(zf.open(name), nrows=1).iloc[0]
+    lon = first['longitude']
+    if (lon > 360 or lon < -360):
+        lon %= 360
+    if (lon > 180):
+        lon -= 360
+    date = pd.to_datetime(first['valid_time'])
+    if (start_year != 0):
+        date = max(date, pd.Timestamp(start_year, 1, 1))
+    return {"id": era5_station_id(first['latitude'], lon), "yr": date.year, "mon": date.month, "day": date.day, "hr": date.hour}
+
+# reads the three csv files of a downloaded ERA5 .zip file (without unzipping it to disk) and converts them to the hourly weather
+# the FWI scripts read, returns a dataframe with columns id, lat, long, timezone, yr, mon, day, hr, temp, rh, ws, prec
+# or None if the file has no data
+def era5_data(inputfile):
     # read data and merge into single dataframe
-    df = pd.read_csv("{}/{}".format(outdir_temp, unzipped[0]))
-    df2 = pd.read_csv("{}/{}".format(outdir_temp, unzipped[1]))
-    df3 = pd.read_csv("{}/{}".format(outdir_temp, unzipped[2]))
+    with timing.stage("do_conversion.read", file=inputfile):
+        with zipfile.ZipFile(inputfile) as zf:
+            unzipped = [name for name in zf.namelist() if (not name.endswith('/'))]
+            df = pd.read_csv(zf.open(unzipped[0]))
+            df2 = pd.read_csv(zf.open(unzipped[1]))
+            df3 = pd.read_csv(zf.open(unzipped[2]))
 
-    # remove columns
-    df2.drop(columns=['latitude', 'longitude'], inplace=True)
-    df3.drop(columns=['latitude', 'longitude'], inplace=True)
+        # remove columns
+        df2.drop(columns=['latitude', 'longitude'], inplace=True)
+        df3.drop(columns=['latitude', 'longitude'], inplace=True)
 
-    df = df.join(df2.set_index('valid_time'), on='valid_time')
-    df = df.join(df3.set_index('valid_time'), on='valid_time')
+        df = df.join(df2.set_index('valid_time'), on='valid_time')
+        df = df.join(df3.set_index('valid_time'), on='valid_time')
 
-    del df2
-    del df3
+        del df2
+        del df3
 
     # check if data is actually present, downloaded era5 files can have no data at all
     if (df['t2m'].iloc[0] != df['t2m'].iloc[0]):
         print("{} seems to have no valid data, skipping...".format(inputfile))
-        return
+        return None
 
     # convert to datetime format
     df['date'] = pd.to_datetime(df['valid_time'])
@@ -93,19 +128,7 @@ def do_conversion(inputfile, outputfile=None):
     if (lon > 180):
         lon -= 360
 
-    # generate an id and use as output file name if one is not provided already
-    llat = 'N'
-    llon = 'E'
-
-    if (lat < 0):
-        llat = 'S'
-    if (lon < 0):
-        llon = 'W'
-    station_id = "{:.2f}{}_{:.2f}{}".format(np.abs(lat), llat, np.abs(lon), llon)
-    if outputfile is None:
-        outputfile = "era5input_{}.csv".format(station_id)
-
-    df['id'] = np.full(len(df), station_id)
+    df['id'] = np.full(len(df), era5_station_id(lat, lon))
 
     timezone = get_timezone(lat, lon)
     df['timezone'] = np.full(len(df), timezone)
@@ -116,41 +139,79 @@ def do_conversion(inputfile, outputfile=None):
     df['day'] = df['date'].dt.day
     df['hr'] = df['date'].dt.hour
 
-    # conversions
-    df['temp'] = df['t2m'] - 273.15
-    df['prec'] = np.maximum(df['tp'] * 1000, 0)
-    df['ws'] = np.maximum(np.hypot(df['u10'], df['v10']) * 3.6, 0)
-    df['rh'] = np.minimum(vtetens(df['d2m'] - 273.15) / vtetens(df['t2m'] - 273.15) * 100, 100)
+    with timing.stage("do_conversion.convert", rows=len(df)):
+        # conversions
+        df['temp'], df['rh'], df['ws'], df['prec'] = era5_weather(df['t2m'], df['d2m'], df['tp'], df['u10'], df['v10'])
+
+    return df[CONVERTED_COLUMNS].reset_index(drop=True)
 
+# returns True if outputfile was written, None if the file has no data
+@profiled
+@timing.timed()
+def do_conversion(inputfile, outputfile=None):
+    start_time = time.perf_counter()
+    df = era5_data(inputfile)
+    if (df is None):
+        return
+    # use the generated id as output file name if one is not provided already
+    if outputfile is None:
+        outputfile = "era5input_{}.csv".format(df['id'].iloc[0])
 
-    df.to_csv(outputfile, columns=['id', 'lat', 'long', 'timezone', 'yr', 'mon', 'day', 'hr', 'temp', 'rh', 'ws', 'prec'], index=False)
+    with timing.stage("do_conversion.write", rows=len(df), file=outputfile):
+        df.to_csv(outputfile, index=False)
     end_time = time.perf_counter()
     print("Converted {} to {}, time taken {:6f}s".format(inputfile, outputfile, end_time - start_time))
-    subprocess.call(["rm", "-rf", outdir_temp])
+    return True
 
 if __name__ == '__main__':
-    counter = 0
-    conversion_args = []
-    inputfile = "{}/{}/{}".format(projectDir, regionName, pointLocations)
-    with open(inputfile, mode='r') as ifile:
-        for line in ifile:
-            counter += 1
-            if (line[0] == '#'):
-                continue
-            iline = line.strip().split('#')[0].split(',')
-            station_id = iline[0]
-            inzipfile = "{}/{}/{}/{}_{}.zip".format(projectDir, regionName, downloadedFolder, downloadedPrefix, station_id)
-            if (not os.path.isfile(inzipfile)):
-                print("Line {}: {} does not exist or is an invalid file, skipping...".format(counter, inzipfile))
-            else:
-                converted_file = "{}/{}/{}/{}_{}.csv".format(projectDir, regionName, convertedFolder, convertedPrefix, station_id)
-                conversion_args.append((inzipfile, converted_file))
+    check_sharding(shardQueue, cacheManifest=cacheManifest)
+    subprocess.call(["mkdir",
+                    "-p",
+                    "{}/{}/{}".format(projectDir, regionName, convertedFolder)
+                     ])
+    conversion_jobs = []
+    conversion_ids = []
+    points = region_points()
+    for k, station_id in enumerate(points.ids()):
+        inzipfile = points.path("downloaded", k)
+        if (not os.path.isfile(inzipfile)):
+            print("Line {}: {} does not exist or is an invalid file, skipping...".format(points.records['line'][k], inzipfile))
+        else:
+            converted_file = points.path("converted", k)
+            conversion_jobs.append(((inzipfile, converted_file), [inzipfile], {"start_year": start_year, "end_year": end_year,
+                                    "version": util.version()}, [converted_file]))
+            conversion_ids.append(station_id)
+    # per-stage timings and profiles, see the timing/profiling section of giss_config.py
+    timing_log = None if (timingLog is None) else "{}/{}/{}".format(projectDir, regionName, timingLog)
+    profile_folder = None
+    if (do_profile):
+        profile_folder = "{}/{}/{}".format(projectDir, regionName, profileFolder)
+        subprocess.call(["mkdir", "-p", profile_folder])
+
     if (do_multiprocess):
-        pool = Pool()
-        pool.starmap(do_conversion, conversion_args)
-        pool.close()
-        pool.join()
+        pool = Pool(initializer=init_timing, initargs=(timing_log, profile_folder))
+        run_points = pool.starmap
+    else:
+        init_timing(timing_log, profile_folder)
+        run_points = lambda fn, points: [fn(*cargs) for cargs in points]
+
+    # skips points whose output is up to date, see the cache section of giss_config.py
+    cache = None if (cacheManifest is None) else CacheManifest("{}/{}/{}".format(projectDir, regionName, cacheManifest),
+                                                               "{}/{}/{}".format(projectDir, regionName, cacheFolder), cacheMaxBytes)
+
+    if (shardQueue is None):
+        run_cached(cache, run_points, do_conversion, conversion_jobs)
     else:
-        for cargs in conversion_args:
-            do_conversion(*cargs)
+        # this process is one of the workers sharing the list of points, see the sharding section of giss_config.py
+        point_args = dict(zip(conversion_ids, conversion_jobs))
+        queue = WorkQueue("{}/{}/{}/era5_convert".format(projectDir, regionName, shardQueue), list(point_args),
+                          shardBatchSize, shardHeartbeat, shardStaleAfter)
+        def run_batch(ids):
+            run_cached(cache, run_points, do_conversion, [point_args[i] for i in ids])
+            return {"points": len(ids)}
+        mine = queue.run(run_batch)
+        print("{} did {} of {} batches".format(queue.worker, len(mine), len(queue.batches)))
 
+    if (do_multiprocess):
+        pool.close()
+        pool.join()
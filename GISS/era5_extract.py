@@ -0,0 +1,263 @@
+# extracts the hourly weather of every point of pointLocations from local gridded ERA5-Land NetCDF files (instead of downloading a
+# timeseries per point with csdapi_get_era5.py and converting it with era5_convert.py)
+# each point goes to its nearest grid cell with data, the files are opened once and read in blocks of hours, each block with one read
+# of the box around the cells (or one read per chunk of the variable holding cells, when the cells are spread over much of the grid)
+# the weather is converted as in era5_convert.py and written to <convertedFolder>/<convertedPrefix>_<id>.csv for every point, ready for
+# giss_hourly_FWI_parallel.py, or consolidated into one <convertedPrefix>_<regionName>.csv, see the era5_extract.py section of giss_config.py
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import glob, os, subprocess, time
+
+from giss_config import *
+from giss_utils import get_timezone, init_timing
+from era5_convert import CONVERTED_COLUMNS, era5_station_id, era5_weather
+from grid_match import latlon_grid
+from point_registry import region_points
+import timing
+
+ERA5_VARIABLES = ['t2m', 'd2m', 'tp', 'u10', 'v10']
+TIME_VARIABLES = ['valid_time', 'time']
+
+# hours since 1970-01-01 00 UTC of the times of a NetCDF time variable
+def netcdf_hours(variable):
+    calendar = getattr(variable, 'calendar', 'standard')
+    dates = nc.num2date(variable[:], variable.units, calendar)
+    return np.rint(nc.date2num(dates, "hours since 1970-01-01 00:00:00", calendar)).astype(np.int64)
+
+# yr, mon, day, hr of hours since 1970-01-01 00 UTC
+def hour_dates(hours):
+    dates = np.asarray(hours, dtype=np.int64).astype('datetime64[h]')
+    months = dates.astype('datetime64[M]')
+    yr = months.astype(np.int64) // 12 + 1970
+    mon = months.astype(np.int64) % 12 + 1
+    day = (dates.astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return yr, mon, day, np.asarray(hours, dtype=np.int64) % 24
+
+# hourly precipitation from ERA5-Land precipitation accumulated since 00 UTC (the 00 UTC value is the total of the day before)
+# times are hours since 1970, tp is (hours, cells), previous is (hour, values) of the hour before times[0] (None if there is none)
+# returns the hourly precipitation and the (hour, values) to pass with the next block, an hour other than 01 UTC without the hour before gets 0
+def deaccumulate(times, tp, previous=None):
+    if (previous is None):
+        previous = (times[0] - 2, np.full(tp.shape[1], np.nan))
+    before = np.concatenate((previous[1][np.newaxis, :], tp[:-1]))
+    before_times = np.concatenate(([previous[0]], times[:-1]))
+    first_hour = ((times % 24) == 1)[:, np.newaxis]
+    follows = (before_times == times - 1)[:, np.newaxis]
+    hourly = np.where(first_hour, tp, np.where(follows, tp - before, 0.0))
+    return hourly, (times[-1], tp[-1])
+
+# ERA5 variables of a set of NetCDF files on the same latitude/longitude grid, variables may be split over the files (e.g. the instant and
+# accum files of a CDS download) and so may the times (e.g. one file per month), cells without t2m at the first hour (sea) are masked out
+class grid_source:
+    def __init__(self, files):
+        self.files = sorted(files)
+        if (len(self.files) == 0):
+            raise RuntimeError("No ERA5 NetCDF files to read")
+        self.datasets = {}
+        # variable: list of (file, hours, chunk sizes or None)
+        self.sources = {v: [] for v in ERA5_VARIABLES}
+        lat = None
+        for filename in self.files:
+            dataset = self._dataset(filename)
+            tname = next((t for t in TIME_VARIABLES if (t in dataset.variables)), None)
+            if (tname is None):
+                raise RuntimeError("{} has no time variable ({})".format(filename, ", ".join(TIME_VARIABLES)))
+            hours = netcdf_hours(dataset[tname])
+            if (np.any(np.diff(hours) <= 0)):
+                raise RuntimeError("Times of {} are not increasing".format(filename))
+            flat = np.asarray(dataset['latitude'][:], dtype=float)
+            flon = np.asarray(dataset['longitude'][:], dtype=float)
+            if (lat is None):
+                lat, lon = flat, flon
+            elif (not (np.array_equal(lat, flat) and np.array_equal(lon, flon))):
+                raise RuntimeError("{} is not on the same grid as {}".format(filename, self.files[0]))
+            for v in ERA5_VARIABLES:
+                if (v not in dataset.variables):
+                    continue
+                if (dataset[v].dimensions != (tname, 'latitude', 'longitude')):
+                    raise RuntimeError("{} of {} has dimensions {}, not ({}, latitude, longitude)".format(v, filename, dataset[v].dimensions, tname))
+                chunking = dataset[v].chunking()
+                self.sources[v].append((filename, hours, None if (chunking == 'contiguous') else chunking))
+        missing = [v for v in ERA5_VARIABLES if (len(self.sources[v]) == 0)]
+        if (len(missing) > 0):
+            raise RuntimeError("{} not found in {}".format(", ".join(missing), ", ".join(self.files)))
+        self.times = np.unique(np.concatenate([hours for v in ERA5_VARIABLES for _, hours, _ in self.sources[v]]))
+        first = self.sources['t2m'][0][0]
+        mask = ~np.isnan(np.ma.filled(self.datasets[first]['t2m'][0, :, :].astype(float), np.nan))
+        self.grid = latlon_grid(lat, lon, None if (mask.all()) else mask)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for dataset in self.datasets.values():
+            dataset.close()
+        self.datasets = {}
+
+    def _dataset(self, filename):
+        if (filename not in self.datasets):
+            self.datasets[filename] = nc.Dataset(filename, mode='r')
+        return self.datasets[filename]
+
+    # hours of the files from start to end (hours since 1970, None for no limit)
+    def hours(self, start=None, end=None):
+        times = self.times
+        if (start is not None):
+            times = times[times >= start]
+        if (end is not None):
+            times = times[times < end]
+        return times
+
+    # how to read cells (i, j) of a variable with the given chunk sizes: a list of (latitude slice, longitude slice, positions of the cells
+    # in it), the box around all the cells, or with chunked variables a box per chunk holding cells if that decompresses fewer chunks
+    def _read_plan(self, i, j, chunks):
+        boxes = [np.arange(len(i))]
+        if (chunks is not None):
+            tile = (i // chunks[1]) * (len(self.grid.lon) // chunks[2] + 1) + j // chunks[2]
+            tiles, inverse = np.unique(tile, return_inverse=True)
+            box_chunks = (i.max() // chunks[1] - i.min() // chunks[1] + 1) * (j.max() // chunks[2] - j.min() // chunks[2] + 1)
+            if (2 * len(tiles) < box_chunks):
+                boxes = np.split(np.argsort(inverse, kind='stable'), np.cumsum(np.bincount(inverse))[:-1])
+        return [(slice(i[pos].min(), i[pos].max() + 1), slice(j[pos].min(), j[pos].max() + 1), pos) for pos in boxes]
+
+    # grid values read per hour of a plan (for sizing blocks of hours)
+    def _plan_size(self, plan):
+        return sum((s.stop - s.start) * (t.stop - t.start) for s, t, _ in plan)
+
+    # the values of cells (i, j) of every variable, in blocks of hours of at most memory bytes of reads, from start to end (hours since 1970,
+    # None for all), yields (hours, {variable: array (hours, cells)}), hours a file doesn't have are nan
+    def blocks(self, i, j, start=None, end=None, memory=1024**3):
+        i = np.asarray(i)
+        j = np.asarray(j)
+        times = self.hours(start, end)
+        plans = {(v, filename): self._read_plan(i, j, chunks) for v in ERA5_VARIABLES for filename, _, chunks in self.sources[v]}
+        per_hour = 8 * (sum(max(self._plan_size(plans[(v, f)]) for f, _, _ in self.sources[v]) for v in ERA5_VARIABLES) + 4 * len(ERA5_VARIABLES) * len(i))
+        hours = max(1, int(memory // per_hour))
+        # blocks of whole time chunks, so no chunk is decompressed twice
+        time_chunk = max([chunks[0] for v in ERA5_VARIABLES for _, _, chunks in self.sources[v] if (chunks is not None)], default=1)
+        if (hours > time_chunk):
+            hours -= hours % time_chunk
+        for b in range(0, len(times), hours):
+            block = times[b:b + hours]
+            values = {}
+            with timing.stage("era5_extract.read", rows=len(block) * len(i)):
+                for v in ERA5_VARIABLES:
+                    out = np.full((len(block), len(i)), np.nan)
+                    for filename, file_hours, _ in self.sources[v]:
+                        first = np.searchsorted(file_hours, block[0], side='left')
+                        last = np.searchsorted(file_hours, block[-1], side='right')
+                        if (first >= last):
+                            continue
+                        rows = np.searchsorted(block, file_hours[first:last])
+                        variable = self.datasets[filename][v]
+                        for lat_slice, lon_slice, pos in plans[(v, filename)]:
+                            data = np.ma.filled(variable[first:last, lat_slice, lon_slice].astype(np.float64), np.nan)
+                            out[rows[:, np.newaxis], pos[np.newaxis, :]] = data[:, i[pos] - lat_slice.start, j[pos] - lon_slice.start]
+                    values[v] = out
+            yield block, values
+
+# files of gridFiles (see the era5_extract.py section of giss_config.py)
+def grid_files():
+    if (gridFiles is None):
+        raise RuntimeError("gridFiles is not set in giss_config.py, see its era5_extract.py section")
+    patterns = [gridFiles] if (isinstance(gridFiles, str)) else gridFiles
+    return sorted(set(f for p in patterns for f in glob.glob(os.path.join("{}/{}".format(projectDir, regionName), p))))
+
+# first hour of start_year and the hour after end_year (hours since 1970), None for 0 (no limit)
+def year_hours(start_year, end_year):
+    start = None if (start_year == 0) else int(np.datetime64("{:04d}-01-01T00".format(start_year), 'h').astype(np.int64))
+    end = None if (end_year == 0) else int(np.datetime64("{:04d}-01-01T00".format(end_year + 1), 'h').astype(np.int64))
+    return start, end
+
+# nearest cell with data of every point (dataframe with id, lat, lon), each cell is read once however many points it has
+# returns a dataframe of the cells (i, j, id, lat, long, timezone), the cell of each point and the distance of each point from it in km
+def point_cells(grid, points):
+    pi, pj, dist = grid.nearest(points['lat'].to_numpy(), points['lon'].to_numpy())
+    cells, point_cell = np.unique(pi * len(grid.lon) + pj, return_inverse=True)
+    ci = cells // len(grid.lon)
+    cj = cells % len(grid.lon)
+    clat, clon = grid.cell_latlon(ci, cj)
+    clat = np.round(clat, 6)
+    clon = np.round(clon, 6)
+    return pd.DataFrame({'i': ci, 'j': cj, 'id': [era5_station_id(a, o) for a, o in zip(clat, clon)], 'lat': clat, 'long': clon,
+                         'timezone': [get_timezone(a, o) for a, o in zip(clat, clon)]}), point_cell, dist
+
+# converted weather of cells (i, j) in blocks of hours (see grid_source.blocks), yields (hours, temp, rh, ws, prec), each (hours, cells)
+# with accumulated, tp is accumulated since 00 UTC and is deaccumulated first
+def weather_blocks(source, i, j, start=None, end=None, memory=1024**3, accumulated=True):
+    previous = None
+    for hours, values in source.blocks(i, j, start, end, memory):
+        if (accumulated):
+            # the hour before the first is read with it, so the first hour of a later start_year is deaccumulated too
+            if (previous is None and hours[0] % 24 != 1 and hours[0] - 1 in source.times):
+                _, before = next(source.blocks(i, j, hours[0] - 1, hours[0], memory))
+                previous = (hours[0] - 1, before['tp'][0])
+            values['tp'], previous = deaccumulate(hours, values['tp'], previous)
+        with timing.stage("era5_extract.convert", rows=len(hours) * len(i)):
+            temp, rh, ws, prec = era5_weather(values['t2m'], values['d2m'], values['tp'], values['u10'], values['v10'])
+        yield hours, temp, rh, ws, prec
+
+# converted weather of a block of hours of cells (dataframe with id, lat, long, timezone), as a dataframe of CONVERTED_COLUMNS ordered
+# by cell then hour, hours with missing values are left out
+def block_weather(hours, temp, rh, ws, prec, cells):
+    yr, mon, day, hr = hour_dates(hours)
+    n_hours = len(hours)
+    n_cells = len(cells)
+    df = pd.DataFrame({
+        'id': np.repeat(cells['id'].to_numpy(), n_hours), 'lat': np.repeat(cells['lat'].to_numpy(), n_hours),
+        'long': np.repeat(cells['long'].to_numpy(), n_hours), 'timezone': np.repeat(cells['timezone'].to_numpy(), n_hours),
+        'yr': np.tile(yr, n_cells), 'mon': np.tile(mon, n_cells), 'day': np.tile(day, n_cells), 'hr': np.tile(hr, n_cells),
+        'temp': temp.T.ravel(), 'rh': rh.T.ravel(), 'ws': ws.T.ravel(), 'prec': prec.T.ravel()}, columns=CONVERTED_COLUMNS)
+    return df[~df[['temp', 'rh', 'ws', 'prec']].isna().any(axis=1)]
+
+if __name__ == '__main__':
+    start_time = time.perf_counter()
+    files = grid_files()
+    subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, convertedFolder)])
+    # per-stage timings, see the timing/profiling section of giss_config.py
+    init_timing(None if (timingLog is None) else "{}/{}/{}".format(projectDir, regionName, timingLog))
+
+    points = region_points().frame()
+    with grid_source(files) as source:
+        cells, point_cell, dist = point_cells(source.grid, points)
+        print("{} points matched to {} grid cells of {} files, farthest {:.1f} km away".format(len(points), len(cells), len(files), dist.max() if (len(dist) > 0) else 0))
+
+        start, end = year_hours(start_year, end_year)
+        folder = "{}/{}/{}".format(projectDir, regionName, convertedFolder)
+        if (gridConsolidated):
+            cell_outputs = [["{}/{}_{}.csv".format(folder, convertedPrefix, regionName)] for c in range(len(cells))]
+        else:
+            cell_outputs = [[] for c in range(len(cells))]
+            for p, c in zip(points['id'], point_cell):
+                cell_outputs[c].append("{}/{}_{}.csv".format(folder, convertedPrefix, p))
+        header = ",".join(CONVERTED_COLUMNS) + "\n"
+        written = set()
+        for hours, temp, rh, ws, prec in weather_blocks(source, cells['i'].to_numpy(), cells['j'].to_numpy(), start, end, gridMemory, gridAccumulated):
+            df = block_weather(hours, temp, rh, ws, prec, cells)
+            # rows of each cell
+            bounds = np.searchsorted(df.index.to_numpy() // len(hours), np.arange(len(cells) + 1))
+            with timing.stage("era5_extract.write", rows=len(df)):
+                # formatting the rows is most of the time, so cells are formatted once (in groups, to keep the text small) for all their points
+                group = max(1, 200000 // len(hours))
+                for g in range(0, len(cells), group):
+                    lines = df.iloc[bounds[g]:bounds[min(g + group, len(cells))]].to_csv(index=False, header=False).splitlines(keepends=True)
+                    for c in range(g, min(g + group, len(cells))):
+                        text = "".join(lines[bounds[c] - bounds[g]:bounds[c + 1] - bounds[g]])
+                        if (len(text) == 0):
+                            continue
+                        for outputfile in cell_outputs[c]:
+                            with open(outputfile, mode='a' if (outputfile in written) else 'w') as ofile:
+                                if (outputfile not in written):
+                                    ofile.write(header)
+                                    written.add(outputfile)
+                                ofile.write(text)
+            print("Extracted {} to {} UTC".format(hours[0].astype('datetime64[h]'), hours[-1].astype('datetime64[h]')))
+    for outputfile in sorted(set(f for files in cell_outputs for f in files)):
+        if (outputfile not in written):
+            print("{} has no data, not written".format(outputfile))
+    print("Extracted {} points to {} files, time taken {:6f}s".format(len(points), len(written), time.perf_counter() - start_time))
@@ -0,0 +1,133 @@
+# era5_convert.py and giss_hourly_FWI_parallel.py in one pass: each point's downloaded .zip file is read and converted in memory
+# and goes straight into hFWI (and optionally daily summaries), without the converted .csv or temporary unzipped files
+# only the FWI output (and daily summaries, climatology, state database) are written, see the era5_to_fwi.py section of giss_config.py
+
+from multiprocessing import Pool
+
+import os, subprocess, time
+
+from giss_config import *
+from giss_utils import check_sharding, fwi_calc, init_timing, profiled, saved_start_state
+from era5_convert import era5_data, era5_first_row
+from state_store import StateStore, state_from_codes
+from work_queue import WorkQueue
+from cache_manifest import CacheManifest, model_constants, run_cached
+from point_registry import region_points
+import timing, util
+
+# converts one point's ERA5 .zip file and calculates its FWI, with the arguments of fwi_calc after the output file
+# returns the state at the last hour, None if the file had no data or the calculation failed
+@profiled
+@timing.timed()
+def era5_fwi(inzipfile, outputfile, ffmc=None, dmc=None, dc=None, climfile=None, clim_period='doy', clim_variable='fwi', outputs=None,
+             state_db=None, dailyfile=None, state_id=None):
+    start_time = time.perf_counter()
+    data = era5_data(inzipfile)
+    if (data is None):
+        return None
+    state = fwi_calc(inzipfile, outputfile, ffmc, dmc, dc, climfile, clim_period, clim_variable, outputs, state_db, state_id, data=data, dailyfile=dailyfile)
+    print("{} converted and calculated, time taken {:6f}s".format(inzipfile, time.perf_counter() - start_time))
+    return state
+
+init_from_args = False
+if (init_ffmc is not None and init_dmc is not None and init_dc is not None):
+    try:
+        init_ffmc = float(init_ffmc)
+        init_dmc = float(init_dmc)
+        init_dc = float(init_dc)
+        init_from_args = True
+    except:
+        print("Listed starting codes from config file do not seem to be all numbers")
+
+state_db = None if (stateDB is None) else "{}/{}/{}".format(projectDir, regionName, stateDB)
+
+if __name__ == '__main__':
+    check_sharding(shardQueue, stateDB=stateDB, cacheManifest=cacheManifest)
+    subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, fwiFolder)])
+    if (do_daily):
+        subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, dailyFolder)])
+    if (do_climatology):
+        subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, climatologyFolder)])
+
+    fwi_args = []
+    fwi_ids = []
+    startup_codes = []
+    points = region_points()
+    for k, station_id in enumerate(points.ids()):
+        inzipfile = points.path("downloaded", k)
+        if (not os.path.isfile(inzipfile)):
+            print("Line {}: {} does not exist or is an invalid file, skipping...".format(points.records['line'][k], inzipfile))
+            continue
+        fwi_out = points.path("fwi", k)
+        if (do_climatology):
+            clim_args = (points.path("climatology", k), climatology_period, climatology_variable)
+        else:
+            clim_args = (None, None, None)
+        daily_out = points.path("daily", k) if (do_daily) else None
+        # starting codes of the list of points, if it has them
+        codes = points.codes(k)
+        if (codes[0] is not None):
+            startup_codes.append(state_from_codes(station_id, *codes, source="points"))
+        if (init_from_args):
+            codes = (init_ffmc, init_dmc, init_dc)
+            startup_codes.append(state_from_codes(station_id, *codes, source="config"))
+        if (state_db is not None):
+            codes = (None, None, None)
+        outputs = [fwi_out] + ([clim_args[0]] if (do_climatology) else []) + ([daily_out] if (do_daily) else [])
+        config = {"codes": codes, "outputs": fwi_outputs, "format": fwiFormat, "climatology": clim_args[1:], "daily": do_daily, "start_year": start_year, "end_year": end_year, "constants": model_constants(), "version": util.version()}
+        fwi_args.append(((inzipfile, fwi_out, *codes, *clim_args, fwi_outputs, state_db, daily_out, station_id), [inzipfile], config, outputs))
+        fwi_ids.append(station_id)
+
+    # per-stage timings and profiles, see the timing/profiling section of giss_config.py
+    timing_log = None if (timingLog is None) else "{}/{}/{}".format(projectDir, regionName, timingLog)
+    profile_folder = None
+    if (do_profile):
+        profile_folder = "{}/{}/{}".format(projectDir, regionName, profileFolder)
+        subprocess.call(["mkdir", "-p", profile_folder])
+
+    if (state_db is not None):
+        # the startup codes of this run's points are replaced, so codes taken out of the list of points or the config don't stay
+        # config codes come after the point's own, so they override them
+        with StateStore(state_db) as store:
+            store.replace_startup(startup_codes, ("points", "config"), fwi_ids)
+
+    # skips points whose outputs are up to date, see the cache section of giss_config.py
+    cache = None
+    if (cacheManifest is not None):
+        cache = CacheManifest("{}/{}/{}".format(projectDir, regionName, cacheManifest), "{}/{}/{}".format(projectDir, regionName, cacheFolder), cacheMaxBytes)
+        if (state_db is not None):
+            # points start from their saved state, so it is part of their key
+            with StateStore(state_db) as store:
+                for job, station_id in zip(fwi_args, fwi_ids):
+                    job[2]["start_state"] = saved_start_state(store, era5_first_row(job[0][0]), station_id)
+
+    def save_states(end_states):
+        if (state_db is not None):
+            with StateStore(state_db) as store:
+                saved = store.upsert(end_states)
+            print("Saved the last states of {} points to {}".format(saved, state_db))
+
+    if (do_multiprocess):
+        pool = Pool(initializer=init_timing, initargs=(timing_log, profile_folder))
+        run_points = pool.starmap
+    else:
+        init_timing(timing_log, profile_folder)
+        run_points = lambda fn, points: [fn(*fargs) for fargs in points]
+
+    if (shardQueue is None):
+        save_states(run_cached(cache, run_points, era5_fwi, fwi_args))
+    else:
+        # this process is one of the workers sharing the list of points, see the sharding section of giss_config.py
+        point_args = dict(zip(fwi_ids, fwi_args))
+        queue = WorkQueue("{}/{}/{}/era5_to_fwi".format(projectDir, regionName, shardQueue), list(point_args),
+                          shardBatchSize, shardHeartbeat, shardStaleAfter)
+        def run_batch(ids):
+            end_states = run_cached(cache, run_points, era5_fwi, [point_args[i] for i in ids])
+            save_states(end_states)
+            return {"points": len(ids), "failed": [i for i, state in zip(ids, end_states) if (state is None)]}
+        mine = queue.run(run_batch)
+        print("{} did {} of {} batches".format(queue.worker, len(mine), len(queue.batches)))
+
+    if (do_multiprocess):
+        pool.close()
+        pool.join()
@@ -0,0 +1,210 @@
+# region-wide FWI climatology from mergeable fixed-bin histograms
+# each point's hourly FWI output is counted into a histogram per day of year (or month), histograms can be added together,
+# so workers build per-point histograms and merge them into a region summary without ever loading all the outputs at once
+
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from multiprocessing import Pool
+import os, subprocess, sys, time
+sys.path.append("{}/../FWI/Python".format(os.path.dirname(os.path.realpath(__file__))))
+import util
+
+DAY_OF_YEAR = 'doy'
+MONTH = 'month'
+
+# default histogram bins: 0.1 wide to 20, then roughly 3% wide (relative) to 500, plus an overflow bin for anything higher
+DEFAULT_BIN_EDGES = np.concatenate((np.arange(0, 20, 0.1), np.geomspace(20, 500, 110)))
+
+# index of a date in a leap year calendar (0-365), so Feb 29 has its own slot and other dates line up across years
+def doy_slot(month, day):
+    return datetime(2000, month, day).timetuple().tm_yday - 1
+
+# vectorized doy_slot for arrays of months and days
+def doy_slots(month, day):
+    cumdays = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+    return cumdays[np.asarray(month) - 1] + np.asarray(day) - 1
+
+class fwi_climatology:
+    # period is 'doy' (366 day of year slots) or 'month' (12 slots), variable is the hFWI output column counted
+    def __init__(self, period=DAY_OF_YEAR, variable='fwi', bin_edges=None):
+        if (period != DAY_OF_YEAR and period != MONTH):
+            raise ValueError("Climatology period must be '{}' or '{}', not {}".format(DAY_OF_YEAR, MONTH, period))
+        self.period = period
+        self.variable = variable
+        self.bin_edges = np.asarray(DEFAULT_BIN_EDGES if bin_edges is None else bin_edges, dtype=float)
+        nslots = 366 if (period == DAY_OF_YEAR) else 12
+        # last bin holds values above the last edge, 64 bit counts as hourly monthly slots of a large region pass 2**32
+        self.counts = np.zeros((nslots, len(self.bin_edges)), dtype=np.int64)
+        self.maximum = np.full(nslots, np.nan)
+        self.years = set()
+
+    # counts the values of an hFWI output (needs mon, day and the climatology variable, yr is optional)
+    def add(self, df):
+        values = np.asarray(df[self.variable], dtype=float)
+        valid = ~np.isnan(values)
+        if (self.period == DAY_OF_YEAR):
+            slots = doy_slots(df['mon'], df['day'])[valid]
+        else:
+            slots = np.asarray(df['mon'])[valid] - 1
+        values = values[valid]
+        bins = np.clip(np.searchsorted(self.bin_edges, values, side='right') - 1, 0, len(self.bin_edges) - 1)
+        np.add.at(self.counts, (slots, bins), 1)
+        np.fmax.at(self.maximum, slots, values)
+        if ('yr' in df.columns):
+            self.years.update(int(y) for y in pd.unique(df['yr']))
+        return self
+
+    # adds the counts of another climatology with the same period, variable and bins
+    def merge(self, other):
+        if (other.period != self.period or other.variable != self.variable or not np.array_equal(other.bin_edges, self.bin_edges)):
+            raise ValueError("Only climatologies with the same period, variable and bins can be merged")
+        self.counts += other.counts
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        self.years.update(other.years)
+        return self
+
+    # returns percentiles (0-100) for every slot, or for the combined counts of the listed slots if given
+    # values are linearly interpolated inside a bin, anything in the overflow bin is placed between the last edge and the maximum
+    def percentiles(self, q, slots=None):
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if (slots is None):
+            counts = self.counts
+            maximum = self.maximum
+        else:
+            counts = self.counts[slots].sum(axis=0, keepdims=True)
+            maximum = np.nanmax(self.maximum[slots], keepdims=True) if (not np.isnan(self.maximum[slots]).all()) else np.full(1, np.nan)
+        upper = np.append(self.bin_edges[1:], np.nan)
+        out = np.full((counts.shape[0], len(q)), np.nan)
+        cumulative = np.cumsum(counts, axis=1)
+        for i in range(counts.shape[0]):
+            total = cumulative[i, -1]
+            if (total == 0):
+                continue
+            targets = q / 100.0 * total
+            b = np.minimum(np.searchsorted(cumulative[i], targets, side='left'), counts.shape[1] - 1)
+            below = np.where(b > 0, cumulative[i][b - 1], 0)
+            frac = np.where(counts[i][b] > 0, (targets - below) / np.maximum(counts[i][b], 1), 0.0)
+            top = np.where(np.isnan(upper[b]), maximum[i], np.minimum(upper[b], maximum[i]))
+            out[i] = self.bin_edges[b] + frac * (top - self.bin_edges[b])
+        return out
+
+    def save(self, outputfile):
+        np.savez_compressed(outputfile, counts=self.counts, maximum=self.maximum, bin_edges=self.bin_edges,
+            period=self.period, variable=self.variable, years=np.array(sorted(self.years), dtype=int))
+
+    @staticmethod
+    def load(inputfile):
+        with np.load(inputfile) as data:
+            clim = fwi_climatology(period=str(data['period']), variable=str(data['variable']), bin_edges=data['bin_edges'])
+            clim.counts = data['counts'].astype(np.int64)
+            clim.maximum = data['maximum']
+            clim.years = set(int(y) for y in data['years'])
+        return clim
+
+    # writes percentiles of every slot to a csv file
+    def to_csv(self, outputfile, q=(5, 25, 50, 75, 95)):
+        p = self.percentiles(q)
+        with open(outputfile, 'w') as outcsv:
+            outcsv.write("{},count,{}\n".format(self.period, ",".join("p{:g}".format(i) for i in q)))
+            for i in range(p.shape[0]):
+                outcsv.write("{},{},{}\n".format(i + 1, self.counts[i].sum(), ",".join("{:.4f}".format(v) for v in p[i])))
+
+# whether a saved climatology is of period and variable, False if it can't be read
+def climatology_matches(climfile, period, variable):
+    try:
+        with np.load(climfile) as data:
+            return str(data['period']) == period and str(data['variable']) == variable
+    except Exception:
+        return False
+
+# builds the climatology of a single point from its FWI output, only reading the columns that are needed
+def point_climatology(fwifile, climfile=None, period=DAY_OF_YEAR, variable='fwi'):
+    start_time = time.perf_counter()
+    clim = fwi_climatology(period=period, variable=variable)
+    try:
+        if (fwifile.endswith(".npz")):
+            clim.add(util.load_compact(fwifile, ['yr', 'mon', 'day', variable]))
+        else:
+            for chunk in pd.read_csv(fwifile, usecols=['yr', 'mon', 'day', variable], chunksize=24*366*5):
+                clim.add(chunk)
+    except Exception as e:
+        print("Climatology of {} failed, {}".format(fwifile, repr(e)))
+        return None
+    if (climfile is not None):
+        clim.save(climfile)
+    end_time = time.perf_counter()
+    print("Climatology of {} calculated, time taken {:6f}s".format(fwifile, end_time - start_time))
+    return clim
+
+# merges a list of saved climatologies into one, skipping those that aren't of period and variable if given
+def merge_climatologies(climfiles, period=None, variable=None):
+    merged = None
+    for climfile in climfiles:
+        try:
+            clim = fwi_climatology.load(climfile)
+        except Exception as e:
+            print("Reading climatology {} failed, {}".format(climfile, repr(e)))
+            continue
+        if ((period is not None and clim.period != period) or (variable is not None and clim.variable != variable)):
+            print("Skipping climatology {}, it is a {} climatology of {}".format(climfile, clim.period, clim.variable))
+            continue
+        try:
+            merged = clim if (merged is None) else merged.merge(clim)
+        except ValueError as e:
+            print("Skipping climatology {}, {}".format(climfile, e))
+    return merged
+
+if __name__ == '__main__':
+    from giss_config import *
+    from point_registry import region_points
+
+    climdir = "{}/{}/{}".format(projectDir, regionName, climatologyFolder)
+    subprocess.call(["mkdir", "-p", climdir])
+
+    # per-point climatologies are (re)built for any FWI output newer than its climatology, or if the climatology is of another
+    # climatology_period or climatology_variable
+    clim_args = []
+    climfiles = []
+    points = region_points()
+    for k in range(len(points)):
+        fwifile = points.path("fwi", k)
+        climfile = points.path("climatology", k)
+        if (os.path.isfile(fwifile)):
+            if (not os.path.isfile(climfile) or os.path.getmtime(climfile) < os.path.getmtime(fwifile)
+                or not climatology_matches(climfile, climatology_period, climatology_variable)):
+                clim_args.append((fwifile, climfile, climatology_period, climatology_variable))
+            climfiles.append(climfile)
+        elif (os.path.isfile(climfile)):
+            if (climatology_matches(climfile, climatology_period, climatology_variable)):
+                climfiles.append(climfile)
+            else:
+                print("Line {}: {} is not a {} climatology of {} and {} does not exist, skipping...".format(points.records['line'][k], climfile,
+                      climatology_period, climatology_variable, fwifile))
+        else:
+            print("Line {}: {} does not exist or is an invalid file, skipping...".format(points.records['line'][k], fwifile))
+
+    start_time = time.perf_counter()
+    nchunks = max(1, min(len(climfiles), os.cpu_count() or 1)) if (do_multiprocess) else 1
+    chunks = [ climfiles[i::nchunks] for i in range(nchunks) ]
+    if (do_multiprocess):
+        with Pool() as pool:
+            pool.starmap(point_climatology, clim_args)
+            partials = pool.starmap(merge_climatologies, [(chunk, climatology_period, climatology_variable) for chunk in chunks])
+    else:
+        for cargs in clim_args:
+            point_climatology(*cargs)
+        partials = [ merge_climatologies(chunk, climatology_period, climatology_variable) for chunk in chunks ]
+
+    region = None
+    for partial in partials:
+        if (partial is not None):
+            region = partial if (region is None) else region.merge(partial)
+    if (region is None):
+        print("No climatologies to merge")
+        exit(1)
+    regionfile = "{}/{}_{}".format(climdir, climatologyPrefix, regionName)
+    region.save(regionfile + ".npz")
+    region.to_csv(regionfile + ".csv")
+    end_time = time.perf_counter()
+    print("Region climatology of {} points outputted to {}.npz, time taken {:6f}s".format(len(climfiles), regionfile, end_time - start_time))
@@ -0,0 +1,34 @@
+# saves every point's FWI output in the region's result store (see FWI/Python/result_store.py), partitioned by point and year
+# so plots and analyses read only the rows and columns they need instead of whole era5FWI_<id>.csv files
+# outputs unchanged since they were last saved are skipped, so this can be run after every giss_hourly_FWI_parallel.py or era5_to_fwi.py run
+
+import os, sys, time
+sys.path.append("{}/../FWI/Python".format(os.path.dirname(os.path.realpath(__file__))))
+from result_store import ResultStore
+
+if __name__ == '__main__':
+    from giss_config import *
+    from point_registry import region_points
+
+    storedir = "{}/{}/{}".format(projectDir, regionName, resultStore)
+    store = ResultStore(storedir)
+
+    start_time = time.perf_counter()
+    saved = 0
+    rows = 0
+    points = region_points()
+    for k in range(len(points)):
+        fwifile = points.path("fwi", k)
+        if (not os.path.isfile(fwifile)):
+            print("Line {}: {} does not exist or is an invalid file, skipping...".format(points.records['line'][k], fwifile))
+            continue
+        try:
+            n = store.ingest(fwifile)
+        except Exception as e:
+            print("Saving {} failed, {}".format(fwifile, repr(e)))
+            continue
+        if (n > 0):
+            saved += 1
+            rows += n
+    end_time = time.perf_counter()
+    print("Saved {} FWI outputs ({} rows) to {}, {} points in the store, time taken {:6f}s".format(saved, rows, storedir, len(store.stations()), end_time - start_time))
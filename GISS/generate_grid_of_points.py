@@ -1,8 +1,91 @@
 import netCDF4 as nc
 import numpy as np
-import subprocess
+import os, subprocess
 from giss_config import *
 from giss_utils import find_nearest_sorted_latlon
+from point_registry import point_registry, stage_paths
+import util
+
+# station id, lat and lon of a grid cell, None if its latitude is invalid
+def grid_point(lat_i, lon_j):
+    # adjust longitude to be -180 to 180 instead of 0 to 360
+    if (lat_i > 90 or lat_i < -90):
+        print("latitude {} is invalid".format(lat_i))
+        return None
+    if (lon_j > 360 or lon_j < -360):
+        lon_j %= 360
+    if (lon_j > 180):
+        lon_j -= 360
+
+    # generate a station id from lat/lon
+    llat = 'N'
+    llon = 'E'
+
+    if (lat_i < 0):
+        llat = 'S'
+    if (lon_j < 0):
+        llon = 'W'
+    station_id = "{:.2f}{}_{:.2f}{}".format(abs(lat_i), llat, abs(lon_j), llon)
+    return station_id, lat_i, lon_j
+
+# writes the points of a list of grid cells (i, j) where topo > 0 to the list of points, returns the cells and their points
+def write_points(outfile, cells, lat, lon, topo):
+    points = {}
+    with open(outfile, mode='w') as f:
+        for i, j in cells:
+            if (topo[i,j] > 0):
+                point = grid_point(lat[i], lon[j])
+                if (point is None):
+                    continue
+                points[(i, j)] = point
+                f.write("{},{:.2f},{:.2f}\n".format(*point))
+    return points
+
+# danger metric of a point from its FWI output (see refineMetric in giss_config.py), NaN if it has none
+def point_metric(fwifile, metric=refineMetric, variable=refineVariable, threshold=refineFWI):
+    # the stages already reported the points they failed on
+    if (not os.path.isfile(fwifile)):
+        return np.nan
+    try:
+        df = util.read_output(fwifile, ['yr', 'mon', 'day', variable])
+    except Exception as e:
+        print("Reading {} failed, {}".format(fwifile, repr(e)))
+        return np.nan
+    values = df[variable].to_numpy(dtype=np.float64)
+    if (len(values) == 0 or np.isnan(values).all()):
+        return np.nan
+    if (metric == 'p95'):
+        return np.nanpercentile(values, 95)
+    if (metric == 'days'):
+        daily = df.groupby(['yr', 'mon', 'day'])[variable].max()
+        return (daily >= threshold).sum() / df['yr'].nunique()
+    raise RuntimeError("refineMetric {} is not one of 'p95', 'days'".format(metric))
+
+# cells (i, j) on the lattice of step (from first_i, first_j) to refine: their metric is at least above, or differs by at least change
+# from the metric of a neighbour on the lattice (step cells away), cells without a metric are never refined
+def refine_cells(metrics, step, first_i, first_j, above=refineAbove, change=refineChange):
+    flagged = set()
+    for (i, j), m in metrics.items():
+        if ((i - first_i) % step != 0 or (j - first_j) % step != 0 or np.isnan(m)):
+            continue
+        if (above is not None and m >= above):
+            flagged.add((i, j))
+            continue
+        if (change is None):
+            continue
+        for neighbour in ((i - step, j), (i + step, j), (i, j - step), (i, j + step)):
+            n = metrics.get(neighbour, np.nan)
+            if (not np.isnan(n) and abs(m - n) >= change):
+                flagged.add((i, j))
+                break
+    return flagged
+
+# runs the stages of the pipeline (refineStages) on the list of points
+def run_stages(level):
+    for command in refineStages:
+        print("Level {}: {}".format(level, " ".join(command)))
+        if (subprocess.call(command) != 0):
+            raise RuntimeError("Level {}: {} failed".format(level, " ".join(command)))
 
 subprocess.call(["mkdir",
                 "-p",
@@ -11,7 +94,7 @@ subprocess.call(["mkdir",
 
 outfile = "{}/{}/{}".format(projectDir, regionName, pointLocations)
 
-with nc.Dataset(topo, mode='r') as dataset, open(outfile, mode='w') as f:
+with nc.Dataset(topo, mode='r') as dataset:
     lat = dataset['latitude'][:]
     lon = dataset['longitude'][:]
 
@@ -23,37 +106,60 @@ with nc.Dataset(topo, mode='r') as dataset, open(outfile, mode='w') as f:
     #print(start_lat_idx, start_lon_idx, end_lat_idx, end_lon_idx)
     #print(lat[start_lat_idx], lon[start_lon_idx], lat[end_lat_idx], lon[end_lon_idx])
 
-    latrange = range(start_lat_idx, end_lat_idx+1, stride) if (start_lat_idx < end_lat_idx) else range(end_lat_idx, start_lat_idx+1, stride)
-    lonrange = range(start_lon_idx, end_lon_idx+1, stride) if (start_lon_idx < end_lon_idx) else range(end_lon_idx, start_lon_idx+1, stride)
-
-    #print(latrange)
-    #print(lonrange)
+    first_i, last_i = min(start_lat_idx, end_lat_idx), max(start_lat_idx, end_lat_idx)
+    first_j, last_j = min(start_lon_idx, end_lon_idx), max(start_lon_idx, end_lon_idx)
 
     topo = dataset[topo_var][0,:,:]
-    for i in latrange:
-        for j in lonrange:
-            if (topo[i,j] > 0):
-                lat_i = lat[i]
-                lon_j = lon[j]
 
-                # adjust longitude to be -180 to 180 instead of 0 to 360
-                if (lat_i > 90 or lat_i < -90):
-                    print("latitude {} is invalid".format(lat))
-                    continue
-                if (lon_j > 360 or lon_j < -360):
-                    lon_j %= 360
-                if (lon_j > 180):
-                    lon_j -= 360
+if (refineLevels > 0 and shardQueue is not None):
+    raise RuntimeError("refineLevels > 0 can't be used with shardQueue (each level is a different list of points), set shardQueue to None")
 
-                # generate a station id from lat/lon
-                llat = 'N'
-                llon = 'E'
+if (refineLevels == 0):
+    latrange = range(first_i, last_i+1, stride)
+    lonrange = range(first_j, last_j+1, stride)
 
-                if (lat_i < 0):
-                    llat = 'S'
-                if (lon_j < 0):
-                    llon = 'W'
-                station_id = "{:.2f}{}_{:.2f}{}".format(abs(lat_i), llat, abs(lon_j), llon)
-                f.write("{},{:.2f},{:.2f}\n".format(station_id,lat_i,lon_j))
+    #print(latrange)
+    #print(lonrange)
 
+    write_points(outfile, [(i, j) for i in latrange for j in lonrange], lat, lon, topo)
+else:
+    # adaptive grid: the pipeline is run on a coarse grid, then on finer grids only around the cells where the FWI metric is high or
+    # changes sharply, each level's list of points only has its new points so the stages don't redo the points of earlier levels
+    fwi_path = stage_paths()["fwi"]
+    registryfile = "{}/{}/{}".format(projectDir, regionName, pointRegistry)
+    timezones = {}
+    step = stride * 2**refineLevels
+    cells = [(i, j) for i in range(first_i, last_i+1, step) for j in range(first_j, last_j+1, step)]
+    points = {}
+    metrics = {}
+    levels = []
+    for level in range(refineLevels + 1):
+        new = write_points(outfile, cells, lat, lon, topo)
+        print("Level {}: {} new points with stride {}".format(level, len(new), step))
+        # the registry the stages read is made here, so each point's timezone is only looked up once over all levels
+        records = point_registry.build(outfile, registryfile, timezones)
+        timezones.update(zip((i.decode() for i in records['id']), records['timezone'].tolist()))
+        levels.append((step, new))
+        points.update(new)
+        if (len(new) > 0):
+            run_stages(level)
+        for cell, point in new.items():
+            metrics[cell] = point_metric(fwi_path.format(point[0]))
+        if (level == refineLevels):
+            break
+        # the cells of the next grid (half the stride) around the cells to refine
+        flagged = refine_cells(metrics, step, first_i, first_j)
+        step //= 2
+        cells = sorted(set((i + di, j + dj) for i, j in flagged for di in (-step, 0, step) for dj in (-step, 0, step)
+                           if (first_i <= i + di <= last_i and first_j <= j + dj <= last_j)) - set(points))
+        print("Level {}: {} points to refine".format(level, len(flagged)))
 
+    # the list of points ends up with the points of every level
+    with open(outfile, mode='w') as f:
+        for level, (level_stride, new) in enumerate(levels):
+            f.write("# level {}, stride {}\n".format(level, level_stride))
+            for cell in sorted(new):
+                f.write("{},{:.2f},{:.2f}\n".format(*new[cell]))
+    point_registry.build(outfile, registryfile, timezones)
+    print("Wrote {} points to {}, the uniform grid of stride {} has {}".format(len(points), outfile, stride,
+          int((topo[first_i:last_i+1:stride, first_j:last_j+1:stride] > 0).sum())))
@@ -22,6 +22,28 @@ end_lat = 43.75
 end_lon = 3.04
 stride = 2 # step size of generated grid points if the generated grid has too many points, stride 2 skips every other cell on each dimension, reducing total number of points by a factor of 4
 pointLocations = 'IberianPeninsulaGridLocations.csv' # if defining a custom-made point location, scripts will search for it in <projectDir>/<regionName>/<pointLocations> from the working folder
+# adaptive grid: with refineLevels > 0, the grid starts with a stride of stride * 2**refineLevels, refineStages are run on its points, and
+# the stride is halved around the points whose metric is at least refineAbove or differs from a neighbour's by at least refineChange,
+# down to stride. refineLevels = 0 generates the uniform grid of stride. each level's stages only get its new points in pointLocations,
+# so refineLevels > 0 can't be used with sharding (shardQueue below)
+refineLevels = 0
+refineMetric = 'p95' # 'p95' (95th percentile of refineVariable) or 'days' (days per year with a daily maximum refineVariable of at least refineFWI)
+refineVariable = 'fwi'
+refineFWI = 30
+refineAbove = None # None to refine only where the metric changes between neighbours
+refineChange = 10 # None to refine only where the metric is above refineAbove
+# commands run from the working folder on the points of each level, which must write their FWI outputs (see giss_hourly_FWI_parallel.py)
+# e.g. [["python", "csdapi_get_era5.py"], ["python", "era5_convert.py"], ["python", "giss_hourly_FWI_parallel.py"]] or [["python", "grid_to_fwi.py"]]
+refineStages = [["python", "csdapi_get_era5.py"], ["python", "era5_to_fwi.py"]]
+
+############### point_registry.py ##############
+# the list of points is read once into <projectDir>/<regionName>/<pointRegistry> (a binary copy with timezones, see point_registry.py),
+# which every script reads instead of the list, it is made again whenever pointLocations changes
+# subsetBox = (min lat, min lon, max lat, max lon) and/or subsetIds (a list of ids, or a file in <projectDir>/<regionName>/ with an id per line)
+# limit every script to those points of the list without editing it, None for all points
+pointRegistry = "PointRegistry.npy"
+subsetBox = None
+subsetIds = None
 
 ############## csdapi_get_era5.py ##############
 # select variables and date range
@@ -47,8 +69,95 @@ convertedFolder = "ConvertedData"
 #########  giss_hourly_FWI_parallel.py #########
 # starting codes, specify None for all to use default codes specified by cffdrs (ffmc = 85, dmc = 6, dc = 15)
 # if defined here, starting codes will override any starting codes defined in the list of points
+# with a state database (stateDB below), these and the codes in the list of points are saved in it as startup codes
 init_ffmc = None
 init_dmc = None
 init_dc = None
 fwiPrefix = "era5FWI"
 fwiFolder = "FWIData"
+# 'csv', or 'npz' for the compact format (float32 values, categorical id, integer time index, see save_compact in FWI/Python/util.py), about a quarter of the size
+# fwi_climatology.py, plot_fwi.py and plot_fwi_batch.py read either
+fwiFormat = 'csv'
+# outputs to calculate, None for all, or a list such as ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi', 'dsr'] (standard FWI System only, no grass) or ['ffmc', 'isi']
+# skipping outputs skips their calculations (see OUTPUT_DEPENDENCIES in FWI/Python/NG_FWI.py), the climatology variable must be one of them
+fwi_outputs = None
+
+################ era5_to_fwi.py #################
+# era5_to_fwi.py does era5_convert.py and giss_hourly_FWI_parallel.py in one pass, from the downloaded .zip files straight to the FWI output
+# (same settings as the two scripts, without writing the converted data), and if do_daily is True saves daily summaries of every point
+# as <projectDir>/<regionName>/<dailyFolder>/<dailyPrefix>_<id>.csv (daily summaries need every output, fwi_outputs = None)
+do_daily = False
+dailyPrefix = "era5daily"
+dailyFolder = "DailyData"
+
+################ state database ################
+# SQLite database of the FWI state (moisture codes, grass moisture, canopy rain counters) of each point by hour, see FWI/Python/state_store.py
+# giss_hourly_FWI_parallel.py starts each point from its latest state before its first hour and saves the state at its last hour,
+# so a run of the following years continues from the previous run. <projectDir>/<regionName>/<stateDB>, e.g. "fwi_state.db", None to turn off
+# each run replaces the startup codes saved from the list of points and init_ffmc/dmc/dc with the current ones
+stateDB = None
+
+################### sharding ###################
+# to share era5_convert.py and giss_hourly_FWI_parallel.py between several processes or hosts, set shardQueue to a folder name on a
+# filesystem every host can see and start the script as many times as wanted, on any hosts with the same config
+# each process claims batches of shardBatchSize points from <projectDir>/<regionName>/<shardQueue>/<script>/ (lock files, see work_queue.py)
+# and runs them (with a Pool if do_multiprocess), until every batch is done. finished batches are recorded there as batch_<n>.done
+# a batch whose lock isn't touched for shardStaleAfter seconds (its process died) is taken over by another process
+# the queue keeps finished batches for reruns, delete the folder to start over. None to turn off
+# stateDB and cacheManifest must be None with sharding (SQLite isn't safe on a filesystem shared between hosts)
+shardQueue = None
+shardBatchSize = 50
+shardHeartbeat = 30 # seconds between touches of the lock of the batch being worked on
+shardStaleAfter = 300 # seconds without a heartbeat before a batch is reclaimed
+
+#################### cache #####################
+# to skip points whose outputs are up to date when era5_convert.py, giss_hourly_FWI_parallel.py or era5_to_fwi.py is run again, set
+# cacheManifest to a file name, <projectDir>/<regionName>/<cacheManifest> (SQLite, see cache_manifest.py) then records the key each output
+# was made with: a hash of the point's input file and of the settings its outputs depend on (years, starting codes, outputs, model
+# constants, code version, saved starting state). outputs remade with other settings are first moved to <cacheFolder>/<key>/, so going back
+# to those settings restores them instead of recalculating them, keeping at most cacheMaxBytes there (least recently used removed first)
+# the manifest is only written by the main process of each script. None to turn off
+cacheManifest = None
+cacheFolder = "Cache"
+cacheMaxBytes = 10 * 1024**3
+
+############### era5_extract.py ################
+# era5_extract.py reads the points of pointLocations out of local gridded ERA5-Land NetCDF files (t2m, d2m, tp, u10, v10 on a latitude/longitude
+# grid, variables and times may be split over several files) instead of downloading each point, gridFiles is a glob pattern (or a list of them)
+# relative to <projectDir>/<regionName>/, e.g. "Grid/*.nc". if gridAccumulated is True, tp is accumulated since 00 UTC (as in ERA5-Land files
+# from the CDS) and is converted back to hourly values. if gridConsolidated is True, every point goes into one <convertedPrefix>_<regionName>.csv
+# instead of a file per point. gridMemory is about the most bytes read at once, the files are read in blocks of hours of that size
+gridFiles = None
+gridAccumulated = True
+gridConsolidated = False
+gridMemory = 1024**3
+
+############## grid_transpose.py ###############
+# grid_transpose.py (run by grid_to_fwi.py) transposes the weather of the points of pointLocations from the gridFiles above to a series
+# per grid cell in <projectDir>/<regionName>/<transposeFolder>/ (a memory-mapped array of cells x hours x temp/rh/ws/prec, about
+# 16 bytes per cell and hour as float32), reading blocks of about gridMemory bytes. grid_to_fwi.py then calculates the FWI of each point
+# from its cell's series. 'float64' keeps the values exactly as era5_extract.py writes them, 'float32' takes half the disk space
+transposeFolder = "Transposed"
+transposeDtype = 'float32'
+
+############## fwi_climatology.py ##############
+# per-point and region-wide histograms of an FWI output variable by day of year ('doy') or 'month', used for region percentiles
+# if do_climatology is True, giss_hourly_FWI_parallel.py also updates each point's climatology as soon as its FWI is calculated
+do_climatology = False
+climatology_period = 'doy'
+climatology_variable = 'fwi'
+climatologyPrefix = "fwiclim"
+climatologyFolder = "Climatology"
+
+################# fwi_store.py #################
+# consolidated store of every point's FWI output, partitioned by point and year (see FWI/Python/result_store.py), in <projectDir>/<regionName>/<resultStore>
+# fwi_store.py saves the outputs that changed since its last run, plot_fwi.py --store reads only the rows and columns a plot needs from it
+resultStore = "FWIStore"
+
+################ timing/profiling ################
+# per-stage timings (wall time, rows, peak memory, see FWI/Python/timing.py) of era5_convert.py and giss_hourly_FWI_parallel.py
+# written as one JSON line per stage to <projectDir>/<regionName>/<timingLog>, None to turn off
+timingLog = None
+# if True, memory is traced (tracemalloc) for the peak memory of each stage and a cProfile of every point is saved to <projectDir>/<regionName>/<profileFolder>/
+do_profile = False
+profileFolder = "Profiles"
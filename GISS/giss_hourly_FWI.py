@@ -28,12 +28,25 @@ sys.path.append("{}/../FWI/Python".format(source_dir))
 
 from NG_FWI import hFWI
 from daily_summaries import generate_daily_summaries
+from state_store import StateStore, hfwi_args, hour_index, state_from_output
+
+# Optional state database (see FWI/Python/state_store.py): without starting codes on
+# the command line, the run starts from the station's latest state saved before its
+# first hour, and the state at its last hour is saved in it
+state_db = None
+if ("--state-db" in sys.argv):
+    i = sys.argv.index("--state-db")
+    if (i + 1 >= len(sys.argv)):
+        print("--state-db needs a database file")
+        exit(1)
+    state_db = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
 
 # Load the input weather station data file
 
 initializeCodes = False
 if (len(sys.argv) < 3):
-    print('Usage: python giss_hourly_FWI.py <data file> <output file> [ffmc] [dmc] [dc]')
+    print('Usage: python giss_hourly_FWI.py <data file> <output file> [--state-db <database>] [ffmc] [dmc] [dc]')
     exit()
 elif (len(sys.argv) == 6):
     ffmc = float(sys.argv[3])
@@ -44,8 +57,20 @@ elif (len(sys.argv) == 6):
 datafile = sys.argv[1]
 outputfile = sys.argv[2]
 
-# command line FWI starting codes will override starting codes read from file
-if (not initializeCodes):
+# Specify the file path if PRF2007_hourly_wx.csv is not in the working directory
+#data = pd.read_csv("PRF2007_hourly_wx.csv")
+data = pd.read_csv(datafile, comment='#')
+
+# command line FWI starting codes will override a saved state, which overrides starting codes read from file
+start_args = None
+if (not initializeCodes and state_db is not None and len(data) > 0):
+    first = data.iloc[0]
+    with StateStore(state_db) as store:
+        record = store.latest([first["id"]], before=hour_index(first["yr"], first["mon"], first["day"], first["hr"]) - 1).get(str(first["id"]))
+    if (record is not None):
+        start_args = hfwi_args(record)
+        print("Starting FWI run from the state saved for {} from {}".format(record["id"], record["source"]))
+if (not initializeCodes and start_args is None):
     with open(datafile, mode='r') as d:
         header = d.readline().strip()
         # the header may or may not have a starting FWI codes placed after the last row as a comment
@@ -56,10 +81,6 @@ if (not initializeCodes):
             dc = float(headerarr[3])
             initializeCodes = True
 
-# Specify the file path if PRF2007_hourly_wx.csv is not in the working directory
-#data = pd.read_csv("PRF2007_hourly_wx.csv")
-data = pd.read_csv(datafile, comment='#')
-
 # Print the column names, data should contain 12 columns
 print(data.columns)
 # Index(['id', 'lat', 'long', 'timezone', 'yr', 'mon', 'day', 'hr', 'temp', 'rh', 
@@ -78,12 +99,17 @@ print(data.columns)
 if (initializeCodes):
     print("Starting FWI run with starting codes FFMC={}, DMC={}, DC={}".format(ffmc, dmc, dc))
     data_fwi = hFWI(data, ffmc_old=ffmc, dmc_old=dmc, dc_old=dc)
+elif (start_args is not None):
+    data_fwi = hFWI(data, **start_args)
 else:
     data_fwi = hFWI(data)
 
 # Output is a DataFrame, with FWI calculations appended after the input columns.
 # Save the output as a .csv file (overrides any preexisting file).
 data_fwi.to_csv(outputfile, index = False)
+if (state_db is not None and len(data_fwi) > 0):
+    with StateStore(state_db) as store:
+        store.upsert([state_from_output(data_fwi.iloc[-1], source=outputfile)])
 
 # Print the last two rows of the standard moisture codes and fire behaviour indices.
 standard_components = ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']
@@ -5,12 +5,19 @@ from multiprocessing import Pool
 import os, subprocess
 
 from giss_config import *
-from giss_utils import fwi_calc
+from giss_utils import check_sharding, first_row, fwi_calc, init_timing, saved_start_state
+from state_store import StateStore, state_from_codes
+from work_queue import WorkQueue
+from cache_manifest import CacheManifest, model_constants, run_cached
+from point_registry import region_points
+import util
 
 subprocess.call(["mkdir",
                 "-p",
                 "{}/{}/{}".format(projectDir, regionName, fwiFolder)
                  ])
+if (do_climatology):
+    subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, climatologyFolder)])
 
 init_from_args = False
 if (init_ffmc is not None and init_dmc is not None and init_dc is not None):
@@ -22,40 +29,91 @@ if (init_ffmc is not None and init_dmc is not None and init_dc is not None):
     except:
         print("Listed starting codes from config file do not seem to be all numbers")
 
+# with a state database, starting codes of the config and list of points are saved in it as startup codes,
+# and each point starts from its latest state before its first hour (see the state database section of giss_config.py)
+state_db = None if (stateDB is None) else "{}/{}/{}".format(projectDir, regionName, stateDB)
+
 if __name__ == '__main__':
-    counter = 0
+    check_sharding(shardQueue, stateDB=stateDB, cacheManifest=cacheManifest)
     fwi_args = []
-    inputfile = "{}/{}/{}".format(projectDir, regionName, pointLocations)
-    with open(inputfile, mode='r') as ifile:
-        for line in ifile:
-            counter += 1
-            if (line[0] == '#'):
-                continue
-            iline = line.strip().split('#')[0].split(',')
-            station_id = iline[0]
-            indata = "{}/{}/{}/{}_{}.csv".format(projectDir, regionName, convertedFolder, convertedPrefix, station_id)
-            if (not os.path.isfile(indata)):
-                print("Line {}: {} does not exist or is an invalid file, skipping...".format(counter, indata))
+    fwi_ids = []
+    startup_codes = []
+    points = region_points()
+    for k, station_id in enumerate(points.ids()):
+        indata = points.path("converted", k)
+        if (not os.path.isfile(indata)):
+            print("Line {}: {} does not exist or is an invalid file, skipping...".format(points.records['line'][k], indata))
+        else:
+            fwi_out = points.path("fwi", k)
+            if (do_climatology):
+                clim_args = (points.path("climatology", k), climatology_period, climatology_variable)
             else:
-                fwi_out = "{}/{}/{}/{}_{}.csv".format(projectDir, regionName, fwiFolder, fwiPrefix, station_id)
-                if len(iline) == 3:
-                    if (init_from_args):
-                        fwi_args.append((indata, fwi_out, init_ffmc, init_dmc, init_dc))
-                    else:
-                        fwi_args.append((indata, fwi_out, None, None, None))
-                elif len(iline) == 6:
-                    try:
-                        fwi_args.append((indata, fwi_out, float(iline[2]), float(iline[3]), float(iline[4])))
-                    except:
-                        print("Line {}: Listed starting codes do not seem to be all numbers, skipping...".format(counter))
-                else:
-                    print("Line {}: Invalid number of arguments, skipping...".format(counter))
+                clim_args = (None, None, None)
+            # starting codes of the list of points, if it has them
+            codes = points.codes(k)
+            if (codes[0] is not None):
+                startup_codes.append(state_from_codes(station_id, *codes, source="points"))
+            if (init_from_args):
+                codes = (init_ffmc, init_dmc, init_dc)
+                startup_codes.append(state_from_codes(station_id, *codes, source="config"))
+            if (state_db is not None):
+                codes = (None, None, None)
+            outputs = [fwi_out] + ([clim_args[0]] if (do_climatology) else [])
+            config = {"codes": codes, "outputs": fwi_outputs, "format": fwiFormat, "climatology": clim_args[1:], "constants": model_constants(), "version": util.version()}
+            fwi_args.append(((indata, fwi_out, *codes, *clim_args, fwi_outputs, state_db, station_id), [indata], config, outputs))
+            fwi_ids.append(station_id)
+
+    # per-stage timings and profiles, see the timing/profiling section of giss_config.py
+    timing_log = None if (timingLog is None) else "{}/{}/{}".format(projectDir, regionName, timingLog)
+    profile_folder = None
+    if (do_profile):
+        profile_folder = "{}/{}/{}".format(projectDir, regionName, profileFolder)
+        subprocess.call(["mkdir", "-p", profile_folder])
+
+    if (state_db is not None):
+        # the startup codes of this run's points are replaced, so codes taken out of the list of points or the config don't stay
+        # config codes come after the point's own, so they override them
+        with StateStore(state_db) as store:
+            store.replace_startup(startup_codes, ("points", "config"), fwi_ids)
+
+    # skips points whose outputs are up to date, see the cache section of giss_config.py
+    cache = None
+    if (cacheManifest is not None):
+        cache = CacheManifest("{}/{}/{}".format(projectDir, regionName, cacheManifest), "{}/{}/{}".format(projectDir, regionName, cacheFolder), cacheMaxBytes)
+        if (state_db is not None):
+            # points start from their saved state, so it is part of their key
+            with StateStore(state_db) as store:
+                for job, station_id in zip(fwi_args, fwi_ids):
+                    job[2]["start_state"] = saved_start_state(store, first_row(job[0][0]), station_id)
+
+    def save_states(end_states):
+        if (state_db is not None):
+            # states at the last hour of every point, saved in one transaction
+            with StateStore(state_db) as store:
+                saved = store.upsert(end_states)
+            print("Saved the last states of {} points to {}".format(saved, state_db))
+
+    if (do_multiprocess):
+        pool = Pool(initializer=init_timing, initargs=(timing_log, profile_folder))
+        run_points = pool.starmap
+    else:
+        init_timing(timing_log, profile_folder)
+        run_points = lambda fn, points: [fn(*fargs) for fargs in points]
+
+    if (shardQueue is None):
+        save_states(run_cached(cache, run_points, fwi_calc, fwi_args))
+    else:
+        # this process is one of the workers sharing the list of points, see the sharding section of giss_config.py
+        point_args = dict(zip(fwi_ids, fwi_args))
+        queue = WorkQueue("{}/{}/{}/giss_hourly_FWI_parallel".format(projectDir, regionName, shardQueue), list(point_args),
+                          shardBatchSize, shardHeartbeat, shardStaleAfter)
+        def run_batch(ids):
+            end_states = run_cached(cache, run_points, fwi_calc, [point_args[i] for i in ids])
+            save_states(end_states)
+            return {"points": len(ids), "failed": [i for i, state in zip(ids, end_states) if (state is None)]}
+        mine = queue.run(run_batch)
+        print("{} did {} of {} batches".format(queue.worker, len(mine), len(queue.batches)))
 
     if (do_multiprocess):
-        pool = Pool()
-        pool.starmap(fwi_calc, fwi_args)
         pool.close()
         pool.join()
-    else:
-        for fargs in fwi_args:
-            fwi_calc(*fargs)
@@ -5,17 +5,30 @@ from multiprocessing import Pool
 import sys, os
 
 from giss_utils import fwi_calc
+from state_store import StateStore
+
+# optional state database, files without starting codes start from their station's latest saved state
+# and the state at the last hour of every file is saved (see FWI/Python/state_store.py)
+state_db = None
+if ("--state-db" in sys.argv):
+    i = sys.argv.index("--state-db")
+    if (i + 1 >= len(sys.argv)):
+        print("--state-db needs a database file")
+        exit(1)
+    state_db = sys.argv[i + 1]
+    del sys.argv[i:i + 2]
 
 if (len(sys.argv) < 2):
-    print("Usage: python giss_hourly_FWI_multi.py <txt file>")
+    print("Usage: python giss_hourly_FWI_parallel_cmd.py <txt file> [--state-db <database>] [ffmc dmc dc]")
     print("Text file contains, per line, separated by commas: <weather data>,<output file>,[ffmc],[dmc],[dc]")
     exit(1)
 
-if (len(sys.argv) == 6):
+init_from_args = False
+if (len(sys.argv) == 5):
     try:
-        init_ffmc = float(sys.argv[3])
-        init_dmc = float(sys.argv[4])
-        init_dc = float(sys.argv[5])
+        init_ffmc = float(sys.argv[2])
+        init_dmc = float(sys.argv[3])
+        init_dc = float(sys.argv[4])
         init_from_args = True
     except:
         print("Listed starting values do not all appear to be numbers")
@@ -23,7 +36,7 @@ if (len(sys.argv) == 6):
 
 inputdatafile = sys.argv[1]
 if (not os.path.isfile(inputdatafile)):
-    print("Specified file {} does not exist, exiting...".format(txtdatafile))
+    print("Specified file {} does not exist, exiting...".format(inputdatafile))
     exit(2)
 
 if (inputdatafile.split('.')[-1].lower() != 'csv' and inputdatafile.split('.')[-1].lower() != 'txt'):
@@ -48,7 +61,7 @@ if __name__ == '__main__':
                     if (init_from_args):
                         fwi_args.append((iofiles[0], iofiles[1], init_ffmc, init_dmc, init_dc))
                     else:
-                        fwi_args.append((iofiles[0], iofiles[1], None, None, None))
+                        fwi_args.append((iofiles[0], iofiles[1], None, None, None, None, 'doy', 'fwi', None, state_db))
                 elif len(iofiles) == 5:
                     try:
                         fwi_args.append((iofiles[0], iofiles[1], float(iofiles[2]), float(iofiles[3]), float(iofiles[4])))
@@ -58,6 +71,11 @@ if __name__ == '__main__':
                     print("Line {}: Invalid number of arguments, skipping...".format(counter))
 
     pool = Pool()
-    pool.starmap(fwi_calc, fwi_args)
+    end_states = pool.starmap(fwi_calc, fwi_args)
     pool.close()
     pool.join()
+
+    if (state_db is not None):
+        with StateStore(state_db) as store:
+            saved = store.upsert(end_states)
+        print("Saved the last states of {} files to {}".format(saved, state_db))
@@ -3,7 +3,7 @@ from timezonefinder import TimezoneFinder
 from pytz import timezone
 import pandas as pd
 import numpy as np
-import time
+import functools, time
 
 import sys, os
 script_path = os.path.realpath(__file__)
@@ -11,6 +11,46 @@ source_dir = os.path.dirname(script_path)
 sys.path.append("{}/../FWI/Python".format(source_dir))
 
 from NG_FWI import hFWI
+from daily_summaries import generate_daily_summaries
+from fwi_climatology import fwi_climatology
+import timing
+import util
+from state_store import StateStore, hfwi_args, hour_index, state_from_output
+
+# folder cProfile statistics of each point are saved to, set by init_timing()
+profile_dir = None
+
+# turns on per-stage timings (FWI/Python/timing.py) in this process, also used as the initializer of Pool() workers
+# logfile gets one JSON line per stage, if profiledir is given memory is traced and every profiled() call saves a cProfile there
+def init_timing(logfile=None, profiledir=None):
+    global profile_dir
+    if (logfile is not None):
+        timing.add_callback(timing.json_log(logfile))
+    profile_dir = profiledir
+
+# sharding runs workers on several hosts, and SQLite files (the state database, the cache manifest) can't be written safely from several
+# hosts on a shared filesystem, so a RuntimeError is raised if shard_queue is set together with any of databases (setting name -> value)
+def check_sharding(shard_queue, **databases):
+    shared = [name for name, value in databases.items() if (value is not None)]
+    if (shard_queue is not None and len(shared) > 0):
+        raise RuntimeError("shardQueue can't be used with {} (SQLite isn't safe on a filesystem shared between hosts), set {} to None".format(
+                           " or ".join(shared), " and ".join(shared)))
+
+# decorator saving a cProfile (and tracing memory) of each call to <profile_dir>/<function>_<first argument file name>.prof when profiling is on
+def profiled(fn):
+    @functools.wraps(fn)
+    def profiled_fn(*args, **kwargs):
+        if (profile_dir is None):
+            return fn(*args, **kwargs)
+        name = os.path.basename(str(args[0])) if (len(args) > 0) else "call"
+        with timing.capture("{}/{}_{}.prof".format(profile_dir, fn.__name__, name)):
+            return fn(*args, **kwargs)
+    return profiled_fn
+
+# loading the timezone data takes longer than looking up a location, so each process loads it once
+@functools.lru_cache(maxsize=None)
+def timezone_finder():
+    return TimezoneFinder()
 
 def get_timezone(lat, lon):
     assert lat < 90
@@ -20,8 +60,7 @@ def get_timezone(lat, lon):
     if (lon > 180):
         lon -= 360
 
-    tf = TimezoneFinder()
-    tz_loc = tf.timezone_at(lat=lat, lng=lon)
+    tz_loc = timezone_finder().timezone_at(lat=lat, lng=lon)
     utc = timezone(tz_loc).localize(datetime(2007, 1, 1)).strftime('%z')
     utc_int = int(utc[:3])
     return utc_int
@@ -39,7 +78,7 @@ def find_nearest_sorted_latlon(array, value, qualifier=None):
     else:
         reverse = False
 
-    if (all(a >= 0 for a in array) and value < 0):
+    if (np.all(np.asarray(array) >= 0) and value < 0):
         lon360 = True
         value += 360
     else:
@@ -78,38 +117,96 @@ def find_nearest_sorted_latlon(array, value, qualifier=None):
         ret -= len(array)
     return ret
 
-def fwi_calc(datafile, outputfile, ffmc=None, dmc=None, dc=None):
+# id, yr, mon, day, hr of the first hour of an hourly weather .csv file (e.g. from era5_convert.py), reading only its first line
+def first_row(datafile):
+    return pd.read_csv(datafile, comment='#', nrows=1).iloc[0]
+
+# the state saved in the state database store that a run starting at row (with id, yr, mon, day, hr) starts from in fwi_calc,
+# without when it was saved, None if there is none (used in cache keys, see cache_manifest.py)
+# state_id is the id the state is saved under, as in fwi_calc
+def saved_start_state(store, row, state_id=None):
+    state_id = str(row["id"] if (state_id is None) else state_id)
+    record = store.latest([state_id], before=hour_index(row["yr"], row["mon"], row["day"], row["hr"]) - 1).get(state_id)
+    if (record is not None):
+        record = {k: v for k, v in record.items() if (k not in ("source", "updated"))}
+    return record
+
+# outputfile ending in .npz is saved in the compact format (see save_compact in FWI/Python/util.py), otherwise as .csv
+# if climfile is given, the day of year/month histogram of the output (see fwi_climatology.py) is saved there as well
+# outputs is a list of outputs to calculate (see hFWI), None for all
+# starting codes: ffmc, dmc and dc if given, otherwise the point's latest state before its first hour in the state database state_db (see FWI/Python/state_store.py),
+# otherwise the #ffmc#dmc#dc comment after the header of datafile, otherwise the cffdrs defaults
+# state_id is the id the point's state is read and saved under in state_db (its id in the list of points), None for the id column of the weather
+# data is the hourly weather if it is already in memory (e.g. from era5_data in era5_convert.py), then datafile is only used in messages
+# and has no header starting codes. if dailyfile is given, daily summaries (see FWI/Python/daily_summaries.py) are saved there as .csv
+# returns the state at the last hour (for StateStore.upsert), None if the calculation failed
+@profiled
+@timing.timed()
+def fwi_calc(datafile, outputfile, ffmc=None, dmc=None, dc=None, climfile=None, clim_period='doy', clim_variable='fwi', outputs=None, state_db=None,
+             state_id=None, data=None, dailyfile=None):
     start_time = time.perf_counter()
-    if (ffmc is None and dmc is None and dc is None):
-        initializeCodes = False
+    if (data is None):
+        with timing.stage("fwi_calc.read", file=datafile):
+            data = pd.read_csv(datafile, comment='#')
+        has_header = True
     else:
-        initializeCodes = True
-    # FWI starting codes from .txt file will override starting codes read from .csv file
-    if (not initializeCodes):
+        has_header = False
+    if (state_id is None and len(data) > 0):
+        state_id = data["id"].iloc[0]
+    start_args = None
+    if (ffmc is not None and dmc is not None and dc is not None):
+        start_args = {"ffmc_old": ffmc, "dmc_old": dmc, "dc_old": dc}
+        start_from = "starting codes FFMC={}, DMC={}, DC={}".format(ffmc, dmc, dc)
+    if (start_args is None and state_db is not None and len(data) > 0):
+        first = data.iloc[0]
+        with StateStore(state_db) as store:
+            record = store.latest([str(state_id)], before=hour_index(first["yr"], first["mon"], first["day"], first["hr"]) - 1).get(str(state_id))
+        if (record is not None):
+            start_args = hfwi_args(record)
+            start_from = "state saved for {} from {}".format(record["id"], record["source"])
+    if (start_args is None and has_header):
         with open(datafile, mode='r') as d:
             header = d.readline().strip()
             # the header may or may not have a starting FWI codes placed after the last row as a comment
             headerarr = header.split('#')
             if (len(headerarr) == 4):
                 try:
-                    ffmc = float(headerarr[1])
-                    dmc = float(headerarr[2])
-                    dc = float(headerarr[3])
-                    initializeCodes = True
+                    start_args = {"ffmc_old": float(headerarr[1]), "dmc_old": float(headerarr[2]), "dc_old": float(headerarr[3])}
+                    start_from = "starting codes FFMC={}, DMC={}, DC={}".format(headerarr[1], headerarr[2], headerarr[3])
                 except:
                     print("Listed starting codes from {} do not seem to be all numbers".format(datafile))
 
-    data = pd.read_csv(datafile, comment='#')
     try:
-        if (initializeCodes):
-            print("Starting FWI run {} with starting codes FFMC={}, DMC={}, DC={}".format(datafile, ffmc, dmc, dc))
-            data_fwi = hFWI(data, ffmc_old=ffmc, dmc_old=dmc, dc_old=dc, silent=True)
+        compact = outputfile.endswith(".npz")
+        # daily summaries are made from the full output, so it is compacted after them
+        compact_hfwi = compact and (dailyfile is None)
+        if (start_args is not None):
+            print("Starting FWI run {} with {}".format(datafile, start_from))
+            data_fwi = hFWI(data, silent=True, compact=compact_hfwi, outputs=outputs, **start_args)
         else:
-            data_fwi = hFWI(data, silent=True)
+            data_fwi = hFWI(data, silent=True, compact=compact_hfwi, outputs=outputs)
+        if (dailyfile is not None):
+            daily = generate_daily_summaries(data_fwi, silent=True)
     except Exception as e:
         print("FWI conversion {} failed, {}".format(datafile, repr(e)))
-        return
+        return None
 
-    data_fwi.to_csv(outputfile, index = False)
+    if (dailyfile is not None):
+        with timing.stage("fwi_calc.daily_write", rows=len(daily), file=dailyfile):
+            daily.to_csv(dailyfile, index=False)
+        if (compact):
+            data_fwi = util.compact(data_fwi)
+
+    with timing.stage("fwi_calc.write", rows=len(data_fwi), file=outputfile):
+        if (compact):
+            util.save_compact(data_fwi, outputfile)
+        else:
+            data_fwi.to_csv(outputfile, index = False)
+    if (climfile is not None):
+        with timing.stage("fwi_calc.climatology", rows=len(data_fwi), file=climfile):
+            fwi_climatology(period=clim_period, variable=clim_variable).add(data_fwi).save(climfile)
     end_time = time.perf_counter()
     print("FWI from {} calculated, outputted to {}, time taken {:6f}s".format(datafile, outputfile, end_time - start_time))
+    state = state_from_output(data_fwi.iloc[-1], source=outputfile)
+    state["id"] = str(state_id)
+    return state
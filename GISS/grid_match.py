@@ -0,0 +1,339 @@
+# matches many latitude/longitude locations (e.g. weather stations, fire locations) to ERA5 grid cells or to the points of a region at once
+# grids: latlon_grid works on the latitude and longitude axes of the grid (either order, longitudes -180-180 or 0-360, global grids wrap around),
+# so the nearest cell and the 4 cells and weights of bilinear interpolation of any number of locations are found with a few array operations
+# scattered points (e.g. the points of pointLocations, or the land cells of a grid): point_index sorts them into buckets of a regular
+# latitude/longitude grid and finds the k nearest of each location (great circle distance) by searching growing windows of buckets
+# until nothing outside the window can be nearer, so it is exact without a KD-tree
+#
+#     python grid_match.py stations.csv matches.csv --outputs
+# adds the nearest point of the region (and its FWI output file) to every row of stations.csv, see python grid_match.py -h
+
+import numpy as np
+import pandas as pd
+import argparse, os
+
+EARTH_RADIUS = 6371.0 # km
+
+# longitudes in -180 to 180 (only those outside are changed, so they don't pick up rounding errors)
+def normalize_lon(lon):
+    lon = np.asarray(lon, dtype=float)
+    return np.where((lon < -180.0) | (lon >= 180.0), (lon + 180.0) % 360.0 - 180.0, lon)
+
+# great circle distance in km between arrays of locations (haversine)
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+# index of scattered points in buckets of cell degrees, cell defaults to about the spacing of the points
+class point_index:
+    def __init__(self, lat, lon, cell=None):
+        self.lat = np.asarray(lat, dtype=float).ravel()
+        self.lon = normalize_lon(lon).ravel()
+        if (cell is None):
+            if (len(self.lat) > 1):
+                area = max(np.ptp(self.lat), 0.01) * max(np.ptp(self.lon), 0.01)
+                cell = float(np.clip(np.sqrt(area / len(self.lat)), 0.01, 10.0))
+            else:
+                cell = 10.0
+        # a whole number of buckets around the globe and from pole to pole
+        self.nlat = int(np.ceil(180.0 / cell))
+        self.nlon = 2 * self.nlat
+        self.cell = 180.0 / self.nlat
+        blat, blon = self._buckets(self.lat, self.lon)
+        keys = blat * self.nlon + blon
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _buckets(self, lat, lon):
+        blat = np.clip(np.floor((lat + 90.0) / self.cell).astype(np.int64), 0, self.nlat - 1)
+        blon = np.floor((lon + 180.0) / self.cell).astype(np.int64) % self.nlon
+        return blat, blon
+
+    # the k nearest points of each location, returns (positions of the points (n, k), distances in km (n, k)), nearest first
+    # (-1 and inf where there are fewer than k points), chunk locations are searched at a time
+    def query(self, lat, lon, k=1, chunk=10000):
+        lat = np.asarray(lat, dtype=float).ravel()
+        lon = normalize_lon(lon).ravel()
+        idx = np.full((len(lat), k), -1, dtype=np.int64)
+        dist = np.full((len(lat), k), np.inf)
+        for start in range(0, len(lat), chunk):
+            stop = min(start + chunk, len(lat))
+            idx[start:stop], dist[start:stop] = self._query(lat[start:stop], lon[start:stop], k)
+        return idx, dist
+
+    def _query(self, lat, lon, k, budget=4000000):
+        idx = np.full((len(lat), k), -1, dtype=np.int64)
+        dist = np.full((len(lat), k), np.inf)
+        if (len(self.lat) == 0):
+            return idx, dist
+        qlat, qlon = self._buckets(lat, lon)
+        pending = np.arange(len(lat))
+        # k-th distance found so far, nothing farther can be one of the k nearest
+        limit = np.full(len(lat), np.inf)
+        r = 1
+        while (len(pending) > 0):
+            # points of the window of buckets around each pending location: every bucket row of the window is one or two
+            # (across the 180th meridian) runs of sorted keys
+            blat = qlat[pending, None] + np.arange(-r, r + 1)[None, :]
+            valid = (blat >= 0) & (blat < self.nlat)
+            if (2 * r + 1 < self.nlon):
+                west = qlon[pending] - r
+                east = qlon[pending] + r
+                first = np.stack((west % self.nlon, np.where(west < 0, 0, np.where(east >= self.nlon, 0, 1))), axis=1)
+                last = np.stack((np.where(west < 0, self.nlon - 1, np.where(east >= self.nlon, self.nlon - 1, east)),
+                                 np.where(west < 0, east, np.where(east >= self.nlon, east - self.nlon, 0))), axis=1)
+            else:
+                first = np.zeros((len(pending), 2), dtype=np.int64)
+                last = np.stack((np.full(len(pending), self.nlon - 1), np.full(len(pending), -1)), axis=1)
+            row_key = np.where(valid, blat * self.nlon, 0)[:, :, None]
+            lo = np.searchsorted(self.keys, row_key + first[:, None, :], side='left')
+            hi = np.searchsorted(self.keys, row_key + last[:, None, :], side='right')
+            hi = np.where(valid[:, :, None] & (last >= first)[:, None, :], np.maximum(hi, lo), lo)
+            counts = (hi - lo).reshape(len(pending), -1)
+            found_idx = np.full((len(pending), k), -1, dtype=np.int64)
+            found_dist = np.full((len(pending), k), np.inf)
+            # locations in batches of at most budget candidate points (and at least one location)
+            totals = np.cumsum(counts.sum(axis=1))
+            start = 0
+            while (start < len(pending)):
+                stop = max(start + 1, int(np.searchsorted(totals, (totals[start - 1] if (start > 0) else 0) + budget, side='right')))
+                self._nearest_k(lat[pending[start:stop]], lon[pending[start:stop]], lo.reshape(len(pending), -1)[start:stop],
+                                counts[start:stop], limit[pending[start:stop]], found_idx[start:stop], found_dist[start:stop])
+                start = stop
+            # nearest distance any point outside the window can have, along latitude and along longitude
+            plat = lat[pending]
+            south = (qlat[pending] - r) * self.cell - 90.0
+            north = (qlat[pending] + r + 1) * self.cell - 90.0
+            lat_gap = np.minimum(np.where(qlat[pending] - r > 0, plat - south, np.inf), np.where(qlat[pending] + r < self.nlat - 1, north - plat, np.inf))
+            if (2 * r + 1 < self.nlon):
+                west = (qlon[pending] - r) * self.cell - 180.0
+                east = (qlon[pending] + r + 1) * self.cell - 180.0
+                lon_gap = np.radians(np.minimum(lon[pending] - west, east - lon[pending]))
+                lon_bound = np.arcsin(np.cos(np.radians(plat)) * np.sin(np.minimum(lon_gap, np.pi / 2))) * EARTH_RADIUS
+            else:
+                lon_bound = np.full(len(pending), np.inf)
+            bound = np.minimum(np.radians(lat_gap) * EARTH_RADIUS, lon_bound)
+            done = (found_dist[:, -1] <= bound) | np.isinf(bound)
+            idx[pending[done]] = found_idx[done]
+            dist[pending[done]] = found_dist[done]
+            limit[pending] = found_dist[:, -1]
+            # next window, at least as wide as the k-th distance found so far
+            reach = np.degrees(found_dist[~done, -1] / EARTH_RADIUS)
+            lon_reach = np.degrees(np.arcsin(np.minimum(np.sin(np.radians(np.minimum(reach, 90.0))) / np.maximum(np.cos(np.radians(lat[pending[~done]])), 1e-9), 1.0)))
+            needed = np.ceil(np.maximum(reach, np.where(lon_reach >= 90.0, 360.0, lon_reach)) / self.cell) + 1
+            pending = pending[~done]
+            r = int(max(2 * r, np.min(needed, initial=2 * r))) if (len(pending) > 0) else r
+        return idx, dist
+
+    # fills found_idx and found_dist with the k nearest of the candidate points of each location, given as runs of sorted points
+    # starting at lo with counts points, leaving out points farther than limit
+    def _nearest_k(self, lat, lon, lo, counts, limit, found_idx, found_dist):
+        k = found_idx.shape[1]
+        counts = counts.ravel()
+        owner = np.repeat(np.repeat(np.arange(len(lat)), lo.shape[1]), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        points = self.order[np.repeat(lo.ravel(), counts) + within]
+        d = distance_km(lat[owner], lon[owner], self.lat[points], self.lon[points])
+        near = d <= limit[owner]
+        owner, points, d = owner[near], points[near], d[near]
+        order = np.lexsort((d, owner))
+        owner, points, d = owner[order], points[order], d[order]
+        rank = np.arange(len(owner)) - np.searchsorted(owner, np.arange(len(lat)), side='left')[owner]
+        keep = rank < k
+        found_idx[owner[keep], rank[keep]] = points[keep]
+        found_dist[owner[keep], rank[keep]] = d[keep]
+
+# regular latitude/longitude grid from its axes (e.g. of an ERA5 NetCDF file), mask is an optional 2-d (lat, lon) array of cells to use
+# (e.g. land mask > 0), masked out cells are never matched
+class latlon_grid:
+    def __init__(self, lat, lon, mask=None):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.mask = None if (mask is None) else np.asarray(mask, dtype=bool)
+        # axes in increasing order (latitude is often descending, longitude 0-360), with the positions in the original axes
+        self.lat_order = np.argsort(self.lat, kind='stable')
+        self.lat_sorted = self.lat[self.lat_order]
+        lon = normalize_lon(self.lon)
+        self.lon_order = np.argsort(lon, kind='stable')
+        self.lon_sorted = lon[self.lon_order]
+        # global grids wrap around in longitude
+        step = np.median(np.diff(self.lon_sorted)) if (len(lon) > 1) else 360.0
+        self.wrap = (len(lon) > 1 and len(lon) * step >= 360.0 - step / 2)
+        self.cells = None
+
+    @staticmethod
+    def from_netcdf(filename, mask_var=None, lat_var='latitude', lon_var='longitude'):
+        import netCDF4 as nc
+        with nc.Dataset(filename, mode='r') as dataset:
+            lat = np.asarray(dataset[lat_var][:])
+            lon = np.asarray(dataset[lon_var][:])
+            mask = None
+            if (mask_var is not None):
+                values = dataset[mask_var]
+                # first time step of (time, lat, lon) variables, as generate_grid_of_points.py
+                values = values[0, :, :] if (values.ndim == 3) else values[:, :]
+                mask = np.ma.filled(values, 0) > 0
+        return latlon_grid(lat, lon, mask)
+
+    # latitude, longitude (-180 to 180) of grid cells
+    def cell_latlon(self, i, j):
+        return self.lat[i], normalize_lon(self.lon[j])
+
+    # cell of the axis nearest to each value, as positions in the original axis
+    def _nearest_axis(self, sorted_axis, order, values, wrap=False):
+        n = len(sorted_axis)
+        right = np.searchsorted(sorted_axis, values, side='left')
+        if (wrap):
+            left = (right - 1) % n
+            right = right % n
+            dl = np.abs((values - sorted_axis[left] + 180.0) % 360.0 - 180.0)
+            dr = np.abs((sorted_axis[right] - values + 180.0) % 360.0 - 180.0)
+        else:
+            left = np.clip(right - 1, 0, n - 1)
+            right = np.clip(right, 0, n - 1)
+            dl = np.abs(values - sorted_axis[left])
+            dr = np.abs(sorted_axis[right] - values)
+        return order[np.where(dl <= dr, left, right)]
+
+    # the two cells of the axis around each value and the weight of the second, positions in the original axis
+    def _bracket_axis(self, sorted_axis, order, values, wrap=False):
+        n = len(sorted_axis)
+        right = np.searchsorted(sorted_axis, values, side='right')
+        if (wrap):
+            left = (right - 1) % n
+            right = right % n
+            span = (sorted_axis[right] - sorted_axis[left]) % 360.0
+            offset = (values - sorted_axis[left]) % 360.0
+            weight = np.where(span > 0, offset / np.where(span > 0, span, 1), 0.0)
+        else:
+            # outside the axis, the edge cell gets all the weight
+            left = np.clip(right - 1, 0, n - 1)
+            right = np.clip(right, 0, n - 1)
+            span = sorted_axis[right] - sorted_axis[left]
+            weight = np.where(span > 0, (values - sorted_axis[left]) / np.where(span > 0, span, 1), 0.0)
+            weight = np.clip(weight, 0, 1)
+        return order[left], order[right], weight
+
+    # index of the (unmasked) grid cells, built the first time it is needed
+    def _cell_index(self):
+        if (self.cells is None):
+            if (self.mask is None):
+                i, j = np.meshgrid(np.arange(len(self.lat)), np.arange(len(self.lon)), indexing='ij')
+                i, j = i.ravel(), j.ravel()
+            else:
+                i, j = np.nonzero(self.mask)
+            lat, lon = self.cell_latlon(i, j)
+            cell = float(np.median(np.abs(np.diff(self.lat_sorted)))) if (len(self.lat) > 1) else None
+            self.cells = (i, j, point_index(lat, lon, cell=cell))
+        return self.cells
+
+    # nearest cell of each location, returns (latitude indices, longitude indices, distances in km)
+    # without a mask it is the cell the location falls in, with one the nearest unmasked cell
+    def nearest(self, lat, lon):
+        if (self.mask is not None):
+            i, j, dist = self.knn(lat, lon, 1)
+            return i[:, 0], j[:, 0], dist[:, 0]
+        lat = np.asarray(lat, dtype=float)
+        lon = normalize_lon(lon)
+        i = self._nearest_axis(self.lat_sorted, self.lat_order, lat)
+        j = self._nearest_axis(self.lon_sorted, self.lon_order, lon, wrap=self.wrap)
+        glat, glon = self.cell_latlon(i, j)
+        return i, j, distance_km(lat, lon, glat, glon)
+
+    # the 4 cells around each location and their bilinear interpolation weights, returns (latitude indices (n, 4), longitude indices (n, 4),
+    # weights (n, 4)), weights add up to 1, with a mask masked out cells get no weight (all 0 if all 4 are masked out)
+    def bilinear(self, lat, lon):
+        lat = np.asarray(lat, dtype=float).ravel()
+        lon = normalize_lon(lon).ravel()
+        i0, i1, t = self._bracket_axis(self.lat_sorted, self.lat_order, lat)
+        j0, j1, u = self._bracket_axis(self.lon_sorted, self.lon_order, lon, wrap=self.wrap)
+        i = np.stack((i0, i0, i1, i1), axis=1)
+        j = np.stack((j0, j1, j0, j1), axis=1)
+        w = np.stack(((1 - t) * (1 - u), (1 - t) * u, t * (1 - u), t * u), axis=1)
+        if (self.mask is not None):
+            w = np.where(self.mask[i, j], w, 0.0)
+            total = w.sum(axis=1, keepdims=True)
+            w = np.where(total > 0, w / np.where(total > 0, total, 1), 0.0)
+        return i, j, w
+
+    # the k nearest (unmasked) cells of each location, returns (latitude indices (n, k), longitude indices (n, k), distances in km (n, k))
+    # nearest first, -1 and inf where the grid has fewer than k cells
+    def knn(self, lat, lon, k=4):
+        ci, cj, index = self._cell_index()
+        pos, dist = index.query(lat, lon, k)
+        i = np.where(pos >= 0, ci[pos], -1)
+        j = np.where(pos >= 0, cj[pos], -1)
+        return i, j, dist
+
+# the k nearest points of a point list for each location, with the FWI output file of each point (output_pattern with {} for the point id)
+# returns a dataframe with the row of the location, rank (0 for the nearest), point id, lat, lon, distance in km and output file ('' if it
+# doesn't exist), locations farther than max_km from every point get no rows
+def match_points(points, lat, lon, k=1, output_pattern=None, max_km=None):
+    index = point_index(points['lat'].to_numpy(), points['lon'].to_numpy())
+    pos, dist = index.query(lat, lon, k)
+    row, rank = np.nonzero((pos >= 0) & ((dist <= max_km) if (max_km is not None) else True))
+    matched = points.iloc[pos[row, rank]]
+    out = pd.DataFrame({'row': row, 'rank': rank, 'point_id': matched['id'].to_numpy(), 'point_lat': matched['lat'].to_numpy(),
+                        'point_lon': matched['lon'].to_numpy(), 'distance_km': dist[row, rank]})
+    if (output_pattern is not None):
+        files = [output_pattern.format(i) for i in out['point_id']]
+        out['fwi_file'] = [f if os.path.isfile(f) else '' for f in files]
+    return out
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', help='csv file of locations')
+    parser.add_argument('output', help='csv file to write the locations and their matches to (one row per match)')
+    parser.add_argument('--lat', default='lat', help='Latitude column of the input (default lat)')
+    parser.add_argument('--lon', default='lon', help='Longitude column of the input (default lon)')
+    parser.add_argument('-m', '--mode', default='nearest', choices=['nearest', 'bilinear', 'knn'], help='nearest cell or point, the 4 cells and weights of bilinear interpolation, or the k nearest (default nearest)')
+    parser.add_argument('-k', type=int, default=4, help='Number of cells or points for knn (default 4)')
+    parser.add_argument('--grid', nargs='?', const='', default=None, help='Match to the cells of a NetCDF grid (the land mask topo of giss_config.py if no file is given)')
+    parser.add_argument('--mask', default=None, help='Variable of the grid file, cells where it is not > 0 are never matched (e.g. lsm for land cells only)')
+    parser.add_argument('--outputs', action='store_true', help='Match to the points of pointLocations of giss_config.py and add their FWI output files')
+    parser.add_argument('--max-km', type=float, default=None, help='Leave out points farther than this (with --outputs)')
+    args = parser.parse_args()
+
+    locations = pd.read_csv(args.input)
+    lat = locations[args.lat].to_numpy(dtype=float)
+    lon = locations[args.lon].to_numpy(dtype=float)
+    k = 1 if (args.mode == 'nearest') else args.k
+    if (args.outputs):
+        from point_registry import region_points
+        if (args.mode == 'bilinear'):
+            print("Points are not a grid, use nearest or knn with --outputs")
+            exit(1)
+        points = region_points()
+        matches = match_points(points.frame(), lat, lon, k, points.paths["fwi"], args.max_km)
+    else:
+        if (args.grid is None):
+            print("Use --grid <NetCDF file> to match to a grid or --outputs to match to the points of the region")
+            exit(1)
+        if (args.grid == ''):
+            from giss_config import topo
+            args.grid = topo
+        grid = latlon_grid.from_netcdf(args.grid, args.mask)
+        if (args.mode == 'bilinear'):
+            i, j, w = grid.bilinear(lat, lon)
+            glat, glon = grid.cell_latlon(i, j)
+            dist = distance_km(lat[:, None], lon[:, None], glat, glon)
+        else:
+            if (args.mode == 'nearest'):
+                i, j, dist = (a[:, None] for a in grid.nearest(lat, lon))
+            else:
+                i, j, dist = grid.knn(lat, lon, k)
+            w = None
+        row, rank = np.nonzero(i >= 0)
+        glat, glon = grid.cell_latlon(i[row, rank], j[row, rank])
+        matches = pd.DataFrame({'row': row, 'rank': rank, 'lat_index': i[row, rank], 'lon_index': j[row, rank],
+                                'grid_lat': np.round(glat, 6), 'grid_lon': np.round(glon, 6), 'distance_km': dist[row, rank]})
+        if (w is not None):
+            matches['weight'] = w[row, rank]
+    out = locations.iloc[matches['row']].reset_index(drop=True)
+    out = pd.concat([out, matches.drop(columns=['row']).reset_index(drop=True)], axis=1)
+    out.to_csv(args.output, index=False)
+    print("Matched {} of {} locations, {} rows written to {}".format(len(pd.unique(matches['row'])), len(locations), len(out), args.output))
@@ -0,0 +1,128 @@
+# the FWI of every point of pointLocations from local gridded ERA5-Land NetCDF files (see era5_extract.py): the grid is first transposed to
+# a series per grid cell on disk (see grid_transpose.py, skipped if it is up to date), then each point's weather is read from it as one
+# contiguous piece of the memory-mapped file and goes straight into hFWI (and optionally daily summaries), without converted .csv files
+# only the FWI output (and daily summaries, climatology, state database) are written, as era5_to_fwi.py
+
+from multiprocessing import Pool
+
+import subprocess, time
+
+from giss_config import *
+from giss_utils import check_sharding, fwi_calc, init_timing, profiled
+from era5_extract import grid_files, year_hours
+from grid_transpose import open_series, transpose
+from point_registry import region_points
+from state_store import StateStore, state_from_codes
+from work_queue import WorkQueue
+import timing
+
+# reads one grid cell's series (its row of the transposition in folder) and calculates its FWI, with the arguments of fwi_calc after
+# the output file, returns the state at the last hour, None if the cell has no data or the calculation failed
+@profiled
+@timing.timed()
+def grid_fwi(folder, row, outputfile, ffmc=None, dmc=None, dc=None, climfile=None, clim_period='doy', clim_variable='fwi', outputs=None,
+             state_db=None, dailyfile=None, state_id=None):
+    start_time = time.perf_counter()
+    series = open_series(folder)
+    with timing.stage("grid_fwi.read", file=folder):
+        data = series.weather(row)
+    name = "{} ({})".format(folder, series.cells['id'].iloc[row])
+    if (len(data) == 0):
+        print("{} seems to have no valid data, skipping...".format(name))
+        return None
+    state = fwi_calc(name, outputfile, ffmc, dmc, dc, climfile, clim_period, clim_variable, outputs, state_db, state_id, data=data, dailyfile=dailyfile)
+    print("{} read and calculated, time taken {:6f}s".format(name, time.perf_counter() - start_time))
+    return state
+
+init_from_args = False
+if (init_ffmc is not None and init_dmc is not None and init_dc is not None):
+    try:
+        init_ffmc = float(init_ffmc)
+        init_dmc = float(init_dmc)
+        init_dc = float(init_dc)
+        init_from_args = True
+    except:
+        print("Listed starting codes from config file do not seem to be all numbers")
+
+state_db = None if (stateDB is None) else "{}/{}/{}".format(projectDir, regionName, stateDB)
+
+if __name__ == '__main__':
+    check_sharding(shardQueue, stateDB=stateDB)
+    subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, fwiFolder)])
+    if (do_daily):
+        subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, dailyFolder)])
+    if (do_climatology):
+        subprocess.call(["mkdir", "-p", "{}/{}/{}".format(projectDir, regionName, climatologyFolder)])
+
+    # per-stage timings and profiles, see the timing/profiling section of giss_config.py
+    timing_log = None if (timingLog is None) else "{}/{}/{}".format(projectDir, regionName, timingLog)
+    profile_folder = None
+    if (do_profile):
+        profile_folder = "{}/{}/{}".format(projectDir, regionName, profileFolder)
+        subprocess.call(["mkdir", "-p", profile_folder])
+    init_timing(timing_log, profile_folder)
+
+    points = region_points()
+    folder = "{}/{}/{}".format(projectDir, regionName, transposeFolder)
+    start, end = year_hours(start_year, end_year)
+    # with several workers sharing the points, the transposition is made first (python grid_transpose.py), they only check it is up to date
+    cells, point_cell = transpose(grid_files(), points.frame(), folder, start, end, gridMemory, gridAccumulated, transposeDtype, check_only=(shardQueue is not None))
+
+    fwi_args = []
+    fwi_ids = []
+    startup_codes = []
+    for k, station_id in enumerate(points.ids()):
+        fwi_out = points.path("fwi", k)
+        if (do_climatology):
+            clim_args = (points.path("climatology", k), climatology_period, climatology_variable)
+        else:
+            clim_args = (None, None, None)
+        daily_out = points.path("daily", k) if (do_daily) else None
+        # starting codes of the list of points, if it has them
+        codes = points.codes(k)
+        if (codes[0] is not None):
+            startup_codes.append(state_from_codes(station_id, *codes, source="points"))
+        if (init_from_args):
+            codes = (init_ffmc, init_dmc, init_dc)
+            startup_codes.append(state_from_codes(station_id, *codes, source="config"))
+        if (state_db is not None):
+            codes = (None, None, None)
+        fwi_args.append((folder, int(point_cell[k]), fwi_out, *codes, *clim_args, fwi_outputs, state_db, daily_out, station_id))
+        fwi_ids.append(station_id)
+
+    if (state_db is not None):
+        # the startup codes of this run's points are replaced, so codes taken out of the list of points or the config don't stay
+        # config codes come after the point's own, so they override them
+        with StateStore(state_db) as store:
+            store.replace_startup(startup_codes, ("points", "config"), fwi_ids)
+
+    def save_states(end_states):
+        if (state_db is not None):
+            with StateStore(state_db) as store:
+                saved = store.upsert(end_states)
+            print("Saved the last states of {} points to {}".format(saved, state_db))
+
+    if (do_multiprocess):
+        # workers are forked with the timing log of this process already on
+        pool = Pool(initializer=init_timing, initargs=(None, profile_folder))
+        run_points = pool.starmap
+    else:
+        run_points = lambda fn, points: [fn(*fargs) for fargs in points]
+
+    if (shardQueue is None):
+        save_states(run_points(grid_fwi, fwi_args))
+    else:
+        # this process is one of the workers sharing the list of points, see the sharding section of giss_config.py
+        point_args = dict(zip(fwi_ids, fwi_args))
+        queue = WorkQueue("{}/{}/{}/grid_to_fwi".format(projectDir, regionName, shardQueue), list(point_args),
+                          shardBatchSize, shardHeartbeat, shardStaleAfter)
+        def run_batch(ids):
+            end_states = run_points(grid_fwi, [point_args[i] for i in ids])
+            save_states(end_states)
+            return {"points": len(ids), "failed": [i for i, state in zip(ids, end_states) if (state is None)]}
+        mine = queue.run(run_batch)
+        print("{} did {} of {} batches".format(queue.worker, len(mine), len(queue.batches)))
+
+    if (do_multiprocess):
+        pool.close()
+        pool.join()
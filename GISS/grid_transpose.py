@@ -0,0 +1,120 @@
+# transposes the hourly weather of the grid cells of pointLocations from gridded ERA5-Land NetCDF files (stored a field per hour, see
+# era5_extract.py) to a series per cell, so the FWI calculation (which goes through the hours of one point at a time) reads each point's
+# weather as one contiguous piece of a file instead of one small read per hour or the whole grid in memory
+# the grid is read in blocks of hours (about gridMemory bytes) and each block is scattered into a memory-mapped array on disk of
+# (cells, hours, temp/rh/ws/prec), <projectDir>/<regionName>/<transposeFolder>/series.npy, flushed after every block, so memory use
+# depends on the block size and not on the number of points or years. an interrupted transposition continues from its last block
+# see grid_to_fwi.py for the FWI calculation from it
+
+import numpy as np
+import pandas as pd
+import json, os, subprocess, time
+from functools import lru_cache
+
+from giss_config import *
+from giss_utils import init_timing
+from era5_convert import CONVERTED_COLUMNS
+from era5_extract import grid_files, grid_source, hour_dates, point_cells, weather_blocks, year_hours
+from point_registry import region_points
+import timing
+
+SERIES_VARIABLES = ['temp', 'rh', 'ws', 'prec']
+
+# series of a transposition folder: series.npy (cells, hours, SERIES_VARIABLES), hours.npy (hours since 1970 of the second axis),
+# cells.csv (i, j, id, lat, long, timezone of each cell) and progress.json (the settings it was made with and the hours filled so far)
+class point_series:
+    def __init__(self, folder):
+        self.folder = folder
+        self.cells = pd.read_csv("{}/cells.csv".format(folder))
+        self.hours = np.load("{}/hours.npy".format(folder))
+        self.series = np.load("{}/series.npy".format(folder), mmap_mode='r')
+
+    @staticmethod
+    def progress(folder):
+        try:
+            with open("{}/progress.json".format(folder), mode='r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # hourly weather of a cell (its row in cells.csv) as a dataframe of CONVERTED_COLUMNS, hours with missing values are left out
+    def weather(self, row):
+        # one contiguous read of the cell's series
+        values = np.asarray(self.series[row], dtype=np.float64)
+        keep = ~np.isnan(values).any(axis=1)
+        hours = self.hours[keep]
+        values = values[keep]
+        cell = self.cells.iloc[row]
+        yr, mon, day, hr = hour_dates(hours)
+        df = pd.DataFrame({'id': np.full(len(hours), cell['id']), 'lat': np.full(len(hours), cell['lat']), 'long': np.full(len(hours), cell['long']),
+                           'timezone': np.full(len(hours), cell['timezone']), 'yr': yr, 'mon': mon, 'day': day, 'hr': hr}, columns=CONVERTED_COLUMNS)
+        for k, v in enumerate(SERIES_VARIABLES):
+            df[v] = values[:, k]
+        return df
+
+# point_series of a folder, opened once per process (the series are memory-mapped, so workers share the file's pages)
+@lru_cache(maxsize=None)
+def open_series(folder):
+    return point_series(folder)
+
+# settings a transposition depends on, if any changes it is made again
+def transpose_settings(files, cells, start, end, accumulated, dtype):
+    return {"files": [[f, os.stat(f).st_mtime_ns, os.stat(f).st_size] for f in files], "cells": cells[['i', 'j']].to_numpy().tolist(),
+            "start": start, "end": end, "accumulated": accumulated, "dtype": dtype}
+
+# progress.json is replaced, not rewritten, so an interrupted run leaves the last one
+def save_progress(folder, progress):
+    with open("{}/progress.json.tmp".format(folder), mode='w') as f:
+        json.dump(progress, f)
+    os.replace("{}/progress.json.tmp".format(folder), "{}/progress.json".format(folder))
+
+# transposes the weather of the cells of points (dataframe with id, lat, lon) from the NetCDF files into folder, from start to end (hours
+# since 1970, None for all), values are saved as dtype. returns the cells (see era5_extract.point_cells) and the cell of each point
+# nothing is read if folder already has the same transposition, and an interrupted one continues after its last finished block
+# with check_only, nothing is written and a RuntimeError is raised if folder doesn't have the same, finished, transposition
+def transpose(files, points, folder, start=None, end=None, memory=1024**3, accumulated=True, dtype='float32', check_only=False):
+    start_time = time.perf_counter()
+    with grid_source(files) as source:
+        cells, point_cell, dist = point_cells(source.grid, points)
+        settings = transpose_settings(files, cells, start, end, accumulated, dtype)
+        progress = point_series.progress(folder)
+        times = source.hours(start, end)
+        if (check_only and (progress is None or progress["settings"] != settings or progress["filled"] < len(times))):
+            raise RuntimeError("{} is not up to date, run python grid_transpose.py first".format(folder))
+        if (progress is not None and progress["settings"] == settings):
+            if (progress["filled"] >= len(times)):
+                print("{} is up to date".format(folder))
+                return cells, point_cell
+            series = np.load("{}/series.npy".format(folder), mmap_mode='r+')
+            print("Continuing {} from {}".format(folder, times[progress["filled"]].astype('datetime64[h]')))
+        else:
+            subprocess.call(["mkdir", "-p", folder])
+            cells.to_csv("{}/cells.csv".format(folder), index=False)
+            np.save("{}/hours.npy".format(folder), times)
+            series = np.lib.format.open_memmap("{}/series.npy".format(folder), mode='w+', dtype=dtype, shape=(len(cells), len(times), len(SERIES_VARIABLES)))
+            progress = {"settings": settings, "filled": 0}
+            save_progress(folder, progress)
+        print("Transposing {} hours of {} grid cells ({} points) to {}, {:.1f} GB".format(len(times), len(cells), len(points), folder, series.nbytes / 1024**3))
+
+        # the block size leaves room for the block in cell-major order next to the block read
+        first = None if (progress["filled"] == 0) else int(times[progress["filled"]])
+        for hours, temp, rh, ws, prec in weather_blocks(source, cells['i'].to_numpy(), cells['j'].to_numpy(), first if (first is not None) else start,
+                                                         end, memory // 2, accumulated):
+            t0 = np.searchsorted(times, hours[0])
+            with timing.stage("grid_transpose.scatter", rows=len(hours) * len(cells)):
+                # each cell gets one contiguous run of its series
+                series[:, t0:t0 + len(hours), :] = np.stack((temp.T, rh.T, ws.T, prec.T), axis=-1)
+                series.flush()
+            progress["filled"] = int(t0 + len(hours))
+            save_progress(folder, progress)
+            print("Transposed {} to {} UTC".format(hours[0].astype('datetime64[h]'), hours[-1].astype('datetime64[h]')))
+        del series
+    print("Transposed {} grid cells to {}, time taken {:6f}s".format(len(cells), folder, time.perf_counter() - start_time))
+    return cells, point_cell
+
+if __name__ == '__main__':
+    # per-stage timings, see the timing/profiling section of giss_config.py
+    init_timing(None if (timingLog is None) else "{}/{}/{}".format(projectDir, regionName, timingLog))
+    points = region_points().frame()
+    start, end = year_hours(start_year, end_year)
+    transpose(grid_files(), points, "{}/{}/{}".format(projectDir, regionName, transposeFolder), start, end, gridMemory, gridAccumulated, transposeDtype)
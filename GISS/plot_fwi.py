@@ -2,40 +2,16 @@
 
 import pandas as pd
 import numpy as np
-import argparse, os
+import argparse, os, sys
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from datetime import datetime, timedelta
 import calendar
+sys.path.append("{}/../FWI/Python".format(os.path.dirname(os.path.realpath(__file__))))
+import util
+from result_store import ResultStore
 
-parser = argparse.ArgumentParser()
-
-parser.add_argument('-i', '--input', nargs=1, required=True, help='Name of csv file of FWI output')
-parser.add_argument('-o', '--output', nargs=1, required=True, help='Name of output file of FWI output (PDF or PNG)')
-parser.add_argument('--name', nargs=1, help='Name of the station')
-parser.add_argument('-m', '--mode', nargs=1, help='Plot type: default (hourly and maximum daily FWI), hourly (hourly FWI), maxdaily (maximum daily FWI), rolling (daily rolling period, specify period in days), monthly (monthly FWI with percentiles, seasonal (seasonal FWI with percentiles), seasonal_custom (user-defined seasons)')
-parser.add_argument('-p', '--period', nargs=1, help='Period for rolling statistics, number of days in rolling average')
-parser.add_argument('--from', nargs=3, help='Date from where plot starts, separated by spaces YYYY MM DD')
-parser.add_argument('--to', nargs=3, help='Date to where plot ends, separated by spaces YYYY MM DD')
-parser.add_argument('--season', nargs=1, help='Automatically sets date boundary of the plot to be the last specified season in data range; using DJF, MAM, JJA, SON will give seasons Dec 1-Feb 28/29, Mar 1-May 31, etc.; using winter, spring, summer, fall/autumn will give seasons using Mar 20, Jun 21, Sep 22, and Dec 21 as the boundaries.')
-parser.add_argument('--seasons-custom', nargs='*', help='List of months for custom definition of seasons')
-parser.add_argument('--all', action='store_true', help='Plot the entire date range (option ignored if either --from or --to are also given, not applicable to rolling plot)')
-parser.add_argument('--dump-to-csv', action='store_true', help='Dumps percentile data from rolling plot to csv file, does not apply to other plot types')
-
-args = parser.parse_args()
-
-inputfile = None
-outputfile = None
-outputfile_format = None
-startdate = None
-enddate = None
-period = None
-season = None
-seasons_custom = None
-plot_all = False
-dump_csv = False
-station_name = ''
-plot_mode = 'default'
+from fwi_climatology import fwi_climatology, doy_slot
 
 HOURLY_FWI = 'hourly'
 MAX_DAILY_FWI = 'maxdaily'
@@ -45,86 +21,225 @@ SEASONAL = 'seasonal'
 SEASONAL_SOLAR = 'seasonal_solar'
 SEASONAL_CUSTOM = 'seasonal_custom'
 MONTHLY = 'monthly'
-
-for k,v in vars(args).items():
-    #print (k,v)
-    if (k == 'input'):
-        if (not os.path.isfile(v[0])):
-            print("Specified file {} does not exist, exiting...".format(v[0]))
-            exit(1)
-        else:
-            inputfile = v[0]
-    if (k == 'output'):
-        outputfile = v[0]
-        outputfile_format = outputfile.split('.')[-1].lower()
-        if (outputfile_format != 'png' and outputfile_format != 'pdf'):
-            print("Output file format {} not recognized, exiting...".format(outputfile_format))
-            exit(2)
-    if (k == 'name'):
-        if (v is not None):
-            station_name = v[0]
-    if (k == 'mode'):
-        if (v is not None):
-            plot_mode = v[0]
-            if (plot_mode != HOURLY_FWI and plot_mode != MAX_DAILY_FWI and plot_mode != ROLLING_STATS and plot_mode != DEFAULT and plot_mode != SEASONAL and plot_mode != SEASONAL_SOLAR and plot_mode != SEASONAL_CUSTOM and plot_mode != MONTHLY):
-                print("Invalid plotting mode {}".format(plot_mode))
-                exit(3)
-    if (k == 'period'):
-        if (v is not None):
-            period = int(v[0])
-    if (k == 'from'):
-        if (v is not None):
-            time = [ int(i) for i in v ]
-            startdate = datetime(*time)
-    if (k == 'to'):
-        if (v is not None):
-            time = [ int(i) for i in v ]
-            enddate = datetime(*time, hour=23)
-    if (k == 'all'):
-        plot_all = v
-    if (k == 'season'):
-        if (v is not None):
-            season = v[0].upper()
-            if (season != 'DJF' and season != 'MAM' and season != 'JJA' and season != 'SON' and season != 'WINTER' and season != 'SPRING' and season != 'SUMMER' and season != 'AUTUMN' and season != 'FALL'):
-                print("Invalid season {}".format(v[0]))
-                exit(10)
-    if (k == 'seasons_custom'):
-        if (v is not None):
-            seasons_custom = [ int(i) for i in v ]
-            if (len(seasons_custom) > 12):
-                print("Too many months defined for custom season")
-                exit(11)
-            if (seasons_custom != sorted(seasons_custom)):
-                print("Months for custom seasons must be placed sequentially")
-                exit(12)
-    if (k == 'dump_to_csv'):
-        dump_csv = v
-
-if (plot_mode == ROLLING_STATS and period is None):
-    print("Must specify period and starting and end dates for rolling statistics. --from <YYYY> <MM> <DD> --to <YYYY> <MM> <DD> --period <days>")
-    exit(20)
+PLOT_MODES = [DEFAULT, HOURLY_FWI, MAX_DAILY_FWI, ROLLING_STATS, MONTHLY, SEASONAL, SEASONAL_SOLAR, SEASONAL_CUSTOM]
+# columns of the FWI output the plots use, the only ones read from a result store
+STORE_COLUMNS = ['time', 'yr', 'mon', 'day', 'hr', 'fwi']
+
+# errors of a plot, raised so plot_fwi_batch.py can go on with the other plots, the command line prints them and exits with exit_code
+class PlotError(Exception):
+    exit_code = 1
+
+class SeasonDataError(PlotError, LookupError):
+    exit_code = 13
+
+class RollingPeriodError(PlotError, ValueError):
+    exit_code = 4
+
+class PlotModeError(PlotError, ValueError):
+    exit_code = 7
+
+# command line options are only parsed when run as a script, so fwi_data can be imported (e.g. by plot_fwi_batch.py)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-i', '--input', nargs=1, required=True, help='Name of csv file of FWI output, or station id with --store')
+    parser.add_argument('-o', '--output', nargs=1, required=True, help='Name of output file of FWI output (PDF or PNG)')
+    parser.add_argument('--name', nargs=1, help='Name of the station')
+    add_plot_arguments(parser)
+
+    return check_args(parser.parse_args(argv))
+
+# plotting options shared by plot_fwi.py and plot_fwi_batch.py
+def add_plot_arguments(parser):
+    parser.add_argument('-m', '--mode', nargs=1, help='Plot type: default (hourly and maximum daily FWI), hourly (hourly FWI), maxdaily (maximum daily FWI), rolling (daily rolling period, specify period in days), monthly (monthly FWI with percentiles, seasonal (seasonal FWI with percentiles), seasonal_custom (user-defined seasons)')
+    parser.add_argument('-p', '--period', nargs=1, help='Period for rolling statistics, number of days in rolling average')
+    parser.add_argument('--from', nargs=3, help='Date from where plot starts, separated by spaces YYYY MM DD')
+    parser.add_argument('--to', nargs=3, help='Date to where plot ends, separated by spaces YYYY MM DD')
+    parser.add_argument('--season', nargs=1, help='Automatically sets date boundary of the plot to be the last specified season in data range; using DJF, MAM, JJA, SON will give seasons Dec 1-Feb 28/29, Mar 1-May 31, etc.; using winter, spring, summer, fall/autumn will give seasons using Mar 20, Jun 21, Sep 22, and Dec 21 as the boundaries.')
+    parser.add_argument('--seasons-custom', nargs='*', help='List of months for custom definition of seasons')
+    parser.add_argument('--all', action='store_true', help='Plot the entire date range (option ignored if either --from or --to are also given, not applicable to rolling plot)')
+    parser.add_argument('--dump-to-csv', action='store_true', help='Dumps percentile data from rolling plot to csv file, does not apply to other plot types')
+    parser.add_argument('--climatology', nargs=1, help='Climatology file (.npz from fwi_climatology.py) to take the percentiles of rolling plots from instead of the input file')
+    parser.add_argument('--full-resolution', action='store_true', help='Plot every hourly point instead of the minimum and maximum in each pixel column of the plot')
+    parser.add_argument('--store', nargs=1, help='Result store folder (see FWI/Python/result_store.py and fwi_store.py) to read stations from, inputs are then station ids; with --from and --to only the rows around those dates are read')
+
+# checks the parsed command line options and returns them as a dictionary
+def check_args(args):
+    inputfile = None
+    outputfile = None
+    outputfile_format = None
+    startdate = None
+    enddate = None
+    period = None
+    season = None
+    seasons_custom = None
+    plot_all = False
+    dump_csv = False
+    downsample = True
+    climatology = None
+    station_name = ''
+    plot_mode = 'default'
+    store = None
+    if (getattr(args, 'store', None) is not None):
+        if (not os.path.isfile(os.path.join(args.store[0], 'index.npz'))):
+            print("Specified result store {} does not exist, exiting...".format(args.store[0]))
+            exit(22)
+        store = args.store[0]
+
+    for k,v in vars(args).items():
+        #print (k,v)
+        if (k == 'input'):
+            if (store is not None):
+                inputfile = v[0]
+            elif (not os.path.isfile(v[0])):
+                print("Specified file {} does not exist, exiting...".format(v[0]))
+                exit(1)
+            else:
+                inputfile = v[0]
+        if (k == 'output'):
+            outputfile = v[0]
+            outputfile_format = outputfile.split('.')[-1].lower()
+            if (outputfile_format != 'png' and outputfile_format != 'pdf'):
+                print("Output file format {} not recognized, exiting...".format(outputfile_format))
+                exit(2)
+        if (k == 'name'):
+            if (v is not None):
+                station_name = v[0]
+        if (k == 'mode'):
+            if (v is not None):
+                plot_mode = v[0]
+                if (plot_mode not in PLOT_MODES):
+                    print("Invalid plotting mode {}".format(plot_mode))
+                    exit(3)
+        if (k == 'period'):
+            if (v is not None):
+                period = int(v[0])
+        if (k == 'from'):
+            if (v is not None):
+                time = [ int(i) for i in v ]
+                startdate = datetime(*time)
+        if (k == 'to'):
+            if (v is not None):
+                time = [ int(i) for i in v ]
+                enddate = datetime(*time, hour=23)
+        if (k == 'all'):
+            plot_all = v
+        if (k == 'season'):
+            if (v is not None):
+                season = v[0].upper()
+                if (season != 'DJF' and season != 'MAM' and season != 'JJA' and season != 'SON' and season != 'WINTER' and season != 'SPRING' and season != 'SUMMER' and season != 'AUTUMN' and season != 'FALL'):
+                    print("Invalid season {}".format(v[0]))
+                    exit(10)
+        if (k == 'seasons_custom'):
+            if (v is not None):
+                seasons_custom = [ int(i) for i in v ]
+                if (len(seasons_custom) > 12):
+                    print("Too many months defined for custom season")
+                    exit(11)
+                if (seasons_custom != sorted(seasons_custom)):
+                    print("Months for custom seasons must be placed sequentially")
+                    exit(12)
+        if (k == 'dump_to_csv'):
+            dump_csv = v
+        if (k == 'climatology'):
+            if (v is not None):
+                if (not os.path.isfile(v[0])):
+                    print("Specified climatology {} does not exist, exiting...".format(v[0]))
+                    exit(21)
+                climatology = v[0]
+        if (k == 'full_resolution'):
+            downsample = not v
+
+    if (plot_mode == ROLLING_STATS and period is None):
+        print("Must specify period and starting and end dates for rolling statistics. --from <YYYY> <MM> <DD> --to <YYYY> <MM> <DD> --period <days>")
+        exit(20)
+
+    return {
+        'inputfile': inputfile,
+        'outputfile': outputfile,
+        'station_name': station_name,
+        'plot_mode': plot_mode,
+        'period': period,
+        'startdate': startdate,
+        'enddate': enddate,
+        'season': season,
+        'seasons_custom': seasons_custom,
+        'plot_all': plot_all,
+        'dump_csv': dump_csv,
+        'downsample': downsample,
+        'climatology': climatology,
+        'store': store
+    }
+
+# first and last dates of the rows plots of these modes need with the options opts, None if they need every row
+# (e.g. to find the fire season or the percentiles of rolling plots without a climatology)
+def plot_window(plot_modes, opts):
+    if (opts['startdate'] is None or opts['enddate'] is None or opts['season'] is not None):
+        return None
+    before = timedelta(0)
+    after = timedelta(0)
+    for plot_mode in plot_modes:
+        if (plot_mode == ROLLING_STATS and opts['climatology'] is None):
+            return None
+        if (plot_mode == MONTHLY):
+            # whole months
+            before = max(before, timedelta(days=31))
+            after = max(after, timedelta(days=31))
+        elif (plot_mode in [SEASONAL, SEASONAL_SOLAR, SEASONAL_CUSTOM]):
+            # whole seasons, up to a year with custom seasons
+            before = max(before, timedelta(days=366))
+            after = max(after, timedelta(days=366))
+    return opts['startdate'] - before, opts['enddate'] + after
 
 class fwi_data:
-    def __init__(self, csvfile, station_name):
+    # plot_all and season are the --all and --season options, fig is an optional figure to reuse between plots
+    # downsample reduces hourly lines to the minimum and maximum of each pixel column before plotting
+    # climatology is a saved fwi_climatology to take rolling percentiles from (e.g. the region's) instead of this file
+    # with store (a ResultStore or its folder), csvfile is the id of a station in the store and only the columns the plots use are read,
+    # only the rows from window[0] to window[1] if window is given (see plot_window)
+    def __init__(self, csvfile, station_name, plot_all=False, season=None, fig=None, downsample=True, climatology=None, store=None, window=None):
         self.name = station_name
-        self.df = pd.read_csv(csvfile)
-        self.id = self.df['id'].iloc[0]
+        self.plot_all = plot_all
+        self.season = season
+        self.fig = fig
+        self.downsample = downsample
+        self.clim = fwi_climatology.load(climatology) if (climatology is not None) else None
+        if (store is not None):
+            store = store if isinstance(store, ResultStore) else ResultStore(store)
+            start, end = (None, None) if (window is None) else window
+            self.df = store.read([csvfile], start, end, STORE_COLUMNS)
+            if (len(self.df) == 0):
+                raise LookupError("No data for {} in {}".format(csvfile, store.root))
+            self.id = csvfile
+        else:
+            # .csv or compact .npz output (see save_compact in FWI/Python/util.py)
+            self.df = util.read_output(csvfile)
+            self.id = self.df['id'].iloc[0]
         self.df.rename(columns={'yr': 'year', 'mon': 'month', 'hr': 'hour'}, inplace=True)
-        self.df['full_date'] = pd.to_datetime(self.df[['year', 'month', 'day', 'hour']])
+        if ('time' in self.df.columns):
+            self.df['full_date'] = pd.to_datetime(self.df['time'], unit='h')
+        else:
+            self.df['full_date'] = pd.to_datetime(self.df[['year', 'month', 'day', 'hour']])
         self.startyear = self.df['year'].iloc[0]
         self.endyear = self.df['year'].iloc[-1]
 
     def plotHourly(self, outputfile, startdate, enddate):
         startdate, enddate = self.checkDates(startdate, enddate)
-        do_plot_setup(self.id, self.name, extra=' (Hourly)')
+        self.fig = do_plot_setup(self.id, self.name, fig=self.fig, extra=' (Hourly)')
         filtered_rows = self.df[(self.df['full_date'] >= startdate) & (self.df['full_date'] <= enddate)]
-        plt.plot(filtered_rows['full_date'], filtered_rows['fwi'], color='blue', linewidth=0.5)
+        plt.plot(*self.hourlyLine(filtered_rows), color='blue', linewidth=0.5)
         plt.gca().set_ylim(bottom=0)
         plt.savefig(outputfile)
 
+    # dates and FWI of the hourly line, downsampled to the width of the plot in pixels
+    def hourlyLine(self, rows):
+        if (not self.downsample):
+            return rows['full_date'], rows['fwi']
+        return downsample_minmax(rows['full_date'].values, rows['fwi'].values, int(plt.gca().get_window_extent().width))
+
     def plotMaxDaily(self, outputfile, startdate, enddate, plotHourly=False):
         startdate, enddate = self.checkDates(startdate, enddate)
-        do_plot_setup(self.id, self.name, extra=' (Max Daily)')
+        self.fig = do_plot_setup(self.id, self.name, fig=self.fig, extra=' (Max Daily)')
         maxdates, maxfwis = self.getMaxDailyFWI(startdate, enddate)
         if (plotHourly):
             # need a dummy last day to get the step plot to look better
@@ -132,7 +247,7 @@ class fwi_data:
             maxfwis.append(maxfwis[-1])
             plt.step(maxdates, maxfwis, where='post', color='red', linewidth=2, label='Max Daily FWI')
             filtered_rows = self.df[(self.df['full_date'] >= startdate) & (self.df['full_date'] <= enddate)]
-            plt.plot(filtered_rows['full_date'], filtered_rows['fwi'], color='blue', linewidth=0.5, label='Hourly FWI')
+            plt.plot(*self.hourlyLine(filtered_rows), color='blue', linewidth=0.5, label='Hourly FWI')
             plt.legend(fontsize=20, framealpha=0.5)
         else:
             plt.plot(maxdates, maxfwis, color='red', linewidth=2)
@@ -141,7 +256,7 @@ class fwi_data:
 
     def plotMonthly(self, outputfile, startdate, enddate, dump_csv=False):
         startdate, enddate = self.checkDates(startdate, enddate)
-        do_plot_setup(self.id, self.name, extra=' (Monthly)')
+        self.fig = do_plot_setup(self.id, self.name, fig=self.fig, extra=' (Monthly)')
         dates, p5, p25, p50, p75, p95 = self.getMonthlyFWI(startdate, enddate)
 
         plt.fill_between(dates, p5, p95, step='post', color='0.95', label='95%')
@@ -160,7 +275,7 @@ class fwi_data:
 
     def plotSeasonal(self, outputfile, startdate, enddate, solar=False, custom=None, dump_csv=False):
         startdate, enddate = self.checkDates(startdate, enddate)
-        do_plot_setup(self.id, self.name, extra=' (Seasonal)')
+        self.fig = do_plot_setup(self.id, self.name, fig=self.fig, extra=' (Seasonal)')
         dates, p5, p25, p50, p75, p95 = self.getSeasonalFWI(startdate, enddate, solar=solar, custom=custom)
 
         plt.fill_between(dates, p5, p95, step='post', color='0.95', label='95%')
@@ -178,11 +293,11 @@ class fwi_data:
                     outcsv.write("{},{},{},{},{},{}\n".format(line[0].strftime("%Y%m%d%H"), *line[1:]))
 
     def plotRolling(self, outputfile, startdate, enddate, period, hourly=False, dump_csv=False):
-        if (season is not None):
-            startdate, enddate = self.findLastSeason(season)
+        if (self.season is not None):
+            startdate, enddate = self.findLastSeason(self.season)
         elif (period is None or startdate is None or enddate is None):
             startdate, enddate = self.findFireSeason()
-        do_plot_setup(self.id, self.name, extra=" (Rolling Period {} Days)".format(period), subtitle="Climate reference period {} to {}".format(self.startyear, self.endyear))
+        self.fig = do_plot_setup(self.id, self.name, fig=self.fig, extra=" (Rolling Period {} Days)".format(period), subtitle=self.referencePeriod())
         dates, p5, p25, p50, p75, p95, avgfwis = self.getRollingFWI(startdate, enddate, period, hourly=hourly)
         plt.fill_between(dates, p5, p95, color='0.95', label='95%')
         plt.fill_between(dates, p25, p75, color='0.85', label='IQR')
@@ -382,8 +497,7 @@ class fwi_data:
         else:
             startdate = datetime(endyear, *seasonDict[season][0])
         if (self.df.iloc[0]['full_date'] > startdate):
-            print("Not enough data for a full specified season")
-            exit(13)
+            raise SeasonDataError("Not enough data for a full specified season")
 
         return startdate, enddate
 
@@ -433,10 +547,9 @@ class fwi_data:
     # returns rolling FWI of all previous FWI periods in percentiles 5, 25, 50, 75, 95, along with the average FWI for the latest period
     def getRollingFWI(self, startdate, enddate, period, hourly=False):
         if (period is None):
-            print("Invalid specification.")
-            exit(4)
-        if (season is not None):
-            startdate, enddate = self.findLastSeason(season)
+            raise RollingPeriodError("Invalid specification. Rolling statistics need a period (--period)")
+        if (self.season is not None):
+            startdate, enddate = self.findLastSeason(self.season)
         elif (startdate is None or enddate is None):
             startdate, enddate = self.findFireSeason()
         period_startmon = startdate.month
@@ -476,7 +589,15 @@ class fwi_data:
 
             dates.append(datefwi)
 
-            if (len(filtered_rows_fwi) == 0):
+            if (len(filtered_rows_fwi) > 0 and self.clim is not None):
+                averagefwi.append(np.average(filtered_rows_fwi['fwi']))
+                p = self.clim.percentiles([5, 25, 50, 75, 95], slots=self.climSlots(rollingdatestart, rollingdateend))[0]
+                percentile5.append(p[0])
+                percentile25.append(p[1])
+                percentile50.append(p[2])
+                percentile75.append(p[3])
+                percentile95.append(p[4])
+            elif (len(filtered_rows_fwi) == 0):
                 averagefwi.append(np.nan)
                 percentile95.append(np.nan)
                 percentile75.append(np.nan)
@@ -497,46 +618,116 @@ class fwi_data:
 
         return dates, percentile5, percentile25, percentile50, percentile75, percentile95, averagefwi
 
+    # day of year (or month) slots of the climatology covered by a rolling period
+    def climSlots(self, rollingdatestart, rollingdateend):
+        if (self.clim.period == 'month'):
+            start = rollingdatestart.month - 1
+            end = rollingdateend.month - 1
+            nslots = 12
+        else:
+            start = doy_slot(rollingdatestart.month, rollingdatestart.day)
+            end = doy_slot(rollingdateend.month, rollingdateend.day)
+            nslots = 366
+        if (start <= end):
+            return list(range(start, end + 1))
+        return list(range(start, nslots)) + list(range(0, end + 1))
+
+    def referencePeriod(self):
+        if (self.clim is not None and len(self.clim.years) > 0):
+            return "Climate reference period {} to {} ({})".format(min(self.clim.years), max(self.clim.years), self.clim.variable.upper())
+        return "Climate reference period {} to {}".format(self.startyear, self.endyear)
+
     def checkDates(self, startdate, enddate):
         if (startdate is None and enddate is None):
-            if (plot_all):
+            if (self.plot_all):
                 startdate = self.df.iloc[0]["full_date"]
                 enddate = self.df.iloc[-1]["full_date"]
-            elif (season is not None):
-                startdate, enddate = self.findLastSeason(season)
+            elif (self.season is not None):
+                startdate, enddate = self.findLastSeason(self.season)
             else:
                 startdate, enddate = self.findFireSeason()
         return startdate, enddate
 
-def do_plot_setup(station_id, station_name, extra='', subtitle=''):
-    fig = plt.figure(figsize=(20, 10))
-    plt.suptitle("{} {} FWI{}".format(station_id, station_name, extra), fontsize=30)
-    plt.title(subtitle, fontsize=20)
-    plt.xlabel("Date", fontsize=20)
-    fig.autofmt_xdate(rotation=45)
-    plt.ylabel("Fire Weather Index{}".format(extra), fontsize=20)
-    plt.yticks(fontsize=15)
-    plt.xticks(fontsize=15)
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y %b %d'))
-
-fwidataobj = fwi_data(inputfile, station_name)
-
-if (plot_mode == DEFAULT):
-    fwidataobj.plotMaxDaily(outputfile, startdate, enddate, plotHourly=True)
-elif (plot_mode == HOURLY_FWI):
-    fwidataobj.plotHourly(outputfile, startdate, enddate)
-elif (plot_mode == MAX_DAILY_FWI):
-    fwidataobj.plotMaxDaily(outputfile, startdate, enddate)
-elif (plot_mode == ROLLING_STATS):
-    fwidataobj.plotRolling(outputfile, startdate, enddate, period, dump_csv=dump_csv)
-elif (plot_mode == MONTHLY):
-    fwidataobj.plotMonthly(outputfile, startdate, enddate, dump_csv=dump_csv)
-elif (plot_mode == SEASONAL):
-    fwidataobj.plotSeasonal(outputfile, startdate, enddate, dump_csv=dump_csv)
-elif (plot_mode == SEASONAL_SOLAR):
-    fwidataobj.plotSeasonal(outputfile, startdate, enddate, solar=True, dump_csv=dump_csv)
-elif (plot_mode == SEASONAL_CUSTOM):
-    fwidataobj.plotSeasonal(outputfile, startdate, enddate, custom=seasons_custom, dump_csv=dump_csv)
-else:
-    print("Invalid mode {}".format(plot_mode))
-    exit(7)
+# level of detail reduction for long time series: keeps the minimum and maximum value in each of nbuckets equal
+# width columns of the x axis (in time order) so the line drawn at that width looks the same as the full series
+# missing values (NaN) are kept as breaks in the line: a column with a gap keeps the minimum and maximum on each side of it
+def downsample_minmax(x, y, nbuckets):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if (nbuckets < 1 or len(y) <= 2 * nbuckets):
+        return x, y
+    t = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(float)
+    span = t[-1] - t[0]
+    if (span <= 0):
+        return x, y
+    bucket = np.minimum(((t - t[0]) / span * nbuckets).astype(np.int64), nbuckets - 1)
+    missing = np.isnan(y)
+    # the values between two gaps are a segment, the first NaN of each gap is kept to break the line there
+    segment = np.cumsum(missing)
+    gaps = np.flatnonzero(missing & ~np.r_[False, missing[:-1]])
+    valid = np.flatnonzero(~missing)
+    if (len(valid) == 0):
+        return x[gaps], y[gaps]
+    # sort by bucket, segment then value, the first and last entries of each are its minimum and maximum
+    order = valid[np.lexsort((y[valid], segment[valid], bucket[valid]))]
+    starts = np.flatnonzero(np.r_[True, (np.diff(bucket[order]) != 0) | (np.diff(segment[order]) != 0)])
+    ends = np.r_[starts[1:], len(order)] - 1
+    keep = np.unique(np.concatenate((order[starts], order[ends], gaps, [0, len(y) - 1])))
+    return x[keep], y[keep]
+
+# sets up the figure for a plot, if a figure from a previous plot is given then its canvas, axes and labels are reused and only the plotted data is cleared
+def do_plot_setup(station_id, station_name, extra='', subtitle='', fig=None):
+    if (fig is None):
+        fig = plt.figure(figsize=(20, 10))
+        plt.suptitle("{} {} FWI{}".format(station_id, station_name, extra), fontsize=30)
+        plt.title(subtitle, fontsize=20)
+        plt.xlabel("Date", fontsize=20)
+        fig.autofmt_xdate(rotation=45)
+        plt.ylabel("Fire Weather Index{}".format(extra), fontsize=20)
+        plt.yticks(fontsize=15)
+        plt.xticks(fontsize=15)
+        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y %b %d'))
+    else:
+        plt.figure(fig.number)
+        ax = plt.gca()
+        if (ax.get_legend() is not None):
+            ax.get_legend().remove()
+        for artist in list(ax.lines) + list(ax.collections):
+            artist.remove()
+        ax.relim()
+        ax.set_autoscale_on(True)
+        fig.suptitle("{} {} FWI{}".format(station_id, station_name, extra), fontsize=30)
+        ax.set_title(subtitle, fontsize=20)
+        ax.set_ylabel("Fire Weather Index{}".format(extra), fontsize=20)
+    return fig
+
+# makes the plot for the specified plotting mode
+def do_plot(fwidataobj, outputfile, plot_mode=DEFAULT, startdate=None, enddate=None, period=None, seasons_custom=None, dump_csv=False):
+    if (plot_mode == DEFAULT):
+        fwidataobj.plotMaxDaily(outputfile, startdate, enddate, plotHourly=True)
+    elif (plot_mode == HOURLY_FWI):
+        fwidataobj.plotHourly(outputfile, startdate, enddate)
+    elif (plot_mode == MAX_DAILY_FWI):
+        fwidataobj.plotMaxDaily(outputfile, startdate, enddate)
+    elif (plot_mode == ROLLING_STATS):
+        fwidataobj.plotRolling(outputfile, startdate, enddate, period, dump_csv=dump_csv)
+    elif (plot_mode == MONTHLY):
+        fwidataobj.plotMonthly(outputfile, startdate, enddate, dump_csv=dump_csv)
+    elif (plot_mode == SEASONAL):
+        fwidataobj.plotSeasonal(outputfile, startdate, enddate, dump_csv=dump_csv)
+    elif (plot_mode == SEASONAL_SOLAR):
+        fwidataobj.plotSeasonal(outputfile, startdate, enddate, solar=True, dump_csv=dump_csv)
+    elif (plot_mode == SEASONAL_CUSTOM):
+        fwidataobj.plotSeasonal(outputfile, startdate, enddate, custom=seasons_custom, dump_csv=dump_csv)
+    else:
+        raise PlotModeError("Invalid mode {}".format(plot_mode))
+
+if __name__ == '__main__':
+    opts = parse_args()
+    try:
+        fwidataobj = fwi_data(opts['inputfile'], opts['station_name'], plot_all=opts['plot_all'], season=opts['season'], downsample=opts['downsample'], climatology=opts['climatology'],
+                              store=opts['store'], window=plot_window([opts['plot_mode']], opts))
+        do_plot(fwidataobj, opts['outputfile'], opts['plot_mode'], opts['startdate'], opts['enddate'], opts['period'], opts['seasons_custom'], opts['dump_csv'])
+    except PlotError as e:
+        print(e)
+        exit(e.exit_code)
@@ -0,0 +1,118 @@
+# batch version of plot_fwi.py, renders plots for many FWI outputs in a single pool of processes
+
+import matplotlib
+matplotlib.use('Agg')
+
+from multiprocessing import Pool
+import argparse, os, time
+
+import plot_fwi
+from plot_fwi import fwi_data, do_plot, plot_window, PLOT_MODES, ROLLING_STATS
+from result_store import ResultStore
+
+# each worker keeps one figure and reuses it (and its Agg canvas) for every plot it renders
+worker_fig = None
+# and opens the result store (--store) once
+worker_store = None
+
+# renders every plot requested for one FWI output file, the file is only read once
+def plot_station(inputfile, station_name, plots, opts):
+    global worker_fig, worker_store
+    start_time = time.perf_counter()
+    if (opts['store'] is not None and worker_store is None):
+        worker_store = ResultStore(opts['store'])
+    try:
+        window = plot_window([plot_mode for _, plot_mode in plots], opts)
+        fwidataobj = fwi_data(inputfile, station_name, plot_all=opts['plot_all'], season=opts['season'], fig=worker_fig, downsample=opts['downsample'], climatology=opts['climatology'],
+                              store=worker_store, window=window)
+    except Exception as e:
+        print("Reading {} failed, {}".format(inputfile, repr(e)))
+        return []
+
+    done = []
+    for outputfile, plot_mode in plots:
+        try:
+            do_plot(fwidataobj, outputfile, plot_mode, opts['startdate'], opts['enddate'], opts['period'], opts['seasons_custom'], opts['dump_csv'])
+            done.append(outputfile)
+        except Exception as e:
+            print("Plot {} from {} failed, {}".format(outputfile, inputfile, repr(e)))
+        worker_fig = fwidataobj.fig
+    end_time = time.perf_counter()
+    print("Plotted {} to {} file(s), time taken {:6f}s".format(inputfile, len(done), end_time - start_time))
+    return done
+
+def plot_station_args(args):
+    return plot_station(*args)
+
+# output file for a plot mode, used when more than one mode is plotted from a line without an explicit mode
+def mode_output(outputfile, plot_mode, multiple):
+    if ('{mode}' in outputfile):
+        return outputfile.format(mode=plot_mode)
+    if (not multiple):
+        return outputfile
+    base, ext = os.path.splitext(outputfile)
+    return "{}_{}{}".format(base, plot_mode, ext)
+
+# reads the list of plots to make, lines are <FWI output csv>,<plot file>,[mode],[station name] (a station id instead of the csv with --store)
+# lines with the same FWI output are grouped together so each file is only parsed once
+def read_plot_list(listfile, modes, opts):
+    tasks = {}
+    counter = 0
+    with open(listfile, mode='r') as ifile:
+        for line in ifile:
+            counter += 1
+            if (line[0] == '#' or line.strip() == ''):
+                continue
+            iline = line.strip().split('#')[0].split(',')
+            if (len(iline) < 2):
+                print("Line {}: No output file specified, skipping...".format(counter))
+                continue
+            inputfile = iline[0]
+            outputfile = iline[1]
+            if (opts['store'] is None and not os.path.isfile(inputfile)):
+                print("Line {}: {} does not exist or is an invalid file, skipping...".format(counter, inputfile))
+                continue
+            if (outputfile.split('.')[-1].lower() not in ['png', 'pdf']):
+                print("Line {}: Output file format of {} not recognized, skipping...".format(counter, outputfile))
+                continue
+            line_modes = [iline[2]] if (len(iline) > 2 and iline[2] != '') else modes
+            station_name = iline[3] if (len(iline) > 3) else ''
+            for plot_mode in line_modes:
+                if (plot_mode not in PLOT_MODES):
+                    print("Line {}: Invalid plotting mode {}, skipping...".format(counter, plot_mode))
+                    continue
+                if (plot_mode == ROLLING_STATS and opts['period'] is None):
+                    print("Line {}: Rolling plots need a period (--period), skipping...".format(counter))
+                    continue
+                key = (inputfile, station_name)
+                if (key not in tasks):
+                    tasks[key] = []
+                tasks[key].append((mode_output(outputfile, plot_mode, len(line_modes) > 1), plot_mode))
+    return [ (inputfile, station_name, plots, opts) for (inputfile, station_name), plots in tasks.items() ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('list', help='File listing plots to make, one per line: <FWI output csv (station id with --store)>,<plot file (PDF or PNG)>,[mode],[station name]')
+    parser.add_argument('--modes', nargs='+', help='Plot types to make for lines without a mode, the mode is added to the plot file name (or replaces {mode} in it) when more than one is given')
+    parser.add_argument('-n', '--processes', nargs=1, type=int, help='Number of worker processes (default number of CPUs)')
+    plot_fwi.add_plot_arguments(parser)
+    args = parser.parse_args()
+    opts = plot_fwi.check_args(args)
+
+    if (not os.path.isfile(args.list)):
+        print("Specified file {} does not exist, exiting...".format(args.list))
+        exit(1)
+    if (args.modes is not None):
+        modes = args.modes
+    else:
+        modes = [opts['plot_mode']]
+
+    start_time = time.perf_counter()
+    tasks = read_plot_list(args.list, modes, opts)
+    processes = args.processes[0] if (args.processes is not None) else None
+    nplots = 0
+    with Pool(processes) as pool:
+        for done in pool.imap_unordered(plot_station_args, tasks):
+            nplots += len(done)
+    end_time = time.perf_counter()
+    print("Made {} plots from {} FWI outputs, time taken {:6f}s".format(nplots, len(tasks), end_time - start_time))
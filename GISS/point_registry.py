@@ -0,0 +1,198 @@
+# binary registry of the points of pointLocations, shared by the GISS scripts instead of each reading the list of points line by line
+# the list is read once into <projectDir>/<regionName>/<pointRegistry>, a .npy array of records (id, lat, lon, timezone, starting codes,
+# line of the list) in the order of the list, with a latitude index (<pointRegistry>.lat.npy, the latitudes in order and their records)
+# and a .json of the list it was made from. both .npy are memory-mapped, so a registry of hundreds of thousands of points opens in
+# milliseconds and a bounding box only reads its latitude band. the registry is made again whenever the list of points changes
+# file names of each stage (downloaded, converted, fwi, daily, climatology) come from giss_config.py
+#
+#     python point_registry.py --box 36 -10 40 -6
+# lists the points of the region in a bounding box, see python point_registry.py -h
+
+import numpy as np
+import argparse, json, os
+
+from giss_config import *
+from giss_utils import get_timezone
+
+NO_TIMEZONE = -99 # timezone of locations without one
+
+# records of the registry, ids are fixed-width bytes sized to the longest id
+def registry_dtype(id_length):
+    return np.dtype([('id', 'S{}'.format(max(1, id_length))), ('lat', 'f8'), ('lon', 'f8'), ('timezone', 'i2'),
+                     ('ffmc', 'f8'), ('dmc', 'f8'), ('dc', 'f8'), ('line', 'i4')])
+
+# file name patterns (with {} for the point id) of the files of each stage, from giss_config.py
+def stage_paths():
+    region = "{}/{}".format(projectDir, regionName)
+    return {
+        "downloaded": "{}/{}/{}_{{}}.zip".format(region, downloadedFolder, downloadedPrefix),
+        "converted": "{}/{}/{}_{{}}.csv".format(region, convertedFolder, convertedPrefix),
+        "fwi": "{}/{}/{}_{{}}.{}".format(region, fwiFolder, fwiPrefix, fwiFormat),
+        "daily": "{}/{}/{}_{{}}.csv".format(region, dailyFolder, dailyPrefix),
+        "climatology": "{}/{}/{}_{{}}.npz".format(region, climatologyFolder, climatologyPrefix),
+    }
+
+# reads a list of points (lines id,lat,lon or id,lat,lon,ffmc,dmc,dc, # for comments, see giss_config.py) into an array of records
+# in the order of the list, invalid lines are skipped with a message
+def parse_points(filename):
+    rows = []
+    counter = 0
+    with open(filename, mode='r') as ifile:
+        for line in ifile:
+            counter += 1
+            if (line[0] == '#'):
+                continue
+            iline = line.strip().split('#')[0].split(',')
+            if (len(iline) == 1 and iline[0] == ''):
+                continue
+            if (len(iline) != 3 and len(iline) != 6):
+                print("Line {}: Invalid number of arguments, skipping...".format(counter))
+                continue
+            try:
+                lat = float(iline[1])
+                lon = float(iline[2])
+            except:
+                print("Line {}: Listed location does not seem to be numbers, skipping...".format(counter))
+                continue
+            codes = (np.nan, np.nan, np.nan)
+            if (len(iline) == 6):
+                try:
+                    codes = (float(iline[3]), float(iline[4]), float(iline[5]))
+                except:
+                    print("Line {}: Listed starting codes do not seem to be all numbers, skipping...".format(counter))
+                    continue
+            rows.append((iline[0], lat, lon, codes, counter))
+    records = np.zeros(len(rows), dtype=registry_dtype(max([len(r[0].encode()) for r in rows], default=1)))
+    records['id'] = [r[0].encode() for r in rows]
+    records['lat'] = [r[1] for r in rows]
+    records['lon'] = [r[2] for r in rows]
+    records['ffmc'], records['dmc'], records['dc'] = np.array([r[3] for r in rows]).reshape(-1, 3).T
+    records['line'] = [r[4] for r in rows]
+    return records
+
+# timezone of a location, NO_TIMEZONE if it has none (e.g. at sea)
+def point_timezone(lat, lon):
+    try:
+        return get_timezone(lat, lon)
+    except:
+        return NO_TIMEZONE
+
+# points of a registry (or of a subset of it), in the order of the list of points
+# lat_index is the latitude index of the records (sorted latitudes and the positions of their records), None for subsets
+class point_registry:
+    def __init__(self, records, lat_index=None):
+        self.records = records
+        self.lat_index = lat_index
+        self.paths = stage_paths()
+
+    # writes the registry of a list of points to filename (and its index and .json next to it), returns its records
+    # timezones (id -> timezone) are known timezones of some of the points, the others are looked up
+    @staticmethod
+    def build(pointsfile, filename, timezones=None):
+        records = parse_points(pointsfile)
+        timezones = {} if (timezones is None) else timezones
+        records['timezone'] = [timezones[i.decode()] if (i.decode() in timezones) else point_timezone(lat, lon)
+                               for i, lat, lon in zip(records['id'], records['lat'], records['lon'])]
+        order = np.argsort(records['lat'], kind='stable')
+        lat_index = np.zeros(len(records), dtype=[('lat', 'f8'), ('row', 'i4')])
+        lat_index['lat'] = records['lat'][order]
+        lat_index['row'] = order
+        for name, array in ((filename, records), ("{}.lat.npy".format(filename), lat_index)):
+            np.save("{}.tmp.npy".format(name), array)
+            os.replace("{}.tmp.npy".format(name), name)
+        stat = os.stat(pointsfile)
+        with open("{}.json".format(filename), mode='w') as f:
+            json.dump({"source": os.path.abspath(pointsfile), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "points": len(records)}, f)
+        print("Registered {} points of {} in {}".format(len(records), pointsfile, filename))
+        return records
+
+    # opens the registry in filename (memory-mapped), made (again) from pointsfile first if it is missing or pointsfile changed
+    @staticmethod
+    def load(filename, pointsfile=None):
+        if (pointsfile is not None):
+            try:
+                with open("{}.json".format(filename), mode='r') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = None
+            stat = os.stat(pointsfile)
+            if (meta is None or not os.path.isfile(filename) or not os.path.isfile("{}.lat.npy".format(filename)) or
+                meta["source"] != os.path.abspath(pointsfile) or meta["mtime_ns"] != stat.st_mtime_ns or meta["size"] != stat.st_size):
+                point_registry.build(pointsfile, filename)
+        return point_registry(np.load(filename, mmap_mode='r'), np.load("{}.lat.npy".format(filename), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.records)
+
+    # points within a bounding box (min lat, min lon, max lat, max lon, longitudes -180 to 180, min lon > max lon crosses 180)
+    # and/or with ids in a list, as a registry in the order of the list of points
+    def subset(self, box=None, ids=None):
+        records = self.records
+        if (box is not None):
+            min_lat, min_lon, max_lat, max_lon = box
+            if (self.lat_index is not None):
+                # only the latitude band of the box is read
+                band = self.lat_index[np.searchsorted(self.lat_index['lat'], min_lat, side='left'):np.searchsorted(self.lat_index['lat'], max_lat, side='right')]
+                records = records[np.sort(band['row'])]
+            else:
+                records = records[(records['lat'] >= min_lat) & (records['lat'] <= max_lat)]
+            lon = (records['lon'] + 180.0) % 360.0 - 180.0
+            if (min_lon <= max_lon):
+                records = records[(lon >= min_lon) & (lon <= max_lon)]
+            else:
+                records = records[(lon >= min_lon) | (lon <= max_lon)]
+        if (ids is not None):
+            records = records[np.isin(records['id'], np.array([str(i).encode() for i in ids]))]
+        return point_registry(np.asarray(records))
+
+    def ids(self):
+        return [i.decode() for i in self.records['id']]
+
+    # starting codes (ffmc, dmc, dc) of the k-th point, Nones if the list of points has none
+    def codes(self, k):
+        record = self.records[k]
+        if (np.isnan(record['ffmc'])):
+            return (None, None, None)
+        return (float(record['ffmc']), float(record['dmc']), float(record['dc']))
+
+    # file of the k-th point for a stage (downloaded, converted, fwi, daily, climatology)
+    def path(self, stage, k):
+        return self.paths[stage].format(self.records['id'][k].decode())
+
+    # id, lat, lon of every point as a dataframe
+    def frame(self):
+        import pandas as pd
+        return pd.DataFrame({'id': self.ids(), 'lat': np.asarray(self.records['lat']), 'lon': np.asarray(self.records['lon'])})
+
+# ids of subsetIds: a list, or a file in <projectDir>/<regionName>/ with one id per line
+def subset_ids(ids):
+    if (ids is None or not isinstance(ids, str)):
+        return ids
+    with open("{}/{}/{}".format(projectDir, regionName, ids), mode='r') as f:
+        return [line.strip().split(',')[0] for line in f if (line.strip() != '' and line[0] != '#')]
+
+# the points of the region (<projectDir>/<regionName>/<pointLocations>) in its registry, limited to subsetBox and subsetIds of giss_config.py
+def region_points():
+    registry = point_registry.load("{}/{}/{}".format(projectDir, regionName, pointRegistry), "{}/{}/{}".format(projectDir, regionName, pointLocations))
+    if (subsetBox is None and subsetIds is None):
+        return registry
+    points = registry.subset(subsetBox, subset_ids(subsetIds))
+    print("{} of {} points in the subset of the region".format(len(points), len(registry)))
+    return points
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Lists the points of the region's registry (see giss_config.py), optionally a subset")
+    parser.add_argument("--box", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"), help="only the points in this bounding box")
+    parser.add_argument("--ids", nargs="+", help="only the points with these ids")
+    parser.add_argument("--rebuild", action="store_true", help="make the registry again from the list of points")
+    args = parser.parse_args()
+    registryfile = "{}/{}/{}".format(projectDir, regionName, pointRegistry)
+    pointsfile = "{}/{}/{}".format(projectDir, regionName, pointLocations)
+    if (args.rebuild):
+        point_registry.build(pointsfile, registryfile)
+    registry = point_registry.load(registryfile, pointsfile)
+    points = registry.subset(args.box, args.ids)
+    for k in range(len(points)):
+        r = points.records[k]
+        codes = "" if (np.isnan(r['ffmc'])) else ",{:g},{:g},{:g}".format(r['ffmc'], r['dmc'], r['dc'])
+        print("{},{:g},{:g},{}{}".format(r['id'].decode(), r['lat'], r['lon'], r['timezone'], codes))
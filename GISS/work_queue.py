@@ -0,0 +1,233 @@
+# work queue of batches of points on a shared filesystem, so any number of processes on any number of hosts can share one run
+# (see the sharding section of giss_config.py)
+#
+# the list of work (e.g. one entry per point) is split into batches of batch_size in list order, and the batches are saved in
+# <folder>/batches.json by the first worker, later workers check they were given the same list
+# a worker claims a batch by creating <folder>/batch_<n>.lock with O_CREAT | O_EXCL (atomic, also over NFS), and touches it
+# every heartbeat seconds while it works on the batch. a lock not touched for stale_after seconds belongs to a worker that died
+# or lost its host, so another worker renames it away (only one rename can succeed), checks the file it moved is still that stale
+# lock (not a fresh one made since by a worker reclaiming it first) and claims the batch again. a worker only touches or removes a lock
+# with its own claim record, so a slow worker whose batch was reclaimed leaves the new owner's lock alone
+# a finished batch is written to <folder>/batch_<n>.done (JSON: worker, host, times, items, results), which is the completion
+# ledger, see ledger() or python work_queue.py <folder>
+#
+# on one machine, start several workers with e.g.
+#     for i in 1 2 3 4; do python giss_hourly_FWI_parallel.py & done; wait
+
+import json, os, socket, threading, time
+
+class WorkQueue:
+    def __init__(self, folder, items, batch_size=50, heartbeat=30.0, stale_after=300.0, worker=None):
+        self.folder = folder
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self.host = socket.gethostname()
+        self.worker = worker if (worker is not None) else "{}-{}".format(self.host, os.getpid())
+        items = [str(i) for i in items]
+        self.batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        # batch number -> claim record written in the lock of each batch this worker claimed
+        self.claims = {}
+        os.makedirs(folder, exist_ok=True)
+        manifest = os.path.join(folder, "batches.json")
+        # written in full under another name first, since other workers read it as soon as it exists
+        temp = "{}.{}.tmp".format(manifest, self.worker)
+        with open(temp, "w") as f:
+            json.dump({"batch_size": batch_size, "batches": self.batches}, f)
+        try:
+            os.link(temp, manifest)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp)
+        with open(manifest) as f:
+            saved = json.load(f)
+        if (saved["batches"] != self.batches):
+            raise RuntimeError("{} was made for a different list of points, use a new queue folder (or delete it) to start over".format(manifest))
+
+    def _path(self, n, ext):
+        return os.path.join(self.folder, "batch_{}.{}".format(n, ext))
+
+    # writes a file only if it doesn't exist yet, True if this call created it
+    def _write_new(self, filename, content):
+        try:
+            fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        return True
+
+    def is_done(self, n):
+        return os.path.exists(self._path(n, "done"))
+
+    def pending(self):
+        return [n for n in range(len(self.batches)) if (not self.is_done(n))]
+
+    # claims batch n, taking over its lock if it is stale, True if this worker now has it
+    def claim(self, n):
+        if (self.is_done(n)):
+            return False
+        lock = self._path(n, "lock")
+        record = {"worker": self.worker, "host": self.host, "pid": os.getpid(), "claimed": time.time()}
+        if (self._write_new(lock, record)):
+            self.claims[n] = record
+            return True
+        try:
+            seen = self._lock_state(lock)
+        except FileNotFoundError:
+            # released or finished in the meantime
+            return self._claim_new(n, lock, record)
+        age = time.time() - seen[1] / 1e9
+        if (age < self.stale_after):
+            return False
+        # abandoned, only one worker's rename of the stale lock succeeds. another worker may have reclaimed the batch between the stat
+        # and the rename, so the lock is moved to a name of its own and only taken over if it is still the stale lock that was seen
+        moved = "{}.stale.{}.{}".format(lock, self.worker, time.time_ns())
+        try:
+            os.rename(lock, moved)
+        except FileNotFoundError:
+            return False
+        try:
+            still_stale = (self._lock_state(moved) == seen)
+        except FileNotFoundError:
+            still_stale = False
+        if (not still_stale):
+            # a fresh lock of another worker
+            self._put_back(moved, lock)
+            return False
+        os.remove(moved)
+        print("Reclaiming batch {} (no heartbeat for {:.0f}s)".format(n, age))
+        return self._claim_new(n, lock, dict(record, reclaimed=True))
+
+    # creates the lock of batch n with this worker's claim record, unless the batch is done or another worker made it first
+    def _claim_new(self, n, lock, record):
+        if (self.is_done(n) or not self._write_new(lock, record)):
+            return False
+        self.claims[n] = record
+        return True
+
+    # whether a lock file has the claim record this worker wrote for batch n
+    def _owns(self, n, lock):
+        try:
+            with open(lock) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        mine = self.claims.get(n, {})
+        return all(record.get(k) == mine.get(k) for k in ("worker", "pid", "claimed"))
+
+    # identity of a lock file: its inode, last heartbeat and claim record
+    def _lock_state(self, lock):
+        stat = os.stat(lock)
+        with open(lock) as f:
+            content = f.read()
+        return (stat.st_ino, stat.st_mtime_ns, content)
+
+    # removes the lock of batch n if it is still this worker's, it is moved to a name of its own first so a lock another worker
+    # made meanwhile is put back instead of removed
+    def release(self, n):
+        lock = self._path(n, "lock")
+        if (self._owns(n, lock)):
+            moved = "{}.release.{}.{}".format(lock, self.worker, time.time_ns())
+            try:
+                os.rename(lock, moved)
+            except FileNotFoundError:
+                moved = None
+            if (moved is not None and not self._owns(n, moved)):
+                self._put_back(moved, lock)
+            elif (moved is not None):
+                os.remove(moved)
+        self.claims.pop(n, None)
+
+    # puts a lock moved away by mistake back, unless yet another lock was made meanwhile
+    def _put_back(self, moved, lock):
+        try:
+            os.link(moved, lock)
+        except OSError:
+            pass
+        try:
+            os.remove(moved)
+        except FileNotFoundError:
+            pass
+
+    # records batch n in the ledger (written to a temporary file then renamed, so it is complete when it appears) and unlocks it
+    def finish(self, n, started, results=None):
+        done = self._path(n, "done")
+        temp = "{}.{}.tmp".format(done, self.worker)
+        with open(temp, "w") as f:
+            json.dump({"batch": n, "worker": self.worker, "host": self.host, "started": started, "finished": time.time(),
+                       "items": self.batches[n], "results": results}, f)
+        os.replace(temp, done)
+        self.release(n)
+
+    # touches the lock of batch n every heartbeat seconds until stop is set, or until the lock isn't this worker's anymore
+    def _beat(self, n, stop):
+        lock = self._path(n, "lock")
+        while (not stop.wait(self.heartbeat)):
+            if (not self._owns(n, lock)):
+                print("{}: batch {} was reclaimed by another worker".format(self.worker, n))
+                return
+            try:
+                os.utime(lock)
+            except FileNotFoundError:
+                return
+
+    # runs process(batch_items) on batches until every batch is done, waiting for batches other workers have claimed so abandoned
+    # ones are reclaimed, process returns a JSON serializable result for the ledger (or None)
+    # returns the numbers of the batches this worker did
+    def run(self, process, poll=None):
+        poll = self.heartbeat if (poll is None) else poll
+        mine = []
+        # workers start at different batches to avoid all trying the same locks
+        first = hash(self.worker) % max(len(self.batches), 1)
+        while True:
+            todo = self.pending()
+            if (len(todo) == 0):
+                return mine
+            todo = sorted(todo, key=lambda n: (n - first) % len(self.batches))
+            claimed = None
+            for n in todo:
+                if (self.claim(n)):
+                    claimed = n
+                    break
+            if (claimed is None):
+                # the rest are being worked on, check for abandoned batches later
+                time.sleep(poll)
+                continue
+            stop = threading.Event()
+            beat = threading.Thread(target=self._beat, args=(claimed, stop), daemon=True)
+            beat.start()
+            started = time.time()
+            try:
+                print("{}: claimed batch {} of 0-{} ({} points)".format(self.worker, claimed, len(self.batches) - 1, len(self.batches[claimed])))
+                result = process(self.batches[claimed])
+            except BaseException:
+                stop.set()
+                beat.join()
+                self.release(claimed)
+                raise
+            stop.set()
+            beat.join()
+            self.finish(claimed, started, result)
+            mine.append(claimed)
+
+# every finished batch in the ledger, in batch order
+def ledger(folder):
+    entries = []
+    for name in os.listdir(folder):
+        if (name.startswith("batch_") and name.endswith(".done")):
+            with open(os.path.join(folder, name)) as f:
+                entries.append(json.load(f))
+    return sorted(entries, key=lambda e: e["batch"])
+
+if __name__ == '__main__':
+    # progress of a queue: python work_queue.py <queue folder>
+    import sys
+    folder = sys.argv[1]
+    with open(os.path.join(folder, "batches.json")) as f:
+        n_batches = len(json.load(f)["batches"])
+    done = ledger(folder)
+    running = [name for name in os.listdir(folder) if (name.endswith(".lock"))]
+    print("{} of {} batches done, {} claimed".format(len(done), n_batches, len(running)))
+    for e in done:
+        print("batch {}: {} points by {} in {:.1f}s".format(e["batch"], len(e["items"]), e["worker"], e["finished"] - e["started"]))
@@ -0,0 +1,349 @@
+# Conformance harness for the FWI engine (FWI/Python)
+#
+# Runs every registered backend / execution mode of the hourly FWI calculation and
+# compares the outputs column by column:
+#
+#   golden      PRF2007 sample data against data/PRF2007_standard_hourly_FWI.csv and
+#               data/PRF2007_standard_daily_summaries.csv
+#   synthetic   random synthetic weather against the reference hFWI()
+#   edge        hand-made edge cases (rain on the intercepts, canopy drying reset, grass
+#               transition, year boundary, southern hemisphere) against the reference hFWI()
+#
+# The largest absolute and relative difference of every column is reported, and a column
+# fails if any value is further than atol + rtol * |expected| from the expected value.
+#
+#   python benchmarks/conformance.py                          # everything, exit 1 on failures
+#   python benchmarks/conformance.py -b restart --cases edge  # one backend, one case
+#   python benchmarks/conformance.py --tolerance dmc=0.5 bui=0.5
+import argparse
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(REPO_DIR, "data")
+sys.path.append(os.path.join(REPO_DIR, "FWI", "Python"))
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+
+ATOL_DEFAULT = 1e-4
+RTOL_DEFAULT = 1e-6
+
+# rows are matched on these columns (when present) before comparing
+KEY_COLUMNS = ["id", "yr", "mon", "day", "hr"]
+
+# registered backends: name -> function(df_wx) returning the hFWI() output for df_wx
+BACKENDS = {}
+
+
+def backend(name):
+    def register(fn):
+        BACKENDS[name] = fn
+        return fn
+    return register
+
+
+### backends and execution modes ###
+
+@backend("reference")
+def run_reference(df_wx):
+    import NG_FWI
+    return NG_FWI.hFWI(df_wx, silent = True)
+
+
+@backend("per_station")
+def run_per_station(df_wx):
+    import NG_FWI
+    return pd.concat([NG_FWI.hFWI(stn, silent = True)
+        for _, stn in df_wx.groupby("id", sort = False)], ignore_index = True)
+
+
+@backend("compact")
+def run_compact(df_wx):
+    import NG_FWI
+    return NG_FWI.hFWI(df_wx, silent = True, compact = True)
+
+
+##
+# Run each station year in two parts, starting the second from the state saved in the
+# last row of the first (what a timestep-by-timestep or operational run does)
+#
+# The split is kept before the matted to standing grass transition when the station year
+# has hours before it, since the transition date is taken from the first row of each run
+#
+# @param    df_wx       hourly weather
+# @return               hFWI() output
+@backend("restart")
+def run_restart(df_wx):
+    import NG_FWI
+    split = ["id"] if NG_FWI.CONTINUOUS_MULTIYEAR else ["id", "yr"]
+    out = []
+    for _, part in df_wx.groupby(split, sort = False):
+        part = part.reset_index(drop = True)
+        before = np.flatnonzero((part["mon"] * 100 + part["day"]).values <
+            NG_FWI.MON_STANDING * 100 + NG_FWI.DAY_STANDING)
+        n = len(before) if len(before) > 1 else len(part)
+        cut = max(1, n // 2)
+        first = NG_FWI.hFWI(part.iloc[:cut], silent = True, round_out = None)
+        out.append(first)
+        if cut < len(part):
+            last = first.iloc[-1]
+            out.append(NG_FWI.hFWI(part.iloc[cut:], silent = True, round_out = None,
+                ffmc_old = None, mcffmc_old = last["mcffmc"], dmc_old = last["dmc"],
+                dc_old = last["dc"], mcgfmc_matted_old = last["mcgfmc_matted"],
+                mcgfmc_standing_old = last["mcgfmc_standing"],
+                prec_cumulative = last["prec_cumulative"],
+                canopy_drying = last["canopy_drying"]))
+    return pd.concat(out, ignore_index = True).round(4)
+
+
+def station_years(df_wx):
+    import NG_FWI
+    split = ["id"] if NG_FWI.CONTINUOUS_MULTIYEAR else ["id", "yr"]
+    return [part.reset_index(drop = True)
+        for _, part in df_wx.groupby(split, sort = False)]
+
+
+##
+# Step each station year one hour at a time with fwi_core.step()
+@backend("step")
+def run_step(df_wx):
+    import fwi_core
+    out = []
+    for part in station_years(df_wx):
+        state = fwi_core.initial_state()
+        rows = []
+        for obs in part.to_dict("records"):
+            state, values = fwi_core.step(state, obs)
+            rows.append(values)
+        out.append(pd.concat([part, pd.DataFrame(rows)], axis = 1))
+    return pd.concat(out, ignore_index = True).round(4)
+
+
+##
+# Step every station year at once with fwi_batch.step_batch(), one hour at a time,
+# leaving out the station years that have ended
+@backend("step_batch")
+def run_step_batch(df_wx):
+    import fwi_batch
+    parts = station_years(df_wx)
+    lengths = np.array([len(part) for part in parts])
+    cols = ["lat", "long", "timezone", "yr", "mon", "day", "hr", "temp", "rh", "ws",
+        "prec"]
+    wx = {c: np.full((len(parts), lengths.max()), np.nan) for c in cols}
+    for i, part in enumerate(parts):
+        for c in cols:
+            wx[c][i, :len(part)] = part[c].values
+    states = fwi_batch.initial_states(len(parts))
+    results = {}
+    for t in range(lengths.max()):
+        active = np.flatnonzero(lengths > t)
+        new, values = fwi_batch.step_batch(states.take(active),
+            {c: wx[c][active, t] for c in cols})
+        states.put(active, new)
+        for k, v in values.items():
+            results.setdefault(k, np.full((len(parts), lengths.max()), np.nan))[active, t] = v
+    out = [pd.concat([part, pd.DataFrame({k: v[i, :len(part)]
+        for k, v in results.items()})], axis = 1) for i, part in enumerate(parts)]
+    return pd.concat(out, ignore_index = True).round(4)
+
+
+##
+# Step every station year through fwi_service.FWIService, one request per hour with
+# the observations of every station year that hasn't ended. Each request is sent a
+# second time (as a client retrying it would), which must be rejected and leave every
+# station's state as it was
+@backend("service")
+def run_service(df_wx):
+    import fwi_service
+    parts = station_years(df_wx)
+    records = [part.to_dict("records") for part in parts]
+    service = fwi_service.FWIService()
+    rows = [[] for _ in parts]
+    for t in range(max(len(r) for r in records)):
+        active = [i for i in range(len(parts)) if len(records[i]) > t]
+        request = [dict(records[i][t], id = str(i)) for i in active]
+        for i, values in zip(active, service.step_observations(request)):
+            rows[i].append(values)
+        states = service.states.copy()
+        try:
+            service.step_observations(request)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Repeated request for hour {} was stepped".format(t))
+        for k in states.__slots__:
+            if not np.array_equal(getattr(states, k), getattr(service.states, k),
+                equal_nan = k != "date_grass_standing"):
+                raise AssertionError("Repeated request for hour {} changed {}".format(t, k))
+    out = [pd.concat([part, pd.DataFrame(rows[i]).drop(columns = KEY_COLUMNS)], axis = 1)
+        for i, part in enumerate(parts)]
+    return pd.concat(out, ignore_index = True)
+
+
+### comparing ###
+
+##
+# Compare the numeric columns two tables have in common
+#
+# @param    actual        table to check
+# @param    expected      expected table
+# @param    atol          absolute tolerance
+# @param    rtol          relative tolerance
+# @param    column_atol   absolute tolerance by column, overrides atol
+# @return                 list of dictionaries, one per column: column, max_abs, max_rel,
+#                         n_fail and passed
+def compare_tables(actual, expected, atol = ATOL_DEFAULT, rtol = RTOL_DEFAULT,
+    column_atol = None):
+    column_atol = {} if column_atol is None else column_atol
+    keys = [k for k in KEY_COLUMNS if k in actual.columns and k in expected.columns]
+    report = []
+    if len(actual) != len(expected):
+        report.append({"column": "(rows)", "max_abs": abs(len(actual) - len(expected)),
+            "max_rel": np.nan, "n_fail": abs(len(actual) - len(expected)),
+            "passed": False})
+    merged = actual.merge(expected, on = keys, how = "inner", suffixes = ("", "_expected"))
+    for col in expected.columns:
+        if col in keys:
+            continue
+        if col not in actual.columns:
+            report.append({"column": col, "max_abs": np.nan, "max_rel": np.nan,
+                "n_fail": len(expected), "passed": False})
+            continue
+        a = merged[col]
+        e = merged[col + "_expected"]
+        if not (pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(e)):
+            n_fail = int((a.astype(str) != e.astype(str)).sum())
+            report.append({"column": col, "max_abs": np.nan, "max_rel": np.nan,
+                "n_fail": n_fail, "passed": n_fail == 0})
+            continue
+        a = a.to_numpy(dtype = float)
+        e = e.to_numpy(dtype = float)
+        both_nan = np.isnan(a) & np.isnan(e)
+        diff = np.where(both_nan, 0.0, np.abs(a - e))
+        rel = np.where(diff == 0.0, 0.0, diff / np.maximum(np.abs(e), 1e-12))
+        tol = column_atol.get(col, atol) + rtol * np.abs(e)
+        # nan in only one of them is a failure (nan > tol is False, so check separately)
+        failed = (diff > tol) | (np.isnan(diff) & ~both_nan)
+        report.append({"column": col,
+            "max_abs": float(np.nanmax(diff)) if len(diff) > 0 else 0.0,
+            "max_rel": float(np.nanmax(rel)) if len(rel) > 0 else 0.0,
+            "n_fail": int(failed.sum()), "passed": not failed.any()})
+    return report
+
+
+def print_report(title, report, verbose = False):
+    passed = all(r["passed"] for r in report)
+    print("{:<60s} {}".format(title, "ok" if passed else "FAILED"))
+    for r in report:
+        if verbose or not r["passed"]:
+            print("    {:<18s} max abs {:12.6g}  max rel {:12.6g}  {:>7d} failed".format(
+                r["column"], r["max_abs"], r["max_rel"], r["n_fail"]))
+    return passed
+
+
+### cases ###
+
+##
+# Inputs and expected outputs to check every backend against
+#
+# @param    cases       names of the cases to build (golden, synthetic, edge)
+# @param    seeds       number of random synthetic weather streams
+# @param    stations    stations in each synthetic weather stream
+# @param    years       years in each synthetic weather stream
+# @return               list of (case name, hourly weather, expected hourly output or
+#                       None for the reference output, expected daily summaries or None)
+def build_cases(cases, seeds = 2, stations = 3, years = 2):
+    out = []
+    if "golden" in cases:
+        out.append(("golden.prf2007",
+            pd.read_csv(os.path.join(DATA_DIR, "PRF2007_hourly_wx.csv")),
+            pd.read_csv(os.path.join(DATA_DIR, "PRF2007_standard_hourly_FWI.csv")),
+            pd.read_csv(os.path.join(DATA_DIR, "PRF2007_standard_daily_summaries.csv"))))
+    if "synthetic" in cases:
+        for seed in range(seeds):
+            out.append(("synthetic.seed{}".format(seed),
+                synthetic.hourly_weather(stations, years, seed = seed), None, None))
+    if "edge" in cases:
+        out.append(("edge", synthetic.edge_case_weather(), None, None))
+    return out
+
+
+def run(backends, cases, atol, rtol, column_atol, verbose = False):
+    import daily_summaries
+    all_passed = True
+    for case, df_wx, expected, expected_daily in cases:
+        if expected is None:
+            expected = BACKENDS["reference"](df_wx)
+        if expected_daily is None:
+            expected_daily = daily_summaries.generate_daily_summaries(expected, silent = True)
+        for name in backends:
+            if name == "reference" and not case.startswith("golden"):
+                continue
+            try:
+                actual = BACKENDS[name](df_wx)
+                actual_daily = daily_summaries.generate_daily_summaries(actual,
+                    silent = True)
+            except Exception as e:
+                print("{:<60s} failed: {!r}".format("{} {}".format(case, name), e))
+                all_passed = False
+                continue
+            all_passed &= print_report("{} {} hourly".format(case, name),
+                compare_tables(actual, expected, atol, rtol, column_atol), verbose)
+            all_passed &= print_report("{} {} daily".format(case, name),
+                compare_tables(actual_daily, expected_daily, atol, rtol, column_atol),
+                verbose)
+    return all_passed
+
+
+def parse_tolerances(items):
+    out = {}
+    for item in items:
+        col, sep, value = item.partition("=")
+        if sep == "":
+            raise ValueError("Expected COLUMN=ATOL, not " + item)
+        out[col] = float(value)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = "conformance")
+    parser.add_argument("-b", "--backends", nargs = "*", default = None,
+        help = "Backends to check (default all)")
+    parser.add_argument("--cases", nargs = "*", default = ["golden", "synthetic", "edge"],
+        help = "Cases to check: golden, synthetic, edge (default all)")
+    parser.add_argument("--atol", type = float, default = ATOL_DEFAULT,
+        help = "Absolute tolerance (default {:g})".format(ATOL_DEFAULT))
+    parser.add_argument("--rtol", type = float, default = RTOL_DEFAULT,
+        help = "Relative tolerance (default {:g})".format(RTOL_DEFAULT))
+    parser.add_argument("--tolerance", nargs = "*", default = [],
+        help = "Absolute tolerance by column, as COLUMN=ATOL")
+    parser.add_argument("--seeds", type = int, default = 2,
+        help = "Number of random synthetic weather streams (default 2)")
+    parser.add_argument("--stations", type = int, default = 3,
+        help = "Stations in each synthetic weather stream (default 3)")
+    parser.add_argument("--years", type = int, default = 2,
+        help = "Years in each synthetic weather stream (default 2)")
+    parser.add_argument("-v", "--verbose", action = "store_true",
+        help = "Report every column, not only the failed ones")
+    parser.add_argument("-l", "--list", action = "store_true",
+        help = "List backends and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BACKENDS))
+        sys.exit(0)
+    backends = list(BACKENDS) if args.backends is None else args.backends
+    for name in backends:
+        if name not in BACKENDS:
+            parser.error("Unknown backend {}, choose from {}".format(name, ", ".join(BACKENDS)))
+    try:
+        column_atol = parse_tolerances(args.tolerance)
+    except ValueError as e:
+        parser.error(str(e))
+    cases = build_cases(args.cases, args.seeds, args.stations, args.years)
+    if not run(backends, cases, args.atol, args.rtol, column_atol, args.verbose):
+        sys.exit(1)
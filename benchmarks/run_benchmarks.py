@@ -0,0 +1,423 @@
+# Benchmark suite for the FWI engine (FWI/Python) and the GISS pipeline (GISS/)
+#
+# Times the hot paths on the PRF2007 sample data and on synthetic inputs scaled by
+# number of stations and years. Every run is appended to a results file along with
+# the git commit and util.version(), so runs on different commits can be compared:
+#
+#   python benchmarks/run_benchmarks.py                        # run everything, record results
+#   python benchmarks/run_benchmarks.py -k hFWI                # only benchmarks matching "hFWI"
+#   python benchmarks/run_benchmarks.py --stations 1 100 --years 1 10
+#   python benchmarks/run_benchmarks.py --compare HEAD~1       # flag regressions vs. a commit
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(REPO_DIR, "data")
+sys.path.append(os.path.join(REPO_DIR, "FWI", "Python"))
+sys.path.append(os.path.join(REPO_DIR, "GISS"))
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+
+RESULTS_DEFAULT = os.path.join(BENCH_DIR, "results", platform.node() + ".jsonl")
+
+# registered benchmarks: name -> (setup function, parameters)
+# setup(**params) does any untimed preparation and returns the function to time
+BENCHMARKS = {}
+
+
+def benchmark(name, **params):
+    def register(setup):
+        BENCHMARKS[name] = (setup, params)
+        return setup
+    return register
+
+
+def prf_hourly():
+    return pd.read_csv(os.path.join(DATA_DIR, "PRF2007_hourly_wx.csv"))
+
+
+def prf_daily():
+    return pd.read_csv(os.path.join(DATA_DIR, "PRF2007_daily_wx.csv"))
+
+
+### FWI engine on the PRF2007 sample data ###
+
+@benchmark("hFWI.prf2007")
+def setup_hfwi_prf():
+    import NG_FWI
+    df = prf_hourly()
+    return lambda: NG_FWI.hFWI(df, silent = True)
+
+
+@benchmark("get_sunlight.prf2007")
+def setup_sunlight_prf():
+    import util
+    df = prf_hourly()
+    df["timestamp"] = pd.to_datetime(df[["yr", "mon", "day", "hr"]].rename(
+        columns = {"yr": "year", "mon": "month", "hr": "hour"})).dt.to_pydatetime()
+    return lambda: util.get_sunlight(df.copy(), get_solrad = True)
+
+
+@benchmark("daily_to_minmax.prf2007")
+def setup_minmax_prf():
+    import make_minmax
+    df = prf_daily()
+    return lambda: make_minmax.daily_to_minmax(df, silent = True)
+
+
+@benchmark("minmax_to_hourly.prf2007")
+def setup_hourly_prf():
+    import make_minmax
+    import make_hourly
+    df = make_minmax.daily_to_minmax(prf_daily(), silent = True)
+    return lambda: make_hourly.minmax_to_hourly(df, silent = True)
+
+
+def setup_ensemble_prf(n_members):
+    import make_minmax
+    import ensemble
+    df = make_minmax.daily_to_minmax(prf_daily(), silent = True)
+    # June of PRF2007 with members perturbed around the observed min/max
+    df = synthetic.ensemble_members(df[df["mon"] == 6], n_members)
+    return lambda: ensemble.ensemble_fwi(df, silent = True)
+
+
+for n_members in [1, 50]:
+    benchmark("ensemble_fwi.prf2007_june.{}members".format(n_members),
+        n_members = n_members)(setup_ensemble_prf)
+
+
+def setup_sweep_prf(n_sets):
+    import fwi_core
+    import sweep
+    df = prf_hourly()
+    # DMC and DC regressions around the defaults
+    sets = sweep.parameter_grid(
+        dmc_regression = fwi_core.DMC_REGRESSION * np.linspace(0.8, 1.2, n_sets // 10),
+        dc_regression = fwi_core.DC_REGRESSION * np.linspace(0.8, 1.2, 10))
+    return lambda: sweep.sweep(df, sets, silent = True)
+
+
+benchmark("sweep.prf2007.100sets", n_sets = 100)(setup_sweep_prf)
+
+
+@benchmark("generate_daily_summaries.prf2007")
+def setup_daily_prf():
+    import NG_FWI
+    import daily_summaries
+    df = NG_FWI.hFWI(prf_hourly(), silent = True)
+    return lambda: daily_summaries.generate_daily_summaries(df, silent = True)
+
+
+### import time (fresh interpreter each run) ###
+
+def setup_import(module):
+    code = "import sys; sys.path.insert(0, {!r}); import {}".format(
+        os.path.join(REPO_DIR, "FWI", "Python"), module)
+    return lambda: subprocess.check_call([sys.executable, "-c", code])
+
+
+benchmark("import.python")(lambda: setup_import("sys"))
+benchmark("import.fwi_core")(lambda: setup_import("fwi_core"))
+benchmark("import.NG_FWI")(lambda: setup_import("NG_FWI"))
+
+
+@benchmark("fwi_core.step.prf2007")
+def setup_step_prf():
+    import NG_FWI
+    import fwi_core
+    df = NG_FWI.hFWI(prf_hourly(), silent = True, round_out = None)
+    obs = df[["yr", "mon", "day", "hr", "temp", "rh", "ws", "prec", "sunrise", "sunset",
+        "solrad", "percent_cured"]].to_dict("records")
+
+    def run():
+        state = fwi_core.initial_state()
+        for o in obs:
+            state, _ = fwi_core.step(state, o)
+    return run
+
+
+### plot aggregations (GISS/plot_fwi.py) on the PRF2007 FWI output ###
+
+def prf_fwi_data():
+    import matplotlib
+    matplotlib.use("Agg")
+    import NG_FWI
+    from plot_fwi import fwi_data
+    csvfile = os.path.join(tempfile.mkdtemp(), "PRF2007_hourly_FWI.csv")
+    NG_FWI.hFWI(prf_hourly(), silent = True).to_csv(csvfile, index = False)
+    return fwi_data(csvfile, "PRF")
+
+
+@benchmark("plot.getMaxDailyFWI.prf2007")
+def setup_plot_maxdaily():
+    obj = prf_fwi_data()
+    start, end = obj.df["full_date"].iloc[0], obj.df["full_date"].iloc[-1]
+    return lambda: obj.getMaxDailyFWI(start, end)
+
+
+@benchmark("plot.getMonthlyFWI.prf2007")
+def setup_plot_monthly():
+    obj = prf_fwi_data()
+    start, end = obj.df["full_date"].iloc[0], obj.df["full_date"].iloc[-1]
+    return lambda: obj.getMonthlyFWI(start, end)
+
+
+@benchmark("plot.getSeasonalFWI.prf2007")
+def setup_plot_seasonal():
+    obj = prf_fwi_data()
+    start, end = obj.df["full_date"].iloc[0], obj.df["full_date"].iloc[-1]
+    return lambda: obj.getSeasonalFWI(start, end)
+
+
+@benchmark("plot.getRollingFWI.prf2007")
+def setup_plot_rolling():
+    obj = prf_fwi_data()
+    start, end = obj.findFireSeason()
+    return lambda: obj.getRollingFWI(start, end, 21)
+
+
+@benchmark("plot.findFireSeason.prf2007")
+def setup_plot_fireseason():
+    obj = prf_fwi_data()
+    return lambda: obj.findFireSeason()
+
+
+### scaled synthetic inputs ###
+
+def register_scaled(stations, years):
+    for n_stations in stations:
+        for n_years in years:
+            size = "{}stn_{}yr".format(n_stations, n_years)
+            benchmark("hFWI.synthetic." + size, n_stations = n_stations,
+                n_years = n_years)(setup_hfwi_synthetic)
+            benchmark("generate_daily_summaries.synthetic." + size,
+                n_stations = n_stations, n_years = n_years)(setup_daily_synthetic)
+            benchmark("minmax_to_hourly.synthetic." + size, n_stations = n_stations,
+                n_years = n_years)(setup_hourly_synthetic)
+            benchmark("era5_convert.synthetic." + size, n_stations = n_stations,
+                n_years = n_years)(setup_era5_synthetic)
+            benchmark("step_batch.synthetic." + size, n_stations = n_stations,
+                n_years = n_years)(setup_step_batch_synthetic)
+
+
+def setup_hfwi_synthetic(n_stations, n_years):
+    import NG_FWI
+    df = synthetic.hourly_weather(n_stations, n_years)
+    return lambda: NG_FWI.hFWI(df, silent = True)
+
+
+def setup_daily_synthetic(n_stations, n_years):
+    import NG_FWI
+    import daily_summaries
+    df = NG_FWI.hFWI(synthetic.hourly_weather(n_stations, n_years), silent = True)
+    return lambda: daily_summaries.generate_daily_summaries(df, silent = True)
+
+
+def setup_hourly_synthetic(n_stations, n_years):
+    import make_minmax
+    import make_hourly
+    df = make_minmax.daily_to_minmax(synthetic.daily_weather(n_stations, n_years),
+        silent = True)
+    return lambda: make_hourly.minmax_to_hourly(df, silent = True)
+
+
+def setup_step_batch_synthetic(n_stations, n_years):
+    import fwi_batch
+    df = synthetic.hourly_weather(n_stations, n_years)
+    cols = ["lat", "long", "timezone", "yr", "mon", "day", "hr", "temp", "rh", "ws",
+        "prec"]
+    # every station has the same hours, so hour t of every station is one step
+    hours = {c: df[c].values.reshape(n_stations, -1).T for c in cols}
+
+    def run():
+        states = fwi_batch.initial_states(n_stations)
+        for t in range(hours["hr"].shape[0]):
+            states, _ = fwi_batch.step_batch(states, {c: v[t] for c, v in hours.items()})
+    return run
+
+
+def setup_era5_synthetic(n_stations, n_years):
+    workdir = tempfile.mkdtemp()
+    # era5_convert.py creates its output folder relative to the working directory on import
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import era5_convert
+    finally:
+        os.chdir(cwd)
+    zips = synthetic.era5_zip_set(workdir, n_stations, n_years)
+    outputs = ["{}/era5converted_{}.csv".format(workdir, stn) for stn, _ in zips]
+
+    def run():
+        for (_, zipped), output in zip(zips, outputs):
+            era5_convert.do_conversion(zipped, output)
+    return run
+
+
+### running and recording ###
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = REPO_DIR,
+            stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def resolve_commit(ref):
+    try:
+        return subprocess.check_output(["git", "rev-parse", ref], cwd = REPO_DIR,
+            stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ref
+
+
+##
+# Time a function, keeping the fastest and median of several repeats
+#
+# @param    fn          function to time
+# @param    repeat      number of timed runs
+# @return               dictionary of min, median and mean seconds
+def time_function(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {"min": times[0], "median": times[len(times) // 2],
+        "mean": sum(times) / len(times), "repeat": repeat}
+
+
+def run(names, repeat, quiet = False):
+    import util
+    commit = git_commit()
+    results = []
+    for name in names:
+        setup, params = BENCHMARKS[name]
+        # the FWI functions (and unzip in era5_convert) print progress, keep it out
+        # of the benchmark output
+        sys.stdout.flush()
+        saved_fd = os.dup(1)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        try:
+            fn = setup(**params)
+            timing = time_function(fn, repeat)
+        except Exception as e:
+            timing = e
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved_fd, 1)
+            os.close(saved_fd)
+            os.close(devnull)
+        if isinstance(timing, Exception):
+            print("{:<50s} failed: {!r}".format(name, timing))
+            continue
+        record = {"benchmark": name, "params": params, "commit": commit,
+            "version": util.version(), "python": platform.python_version(),
+            "machine": platform.node(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        record.update(timing)
+        results.append(record)
+        if not quiet:
+            print("{:<50s} min {:10.4f}s  median {:10.4f}s".format(
+                name, timing["min"], timing["median"]))
+    return results
+
+
+def load_results(results_file):
+    records = []
+    if os.path.isfile(results_file):
+        with open(results_file) as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+
+##
+# Compare results with the latest results recorded for another commit
+#
+# @param    results       results of this run
+# @param    previous      all recorded results
+# @param    commit        commit to compare against
+# @param    threshold     ratio of median times above which a benchmark has regressed
+# @return                 names of regressed benchmarks
+def compare(results, previous, commit, threshold):
+    baseline = {}
+    for record in previous:
+        if record.get("commit") == commit:
+            baseline[record["benchmark"]] = record
+    regressions = []
+    print("\nCompared with {}:".format(commit[:10]))
+    for record in results:
+        base = baseline.get(record["benchmark"])
+        if base is None:
+            print("{:<50s} no baseline".format(record["benchmark"]))
+            continue
+        ratio = record["median"] / base["median"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(record["benchmark"])
+        print("{:<50s} {:10.4f}s -> {:10.4f}s  x{:.2f}{}".format(
+            record["benchmark"], base["median"], record["median"], ratio, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog = "run_benchmarks")
+    parser.add_argument("-k", "--filter", nargs = "*", default = [],
+        help = "Only run benchmarks whose name contains one of these strings")
+    parser.add_argument("--stations", nargs = "*", type = int, default = [1, 10],
+        help = "Numbers of synthetic stations (1 to 10,000, default 1 10)")
+    parser.add_argument("--years", nargs = "*", type = int, default = [1],
+        help = "Numbers of synthetic years per station (1 to 70, default 1)")
+    parser.add_argument("-n", "--repeat", type = int, default = 3,
+        help = "Timed runs per benchmark (default 3)")
+    parser.add_argument("-o", "--results", default = RESULTS_DEFAULT,
+        help = "File results are appended to (default benchmarks/results/<machine>.jsonl)")
+    parser.add_argument("--no-save", action = "store_true",
+        help = "Do not append results to the results file")
+    parser.add_argument("--compare", nargs = "?", const = "HEAD~1",
+        help = "Commit to compare against (default HEAD~1), exits with 1 on regressions")
+    parser.add_argument("--threshold", type = float, default = 1.2,
+        help = "Median time ratio counted as a regression (default 1.2)")
+    parser.add_argument("-l", "--list", action = "store_true",
+        help = "List benchmarks and exit")
+    args = parser.parse_args()
+
+    if not all(1 <= n <= 10000 for n in args.stations):
+        parser.error("--stations must be between 1 and 10,000")
+    if not all(1 <= n <= 70 for n in args.years):
+        parser.error("--years must be between 1 and 70")
+    register_scaled(args.stations, args.years)
+    names = [n for n in BENCHMARKS
+        if len(args.filter) == 0 or any(f in n for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        sys.exit(0)
+
+    results = run(names, args.repeat)
+    previous = load_results(args.results)
+    if not args.no_save and len(results) > 0:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok = True)
+        with open(args.results, "a") as f:
+            for record in results:
+                f.write(json.dumps(record) + "\n")
+    if args.compare is not None:
+        regressions = compare(results, previous, resolve_commit(args.compare),
+            args.threshold)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -0,0 +1,214 @@
+# Synthetic inputs for benchmarks and conformance checks
+#
+# Weather is random but physically plausible (diurnal and seasonal cycles, rain events)
+# so it exercises the same code paths as real station or ERA5 data.
+import datetime
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+
+##
+# Make an hourly weather stream in the format hFWI() reads
+#
+# @param    n_stations    number of stations
+# @param    n_years       number of years per station
+# @param    start_year    first year
+# @param    mon_start     first month of each year (default 1)
+# @param    mon_end       last month of each year (default 12)
+# @param    seed          random seed
+# @return                 hourly weather, columns:
+#                         id, lat, long, timezone, yr, mon, day, hr, temp, rh, ws, prec
+def hourly_weather(n_stations = 1, n_years = 1, start_year = 2000,
+    mon_start = 1, mon_end = 12, seed = 0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for stn in range(n_stations):
+        lat = rng.uniform(35.0, 65.0)
+        lon = rng.uniform(-130.0, 30.0)
+        tz = int(round(lon / 15.0))
+        for yr in range(start_year, start_year + n_years):
+            start = datetime.datetime(yr, mon_start, 1)
+            end = (datetime.datetime(yr + 1, 1, 1) if mon_end == 12
+                else datetime.datetime(yr, mon_end + 1, 1))
+            ts = pd.date_range(start, end, freq = "h", inclusive = "left")
+            n = len(ts)
+            doy = ts.dayofyear.values
+            hr = ts.hour.values
+            seasonal = 12.0 - 14.0 * np.cos(2.0 * np.pi * (doy - 15) / 365.0)
+            diurnal = 6.0 * np.sin(2.0 * np.pi * (hr - 9) / 24.0)
+            temp = seasonal + diurnal + rng.normal(0.0, 2.0, n)
+            rh = np.clip(65.0 - 3.0 * diurnal - 0.8 * (temp - seasonal) +
+                rng.normal(0.0, 8.0, n), 5.0, 100.0)
+            ws = rng.gamma(2.0, 6.0, n)
+            # rain events start ~3% of hours and last a few hours
+            raining = rng.random(n) < 0.03
+            for lag in range(1, 4):
+                raining[lag:] |= raining[:-lag] & (rng.random(n - lag) < 0.5)
+            prec = np.where(raining, rng.exponential(1.0, n), 0.0)
+            frames.append(pd.DataFrame({
+                "id": "STN{:05d}".format(stn),
+                "lat": round(lat, 3),
+                "long": round(lon, 3),
+                "timezone": tz,
+                "yr": ts.year.values,
+                "mon": ts.month.values,
+                "day": ts.day.values,
+                "hr": hr,
+                "temp": np.round(temp, 2),
+                "rh": np.round(rh, 2),
+                "ws": np.round(ws, 2),
+                "prec": np.round(prec, 2)
+            }))
+    return pd.concat(frames, ignore_index = True)
+
+##
+# Make a daily noon weather stream in the format daily_to_minmax() reads
+#
+# @param    n_stations    number of stations
+# @param    n_years       number of years per station
+# @param    start_year    first year
+# @param    seed          random seed
+# @return                 daily weather, columns:
+#                         id, lat, long, timezone, yr, mon, day, temp, rh, ws, prec
+def daily_weather(n_stations = 1, n_years = 1, start_year = 2000, seed = 0):
+    hourly = hourly_weather(n_stations, n_years, start_year, seed = seed)
+    daily = hourly.groupby(["id", "lat", "long", "timezone", "yr", "mon", "day"],
+        sort = False, as_index = False).agg(
+        temp = ("temp", "max"), rh = ("rh", "min"), ws = ("ws", "mean"),
+        prec = ("prec", "sum"))
+    return daily.round({"temp": 2, "rh": 2, "ws": 2, "prec": 2})
+
+##
+# Make ensemble members of daily min/max weather by perturbing it
+#
+# @param    minmax        daily min/max weather (e.g. from daily_to_minmax())
+# @param    n_members     number of members
+# @param    seed          random seed
+# @return                 minmax with a member column, n_members times as long
+def ensemble_members(minmax, n_members, seed = 0):
+    rng = np.random.default_rng(seed)
+    members = []
+    for m in range(n_members):
+        df = minmax.copy()
+        n = len(df)
+        shift = rng.normal(0, 2, n)
+        df["temp_min"] += shift
+        df["temp_max"] += shift + rng.normal(0, 1, n)
+        df["rh_min"] = np.clip(df["rh_min"] + rng.normal(0, 5, n), 0, 100)
+        df["rh_max"] = np.clip(df["rh_max"] + rng.normal(0, 5, n), df["rh_min"], 100)
+        df["ws_max"] = np.maximum(df["ws_max"] * rng.uniform(0.7, 1.3, n), df["ws_min"])
+        df["prec"] = df["prec"] * rng.uniform(0, 2, n)
+        df["member"] = m
+        members.append(df)
+    return pd.concat(members, ignore_index = True)
+
+##
+# Write a zip file like the ones downloaded from the ERA5-Land point timeseries dataset
+#
+# @param    zipfile_out   file to write
+# @param    lat           latitude of the point
+# @param    lon           longitude of the point
+# @param    n_years       number of years
+# @param    start_year    first year
+# @param    seed          random seed
+# @return                 zipfile_out
+def era5_zip(zipfile_out, lat = 40.0, lon = -4.0, n_years = 1, start_year = 2000, seed = 0):
+    wx = hourly_weather(1, n_years, start_year, seed = seed)
+    valid_time = pd.to_datetime(wx[["yr", "mon", "day", "hr"]].rename(
+        columns = {"yr": "year", "mon": "month", "hr": "hour"})).dt.strftime("%Y-%m-%d %H:%M:%S")
+    t2m = wx["temp"] + 273.15
+    # dewpoint from temperature and relative humidity (inverse of the Tetens conversion)
+    gamma = np.log(wx["rh"] / 100.0) + 17.27 * wx["temp"] / (wx["temp"] + 237.3)
+    d2m = 237.3 * gamma / (17.27 - gamma) + 273.15
+    angle = np.random.default_rng(seed).uniform(0, 2 * np.pi, len(wx))
+    speed = wx["ws"] / 3.6
+    files = {
+        "reanalysis-era5-land-timeseries-sfc-wind{}.csv": pd.DataFrame({
+            "valid_time": valid_time, "u10": speed * np.cos(angle),
+            "v10": speed * np.sin(angle)}),
+        "reanalysis-era5-land-timeseries-sfc-2m-temperature{}.csv": pd.DataFrame({
+            "valid_time": valid_time, "d2m": d2m, "t2m": t2m}),
+        "reanalysis-era5-land-timeseries-sfc-pressure-precipitation{}.csv": pd.DataFrame({
+            "valid_time": valid_time, "tp": wx["prec"] / 1000.0})
+    }
+    suffix = "{:07d}".format(seed)
+    with zipfile.ZipFile(zipfile_out, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, df in files.items():
+            df.insert(1, "latitude", lat)
+            df.insert(2, "longitude", lon)
+            z.writestr(name.format(suffix), df.to_csv(index = False))
+    return zipfile_out
+
+##
+# Write a set of ERA5 zip files named like csdapi_get_era5.py downloads
+#
+# @param    outdir        directory to write to
+# @param    n_points      number of points
+# @param    n_years       number of years per point
+# @param    prefix        file name prefix (downloadedPrefix in giss_config.py)
+# @return                 list of (station id, zip file)
+def era5_zip_set(outdir, n_points = 1, n_years = 1, prefix = "era5download"):
+    os.makedirs(outdir, exist_ok = True)
+    out = []
+    for i in range(n_points):
+        lat = 36.0 + 0.1 * (i // 50)
+        lon = -9.0 + 0.1 * (i % 50)
+        station_id = "{:.2f}N_{:.2f}{}".format(lat, abs(lon), "W" if lon < 0 else "E")
+        out.append((station_id, era5_zip("{}/{}_{}.zip".format(outdir, prefix, station_id),
+            lat, lon, n_years, seed = i)))
+    return out
+
+##
+# Make an hourly weather stream of edge cases for conformance checks:
+# rain totals landing exactly on the FFMC/DMC/DC intercepts, rain restarting just
+# before and after the canopy drying reset, the matted to standing grass transition,
+# a run across a year boundary (including a leap day) and a southern hemisphere station
+#
+# @param    seed          random seed for the weather between the edge cases
+# @return                 hourly weather, columns:
+#                         id, lat, long, timezone, yr, mon, day, hr, temp, rh, ws, prec
+def edge_case_weather(seed = 0):
+    frames = []
+    # northern station from June into July (grass transition on July 1)
+    summer = hourly_weather(1, 1, 2001, mon_start = 6, mon_end = 7, seed = seed)
+    summer["prec"] = 0.0
+    rain_events = [
+        # (hour offset, amounts): cumulative totals hitting each intercept exactly
+        (24, [0.5]),                   # FFMC intercept in one hour
+        (48, [0.25, 0.25]),            # FFMC intercept over two hours
+        (72, [1.0, 0.5]),              # DMC intercept
+        (96, [1.5, 1.3]),              # DC intercept
+        (120, [0.3, 0, 0, 0, 0, 0.3]),  # rain again after 4 dry hours (no reset)
+        (144, [0.3, 0, 0, 0, 0, 0, 0.3]),  # rain again after 5 dry hours (reset)
+        (168, [12.0, 8.0, 0.2]),       # heavy rain
+        (690, [2.0]),                  # rain on the hours around the grass transition
+        (714, [0.6])
+    ]
+    for start, amounts in rain_events:
+        for i, amount in enumerate(amounts):
+            summer.loc[start + i, "prec"] = amount
+    # extreme but valid weather
+    summer.loc[200:205, "rh"] = 100.0
+    summer.loc[206:210, "rh"] = 0.0
+    summer.loc[211:215, "ws"] = 0.0
+    summer.loc[216:220, "ws"] = 80.0
+    summer.loc[221:225, "temp"] = -5.0
+    summer["id"] = "EDGE_SUMMER"
+    frames.append(summer)
+    # run across the end of a leap year into the next
+    winter = hourly_weather(1, 2, 2003, seed = seed + 1)
+    winter = winter[((winter["yr"] == 2003) & (winter["mon"] == 12)) |
+        ((winter["yr"] == 2004) & (winter["mon"] <= 3))].copy()
+    winter["id"] = "EDGE_YEAR"
+    frames.append(winter)
+    # southern hemisphere station, starting after July 1 (standing grass next year)
+    south = hourly_weather(1, 1, 2005, mon_start = 8, mon_end = 9, seed = seed + 2)
+    south["lat"] = -33.9
+    south["long"] = 151.2
+    south["timezone"] = 10
+    south["id"] = "EDGE_SOUTH"
+    frames.append(south)
+    return pd.concat(frames, ignore_index = True)